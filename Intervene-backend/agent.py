@@ -1,33 +1,34 @@
 """
 agent.py - Revised main agent class that orchestrates tasks
 """
-import time
-from listener import OverrideDetector
-from tasks import run_task_workflow
+from listener import get_detector
+from tasks import run_task_workflow, OVERRIDE_RESULT
+from config import OVERRIDE_GRACE_PERIOD, configure_logging
 import logging
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 class InterveneAgent:
     def __init__(self):
-        self.detector = OverrideDetector()
+        self.detector = get_detector()
         self.mouse_listener, self.keyboard_listener = self.detector.start_listeners()
         logger.info("Agent initialized and listeners started")
 
     def run_task(self):
         logger.info("🧠 Copilot standing by...")
-        time.sleep(2)  # Wait before acting
+        self.detector.reset()
 
-        if not self.detector.override:
-            logger.info("🚀 No user detected, proceeding with workflow...")
-            run_task_workflow()
-        else:
+        # Returns early the moment the user touches mouse or keyboard
+        if self.detector.wait(OVERRIDE_GRACE_PERIOD):
             logger.info("🛑 Manual override detected. Task cancelled.")
+            return
+
+        logger.info("🚀 No user detected, proceeding with workflow...")
+        # The workflow keeps watching and stops at its next checkpoint on override
+        if run_task_workflow() == OVERRIDE_RESULT:
+            logger.info("🛑 Manual override detected. Task stopped.")
 
     def shutdown(self):
         logger.info("Shutting down agent listeners")
@@ -0,0 +1,136 @@
+"""
+bench_cold_start.py - Cold-start regression check for the backend
+
+Measures, in fresh interpreters:
+
+* import time of main (the FastAPI app and everything it wires up), and
+  which heavy optional modules that import pulled in;
+* time to first request: spawning `uvicorn main:app` until GET /jobs answers.
+
+Heavy modules (PIL, httpx, pynput, xlsxwriter, uvicorn, multiprocessing) are
+only needed once a tool, model call or the server runner is used, so
+importing main must not load them. The check exits non-zero when one of them
+is loaded at import or a median exceeds its budget, so it can run in CI
+after dependency or import changes. Ollama is pointed at an unused port and
+warm-up, keep-alive and override detection are off, so no external service
+is involved.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 5] [--max-import-ms 1500]
+                                          [--max-ready-ms 4000] [--json out.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["PIL", "httpx", "pynput", "xlsxwriter", "uvicorn", "multiprocessing"]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"import_ms": elapsed * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_env():
+    return {
+        **os.environ,
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{free_port()}",
+        "OLLAMA_WARMUP": "false",
+        "OLLAMA_KEEPALIVE_INTERVAL": "0",
+        "OVERRIDE_DETECTION": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def measure_import(env):
+    result = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_ready(env, timeout=30.0):
+    """Seconds from spawning the server until it answers its first request"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode} before answering")
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/jobs")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+            finally:
+                connection.close()
+        raise RuntimeError(f"server did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=1500.0, help="budget for the median import of main")
+    parser.add_argument("--max-ready-ms", type=float, default=4000.0, help="budget for the median time to first request")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    env = server_env()
+    imports = [measure_import(env) for _ in range(args.runs)]
+    ready = [measure_ready(env) * 1000 for _ in range(args.runs)]
+    loaded = sorted({module for run in imports for module in run["loaded"]})
+    results = {
+        "import_ms": {"median": round(statistics.median(r["import_ms"] for r in imports), 1),
+                      "max": round(max(r["import_ms"] for r in imports), 1)},
+        "ready_ms": {"median": round(statistics.median(ready), 1), "max": round(max(ready), 1)},
+        "heavy_modules_loaded": loaded,
+    }
+
+    print(f"import main         median {results['import_ms']['median']} ms, max {results['import_ms']['max']} ms "
+          f"(budget {args.max_import_ms} ms)")
+    print(f"first request       median {results['ready_ms']['median']} ms, max {results['ready_ms']['max']} ms "
+          f"(budget {args.max_ready_ms} ms)")
+    print(f"heavy modules at import: {', '.join(loaded) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "json"}, "results": results}, f, indent=2)
+
+    failures = []
+    if loaded:
+        failures.append(f"importing main loaded {', '.join(loaded)}")
+    if results["import_ms"]["median"] > args.max_import_ms:
+        failures.append("import time over budget")
+    if results["ready_ms"]["median"] > args.max_ready_ms:
+        failures.append("time to first request over budget")
+    if failures:
+        print("REGRESSION: " + "; ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
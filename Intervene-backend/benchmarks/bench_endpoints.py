@@ -0,0 +1,137 @@
+"""
+bench_endpoints.py - Routing, failover and circuit breaking across several Ollama endpoints
+
+Starts local benchmarks/fake_ollama.py servers, each serving --slots
+generations at a time like a GPU, and drives --calls planning generations at
+--concurrency through ollama_pool.EndpointPool. Scenarios:
+
+* single: one endpoint, the baseline;
+* pool: --endpoints identical endpoints;
+* slow: the same, with one endpoint 4x slower than the rest;
+* flaky: one endpoint fails half of its calls (circuit breaker);
+* failover: one endpoint is killed a third of the way through the run.
+
+Reported per scenario: throughput, p50/p95 latency and errors seen by
+callers, then per endpoint: calls, errors, failovers, mean latency and the
+final circuit state.
+
+Usage:
+    python benchmarks/bench_endpoints.py [--endpoints 3] [--slots 2] [--calls 300] [--concurrency 12]
+                                         [--latency 0.1] [--token-rate 400] [--cooldown 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from bench_load import BACKEND_DIR, free_port, percentile, wait_for
+
+sys.path.insert(0, BACKEND_DIR)
+from ollama_client import OllamaClient, OllamaError  # noqa: E402
+from ollama_pool import Endpoint, EndpointPool, check_endpoint  # noqa: E402
+
+SCENARIOS = ["single", "pool", "slow", "flaky", "failover"]
+
+
+def start_fake(args, latency=None, failure_rate=0.0):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_ollama.py"), "--port", str(port),
+         "--latency", str(latency if latency is not None else args.latency), "--token-rate", str(args.token_rate),
+         "--failure-rate", str(failure_rate), "--max-concurrent", str(args.slots), "--seed", str(port)],
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def drive(args, pool, kill=None):
+    latencies, errors = [], 0
+    limit = asyncio.Semaphore(args.concurrency)
+    done = 0
+
+    async def one(n):
+        nonlocal errors, done
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await pool.generate("llama3.2", f"User request: compare prices for item {n}")
+            except OllamaError:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+            done += 1
+            if kill is not None and done == args.calls // 3:
+                kill()
+
+    async def health():
+        # Active checks, as the server runs them, at a benchmark-friendly interval
+        while True:
+            await asyncio.gather(*(check_endpoint(e, timeout=0.5) for e in pool.endpoints))
+            await asyncio.sleep(0.5)
+
+    checks = asyncio.create_task(health())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(args.calls)))
+    wall = time.perf_counter() - started
+    checks.cancel()
+    for endpoint in pool.endpoints:
+        await endpoint.client.aclose()
+    return {
+        "throughput": len(latencies) / wall,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "errors": errors,
+    }
+
+
+def run_scenario(args, name):
+    count = 1 if name == "single" else args.endpoints
+    fakes = []
+    for i in range(count):
+        latency = args.latency * 4 if name == "slow" and i == 0 else None
+        failure_rate = 0.5 if name == "flaky" and i == 0 else 0.0
+        fakes.append(start_fake(args, latency, failure_rate))
+    try:
+        for _, url in fakes:
+            wait_for(f"{url}/api/tags")
+        pool = EndpointPool([Endpoint(OllamaClient(url, timeout=30, connect_timeout=0.5), failure_threshold=3,
+                                      cooldown=args.cooldown) for _, url in fakes])
+        kill = (lambda: fakes[0][0].kill()) if name == "failover" else None
+        result = asyncio.run(drive(args, pool, kill))
+    finally:
+        for process, _ in fakes:
+            process.terminate()
+            process.wait()
+
+    print(f"{name:>9}  {result['throughput']:>7.1f} calls/s  p50 {result['p50'] * 1000:>6.0f} ms  "
+          f"p95 {result['p95'] * 1000:>6.0f} ms  caller errors {result['errors']}")
+    for stats in pool.stats():
+        print(f"{'':>11}{stats['url']:<24} calls {stats['requests']:>4}  errors {stats['errors']:>3}  "
+              f"failovers {stats['failovers']:>3}  mean {stats['mean_latency_ms']} ms  "
+              f"circuit {stats['state']}{'' if stats['healthy'] else ' (unhealthy)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", type=int, default=3)
+    parser.add_argument("--slots", type=int, default=2, help="generations each endpoint serves at once")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--token-rate", type=float, default=400)
+    parser.add_argument("--cooldown", type=float, default=5.0, help="seconds a tripped circuit stays open")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--verbose", action="store_true", help="show failover and circuit logs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    print(f"{args.calls} calls at concurrency {args.concurrency}, {args.slots} slots per endpoint, "
+          f"latency {args.latency}s")
+    for name in args.scenarios.split(","):
+        run_scenario(args, name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+bench_fast_planner.py - Correctness, hit rate and latency saved by the rule-based fast-path planner
+
+Three parts:
+
+* correctness: every request of CORPUS is planned by fast_planner's rules and
+  compared with the plan it must produce, or checked to fall back to the LLM
+  (None). Wrong plans and false positives are listed; with --check the script
+  exits non-zero when there are any, so the corpus doubles as a regression test;
+* matching cost: microseconds per request for the rules, and per browser
+  instruction for handle_browser_tool's former per-call re.search against
+  the shared precompiled patterns;
+* traffic: --requests plans through analyze_request_with_llm_async against
+  benchmarks/fake_ollama.py, --rule-share of them drawn from requests the
+  rules handle, with the fast path off and on (plan cache off). Reported:
+  LLM plans, fast-path hit rate, p50/p95/mean planning latency and the
+  planner's own estimate of the time saved.
+
+Usage:
+    python benchmarks/bench_fast_planner.py [--requests 200] [--concurrency 8] [--rule-share 0.5]
+                                            [--latency 0.05] [--token-rate 400] [--check]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_load import BACKEND_DIR, free_port, percentile, wait_for
+
+sys.path.insert(0, BACKEND_DIR)
+from fast_planner import FastPlanner, parse_browser_instruction  # noqa: E402
+
+
+def browser(instruction):
+    return {"type": "browser", "instruction": instruction}
+
+
+def sheet(headers, output_format=None):
+    step = {"type": "excel", "instruction": f"create a new spreadsheet with columns {', '.join(headers)}",
+            "headers": headers, "data": []}
+    if output_format:
+        step["format"] = output_format
+    return step
+
+
+# (request, the plan the rules must produce, or None when the LLM has to plan it)
+CORPUS = [
+    ("open https://news.ycombinator.com", [browser("open https://news.ycombinator.com")]),
+    ("Open https://www.python.org/downloads/", [browser("open https://www.python.org/downloads/")]),
+    ("please go to github.", [browser("open https://github.com")]),
+    ("navigate to wikipedia", [browser("open https://en.wikipedia.org")]),
+    ("visit example.com/docs", [browser("open https://example.com/docs")]),
+    ("open the Stack Overflow website", [browser("open https://stackoverflow.com")]),
+    ("search for 'usb c hub' on amazon", [browser("open https://www.amazon.com and search for 'usb c hub'")]),
+    ('Search for "LangChain" on Google', [browser("open https://www.google.com and search for 'LangChain'")]),
+    ("search youtube for lofi beats", [browser("open https://www.youtube.com and search for 'lofi beats'")]),
+    ("open amazon and search for standing desks",
+     [browser("open https://www.amazon.com and search for 'standing desks'")]),
+    ("go to ebay and search for 'vintage camera'",
+     [browser("open https://www.ebay.com and search for 'vintage camera'")]),
+    ("look up rust async traits on stack overflow",
+     [browser("open https://stackoverflow.com and search for 'rust async traits'")]),
+    ("google fastapi websockets", [browser("open https://www.google.com and search for 'fastapi websockets'")]),
+    ("search for cheap flights to Tokyo", [browser("open https://www.google.com and search for 'cheap flights to Tokyo'")]),
+    ("can you search for 'pydantic v2 migration'",
+     [browser("open https://www.google.com and search for 'pydantic v2 migration'")]),
+    ("make a spreadsheet with columns Name, Price, Rating", [sheet(["Name", "Price", "Rating"])]),
+    ("Create a new spreadsheet with columns Date, Amount and Category",
+     [sheet(["Date", "Amount", "Category"])]),
+    ("create an excel file with headers: Company, Role, Status as xlsx",
+     [sheet(["Company", "Role", "Status"], "xlsx")]),
+    ("make a sheet with the columns 'First name', 'Last name', 'Email' in csv",
+     [sheet(["First name", "Last name", "Email"], "csv")]),
+    ("search for laptops on amazon, then make a spreadsheet with columns Model, Price",
+     [browser("open https://www.amazon.com and search for 'laptops'"), sheet(["Model", "Price"])]),
+    ("open github; search for 'fastapi' on github",
+     [browser("open https://github.com"), browser("open https://github.com and search for 'fastapi'")]),
+    # Everything below needs the LLM
+    ("find the cheapest laptop on amazon and put it in a spreadsheet", None),
+    ("email my manager a summary of today's meetings", None),
+    ("search for laptops and headphones on amazon", None),
+    ("search for men's shoes", None),
+    ("compare prices of the iPhone 15 on amazon and ebay", None),
+    ("open google and tell me the weather", None),
+    ("make a spreadsheet of the top 10 python web frameworks", None),
+    ("search for flights, then email them to Sam", None),
+    ("summarize https://example.com/article into a spreadsheet with columns Point, Detail", None),
+    ("draft an email to the team about the release", None),
+    ("open amazon and buy a usb c hub", None),
+    ("open README.md", None),
+    ("load config.json", None),
+]
+
+# Requests the rules never handle, for the traffic part
+LLM_REQUESTS = [
+    "compare prices for item {n} and save them to a sheet",
+    "find reviews of product {n} and email a summary to my team",
+    "research vendor {n} and draft an email asking for a quote",
+]
+
+
+# handle_browser_tool before it shared the precompiled patterns
+def parse_per_call(instruction):
+    url_match = re.search(r'https?://[^\s"\']+', instruction)
+    search_match = re.search(r'search for ["\']([^"\']+)["\']', instruction, re.IGNORECASE)
+    return (url_match.group(0) if url_match else None, search_match.group(1) if search_match else None)
+
+
+def median_us(func, items, repeat):
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            started = time.perf_counter()
+            func(item)
+            samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def correctness(args):
+    planner = FastPlanner()
+    counts = {"correct plan": 0, "correct fallback": 0, "wrong plan": 0, "missed": 0, "false positive": 0}
+    problems = []
+    for request, expected in CORPUS:
+        matched = planner.match(request)
+        steps = matched[0] if matched else None
+        if expected is None:
+            kind = "correct fallback" if steps is None else "false positive"
+        elif steps is None:
+            kind = "missed"
+        else:
+            kind = "correct plan" if steps == expected else "wrong plan"
+        counts[kind] += 1
+        if kind in ("wrong plan", "missed", "false positive"):
+            problems.append((kind, request, steps))
+
+    print(f"correctness over {len(CORPUS)} requests ({sum(e is not None for _, e in CORPUS)} the rules must plan)")
+    for kind, count in counts.items():
+        print(f"{kind:>17} {count:>4}")
+    for kind, request, steps in problems:
+        print(f"  {kind}: {request!r} -> {steps}")
+    return counts["wrong plan"] + counts["false positive"]
+
+
+def matching_cost(args):
+    planner = FastPlanner()
+    instructions = [step["instruction"] for _, plan in CORPUS if plan for step in plan if step["type"] == "browser"]
+    requests = [request for request, _ in CORPUS]
+    print()
+    print("matching cost, median per call")
+    print(f"{'rules, per request':>40} {median_us(planner.match, requests, args.repeat):>8.1f} us")
+    print(f"{'browser instruction, re.search per call':>40} "
+          f"{median_us(parse_per_call, instructions, args.repeat):>8.2f} us")
+    print(f"{'browser instruction, precompiled':>40} "
+          f"{median_us(parse_browser_instruction, instructions, args.repeat):>8.2f} us")
+
+
+async def plan_all(args):
+    from llm_task_analyzer import PlanGenerationError, analyze_request_with_llm_async, planning_stats
+    from fast_planner import fast_planner
+
+    rng = random.Random(args.seed)
+    ruled = [request for request, plan in CORPUS if plan]
+    requests = [rng.choice(ruled) if rng.random() < args.rule_share else rng.choice(LLM_REQUESTS).format(n=n)
+                for n in range(args.requests)]
+    latencies, limit = [], asyncio.Semaphore(args.concurrency)
+
+    async def one(request):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await analyze_request_with_llm_async(request)
+            except PlanGenerationError:
+                return
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(request) for request in requests))
+    return {"llm_plans": planning_stats.stats()["plans"], "fast_path": fast_planner.stats(),
+            "latency_ms": {"p50": percentile(latencies, 50) * 1000, "p95": percentile(latencies, 95) * 1000,
+                           "mean": statistics.mean(latencies) * 1000}}
+
+
+def run_traffic(args, enabled, base_url):
+    env = {**os.environ, "FAST_PLANNER_ENABLED": str(enabled), "OLLAMA_BASE_URL": base_url,
+           "PLAN_CACHE_ENABLED": "false", "OLLAMA_KEEPALIVE_INTERVAL": "0",
+           "MODEL_MAX_QUEUE": str(max(1000, args.requests * 2))}
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--requests", str(args.requests),
+               "--concurrency", str(args.concurrency), "--rule-share", str(args.rule_share),
+               "--seed", str(args.seed)]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def traffic(args):
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_ollama.py"), "--port", str(port),
+         "--latency", str(args.latency), "--token-rate", str(args.token_rate), "--seed", str(args.seed)],
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/api/tags")
+        print(f"{args.requests} plans, {args.rule_share:.0%} of a shape the rules handle, "
+              f"concurrency {args.concurrency}")
+        print(f"{'fast path':>9} {'LLM plans':>10} {'hit rate':>9} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} "
+              f"{'saved s (est.)':>15}")
+        for enabled in (False, True):
+            result = run_traffic(args, enabled, f"http://127.0.0.1:{port}")
+            fast = result["fast_path"]
+            saved = fast["estimated_seconds_saved"]
+            print(f"{'on' if enabled else 'off':>9} {result['llm_plans']:>10} "
+                  f"{fast['hit_rate']:>9.0%} {result['latency_ms']['p50']:>8.1f} {result['latency_ms']['p95']:>8.1f} "
+                  f"{result['latency_ms']['mean']:>8.1f} {saved if saved is not None else 0:>15.1f}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rule-share", type=float, default=0.5, help="share of requests the rules can plan")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=400)
+    parser.add_argument("--repeat", type=int, default=200, help="passes over the corpus when timing matchers")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="only check the corpus; exit 1 on wrong plans")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(plan_all(args))))
+        return
+
+    failures = correctness(args)
+    if args.check:
+        sys.exit(1 if failures else 0)
+    matching_cost(args)
+    print()
+    traffic(args)
+
+
+if __name__ == "__main__":
+    main()
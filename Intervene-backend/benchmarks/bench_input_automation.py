@@ -0,0 +1,104 @@
+"""
+bench_input_automation.py - Per-action process spawning vs batched input backends
+
+Runs a typing-heavy step (key presses with a few pastes) three ways on any
+machine, using the recording backend so nothing touches the desktop:
+
+* legacy: one process per action, as press_key/paste_text used to do;
+* batched: the whole step compiled into one invocation;
+* helper: the batch written to an already running helper over a pipe.
+
+--command is the process spawned per invocation, standing in for osascript
+or powershell (whose startup is usually much slower than /bin/true). The
+recorded actions are checked against the input to confirm batching keeps
+their order.
+
+Usage:
+    python benchmarks/bench_input_automation.py [--keys 50] [--pastes 5] [--repeat 5] [--command /bin/true]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from input_automation import AppleScriptBackend, Paste, PowerShellBackend, RecordingBackend, parse_key  # noqa: E402
+
+KEYS = ["tab", "enter", "command+a", "command+c", "shift+tab", "a", "b", "c"]
+
+
+def build_step(keys, pastes):
+    actions = []
+    for i in range(keys):
+        actions.append(parse_key(KEYS[i % len(KEYS)]))
+        if pastes and i % max(1, keys // pastes) == 0 and sum(isinstance(a, Paste) for a in actions) < pastes:
+            actions.append(Paste(f"Pasted block {i} with \"quotes\" and\nnewlines"))
+    return actions
+
+
+class EmulatedHelper(RecordingBackend):
+    """Round-trips each batch through one long-lived shell, like the PowerShell helper"""
+
+    def __init__(self):
+        super().__init__(max_batches=None)
+        self.process = subprocess.Popen(["sh"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+    def run(self, actions):
+        self.process.stdin.write("echo done\n")
+        self.process.stdin.flush()
+        self.process.stdout.readline()
+        super().run(actions)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=50)
+    parser.add_argument("--pastes", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--command", default="/bin/true")
+    args = parser.parse_args()
+
+    actions = build_step(args.keys, args.pastes)
+    command = args.command.split()
+    legacy, batched = RecordingBackend(command, max_batches=None), RecordingBackend(command, max_batches=None)
+    helper = EmulatedHelper()
+
+    results = {
+        "legacy (per action)": timed(lambda: [legacy.run([action]) for action in actions], args.repeat),
+        "batched (one call)": timed(lambda: batched.run(actions), args.repeat),
+        "helper (pipe)": timed(lambda: helper.run(actions), args.repeat),
+    }
+    helper.close()
+    for backend in (legacy, batched, helper):
+        assert backend.actions[:len(actions)] == actions, "actions were reordered"
+
+    compile_cost = {
+        "applescript": timed(lambda: AppleScriptBackend().compile(actions), args.repeat),
+        "powershell": timed(lambda: PowerShellBackend().compile(actions), args.repeat),
+    }
+
+    print(f"{len(actions)} actions per step, spawning {args.command!r} per invocation")
+    print(f"{'backend':>22} {'ms/step':>10} {'ms/action':>10} {'invocations':>12}")
+    for (name, seconds), invocations in zip(results.items(), (len(actions), 1, 1)):
+        print(f"{name:>22} {seconds * 1000:>10.2f} {seconds * 1000 / len(actions):>10.3f} {invocations:>12}")
+    for name, seconds in compile_cost.items():
+        print(f"{'compile ' + name:>22} {seconds * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_journal.py - Per-step cost of the durable workflow journal
+
+Runs the same workload of no-op steps through JobScheduler without a
+journal, with the default batched journal, and with a journal that commits
+as soon as its writer wakes (--flush-interval 0, closest to a commit per
+step). Reported per configuration:
+
+* wall time per step and the overhead per step against no journal;
+* time spent recording on the event loop (mean per record call);
+* commits, rows per commit and commit latency on the writer thread;
+* durability lag: last step finished -> everything committed.
+
+After each journaled run the recorded runs are read back and checked
+against the scheduler's own view of the jobs.
+
+Usage:
+    python benchmarks/bench_journal.py [--jobs 200] [--steps 10] [--concurrency 8] [--step-delay 0]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from journal import WorkflowJournal  # noqa: E402
+from scheduler import COMPLETED, JobScheduler  # noqa: E402
+
+
+async def run_workload(args, journal):
+    async def run_step(job, index, step):
+        if args.step_delay:
+            await asyncio.sleep(args.step_delay)
+        return f"step {index} of {job.id}"
+
+    scheduler = JobScheduler(run_step, max_workers=args.concurrency, max_queue=args.jobs,
+                             max_parallel_steps=1, history_size=args.jobs, journal=journal)
+    await scheduler.start()
+    steps = [{"type": "browser", "instruction": f"open https://example.com/{i}"} for i in range(args.steps)]
+    started = time.perf_counter()
+    jobs = [scheduler.submit(steps, request=f"request {n}") for n in range(args.jobs)]
+    while not all(job.is_finished for job in jobs):
+        await asyncio.sleep(0.001)
+    wall = time.perf_counter() - started
+    durable_lag = None
+    if journal is not None:
+        flushed = time.perf_counter()
+        await asyncio.to_thread(journal.flush)
+        durable_lag = time.perf_counter() - flushed
+    await scheduler.stop()
+    assert all(job.status == COMPLETED for job in jobs), "jobs failed"
+    return jobs, wall, durable_lag
+
+
+def check(journal, jobs):
+    for job in jobs[:: max(1, len(jobs) // 20)]:
+        run = journal.get_run(job.id)
+        assert run["status"] == COMPLETED, run["status"]
+        assert [record["result"] for record in run["steps"]] == job.results, "results differ"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--step-delay", type=float, default=0.0, help="seconds each step awaits")
+    parser.add_argument("--flush-interval", type=float, default=0.05, help="batch window of the batched journal")
+    args = parser.parse_args()
+    total_steps = args.jobs * args.steps
+
+    directory = tempfile.mkdtemp(prefix="intervene-journal-")
+    configurations = [
+        ("no journal", None),
+        (f"batched ({args.flush_interval * 1000:g} ms)", args.flush_interval),
+        ("immediate (0 ms)", 0.0),
+    ]
+    print(f"{args.jobs} jobs x {args.steps} steps, {args.concurrency} concurrent jobs, step delay {args.step_delay}s")
+    print(f"{'configuration':>20} {'us/step':>9} {'overhead':>9} {'record us':>10} {'commits':>8} "
+          f"{'rows/commit':>12} {'commit ms':>10} {'durable lag ms':>15}")
+    baseline = None
+    for name, flush_interval in configurations:
+        journal = None
+        if flush_interval is not None:
+            journal = WorkflowJournal(os.path.join(directory, f"{flush_interval}.sqlite3"),
+                                      flush_interval=flush_interval, max_runs=args.jobs)
+        jobs, wall, durable_lag = asyncio.run(run_workload(args, journal))
+        per_step = wall / total_steps * 1e6
+        if baseline is None:
+            baseline = per_step
+            print(f"{name:>20} {per_step:>9.1f} {'-':>9}")
+            continue
+        check(journal, jobs)
+        stats = journal.stats()
+        journal.close()
+        print(f"{name:>20} {per_step:>9.1f} {per_step - baseline:>+9.1f} {stats['mean_record_us']:>10} "
+              f"{stats['commits']:>8} {stats['mean_rows_per_commit']:>12} {stats['mean_commit_ms']:>10} "
+              f"{durable_lag * 1000:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
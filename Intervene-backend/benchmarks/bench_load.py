@@ -0,0 +1,300 @@
+"""
+bench_load.py - End-to-end load and latency benchmark against a fake Ollama
+
+Starts benchmarks/fake_ollama.py and main:app as subprocesses on free
+loopback ports. Caches, override detection and keep-alive pings are turned
+off so every request does the same work. Each scenario runs a warm-up batch,
+then a fixed number of requests at a fixed concurrency, while --ws-clients
+WebSocket clients listen on /step-updates. Reported per scenario:
+
+* throughput and p50/p95/p99 HTTP latency (errors are counted separately);
+* event-delivery lag: request sent -> each client receiving each of that
+  job's step updates (p50/p95/p99 over all clients and events);
+* event-loop blocking inside the server, from the lag probe exported on
+  /metrics (total seconds blocked and the p99 probe delay).
+
+Request texts and injected failures are seeded, so runs with the same
+arguments are comparable; --json saves results and --compare prints the
+change against a saved run.
+
+Usage:
+    python benchmarks/bench_load.py [--requests 200] [--concurrency 16] [--ws-clients 50]
+                                    [--latency 0.2] [--token-rate 200] [--failure-rate 0]
+                                    [--scenarios steps,run_request,run_request_stream,tool_call]
+                                    [--json out.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["steps", "run_request", "run_request_stream", "tool_call"]
+STEPS_PER_JOB = 3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def parse_loop_lag(text):
+    """Sum, count and cumulative buckets of the event-loop lag histogram"""
+    buckets, total, count = {}, 0.0, 0
+    for line in text.splitlines():
+        if line.startswith("intervene_event_loop_lag_seconds_bucket"):
+            bound = re.search(r'le="([^"]+)"', line).group(1)
+            buckets[float("inf") if bound == "+Inf" else float(bound)] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("intervene_event_loop_lag_seconds_sum"):
+            total = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("intervene_event_loop_lag_seconds_count"):
+            count = float(line.rsplit(" ", 1)[1])
+    return total, count, buckets
+
+
+def loop_lag_delta(before, after):
+    total = after[0] - before[0]
+    count = after[1] - before[1]
+    p99 = None
+    if count:
+        for bound in sorted(after[2]):
+            if after[2][bound] - before[2].get(bound, 0) >= 0.99 * count:
+                p99 = bound
+                break
+    return {"blocked_seconds": round(total, 4), "probes": int(count), "p99_probe_delay": p99}
+
+
+class Listener:
+    """One /step-updates client recording when each job's events arrive"""
+
+    def __init__(self, url):
+        self.url = url
+        self.arrivals = defaultdict(list)
+        self.task = None
+
+    async def start(self):
+        import websockets
+
+        self.connection = await websockets.connect(self.url, max_queue=None)
+        self.task = asyncio.create_task(self._receive())
+
+    async def _receive(self):
+        async for message in self.connection:
+            event = json.loads(message)
+            if "jobId" in event:
+                self.arrivals[event["jobId"]].append(time.perf_counter())
+
+    async def stop(self):
+        self.task.cancel()
+        await self.connection.close()
+
+
+async def run_scenario(name, client, base_url, args, listeners, image_path, sequence):
+    latencies, sent_at, errors = [], {}, 0
+
+    def payload():
+        n = next(sequence)
+        if name == "steps":
+            return "/steps", {"steps": [{"type": "browser", "instruction": f"open https://example.com/{n}/{i}"}
+                                        for i in range(STEPS_PER_JOB)]}
+        if name == "run_request":
+            return "/run_request", {"request": f"find prices for item {n}"}
+        if name == "run_request_stream":
+            return "/run_request", {"request": f"find prices for item {n}", "stream": True}
+        if n % 2:
+            return "/tool_call", {"tool_name": "vision_analyze", "parameters": {"screenshot_path": image_path}}
+        return "/tool_call", {"tool_name": "browser", "parameters": {"instruction": f"open https://example.com/{n}"}}
+
+    async def one(record):
+        nonlocal errors
+        path, body = payload()
+        started = time.perf_counter()
+        try:
+            response = await client.post(base_url + path, json=body)
+            result = response.json()
+        except (httpx.HTTPError, ValueError):
+            errors += record
+            return
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200 or not result.get("success", False):
+            errors += record
+            return
+        if record:
+            latencies.append(elapsed)
+            if "job_id" in result:
+                sent_at[result["job_id"]] = started
+
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def limited(record):
+        async with limit:
+            await one(record)
+
+    await asyncio.gather(*(limited(False) for _ in range(args.warmup)))
+    before = parse_loop_lag((await client.get(base_url + "/metrics")).text)
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(True) for _ in range(args.requests)))
+    wall = time.perf_counter() - started
+    # Let the last jobs finish and their updates reach every client
+    await asyncio.sleep(args.drain)
+    after = parse_loop_lag((await client.get(base_url + "/metrics")).text)
+
+    lags = [
+        arrival - sent_at[job_id]
+        for listener in listeners
+        for job_id, arrivals in listener.arrivals.items() if job_id in sent_at
+        for arrival in arrivals
+    ]
+    for listener in listeners:
+        listener.arrivals.clear()
+
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 2) if latencies else None for p in (50, 95, 99)},
+        "delivery_lag_ms": {f"p{p}": round(percentile(lags, p) * 1000, 2) if lags else None for p in (50, 95, 99)},
+        "events_delivered": len(lags),
+        "event_loop": loop_lag_delta(before, after),
+    }
+
+
+async def drive(args, base_url, image_path):
+    listeners = [Listener(base_url.replace("http", "ws", 1) + "/step-updates") for _ in range(args.ws_clients)]
+    for listener in listeners:
+        await listener.start()
+    sequence = iter(range(10**9))
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        for name in args.scenarios:
+            results[name] = await run_scenario(name, client, base_url, args, listeners, image_path, sequence)
+            print_result(name, results[name])
+    for listener in listeners:
+        await listener.stop()
+    return results
+
+
+def print_result(name, result):
+    latency, lag, loop = result["latency_ms"], result["delivery_lag_ms"], result["event_loop"]
+    print(f"{name:>20}  {result['throughput_rps']:>8} req/s  errors {result['errors']:<4} "
+          f"latency p50/p95/p99 {latency['p50']}/{latency['p95']}/{latency['p99']} ms  "
+          f"delivery p50/p95/p99 {lag['p50']}/{lag['p95']}/{lag['p99']} ms ({result['events_delivered']} events)  "
+          f"loop blocked {loop['blocked_seconds']}s, p99 probe delay <= {loop['p99_probe_delay']}s")
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nChange against {baseline_path} (negative latency is better):")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        changes = []
+        for metric in ("latency_ms", "delivery_lag_ms"):
+            for p in ("p50", "p95", "p99"):
+                if result[metric][p] and old[metric][p]:
+                    changes.append(f"{metric.split('_')[0]} {p} {100 * (result[metric][p] / old[metric][p] - 1):+.1f}%")
+        if result["throughput_rps"] and old["throughput_rps"]:
+            changes.append(f"throughput {100 * (result['throughput_rps'] / old['throughput_rps'] - 1):+.1f}%")
+        print(f"{name:>20}  " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--ws-clients", type=int, default=50)
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for trailing updates")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the backend, e.g. MODEL_MAX_CONCURRENT=4")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file written by --json")
+    args = parser.parse_args()
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+
+    ollama_port, backend_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+        "PLAN_CACHE_ENABLED": "false",
+        "VISION_CACHE_ENABLED": "false",
+        "OVERRIDE_DETECTION": "false",
+        "OLLAMA_KEEPALIVE_INTERVAL": "0",
+        "SCHEDULER_QUEUE_SIZE": str(max(1000, args.requests * 2)),
+        "MODEL_MAX_QUEUE": str(max(1000, args.requests * 2)),
+    }
+    env.update(item.split("=", 1) for item in args.server_env)
+
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_ollama.py"), "--port", str(ollama_port),
+         "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+         "--failure-rate", str(args.failure_rate), "--plan-steps", str(STEPS_PER_JOB), "--seed", str(args.seed)],
+    )
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    image = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+    try:
+        from PIL import Image
+
+        Image.new("RGB", (1920, 1080), (240, 240, 240)).save(image.name)
+        wait_for(f"http://127.0.0.1:{ollama_port}/api/tags")
+        wait_for(f"http://127.0.0.1:{backend_port}/jobs")
+        print(f"{args.requests} requests per scenario, concurrency {args.concurrency}, "
+              f"{args.ws_clients} WebSocket clients, model latency {args.latency}s, "
+              f"{args.token_rate} tokens/s, failure rate {args.failure_rate}")
+        results = asyncio.run(drive(args, f"http://127.0.0.1:{backend_port}", image.name))
+    finally:
+        backend.terminate()
+        fake.terminate()
+        backend.wait()
+        fake.wait()
+        os.unlink(image.name)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("json", "compare")},
+                       "results": results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
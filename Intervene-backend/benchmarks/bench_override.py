@@ -0,0 +1,142 @@
+"""
+bench_override.py - Override detector callback cost and input-to-abort latency
+
+Two measurements, both without a real input backend:
+
+* callback overhead: ns per on_mouse_move call while armed (sub-threshold
+  jitter), right after a trigger (coalesced) and for the old one-line
+  callback, under a synthetic burst of motion events;
+* abort latency: a feeder thread emits motion events at --rate Hz while
+  jobs run on a JobScheduler (an async step and a blocking step in a worker
+  thread); the time from the triggering event to every job having stopped
+  is measured over --trials runs against the 100ms target.
+
+Usage:
+    python benchmarks/bench_override.py [--events N] [--rate HZ] [--trials N]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from listener import OverrideDetector  # noqa: E402
+from scheduler import JobScheduler  # noqa: E402
+from tool_executor import ToolExecutor  # noqa: E402
+from waiting import wait_until  # noqa: E402
+
+TARGET_MS = 100
+
+
+class LegacyDetector:
+    def __init__(self):
+        self.override = False
+
+    def on_mouse_move(self, x, y):
+        self.override = True
+
+
+def callback_cost(callback, events):
+    started = time.perf_counter_ns()
+    for i in range(events):
+        callback(i & 1, 0)
+    return (time.perf_counter_ns() - started) / events
+
+
+def bench_callbacks(events):
+    armed = OverrideDetector(min_move=10**9)
+    triggered = OverrideDetector()
+    triggered.event.set()
+    print(f"{'callback':>22} {'ns/event':>10}")
+    for name, callback in [("legacy attribute set", LegacyDetector().on_mouse_move),
+                           ("armed (jitter)", armed.on_mouse_move),
+                           ("triggered (coalesced)", triggered.on_mouse_move)]:
+        print(f"{name:>22} {callback_cost(callback, events):>10.0f}")
+
+
+def blocking_step(detector, stopped):
+    with detector.watch() as cancelled:
+        # A handler waiting on an application that never becomes ready
+        wait_until(lambda: False, timeout=30, name="bench_blocking", cancel_event=cancelled)
+    stopped.append(time.perf_counter())
+    return "stopped"
+
+
+async def abort_trial(detector, rate):
+    tools = ToolExecutor(thread_workers=4, default_timeout=60)
+    stopped = []
+    tools.register("blocking", lambda: blocking_step(detector, stopped))
+
+    async def run_step(job, index, step):
+        if step["type"] == "blocking":
+            return await tools.run("blocking")
+        await asyncio.sleep(30)
+
+    scheduler = JobScheduler(run_step, max_workers=4, max_queue=8, max_parallel_steps=2, history_size=8)
+    await scheduler.start()
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def abort(triggered_at):
+        tasks = scheduler.cancel_running()
+
+        async def settle():
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # The blocking handler stops on its own once it sees the token
+            while not stopped:
+                await asyncio.sleep(0.001)
+            done.set_result(max(time.perf_counter(), stopped[0]) - triggered_at)
+
+        asyncio.create_task(settle())
+
+    detector.reset()
+    detector.add_observer(lambda t: loop.call_soon_threadsafe(abort, t))
+    scheduler.submit([{"type": "async", "depends_on": []}, {"type": "blocking", "depends_on": []}])
+    await asyncio.sleep(0.05)
+
+    stop_feed = threading.Event()
+
+    def feed():
+        interval = 1.0 / rate
+        x = 0
+        while not stop_feed.is_set():
+            x += 1
+            detector.on_mouse_move(x, 0)
+            time.sleep(interval)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    latency = await asyncio.wait_for(done, 10)
+    stop_feed.set()
+    feeder.join()
+    detector._observers.clear()
+    await scheduler.stop()
+    tools.shutdown()
+    return latency * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--trials", type=int, default=20)
+    args = parser.parse_args()
+
+    bench_callbacks(args.events)
+
+    latencies = []
+    for _ in range(args.trials):
+        # A fresh detector per trial so the debounce window never carries over
+        latencies.append(asyncio.run(abort_trial(OverrideDetector(debounce=0), args.rate)))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"\ninput-to-abort over {args.trials} trials at {args.rate:.0f} events/s: "
+          f"median {statistics.median(latencies):.1f}ms, p95 {p95:.1f}ms, max {latencies[-1]:.1f}ms "
+          f"({'within' if latencies[-1] < TARGET_MS else 'OVER'} the {TARGET_MS}ms target)")
+
+
+if __name__ == "__main__":
+    main()
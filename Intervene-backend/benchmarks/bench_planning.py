@@ -0,0 +1,103 @@
+"""
+bench_planning.py - Wasted generations and tokens per plan for each PLAN_FORMAT
+
+Starts benchmarks/fake_ollama.py with --invalid-rate of unconstrained plans
+breaking the step schema, then plans the same seeded requests once per
+PLAN_FORMAT ("none", "json", "schema"), each in a fresh process with the plan
+cache off. Reported per format:
+
+* plans that passed validation as generated, needed a local fix (prose or
+  broken JSON around the array), needed a repair generation, or failed;
+* generations and output tokens per plan (repairs included);
+* p50/p95 planning latency.
+
+Usage:
+    python benchmarks/bench_planning.py [--requests 100] [--concurrency 8] [--invalid-rate 0.2]
+                                        [--latency 0.05] [--token-rate 400] [--plan-steps 3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench_load import BACKEND_DIR, free_port, percentile, wait_for
+
+FORMATS = ["none", "json", "schema"]
+
+
+async def plan_all(args):
+    sys.path.insert(0, BACKEND_DIR)
+    from llm_task_analyzer import PlanGenerationError, analyze_request_with_llm_async, planning_stats
+
+    latencies, limit = [], asyncio.Semaphore(args.concurrency)
+
+    async def one(n):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await analyze_request_with_llm_async(f"compare prices for item {n} and save them to a sheet")
+            except PlanGenerationError:
+                return
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(n) for n in range(args.requests)))
+    return {**planning_stats.stats(), "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1)
+                                                     if latencies else None for p in (50, 95)}}
+
+
+def run_format(args, fmt, base_url):
+    env = {**os.environ, "PLAN_FORMAT": fmt, "OLLAMA_BASE_URL": base_url, "PLAN_CACHE_ENABLED": "false",
+           "OLLAMA_KEEPALIVE_INTERVAL": "0", "MODEL_MAX_QUEUE": str(max(1000, args.requests * 2))}
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--requests", str(args.requests),
+               "--concurrency", str(args.concurrency)]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--invalid-rate", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=400)
+    parser.add_argument("--plan-steps", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(plan_all(args))))
+        return
+
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_ollama.py"), "--port", str(port),
+         "--latency", str(args.latency), "--token-rate", str(args.token_rate),
+         "--invalid-rate", str(args.invalid_rate), "--plan-steps", str(args.plan_steps), "--seed", str(args.seed)],
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/api/tags")
+        print(f"{args.requests} plans of {args.plan_steps} steps per format, concurrency {args.concurrency}, "
+              f"{args.invalid_rate:.0%} of unconstrained plans break the schema")
+        print(f"{'format':>8} {'valid':>6} {'local fix':>10} {'repaired':>9} {'failed':>7} "
+              f"{'failure rate':>13} {'gens/plan':>10} {'out tok/plan':>13} {'p50 ms':>8} {'p95 ms':>8}")
+        for fmt in args.formats.split(","):
+            result = run_format(args, fmt, f"http://127.0.0.1:{port}")
+            outcomes = result["outcomes"]
+            print(f"{fmt:>8} {outcomes['valid']:>6} {outcomes['repaired_locally']:>10} "
+                  f"{outcomes['repaired_by_model']:>9} {outcomes['failed']:>7} "
+                  f"{result['parse_failure_rate']:>13.1%} {result['generations_per_plan']:>10.2f} "
+                  f"{result['output_tokens_per_plan']:>13.1f} {result['latency_ms']['p50']:>8} "
+                  f"{result['latency_ms']['p95']:>8}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == "__main__":
+    main()
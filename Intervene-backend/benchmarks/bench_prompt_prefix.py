@@ -0,0 +1,138 @@
+"""
+bench_prompt_prefix.py - Time to first token and prompt evaluation per planning call
+
+Plans the same seeded requests against a fresh benchmarks/fake_ollama.py
+with its prompt cache modelled (--prompt-rate, --parallel slots), once per
+layout, each in a fresh process with the plan cache off:
+
+* single prompt: instructions and request formatted into one prompt, repairs
+  sent without the instructions (PLAN_PREFIX_REUSE=false);
+* system prefix: instructions as a fixed system prompt for plans and repairs;
+* system prefix + warm-up: as above, with the prefix primed at startup.
+
+Reported per layout: time to first token of the first plan and mean over
+the rest, prompt tokens evaluated per generation (tokens served from the
+cache are not evaluated), mean prompt-evaluation time, and p50/p95 plan
+latency. --invalid-rate with --format json (the default) makes some plans
+need a repair generation in between.
+
+Usage:
+    python benchmarks/bench_prompt_prefix.py [--requests 60] [--concurrency 2] [--parallel 2]
+                                             [--prompt-rate 300] [--format json] [--invalid-rate 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench_load import BACKEND_DIR, free_port, percentile, wait_for
+
+LAYOUTS = [
+    ("single prompt", {"PLAN_PREFIX_REUSE": "false", "PLAN_PREFIX_WARMUP": "false"}),
+    ("system prefix", {"PLAN_PREFIX_REUSE": "true", "PLAN_PREFIX_WARMUP": "false"}),
+    ("system prefix + warm-up", {"PLAN_PREFIX_REUSE": "true", "PLAN_PREFIX_WARMUP": "true"}),
+]
+
+
+async def plan_all(args):
+    sys.path.insert(0, BACKEND_DIR)
+    from config import PLAN_PREFIX_WARMUP
+    from llm_task_analyzer import PlanGenerationError, analyze_request_with_llm_async, prime_planner
+    from model_registry import LLM, get_model
+
+    stats = get_model(LLM).stats
+    if PLAN_PREFIX_WARMUP:
+        await prime_planner(args.concurrency)
+    # Priming is startup work; only planning calls are measured
+    primed = stats.snapshot()
+    latencies, limit = [], asyncio.Semaphore(args.concurrency)
+
+    async def one(n):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await analyze_request_with_llm_async(f"compare prices for item {n} and save them to a sheet")
+            except PlanGenerationError:
+                return
+            latencies.append(time.perf_counter() - started)
+
+    await one(0)
+    first = stats.snapshot()
+    await asyncio.gather(*(one(n) for n in range(1, args.requests)))
+    last = stats.snapshot()
+
+    def ttft_total(snapshot):
+        return (snapshot["mean_time_to_first_token"] or 0) * snapshot["first_token_calls"]
+
+    def mean_ttft(since, until):
+        calls = until["first_token_calls"] - since["first_token_calls"]
+        return round((ttft_total(until) - ttft_total(since)) / calls * 1000, 1) if calls else None
+
+    generations = last["first_token_calls"] - primed["first_token_calls"]
+    return {
+        "first_ttft_ms": mean_ttft(primed, first),
+        "ttft_ms": mean_ttft(first, last),
+        "generations": generations,
+        "prompt_tokens_per_generation": round((last["prompt_tokens_evaluated"] - primed["prompt_tokens_evaluated"])
+                                              / generations, 1),
+        "prompt_eval_ms": round((last["prompt_eval_seconds"] - primed["prompt_eval_seconds"]) / generations * 1000, 1),
+        "primed_tokens": primed["prompt_tokens_evaluated"],
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) if latencies else None for p in (50, 95)},
+    }
+
+
+def run_layout(args, layout_env):
+    port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "benchmarks", "fake_ollama.py"), "--port", str(port),
+         "--latency", str(args.latency), "--token-rate", str(args.token_rate), "--prompt-rate", str(args.prompt_rate),
+         "--parallel", str(args.parallel), "--invalid-rate", str(args.invalid_rate), "--seed", str(args.seed)],
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/api/tags")
+        env = {**os.environ, **layout_env, "PLAN_FORMAT": args.format, "OLLAMA_BASE_URL": f"http://127.0.0.1:{port}",
+               "PLAN_CACHE_ENABLED": "false", "OLLAMA_KEEPALIVE_INTERVAL": "0",
+               "MODEL_MAX_CONCURRENT": str(args.concurrency), "MODEL_MAX_QUEUE": str(max(1000, args.requests * 2))}
+        command = [sys.executable, os.path.abspath(__file__), "--worker", "--requests", str(args.requests),
+                   "--concurrency", str(args.concurrency)]
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--parallel", type=int, default=2, help="prompt-cache slots of the fake model")
+    parser.add_argument("--prompt-rate", type=float, default=300, help="prompt tokens evaluated per second")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--token-rate", type=float, default=400)
+    parser.add_argument("--format", default="json", choices=["schema", "json", "none"])
+    parser.add_argument("--invalid-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(plan_all(args))))
+        return
+
+    print(f"{args.requests} plans, concurrency {args.concurrency}, {args.parallel} cache slots, "
+          f"{args.prompt_rate:g} prompt tokens/s, format {args.format}, invalid rate {args.invalid_rate:.0%}")
+    print(f"{'layout':>24} {'first TTFT ms':>14} {'TTFT ms':>8} {'prompt tok/gen':>15} {'prompt eval ms':>15} "
+          f"{'primed tok':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, layout_env in LAYOUTS:
+        result = run_layout(args, layout_env)
+        print(f"{name:>24} {result['first_ttft_ms']:>14} {result['ttft_ms']:>8} "
+              f"{result['prompt_tokens_per_generation']:>15} {result['prompt_eval_ms']:>15} "
+              f"{result['primed_tokens']:>11} {result['latency_ms']['p50']:>8} {result['latency_ms']['p95']:>8}")
+
+
+if __name__ == "__main__":
+    main()
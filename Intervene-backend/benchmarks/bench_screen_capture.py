@@ -0,0 +1,175 @@
+"""
+bench_screen_capture.py - Frame acquisition latency and vision upload size with the capture ring
+
+Replays a synthetic desktop through screen_buffer.ScreenCapture, with a grab
+that costs --grab-ms like a real full-screen capture, and compares:
+
+* frame acquisition: grabbing on demand (the path without background
+  capture), copying the latest frame out of the ring, a zero-copy view of it,
+  and the same zero-copy read from a second process attached by name;
+* background cost per captured frame: grab, then diff and write into the ring;
+* per activity (idle, typing, a dialog opening, scrolling), what screen
+  analysis sends the vision model: the full frame every time, or only the
+  regions that changed since the previous analysis (pixels and encoded
+  bytes per analysis, and how many analyses needed no upload at all).
+
+Usage:
+    python benchmarks/bench_screen_capture.py [--width 1920] [--height 1080] [--grab-ms 60]
+                                              [--frames 60] [--repeat 50]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from PIL import ImageDraw
+
+from bench_load import BACKEND_DIR
+
+sys.path.insert(0, BACKEND_DIR)
+from bench_vision_pipeline import synthetic_screen  # noqa: E402
+from config import SCREEN_REGION_MAX_AREA  # noqa: E402
+from screen_buffer import ScreenCapture  # noqa: E402
+from vision_analyzer import encode_image  # noqa: E402
+
+ACTIVITIES = ["idle", "typing", "dialog", "scrolling"]
+
+READER = """
+import sys, time
+sys.path.insert(0, {backend!r})
+from screen_buffer import FrameRing
+ring = FrameRing.attach({name!r})
+samples = []
+for _ in range({repeat}):
+    started = time.perf_counter()
+    frame = ring.latest(copy=False)
+    frame.image.getpixel((0, 0))
+    samples.append(time.perf_counter() - started)
+    del frame
+ring.close()
+samples.sort()
+print(samples[len(samples) // 2])
+"""
+
+
+class Desktop:
+    """Renders successive frames of one activity on top of a static desktop"""
+
+    def __init__(self, size, activity):
+        self.base = synthetic_screen(size)
+        self.activity = activity
+        self.step = 0
+
+    def grab(self):
+        image = self.base.copy()
+        width, height = image.size
+        draw = ImageDraw.Draw(image)
+        if self.activity == "typing":
+            draw.text((60, height - 30), "Draft: " + "x" * self.step, fill=(0, 0, 0))
+        elif self.activity == "dialog" and self.step >= 5:
+            draw.rectangle([width // 3, height // 3, 2 * width // 3, 2 * height // 3], fill=(250, 250, 250),
+                           outline=(90, 90, 90))
+            draw.text((width // 3 + 20, height // 3 + 20), f"Save changes? {self.step}", fill=(0, 0, 0))
+        elif self.activity == "scrolling":
+            image.paste(self.base.crop((0, 22 * self.step % 200, width, height)), (0, 0))
+        self.step += 1
+        return image
+
+
+def median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def acquisition(args):
+    desktop = Desktop((args.width, args.height), "typing")
+
+    def grab_on_demand():
+        time.sleep(args.grab_ms / 1000)
+        return desktop.grab()
+
+    capture = ScreenCapture(fps=1000, frames=8, max_side=0, grab=grab_on_demand)
+    for _ in range(3):
+        capture.capture_once()
+    ring = capture.ring
+
+    def view():
+        frame = ring.latest(copy=False)
+        frame.image.getpixel((0, 0))
+
+    rows = [
+        ("grab on demand", median_ms(grab_on_demand, max(5, args.repeat // 10))),
+        ("ring, copy", median_ms(ring.latest, args.repeat)),
+        ("ring, zero-copy", median_ms(view, args.repeat)),
+    ]
+    output = subprocess.run([sys.executable, "-c", READER.format(backend=BACKEND_DIR, name=ring.name,
+                                                                 repeat=args.repeat)],
+                            check=True, capture_output=True, text=True).stdout
+    rows.append(("other process, zero-copy", float(output) * 1000))
+    stats = capture.stats()
+    capture.stop()
+
+    print(f"frame acquisition at {args.width}x{args.height} ({args.grab_ms:g} ms grab)")
+    for label, ms in rows:
+        print(f"{label:>26} {ms:>9.3f} ms")
+    print(f"{'background, per frame':>26} {stats['mean_capture_ms']:>9.1f} ms grab + "
+          f"{stats['mean_store_ms']:.1f} ms diff and write")
+
+
+def uploads(args, activity):
+    desktop = Desktop((args.width, args.height), activity)
+    capture = ScreenCapture(fps=1000, frames=8, max_side=0, grab=desktop.grab)
+    full_pixels = full_bytes = delta_pixels = delta_bytes = unchanged = 0
+    area = args.width * args.height
+    last_seq = None
+    try:
+        for _ in range(args.frames):
+            seq = capture.capture_once()
+            frame = capture.ring.frame(seq)
+            full_pixels += area
+            full_bytes += len(encode_image(frame.image))
+            regions = capture.changed_regions(last_seq, seq) if last_seq is not None else None
+            changed = sum((b[2] - b[0]) * (b[3] - b[1]) for b in regions or ())
+            if regions == []:
+                unchanged += 1
+            elif regions is None or changed > SCREEN_REGION_MAX_AREA * area:
+                delta_pixels += area
+                delta_bytes += len(encode_image(frame.image))
+            else:
+                delta_pixels += changed
+                delta_bytes += sum(len(encode_image(frame.image.crop(box))) for box in regions)
+            last_seq = seq
+        stats = capture.stats()
+    finally:
+        capture.stop()
+    n = args.frames
+    print(f"{activity:>10} {full_pixels / n / 1e3:>10.0f}K {full_bytes / n / 1024:>9.0f}KB "
+          f"{delta_pixels / n / 1e3:>10.0f}K {delta_bytes / n / 1024:>9.1f}KB {unchanged:>10} "
+          f"{stats['mean_changed_tiles']:>13.1f} {stats['mean_store_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--grab-ms", type=float, default=60, help="cost of one full-screen grab")
+    parser.add_argument("--frames", type=int, default=60, help="frames analyzed per activity")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    acquisition(args)
+    print()
+    print(f"vision uploads per analysis, {args.frames} consecutive frames per activity")
+    print(f"{'activity':>10} {'full px':>11} {'full':>11} {'delta px':>11} {'delta':>11} {'no upload':>10} "
+          f"{'changed tiles':>13} {'store ms':>9}")
+    for activity in ACTIVITIES:
+        uploads(args, activity)
+
+
+if __name__ == "__main__":
+    main()
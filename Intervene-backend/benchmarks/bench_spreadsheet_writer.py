@@ -0,0 +1,90 @@
+"""
+bench_spreadsheet_writer.py - Rows/sec and peak RSS of the spreadsheet writers
+
+Each case runs in a fresh process so peak RSS reflects that case alone. Rows
+come from a generator, as a scraper would produce them; the "legacy" case
+reproduces the old join-based writer, which needs the full list in memory.
+
+Usage:
+    python benchmarks/bench_spreadsheet_writer.py [--max-rows N] [--formats csv,xlsx]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spreadsheet_writer import write_spreadsheet  # noqa: E402
+
+ROW_COUNTS = [1_000, 10_000, 100_000, 1_000_000]
+HEADERS = ["Title", "Description", "URL", "Price"]
+
+
+def generate_rows(count):
+    for i in range(count):
+        yield [f"Result {i}", f'Scraped text with "quotes", commas and\nnewlines #{i}',
+               f"https://example.com/item/{i}", i * 0.25]
+
+
+def legacy_write(path, rows, headers):
+    data = list(rows)
+    with open(path, "w") as f:
+        f.write(",".join(headers) + "\n")
+        for row in data:
+            f.write(",".join(str(cell) for cell in row) + "\n")
+    return len(data)
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def run_case(output_format, count, result_queue):
+    baseline = peak_rss_mb()
+    suffix = "csv" if output_format == "legacy" else output_format
+    with tempfile.NamedTemporaryFile(suffix=f".{suffix}", delete=False) as f:
+        path = f.name
+    try:
+        started = time.perf_counter()
+        if output_format == "legacy":
+            written = legacy_write(path, generate_rows(count), HEADERS)
+        else:
+            written = write_spreadsheet(path, generate_rows(count), HEADERS, output_format=output_format)
+        elapsed = time.perf_counter() - started
+        result_queue.put((written, elapsed, peak_rss_mb() - baseline, os.path.getsize(path)))
+    except Exception as e:
+        result_queue.put(e)
+    finally:
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-rows", type=int, default=ROW_COUNTS[-1])
+    parser.add_argument("--formats", default="legacy,csv,xlsx")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'format':>8} {'rows':>10} {'seconds':>9} {'rows/sec':>12} {'peak RSS +':>11} {'file':>10}")
+    for output_format in args.formats.split(","):
+        for count in (n for n in ROW_COUNTS if n <= args.max_rows):
+            result_queue = context.Queue()
+            process = context.Process(target=run_case, args=(output_format, count, result_queue))
+            process.start()
+            result = result_queue.get()
+            process.join()
+            if isinstance(result, Exception):
+                print(f"{output_format:>8} {count:>10} skipped: {result}")
+                break
+            written, elapsed, rss, size = result
+            print(f"{output_format:>8} {written:>10} {elapsed:>9.2f} {written / elapsed:>12,.0f} "
+                  f"{rss:>9.1f}MB {size / 1_048_576:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
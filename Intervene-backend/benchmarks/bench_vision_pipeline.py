@@ -0,0 +1,134 @@
+"""
+bench_vision_pipeline.py - Capture -> encode -> upload latency per resolution and format
+
+Compares the legacy path (lossless PNG written to a temp file, read back and
+base64-encoded) with the in-memory path used by vision_analyzer.encode_image.
+Uploads go to a loopback HTTP sink, so the numbers isolate client-side cost
+from model inference.
+
+Usage:
+    python benchmarks/bench_vision_pipeline.py [--repeat N] [--live]
+"""
+import argparse
+import base64
+import http.server
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vision_analyzer import encode_image  # noqa: E402
+
+RESOLUTIONS = [(1280, 800), (1920, 1080), (2560, 1600), (3024, 1964), (5120, 2880)]
+VARIANTS = [
+    # (label, format, max_side, quality)
+    ("png-full", "PNG", 0, None),
+    ("jpeg-full", "JPEG", 0, 80),
+    ("jpeg-1024", "JPEG", 1024, 80),
+    ("jpeg-672", "JPEG", 672, 80),
+    ("webp-1024", "WEBP", 1024, 75),
+]
+
+
+class _SinkHandler(http.server.BaseHTTPRequestHandler):
+    """Accepts a POST body and discards it"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_sink():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/generate"
+
+
+def synthetic_screen(size):
+    """Draw a desktop-like frame: flat panels, window chrome and lines of text"""
+    image = Image.new("RGB", size, (236, 236, 236))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.rectangle([0, 0, width, 28], fill=(210, 210, 210))
+    draw.rectangle([40, 60, width - 40, height - 40], fill=(255, 255, 255), outline=(180, 180, 180))
+    for row, y in enumerate(range(90, height - 60, 22)):
+        draw.text((60, y), f"Row {row}: quarterly report cell values 12,345.67 lorem ipsum", fill=(30, 30, 30))
+        draw.line([(50, y + 18), (width - 50, y + 18)], fill=(230, 230, 230))
+    return image
+
+
+def legacy_encode(image):
+    """Baseline: lossless PNG to a temp file, read back and base64-encode"""
+    temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+    try:
+        image.save(temp_file.name)
+        with open(temp_file.name, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    finally:
+        temp_file.close()
+        os.unlink(temp_file.name)
+
+
+def time_ms(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="capture the real screen with ImageGrab")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server, url = start_sink()
+    client = httpx.Client()
+    if args.live:
+        from PIL import ImageGrab
+        frames = [ImageGrab.grab()]
+        capture = ImageGrab.grab
+    else:
+        frames = [synthetic_screen(size) for size in RESOLUTIONS]
+        capture = None
+
+    print(f"{'resolution':>12} {'variant':>12} {'capture':>9} {'encode':>9} {'upload':>9} {'total':>9} {'payload':>10}")
+    for frame in frames:
+        resolution = f"{frame.size[0]}x{frame.size[1]}"
+        cases = [("legacy-disk", lambda img: legacy_encode(img))] + [
+            (label, lambda img, f=fmt, m=max_side, q=quality: encode_image(img, max_side=m, image_format=f, quality=q))
+            for label, fmt, max_side, quality in VARIANTS
+        ]
+        for label, encode in cases:
+            capture_ms, encode_ms, upload_ms, payload = [], [], [], 0
+            for _ in range(args.repeat):
+                elapsed, image = time_ms(capture or frame.copy)
+                capture_ms.append(elapsed)
+                elapsed, encoded = time_ms(lambda: encode(image))
+                encode_ms.append(elapsed)
+                payload = len(encoded)
+                elapsed, _ = time_ms(lambda: client.post(url, json={"model": "llava", "images": [encoded]}))
+                upload_ms.append(elapsed)
+            cap, enc, upload = (statistics.median(v) for v in (capture_ms, encode_ms, upload_ms))
+            print(f"{resolution:>12} {label:>12} {cap:>8.1f}ms {enc:>8.1f}ms {upload:>8.1f}ms "
+                  f"{cap + enc + upload:>8.1f}ms {payload / 1024:>8.0f}KB")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+bench_workers.py - Throughput and cross-worker consistency of main:app with several worker processes
+
+For each --workers count, starts `uvicorn main:app --workers N` (STATE_BACKEND
+"local" for one worker unless --backend sqlite, "sqlite" otherwise, with a
+fresh state database) and drives it with --load-procs client processes
+submitting 3-step browser workflows to POST /steps over --concurrency
+connections, while --ws-clients legacy clients listen on /step-updates
+(each connection lands on whichever worker accepts it). Reported per count:
+
+* throughput and p50/p99 submit latency, and the speed-up over the first count;
+* delivered: share of (client, job, step message) updates that reached each
+  client, whichever worker ran the job;
+* resolved: share of GET /jobs/{id} lookups, over fresh connections, that
+  found the job, whichever worker answered;
+* mean publish-to-delivery lag reported by the shared state backend.
+
+Scaling needs at least as many free cores as workers plus load processes.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--requests 2000] [--concurrency 64]
+                                       [--ws-clients 20] [--load-procs 2] [--backend auto]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench_load import BACKEND_DIR, free_port, percentile, wait_for
+
+STEPS = 3
+
+
+async def load(args):
+    """One load process: submit its share of workflows and report latencies and job ids"""
+    latencies, jobs, errors = [], [], 0
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one(n):
+            nonlocal errors
+            body = {"steps": [{"type": "browser", "instruction": f"open https://example.com/{args.offset + n}/{i}"}
+                              for i in range(STEPS)]}
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    result = (await client.post(args.url + "/steps", json=body)).json()
+                except (httpx.HTTPError, ValueError):
+                    errors += 1
+                    return
+                if not result.get("success"):
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+                jobs.append(result["job_id"])
+
+        await asyncio.gather(*(one(n) for n in range(args.requests)))
+    return {"latencies": latencies, "jobs": jobs, "errors": errors}
+
+
+class Listener:
+    """One legacy /step-updates client counting messages per job"""
+
+    def __init__(self, url):
+        self.url = url
+        self.messages = defaultdict(int)
+
+    async def start(self):
+        import websockets
+
+        self.connection = await websockets.connect(self.url, max_queue=None)
+        self.task = asyncio.create_task(self._receive())
+
+    async def _receive(self):
+        async for message in self.connection:
+            event = json.loads(message)
+            if "jobId" in event:
+                self.messages[event["jobId"]] += 1
+
+    async def stop(self):
+        self.task.cancel()
+        await self.connection.close()
+
+
+async def measure(args, url):
+    listeners = [Listener(url.replace("http", "ws", 1) + "/step-updates") for _ in range(args.ws_clients)]
+    for listener in listeners:
+        await listener.start()
+
+    share = args.requests // args.load_procs
+    commands = [[sys.executable, os.path.abspath(__file__), "--load", "--url", url, "--requests", str(share),
+                 "--concurrency", str(max(1, args.concurrency // args.load_procs)), "--offset", str(n * share)]
+                for n in range(args.load_procs)]
+    started = time.perf_counter()
+    procs = [await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE) for command in commands]
+    outputs = [json.loads((await proc.communicate())[0].decode().strip().splitlines()[-1]) for proc in procs]
+    wall = time.perf_counter() - started
+
+    latencies = [latency for output in outputs for latency in output["latencies"]]
+    jobs = [job for output in outputs for job in output["jobs"]]
+    errors = sum(output["errors"] for output in outputs)
+
+    # Let the queued workflows finish and their updates reach every client
+    deadline = time.monotonic() + args.drain
+    expected = len(jobs) * STEPS * 2
+    while time.monotonic() < deadline:
+        if all(sum(listener.messages[job] for job in jobs) >= expected for listener in listeners):
+            break
+        await asyncio.sleep(0.2)
+    delivered = sum(min(listener.messages[job], STEPS * 2) for listener in listeners for job in jobs)
+    for listener in listeners:
+        await listener.stop()
+
+    # Fresh connections, so the lookups spread over the workers
+    resolved, lags = 0, []
+    sample = jobs[:: max(1, len(jobs) // 200)]
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_keepalive_connections=0)) as client:
+        for job in sample:
+            response = await client.get(f"{url}/jobs/{job}")
+            resolved += response.status_code == 200 and response.json().get("job_id") == job
+        for _ in range(4 * len(args.workers)):
+            state = (await client.get(f"{url}/state")).json()
+            if state.get("mean_delivery_lag_ms") is not None:
+                lags.append(state["mean_delivery_lag_ms"])
+
+    return {
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": (percentile(latencies, 50) or 0) * 1000,
+        "p99_ms": (percentile(latencies, 99) or 0) * 1000,
+        "errors": errors,
+        "delivered": delivered / (expected * len(listeners)) if expected and listeners else None,
+        "resolved": resolved / len(sample) if sample else None,
+        "lag_ms": sum(lags) / len(lags) if lags else None,
+    }
+
+
+def run(args, workers):
+    backend = args.backend if args.backend != "auto" else ("sqlite" if workers > 1 else "local")
+    port = free_port()
+    state_dir = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        "STATE_BACKEND": backend,
+        "STATE_PATH": os.path.join(state_dir, "state.sqlite3"),
+        "JOURNAL_PATH": os.path.join(state_dir, "journal.sqlite3"),
+        "PLAN_CACHE_ENABLED": "false",
+        "OVERRIDE_DETECTION": "false",
+        "OLLAMA_WARMUP": "false",
+        "OLLAMA_KEEPALIVE_INTERVAL": "0",
+        "OLLAMA_HEALTH_INTERVAL": "0",
+        "SCHEDULER_QUEUE_SIZE": str(max(1000, args.requests * 2)),
+        # Every submitted job stays queryable, so lookups measure consistency rather than retention
+        "SCHEDULER_HISTORY_SIZE": str(args.requests),
+        "STATE_MAX_JOBS": str(args.requests),
+        # Listeners must not lose updates to the slow-client policy
+        "WS_QUEUE_SIZE": str(max(1000, args.requests * STEPS * 2)),
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for(f"http://127.0.0.1:{port}/jobs")
+        # Every worker has to be up before clients connect
+        time.sleep(1.0 + 0.5 * workers)
+        return backend, asyncio.run(measure(args, f"http://127.0.0.1:{port}"))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--ws-clients", type=int, default=20)
+    parser.add_argument("--load-procs", type=int, default=2)
+    parser.add_argument("--backend", default="auto", choices=["auto", "local", "sqlite"],
+                        help="state backend (auto: local for one worker, sqlite for more)")
+    parser.add_argument("--drain", type=float, default=30.0, help="longest wait for trailing updates")
+    parser.add_argument("--load", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--offset", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        print(json.dumps(asyncio.run(load(args))))
+        return
+
+    args.workers = [int(n) for n in args.workers.split(",") if n]
+    print(f"{args.requests} workflows of {STEPS} steps, concurrency {args.concurrency} over {args.load_procs} "
+          f"load processes, {args.ws_clients} WebSocket clients, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'backend':>7} {'req/s':>8} {'speed-up':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} "
+          f"{'delivered':>9} {'resolved':>8} {'lag ms':>7}")
+    baseline = None
+    for workers in args.workers:
+        backend, result = run(args, workers)
+        baseline = baseline or result["throughput_rps"]
+        lag = f"{result['lag_ms']:.1f}" if result["lag_ms"] is not None else "-"
+        print(f"{workers:>7} {backend:>7} {result['throughput_rps']:>8.1f} "
+              f"{result['throughput_rps'] / baseline if baseline else 0:>7.2f}x {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['errors']:>6} {result['delivered']:>9.1%} "
+              f"{result['resolved']:>8.1%} {lag:>7}")
+
+
+if __name__ == "__main__":
+    main()
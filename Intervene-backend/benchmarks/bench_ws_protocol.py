@@ -0,0 +1,122 @@
+"""
+bench_ws_protocol.py - Bytes and serialization CPU per workflow for each /step-updates protocol
+
+Drives broadcaster.Broadcaster in-process with --subscribers in-memory
+WebSockets, all on one protocol at a time, while --workflows workflows of
+--steps steps each publish their updates the way main.run_step and the
+scheduler do (step durations are seeded and random, up to --step-ms).
+Protocols:
+
+* legacy: one JSON message per step transition, as existing clients expect;
+* v2-json: coalesced job-state deltas as JSON text;
+* v2-msgpack: the same deltas as MessagePack (skipped without msgpack).
+
+Reported per protocol, per client and workflow: frames and bytes received;
+then, for the whole run, time spent serializing and process CPU time of the
+fan-out (publishing, encoding and every client's sender).
+
+Usage:
+    python benchmarks/bench_ws_protocol.py [--subscribers 200] [--workflows 50] [--steps 5]
+                                           [--step-ms 40] [--window-ms 20]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from bench_load import BACKEND_DIR
+
+sys.path.insert(0, BACKEND_DIR)
+from broadcaster import Broadcaster  # noqa: E402
+from update_protocol import LEGACY, V2, JSON, MSGPACK, msgpack_available  # noqa: E402
+
+PROTOCOLS = [("legacy", LEGACY, JSON), ("v2-json", V2, JSON), ("v2-msgpack", V2, MSGPACK)]
+
+
+class MemorySocket:
+    """Counts what a client would receive"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send_text(self, text):
+        self.frames += 1
+        self.bytes += len(text.encode())
+
+    async def send_bytes(self, data):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def close(self, code=1000):
+        pass
+
+
+async def workflow(broadcaster, n, args, rng):
+    job = f"{n:032x}"
+    broadcaster.publish({"job": job, "status": "running"})
+    for index in range(args.steps):
+        instruction = f"open https://www.example-shop.com and search for 'usb-c hub model {n}-{index}'"
+        broadcaster.publish({"job": job, "step": index, "state": "running",
+                             "message": f"Started step {index + 1}: {instruction}"})
+        await asyncio.sleep(rng.uniform(0, args.step_ms / 1000))
+        result = f"Opened https://www.example-shop.com and searched for 'usb-c hub model {n}-{index}'"
+        broadcaster.publish({"job": job, "step": index, "state": "done", "result": result,
+                             "message": f"Completed step {index + 1}: {result}"})
+    broadcaster.publish({"job": job, "status": "completed"})
+
+
+async def run(args, version, encoding):
+    broadcaster = Broadcaster(queue_size=10000, replay_size=256, coalesce_window=args.window_ms / 1000)
+    sockets = [MemorySocket() for _ in range(args.subscribers)]
+    subscribers = [broadcaster.subscribe(s, version=version, encoding=encoding) for s in sockets]
+    await asyncio.sleep(0.05)
+    # The hello and initial frames are per connection, not per workflow
+    baseline = [(s.frames, s.bytes) for s in sockets]
+
+    rng = random.Random(args.seed)
+    cpu = time.process_time()
+    encode_before = broadcaster.encode_seconds
+    await asyncio.gather(*(workflow(broadcaster, n, args, rng) for n in range(args.workflows)))
+    await asyncio.sleep(args.window_ms / 1000 * 2 + 0.05)
+    while any(not s.queue.empty() for s in subscribers):
+        await asyncio.sleep(0.01)
+    cpu = time.process_time() - cpu
+
+    frames = sum(s.frames - f for s, (f, _) in zip(sockets, baseline))
+    sent = sum(s.bytes - b for s, (_, b) in zip(sockets, baseline))
+    await broadcaster.close()
+    per = args.subscribers * args.workflows
+    return {
+        "frames": frames / per,
+        "bytes": sent / per,
+        "encode_ms": (broadcaster.encode_seconds - encode_before) * 1000,
+        "cpu_s": cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=200)
+    parser.add_argument("--workflows", type=int, default=50)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--step-ms", type=float, default=40, help="longest step duration")
+    parser.add_argument("--window-ms", type=float, default=20, help="coalescing window (WS_COALESCE_WINDOW)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.workflows} concurrent workflows of {args.steps} steps, {args.subscribers} subscribers, "
+          f"{args.window_ms:g} ms coalescing window")
+    print(f"{'protocol':>11} {'frames/wf':>10} {'bytes/wf':>9} {'encode ms':>10} {'CPU s':>7}")
+    for name, version, encoding in PROTOCOLS:
+        if encoding == MSGPACK and not msgpack_available():
+            print(f"{name:>11}  skipped (pip install msgpack)")
+            continue
+        result = asyncio.run(run(args, version, encoding))
+        print(f"{name:>11} {result['frames']:>10.2f} {result['bytes']:>9.0f} {result['encode_ms']:>10.1f} "
+              f"{result['cpu_s']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+fake_ollama.py - Local stand-in for the Ollama /api/generate endpoint
+
+Serves deterministic plans and vision answers with configurable latency,
+token rate and failure injection, so benchmarks measure the backend rather
+than a real model. Failures are drawn from a seeded generator, so two runs
+with the same settings see the same sequence of errors.
+
+Plans follow the request's "format" like a real model would: with a JSON
+schema the output is compact and always valid; with "json" it is compact
+but --invalid-rate of plans break the step schema; without a format it is
+wrapped in prose and a fenced, indented block and may also break the
+schema. Repair prompts are always answered with a valid plan.
+
+With --prompt-rate, prompt evaluation is modelled like Ollama's prompt
+cache: each of --parallel slots keeps the last prompt it evaluated (system
+prompt first), a call reuses the slot sharing the longest prefix and only
+the tokens after that prefix are evaluated and counted.
+
+Usage:
+    python benchmarks/fake_ollama.py [--port 11435] [--latency 0.2] [--token-rate 50]
+                                     [--failure-rate 0] [--invalid-rate 0] [--plan-steps 3] [--seed 1]
+                                     [--prompt-rate 0] [--parallel 1] [--max-concurrent 0]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Ollama counts roughly one token per four characters of English
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class FakeOllamaSettings:
+    latency: float = 0.2          # seconds before the first token (load + prompt eval)
+    token_rate: float = 50.0      # generated tokens per second; 0 means instant
+    failure_rate: float = 0.0     # fraction of calls answered with HTTP 500
+    plan_steps: int = 3           # browser steps in every generated plan
+    seed: int = 1
+    invalid_rate: float = 0.0     # fraction of unconstrained plans that break the step schema
+    prompt_rate: float = 0.0      # prompt tokens evaluated per second; 0 leaves it all to latency
+    parallel: int = 1             # prompt-cache slots, like OLLAMA_NUM_PARALLEL
+    max_concurrent: int = 0       # generations served at once, others wait; 0 means unlimited
+
+
+def build_plan(steps: int, invalid: bool = False) -> list:
+    plan = [
+        {"type": "browser", "instruction": f"open https://example.com/{i} and search for 'item {i}'"}
+        for i in range(steps)
+    ]
+    if invalid:
+        # The usual slips: a missing field and a made-up step type
+        del plan[0]["instruction"]
+        plan[-1]["type"] = "search"
+    return plan
+
+
+def render_plan(plan: list, fmt) -> str:
+    if fmt:
+        return json.dumps(plan, separators=(",", ":"))
+    return ("Here is the plan for your request:\n```json\n" + json.dumps(plan, indent=2)
+            + "\n```\nLet me know if you need anything else.")
+
+
+def split_tokens(text: str):
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+def create_app(settings: FakeOllamaSettings) -> FastAPI:
+    app = FastAPI(title="Fake Ollama")
+    failures = random.Random(settings.seed)
+    invalid = random.Random(settings.seed + 1)
+    app.state.settings = settings
+    app.state.calls = 0
+    app.state.failed = 0
+    app.state.invalid = 0
+    app.state.prompt_tokens = 0
+    app.state.cached_tokens = 0
+    generating = asyncio.Semaphore(settings.max_concurrent) if settings.max_concurrent else None
+    # Per model, the last prompt each slot evaluated
+    prompt_cache = {}
+
+    def evaluate(body) -> int:
+        """Prompt tokens left to evaluate after the best-matching slot's cached prefix"""
+        slots = prompt_cache.setdefault(body.get("model"), [""] * max(1, settings.parallel))
+        text = body["prompt"]
+        if body.get("system"):
+            text = body["system"] + "\n" + text
+        best = max(range(len(slots)), key=lambda i: len(os.path.commonprefix([slots[i], text])))
+        cached = len(os.path.commonprefix([slots[best], text]))
+        slots[best] = text
+        evaluated = math.ceil((len(text) - cached) / CHARS_PER_TOKEN)
+        app.state.prompt_tokens += evaluated
+        app.state.cached_tokens += cached // CHARS_PER_TOKEN
+        return evaluated
+
+    def plan_text(body) -> str:
+        fmt = body.get("format")
+        broken = (not isinstance(fmt, dict) and "Problems:" not in body["prompt"]
+                  and invalid.random() < settings.invalid_rate)
+        app.state.invalid += broken
+        return render_plan(build_plan(settings.plan_steps, broken), fmt)
+
+    def timings(tokens: int, started: float, prompt_tokens: int, prompt_seconds: float):
+        eval_seconds = tokens / settings.token_rate if settings.token_rate else 0.0
+        return {
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+        }
+
+    @asynccontextmanager
+    async def generation_slot():
+        """Like a GPU with a fixed number of slots: extra generations queue here"""
+        if generating is None:
+            yield
+            return
+        async with generating:
+            yield
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        started = time.perf_counter()
+        if failures.random() < settings.failure_rate:
+            app.state.failed += 1
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+
+        prompt = body.get("prompt", "")
+        if not prompt:
+            # Warm-up / keep-alive probe: nothing to generate
+            return {"model": body.get("model"), "response": "", "done": True, "load_duration": 0}
+        text = "A browser window showing a search results page." if body.get("images") else plan_text(body)
+        tokens = split_tokens(text)[:(body.get("options") or {}).get("num_predict") or None]
+        per_token = 1.0 / settings.token_rate if settings.token_rate else 0.0
+        prompt_tokens = evaluate(body)
+        prompt_seconds = settings.latency + (prompt_tokens / settings.prompt_rate if settings.prompt_rate else 0.0)
+
+        if not body.get("stream", True):
+            async with generation_slot():
+                await asyncio.sleep(prompt_seconds + per_token * len(tokens))
+            return {"model": body.get("model"), "response": "".join(tokens), "done": True,
+                    **timings(len(tokens), started, prompt_tokens, prompt_seconds)}
+
+        async def stream():
+            async with generation_slot():
+                await asyncio.sleep(prompt_seconds)
+                for token in tokens:
+                    yield json.dumps({"model": body.get("model"), "response": token, "done": False}) + "\n"
+                    if per_token:
+                        await asyncio.sleep(per_token)
+            yield json.dumps({"model": body.get("model"), "response": "", "done": True,
+                              **timings(len(tokens), started, prompt_tokens, prompt_seconds)}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": []}
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": app.state.calls, "failed": app.state.failed, "invalid": app.state.invalid,
+                "prompt_tokens": app.state.prompt_tokens, "cached_prompt_tokens": app.state.cached_tokens}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=FakeOllamaSettings.latency)
+    parser.add_argument("--token-rate", type=float, default=FakeOllamaSettings.token_rate)
+    parser.add_argument("--failure-rate", type=float, default=FakeOllamaSettings.failure_rate)
+    parser.add_argument("--invalid-rate", type=float, default=FakeOllamaSettings.invalid_rate,
+                        help="fraction of plans generated without a schema that break it")
+    parser.add_argument("--prompt-rate", type=float, default=FakeOllamaSettings.prompt_rate,
+                        help="prompt tokens evaluated per second (0: prompt cost is part of --latency)")
+    parser.add_argument("--parallel", type=int, default=FakeOllamaSettings.parallel, help="prompt-cache slots")
+    parser.add_argument("--max-concurrent", type=int, default=FakeOllamaSettings.max_concurrent,
+                        help="generations served at once (0: unlimited)")
+    parser.add_argument("--plan-steps", type=int, default=FakeOllamaSettings.plan_steps)
+    parser.add_argument("--seed", type=int, default=FakeOllamaSettings.seed)
+    args = parser.parse_args()
+
+    settings = FakeOllamaSettings(args.latency, args.token_rate, args.failure_rate, args.plan_steps, args.seed,
+                                  args.invalid_rate, args.prompt_rate, args.parallel, args.max_concurrent)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
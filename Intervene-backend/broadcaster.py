@@ -0,0 +1,304 @@
+"""
+broadcaster.py - Non-blocking WebSocket fan-out with per-client queues, coalescing and replay
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+
+from metrics import STAGE_SECONDS
+from update_protocol import LEGACY, V2, JSON, FINISHED, JobStates, Payload, delta_frame, encode, legacy_message
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+
+class Subscriber:
+    """One connected client with its own bounded outbound queue and sender task"""
+
+    def __init__(self, websocket, queue_size: int, version: int = LEGACY, encoding: str = JSON):
+        self.websocket = websocket
+        self.version = version
+        self.encoding = encoding
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.closed = False
+        # Sequence number of the newest event this client has been sent
+        self.sent_seq = 0
+
+    def offer(self, payload: Payload, seq: int) -> bool:
+        """Queue an encoded frame without waiting; returns False when the queue is full"""
+        try:
+            self.queue.put_nowait((payload, time.perf_counter(), seq))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def clear(self):
+        """Discard every queued frame"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class Broadcaster:
+    """
+    Publishes step and job events to all subscribers without awaiting any of them.
+
+    Every event gets a monotonically increasing ``seq`` and is kept in a replay
+    buffer of the last ``replay_size`` events. Each subscriber has its own
+    queue drained by its own task, so a slow client only ever delays itself.
+
+    Legacy clients get one JSON message per step event, as before. Version 2
+    clients (see update_protocol) get state deltas: events published within
+    ``coalesce_window`` seconds are merged into one frame per encoding, which
+    is serialized once and shared by every client using that encoding.
+
+    When a subscriber's queue is full, the ``slow_policy`` either disconnects
+    it or drops frames: a legacy client loses its oldest queued message, a
+    version 2 client has its queue replaced by one frame that catches it up.
+    """
+
+    def __init__(self, queue_size: int = 100, replay_size: int = 256,
+                 slow_policy: str = DROP_OLDEST, send_timeout: float = 5.0, coalesce_window: float = 0.02):
+        if slow_policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Unknown slow client policy: {slow_policy}")
+        self.queue_size = queue_size
+        self.slow_policy = slow_policy
+        self.send_timeout = send_timeout
+        self.coalesce_window = coalesce_window
+        self.seq = 0
+        self.replay: deque = deque(maxlen=replay_size)
+        self.states = JobStates(max_finished=replay_size)
+        self.subscribers: Set[Subscriber] = set()
+        self.dropped_events = 0
+        self.disconnected_clients = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._pending_events = 0
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self.frames = {LEGACY: 0, V2: 0}
+        self.bytes_sent = {LEGACY: 0, V2: 0}
+        self.coalesced_events = 0
+        self.encode_seconds = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self.subscribers)
+
+    def publish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stamp an event with the next sequence number and queue it for every subscriber
+
+        Args:
+            event (dict): {"job": id, "step": index, "state": step status,
+                "result": ..., "message": legacy text} for a step, or
+                {"job": id, "status": job status, "steps": {index: status}} for a job;
+                only events with a "message" reach legacy clients. An event
+                that already has a "seq" (assigned by a shared state backend,
+                the same on every worker) keeps it
+
+        Returns:
+            dict: The event including its "seq"
+        """
+        self.seq = event["seq"] if event.get("seq") is not None else self.seq + 1
+        event = {**event, "seq": self.seq}
+        self.replay.append(event)
+        self.states.apply(event)
+
+        legacy = [s for s in self.subscribers if s.version == LEGACY]
+        message = legacy_message(event) if legacy else None
+        if message is not None:
+            payload = self._encode(message, JSON)
+            for subscriber in legacy:
+                self._deliver(subscriber, payload, self.seq)
+
+        if any(s.version == V2 for s in self.subscribers):
+            JobStates.merge(self._pending, event)
+            self._pending_events += 1
+            if self._flush_handle is None:
+                loop = asyncio.get_running_loop()
+                self._flush_handle = (loop.call_later(self.coalesce_window, self._flush) if self.coalesce_window > 0
+                                      else loop.call_soon(self._flush))
+        return event
+
+    def _flush(self):
+        """Send the events of the current coalescing window as one delta frame"""
+        self._flush_handle = None
+        if not self._pending:
+            return
+        frame = delta_frame(self.seq, self._pending)
+        self.coalesced_events += self._pending_events - 1
+        self._pending = {}
+        self._pending_events = 0
+        payloads: Dict[str, Payload] = {}
+        for subscriber in [s for s in self.subscribers if s.version == V2]:
+            if subscriber.encoding not in payloads:
+                payloads[subscriber.encoding] = self._encode(frame, subscriber.encoding)
+            self._deliver(subscriber, payloads[subscriber.encoding], self.seq)
+
+    def _encode(self, message: Any, encoding: str) -> Payload:
+        started = time.perf_counter()
+        payload = encode(message, encoding)
+        self.encode_seconds += time.perf_counter() - started
+        return payload
+
+    def _deliver(self, subscriber: Subscriber, payload: Payload, seq: int):
+        if subscriber.offer(payload, seq):
+            return
+        if self.slow_policy == DISCONNECT:
+            logger.warning("Disconnecting slow WebSocket client")
+            self.disconnected_clients += 1
+            self._drop(subscriber)
+            return
+        subscriber.dropped += 1
+        self.dropped_events += 1
+        if subscriber.version == V2:
+            # Deltas cannot be skipped: replace the backlog with one catch-up frame
+            subscriber.clear()
+            subscriber.offer(self._encode(self._catch_up(subscriber.sent_seq), subscriber.encoding), self.seq)
+            return
+        # Drop the oldest queued message to make room for the newest
+        try:
+            subscriber.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        subscriber.offer(payload, seq)
+
+    def events_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Return buffered events with a sequence number greater than seq"""
+        return [event for event in self.replay if event["seq"] > seq]
+
+    def _replay_gap(self, since: int) -> bool:
+        """Whether events after since have already left the replay buffer"""
+        return bool(self.replay) and self.replay[0]["seq"] > since + 1
+
+    def _catch_up(self, since: int) -> Dict[str, Any]:
+        """One version 2 frame with every change after since (full job states if the buffer lost some)"""
+        if self._replay_gap(since):
+            return delta_frame(self.seq, self.states.snapshot(), gap=True)
+        delta: Dict[str, Dict[str, Any]] = {}
+        for event in self.events_since(since):
+            JobStates.merge(delta, event)
+        return delta_frame(self.seq, delta)
+
+    def subscribe(self, websocket, since: Optional[int] = None,
+                  initial: Optional[List[Dict[str, Any]]] = None,
+                  version: int = LEGACY, encoding: str = JSON) -> Subscriber:
+        """
+        Register an accepted WebSocket and start its sender
+
+        Args:
+            websocket: The accepted WebSocket
+            since (int): Replay buffered events after this sequence number
+            initial (list): Legacy messages sent to this client only, before anything else
+                (version 2 clients get the state of unfinished jobs instead)
+            version (int): update_protocol.LEGACY or V2
+            encoding (str): update_protocol.JSON or MSGPACK (version 2 only)
+
+        Returns:
+            Subscriber: The registered subscriber
+        """
+        subscriber = Subscriber(websocket, self.queue_size, version, encoding)
+        if version == V2:
+            # The hello is always JSON text; binary frames that follow are MessagePack
+            hello = {"v": V2, "seq": self.seq, "hello": {"encoding": encoding,
+                                                         "coalesceMs": round(self.coalesce_window * 1000)}}
+            subscriber.offer(self._encode(hello, JSON), self.seq)
+            if since is None:
+                active = [job for job, state in self.states.jobs.items()
+                          if state.get("status") not in FINISHED]
+                frame = delta_frame(self.seq, self.states.snapshot(active))
+            else:
+                frame = self._catch_up(since)
+            if frame["jobs"] or frame.get("gap"):
+                subscriber.offer(self._encode(frame, encoding), self.seq)
+        else:
+            backlog = list(initial or [])
+            if since is not None:
+                if self._replay_gap(since):
+                    # Part of the requested history has already left the buffer
+                    backlog.append({"replayGap": True, "oldestSeq": self.replay[0]["seq"]})
+                backlog.extend(m for m in map(legacy_message, self.events_since(since)) if m is not None)
+            for message in backlog[-self.queue_size:]:
+                subscriber.offer(self._encode(message, JSON), message.get("seq", self.seq))
+        # A version 2 client that overflows before its first frames went out catches up from scratch
+        subscriber.sent_seq = (since or 0) if version == V2 else self.seq
+        self.subscribers.add(subscriber)
+        subscriber.sender = asyncio.create_task(self._send_loop(subscriber))
+        return subscriber
+
+    def replay_to(self, subscriber: Subscriber, since: int):
+        """Queue buffered events after since for a subscriber already connected"""
+        if subscriber.version == V2:
+            self._deliver(subscriber, self._encode(self._catch_up(since), subscriber.encoding), self.seq)
+            return
+        for message in map(legacy_message, self.events_since(since)):
+            if message is not None and not subscriber.offer(self._encode(message, JSON), message["seq"]):
+                break
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        """Stop a subscriber's sender and forget it"""
+        self.subscribers.discard(subscriber)
+        subscriber.closed = True
+        if subscriber.sender is not None and subscriber.sender is not asyncio.current_task():
+            subscriber.sender.cancel()
+            await asyncio.gather(subscriber.sender, return_exceptions=True)
+
+    async def close(self):
+        """Disconnect every subscriber"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for subscriber in list(self.subscribers):
+            await self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        """Clients, frames and bytes per protocol version, coalescing and serialization cost"""
+        return {
+            "clients": {"legacy": sum(s.version == LEGACY for s in self.subscribers),
+                        "v2": sum(s.version == V2 for s in self.subscribers)},
+            "frames": {"legacy": self.frames[LEGACY], "v2": self.frames[V2]},
+            "bytes": {"legacy": self.bytes_sent[LEGACY], "v2": self.bytes_sent[V2]},
+            "events": self.seq,
+            "coalesced_events": self.coalesced_events,
+            "encode_seconds": round(self.encode_seconds, 6),
+            "dropped_events": self.dropped_events,
+            "disconnected_clients": self.disconnected_clients,
+        }
+
+    def _drop(self, subscriber: Subscriber):
+        """Forget a subscriber and close its socket in the background"""
+        self.subscribers.discard(subscriber)
+        subscriber.closed = True
+        if subscriber.sender is not None and subscriber.sender is not asyncio.current_task():
+            subscriber.sender.cancel()
+        asyncio.ensure_future(self._close_socket(subscriber))
+
+    async def _close_socket(self, subscriber: Subscriber):
+        try:
+            await subscriber.websocket.close(code=1008)
+        except Exception:
+            pass
+
+    async def _send_loop(self, subscriber: Subscriber):
+        try:
+            while True:
+                payload, queued_at, seq = await subscriber.queue.get()
+                if isinstance(payload, bytes):
+                    await asyncio.wait_for(subscriber.websocket.send_bytes(payload), self.send_timeout)
+                else:
+                    await asyncio.wait_for(subscriber.websocket.send_text(payload), self.send_timeout)
+                subscriber.sent_seq = max(subscriber.sent_seq, seq)
+                self.frames[subscriber.version] += 1
+                self.bytes_sent[subscriber.version] += len(payload)
+                # Delivery lag: from publish to the frame being written for this client
+                STAGE_SECONDS.observe(time.perf_counter() - queued_at, stage="broadcast")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending update: {e}")
+            self._drop(subscriber)
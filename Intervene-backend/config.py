@@ -13,33 +13,232 @@ OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_LLM_MODEL = os.getenv("OLLAMA_LLM_MODEL", "llama3.2")
 OLLAMA_VISION_MODEL = os.getenv("OLLAMA_VISION_MODEL", "llava:3")
 
+# Ollama endpoint pools: comma-separated base URLs. OLLAMA_ENDPOINTS serves every
+# model (defaults to OLLAMA_BASE_URL); OLLAMA_LLM_ENDPOINTS and
+# OLLAMA_VISION_ENDPOINTS put planning and vision on their own hosts
+def _url_list(value: str):
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+OLLAMA_ENDPOINTS = _url_list(os.getenv("OLLAMA_ENDPOINTS", OLLAMA_BASE_URL))
+OLLAMA_LLM_ENDPOINTS = _url_list(os.getenv("OLLAMA_LLM_ENDPOINTS", "")) or OLLAMA_ENDPOINTS
+OLLAMA_VISION_ENDPOINTS = _url_list(os.getenv("OLLAMA_VISION_ENDPOINTS", "")) or OLLAMA_ENDPOINTS
+
+# Endpoint health: seconds between active checks (0 = off), failures among the
+# last WINDOW calls that open an endpoint's circuit, and seconds it stays open
+# before a trial call
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+OLLAMA_CIRCUIT_FAILURES = int(os.getenv("OLLAMA_CIRCUIT_FAILURES", "3"))
+OLLAMA_CIRCUIT_WINDOW = int(os.getenv("OLLAMA_CIRCUIT_WINDOW", "10"))
+OLLAMA_CIRCUIT_COOLDOWN = float(os.getenv("OLLAMA_CIRCUIT_COOLDOWN", "30"))
+
+# Ollama HTTP client configuration (seconds / connection counts)
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "5"))
+
+# Model residency: keep_alive sent with every call ("-1" keeps models loaded forever),
+# whether to preload models at startup, and how often to re-touch idle models (0 = never)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "60m")
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "True").lower() in ["true", "1", "yes"]
+OLLAMA_KEEPALIVE_INTERVAL = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", "300"))
+
+# Model gateway: concurrent generations per model and endpoint, and how many
+# calls may wait before new ones are turned away as busy
+MODEL_MAX_CONCURRENT = int(os.getenv("MODEL_MAX_CONCURRENT", "2"))
+MODEL_MAX_QUEUE = int(os.getenv("MODEL_MAX_QUEUE", "16"))
+
+# Vision image pipeline: longest side in pixels (0 keeps full size), format and lossy quality
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "JPEG").upper()
+VISION_IMAGE_QUALITY = int(os.getenv("VISION_IMAGE_QUALITY", "80"))
+
+# Vision result cache: near-identical frames (within THRESHOLD bits of a
+# HASH_SIZE x HASH_SIZE perceptual hash) reuse a recent analysis
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "True").lower() in ["true", "1", "yes"]
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "64"))
+VISION_CACHE_TTL = float(os.getenv("VISION_CACHE_TTL", "30"))
+VISION_CACHE_THRESHOLD = int(os.getenv("VISION_CACHE_THRESHOLD", "6"))
+VISION_CACHE_HASH_SIZE = int(os.getenv("VISION_CACHE_HASH_SIZE", "16"))
+
+# Background screen capture: samples the screen FPS times a second into a
+# shared-memory ring of FRAMES frames (longest side MAX_SIDE pixels) and diffs
+# consecutive frames in TILE_SIZE tiles, ignoring per-channel changes up to
+# DIFF_THRESHOLD. Screen analysis then sends the vision model only the regions
+# (at most MAX_REGIONS) that changed since its last analysis, or the whole
+# frame once they cover more than REGION_MAX_AREA of it
+SCREEN_CAPTURE_ENABLED = os.getenv("SCREEN_CAPTURE_ENABLED", "False").lower() in ["true", "1", "yes"]
+SCREEN_CAPTURE_FPS = float(os.getenv("SCREEN_CAPTURE_FPS", "2"))
+SCREEN_CAPTURE_FRAMES = int(os.getenv("SCREEN_CAPTURE_FRAMES", "8"))
+SCREEN_CAPTURE_MAX_SIDE = int(os.getenv("SCREEN_CAPTURE_MAX_SIDE", "1920"))
+SCREEN_TILE_SIZE = int(os.getenv("SCREEN_TILE_SIZE", "64"))
+SCREEN_DIFF_THRESHOLD = int(os.getenv("SCREEN_DIFF_THRESHOLD", "16"))
+SCREEN_MAX_REGIONS = int(os.getenv("SCREEN_MAX_REGIONS", "4"))
+SCREEN_REGION_MAX_AREA = float(os.getenv("SCREEN_REGION_MAX_AREA", "0.5"))
+
+# Plan cache configuration (TTL in seconds, sizes in entries)
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "True").lower() in ["true", "1", "yes"]
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".intervene", "plan_cache.sqlite3"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "86400"))
+PLAN_CACHE_MEMORY_SIZE = int(os.getenv("PLAN_CACHE_MEMORY_SIZE", "256"))
+PLAN_CACHE_DISK_SIZE = int(os.getenv("PLAN_CACHE_DISK_SIZE", "5000"))
+
+# Plan generation: PLAN_FORMAT is "schema" (decoding constrained to the step
+# schema), "json" (Ollama JSON mode) or "none"; a plan that still fails
+# validation gets up to PLAN_REPAIR_ATTEMPTS targeted repair generations
+PLAN_FORMAT = os.getenv("PLAN_FORMAT", "schema").lower()
+PLAN_MAX_STEPS = int(os.getenv("PLAN_MAX_STEPS", "20"))
+PLAN_MAX_TOKENS = int(os.getenv("PLAN_MAX_TOKENS", "2048"))
+PLAN_REPAIR_ATTEMPTS = int(os.getenv("PLAN_REPAIR_ATTEMPTS", "1"))
+
+# Rule-based fast path: requests made only of common shapes ("open <url>",
+# "search for 'X' on <site>", "make a spreadsheet with columns A, B") are
+# planned by precompiled patterns without an LLM call
+FAST_PLANNER_ENABLED = os.getenv("FAST_PLANNER_ENABLED", "True").lower() in ["true", "1", "yes"]
+
+# Prompt-prefix reuse: the static planning instructions go out as an unchanging
+# system prompt so Ollama can reuse their evaluated prefix across calls, and
+# warm-up evaluates that prefix once per model slot before the first request
+PLAN_PREFIX_REUSE = os.getenv("PLAN_PREFIX_REUSE", "True").lower() in ["true", "1", "yes"]
+PLAN_PREFIX_WARMUP = os.getenv("PLAN_PREFIX_WARMUP", "True").lower() in ["true", "1", "yes"]
+
+# Durable workflow journal: plan, step status and results of every run, so
+# runs can be resumed or replayed after a restart. Commits are batched every
+# JOURNAL_FLUSH_INTERVAL seconds; JOURNAL_AUTO_RESUME restarts interrupted
+# runs at startup instead of waiting for POST /runs/{id}/resume
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "True").lower() in ["true", "1", "yes"]
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", os.path.join(os.path.expanduser("~"), ".intervene", "journal.sqlite3"))
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.05"))
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "256"))
+JOURNAL_MAX_RUNS = int(os.getenv("JOURNAL_MAX_RUNS", "1000"))
+JOURNAL_AUTO_RESUME = os.getenv("JOURNAL_AUTO_RESUME", "False").lower() in ["true", "1", "yes"]
+
+# Workflow scheduler: concurrent jobs, queued jobs, parallel steps per job, finished jobs kept
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "2"))
+SCHEDULER_QUEUE_SIZE = int(os.getenv("SCHEDULER_QUEUE_SIZE", "32"))
+SCHEDULER_MAX_PARALLEL_STEPS = int(os.getenv("SCHEDULER_MAX_PARALLEL_STEPS", "4"))
+SCHEDULER_HISTORY_SIZE = int(os.getenv("SCHEDULER_HISTORY_SIZE", "100"))
+
+# WebSocket fan-out: per-client queue length, replay buffer length,
+# what to do with a client whose queue is full (drop_oldest or disconnect)
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "100"))
+WS_REPLAY_SIZE = int(os.getenv("WS_REPLAY_SIZE", "256"))
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Version 2 clients get the events of each COALESCE_WINDOW seconds merged into one delta frame
+WS_COALESCE_WINDOW = float(os.getenv("WS_COALESCE_WINDOW", "0.02"))
+
+# Tool execution pool; TOOL_LIMITS caps concurrent calls per tool, e.g. "excel=1,email=1"
+TOOL_THREAD_WORKERS = int(os.getenv("TOOL_THREAD_WORKERS", "8"))
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "120"))
+TOOL_LIMITS = {
+    name.strip(): int(limit)
+    for name, limit in (
+        item.split("=", 1) for item in os.getenv("TOOL_LIMITS", "excel=1,email=1,vision_analyze=2").split(",") if "=" in item
+    )
+}
+
+# Upper bound in seconds when waiting for a launched application to become ready
+APP_READY_TIMEOUT = float(os.getenv("APP_READY_TIMEOUT", "10"))
+
+# Input automation: backend (auto, applescript, powershell, powershell-helper,
+# recording), pause between actions of a batch and before the clipboard is
+# restored, and how many batches the recording backend keeps
+INPUT_BACKEND = os.getenv("INPUT_BACKEND", "auto").lower()
+INPUT_ACTION_DELAY = float(os.getenv("INPUT_ACTION_DELAY", "0.02"))
+INPUT_CLIPBOARD_RESTORE_DELAY = float(os.getenv("INPUT_CLIPBOARD_RESTORE_DELAY", "0.5"))
+INPUT_RECORD_LIMIT = int(os.getenv("INPUT_RECORD_LIMIT", "1000"))
+
+# Manual override detection: watch mouse/keyboard while workflows run, seconds
+# of coalescing after a trigger, mouse jitter ignored (pixels), how long our own
+# synthetic input is ignored after it is sent, and the agent's initial grace period
+OVERRIDE_DETECTION = os.getenv("OVERRIDE_DETECTION", "true").lower() in ["true", "1", "yes"]
+OVERRIDE_DEBOUNCE = float(os.getenv("OVERRIDE_DEBOUNCE", "0.25"))
+OVERRIDE_MIN_MOVE = int(os.getenv("OVERRIDE_MIN_MOVE", "3"))
+OVERRIDE_SELF_INPUT_GRACE = float(os.getenv("OVERRIDE_SELF_INPUT_GRACE", "0.1"))
+OVERRIDE_GRACE_PERIOD = float(os.getenv("OVERRIDE_GRACE_PERIOD", "2"))
+
+# Per-workflow span trees served at /jobs/{id}/trace, and how many are kept
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() in ["true", "1", "yes"]
+TRACE_HISTORY_SIZE = int(os.getenv("TRACE_HISTORY_SIZE", "100"))
+
+# Seconds between event-loop lag probes (0 disables the probe)
+EVENT_LOOP_PROBE_INTERVAL = float(os.getenv("EVENT_LOOP_PROBE_INTERVAL", "0.1"))
+
 # Server configuration
 SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
 SERVER_PORT = int(os.getenv("SERVER_PORT", "8001"))
 DEBUG = os.getenv("DEBUG", "True").lower() in ["true", "1", "yes"]
+# Worker processes; uvicorn's --workers defaults to WEB_CONCURRENCY as well
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+
+# State shared by worker processes: STATE_BACKEND is "local" (one process),
+# "sqlite" (job status and step events shared through the database at
+# STATE_PATH; workers are woken over loopback UDP and poll every
+# STATE_POLL_INTERVAL seconds) or "auto" (sqlite with more than one worker).
+# STATE_EVENT_RETENTION events and the STATE_MAX_JOBS most recent jobs are
+# kept; a starting worker loads the last STATE_REPLAY_BACKLOG events for
+# ?since= replay
+STATE_BACKEND = os.getenv("STATE_BACKEND", "auto").lower()
+STATE_PATH = os.getenv("STATE_PATH", os.path.join(os.path.expanduser("~"), ".intervene", "state.sqlite3"))
+STATE_POLL_INTERVAL = float(os.getenv("STATE_POLL_INTERVAL", "0.5"))
+STATE_EVENT_RETENTION = int(os.getenv("STATE_EVENT_RETENTION", "10000"))
+STATE_REPLAY_BACKLOG = int(os.getenv("STATE_REPLAY_BACKLOG", "256"))
+STATE_MAX_JOBS = int(os.getenv("STATE_MAX_JOBS", "1000"))
 
 # Logging configuration
 LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO"))
 
-# Configure logging
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_logging_configured = False
+
+def configure_logging():
+    """Install the root log handler once; entry points (main, agent) call this"""
+    global _logging_configured
+    if _logging_configured:
+        return
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    _logging_configured = True
 
 def get_ollama_config():
     """Get Ollama configuration as a dictionary"""
     return {
         "base_url": OLLAMA_BASE_URL,
+        "llm_endpoints": OLLAMA_LLM_ENDPOINTS,
+        "vision_endpoints": OLLAMA_VISION_ENDPOINTS,
         "llm_model": OLLAMA_LLM_MODEL,
-        "vision_model": OLLAMA_VISION_MODEL
+        "vision_model": OLLAMA_VISION_MODEL,
+        "timeout": OLLAMA_TIMEOUT,
+        "connect_timeout": OLLAMA_CONNECT_TIMEOUT,
+        "max_connections": OLLAMA_MAX_CONNECTIONS,
+        "max_keepalive_connections": OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+        "keep_alive": OLLAMA_KEEP_ALIVE
     }
 
 def log_config():
     """Log the current configuration"""
     logger = logging.getLogger(__name__)
-    logger.info(f"Ollama Base URL: {OLLAMA_BASE_URL}")
-    logger.info(f"Ollama LLM Model: {OLLAMA_LLM_MODEL}")
-    logger.info(f"Ollama Vision Model: {OLLAMA_VISION_MODEL}")
-    logger.info(f"Server: {SERVER_HOST}:{SERVER_PORT}")
+    logger.info(f"Ollama LLM Model: {OLLAMA_LLM_MODEL} on {', '.join(OLLAMA_LLM_ENDPOINTS)}")
+    logger.info(f"Ollama Vision Model: {OLLAMA_VISION_MODEL} on {', '.join(OLLAMA_VISION_ENDPOINTS)}")
+    logger.info(f"Ollama Endpoint Health: checks every {OLLAMA_HEALTH_INTERVAL or 'never'}s, circuit opens after "
+                f"{OLLAMA_CIRCUIT_FAILURES}/{OLLAMA_CIRCUIT_WINDOW} failures for {OLLAMA_CIRCUIT_COOLDOWN}s")
+    logger.info(f"Ollama Keep-Alive: {OLLAMA_KEEP_ALIVE} (warm-up {'on' if OLLAMA_WARMUP else 'off'})")
+    logger.info(f"Ollama Timeout: {OLLAMA_TIMEOUT}s (max {OLLAMA_MAX_CONNECTIONS} connections)")
+    logger.info(f"Vision Images: {VISION_IMAGE_FORMAT} q{VISION_IMAGE_QUALITY}, max side {VISION_MAX_SIDE or 'full'}")
+    if SCREEN_CAPTURE_ENABLED:
+        logger.info(f"Screen Capture: {SCREEN_CAPTURE_FPS:g} fps, {SCREEN_CAPTURE_FRAMES} frames, "
+                    f"{SCREEN_TILE_SIZE}px tiles")
+    else:
+        logger.info("Screen Capture: off")
+    logger.info(f"Plan Cache: {PLAN_CACHE_PATH if PLAN_CACHE_ENABLED else 'disabled'}")
+    logger.info(f"Plan Format: {PLAN_FORMAT} (max {PLAN_MAX_TOKENS} tokens, {PLAN_REPAIR_ATTEMPTS} repair attempts)")
+    logger.info(f"Fast Planner: {'on' if FAST_PLANNER_ENABLED else 'off'}")
+    logger.info(f"Plan Prefix Reuse: {'on' if PLAN_PREFIX_REUSE else 'off'}"
+                f"{' (primed at warm-up)' if PLAN_PREFIX_REUSE and PLAN_PREFIX_WARMUP else ''}")
+    logger.info(f"Scheduler: {SCHEDULER_WORKERS} workers, queue of {SCHEDULER_QUEUE_SIZE}")
+    logger.info(f"Workflow Journal: {JOURNAL_PATH if JOURNAL_ENABLED else 'disabled'}"
+                f"{' (auto-resume)' if JOURNAL_ENABLED and JOURNAL_AUTO_RESUME else ''}")
+    logger.info(f"Server: {SERVER_HOST}:{SERVER_PORT} ({SERVER_WORKERS} workers)")
+    logger.info(f"Shared State: {STATE_BACKEND}{f' at {STATE_PATH}' if STATE_BACKEND != 'local' else ''}")
     logger.info(f"Debug Mode: {DEBUG}")
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+fast_planner.py - Deterministic planner for common request shapes, tried before the LLM
+"""
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import FAST_PLANS
+from plan_schema import PlanValidationError, validate_plan
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Parts of a browser step instruction, shared with main.handle_browser_tool
+URL_PATTERN = re.compile(r'https?://[^\s"\']+')
+SEARCH_PATTERN = re.compile(r'search for ["\']([^"\']+)["\']', re.IGNORECASE)
+
+# Site names users write instead of a URL
+SITES = {
+    "google": "https://www.google.com",
+    "bing": "https://www.bing.com",
+    "duckduckgo": "https://duckduckgo.com",
+    "youtube": "https://www.youtube.com",
+    "amazon": "https://www.amazon.com",
+    "ebay": "https://www.ebay.com",
+    "wikipedia": "https://en.wikipedia.org",
+    "github": "https://github.com",
+    "reddit": "https://www.reddit.com",
+    "stack overflow": "https://stackoverflow.com",
+    "stackoverflow": "https://stackoverflow.com",
+    "linkedin": "https://www.linkedin.com",
+    "google maps": "https://www.google.com/maps",
+    "hacker news": "https://news.ycombinator.com",
+}
+DEFAULT_SEARCH_SITE = "google"
+
+_POLITE = r"(?:(?:please|can you|could you|would you)\s+)?"
+_SITE = "|".join(re.escape(name).replace(r"\ ", r"\s+") for name in sorted(SITES, key=len, reverse=True))
+# A bare name.tld is only taken for a domain with one of these TLDs; otherwise
+# "open README.md" or "load config.json" would be planned as a web page
+WEB_TLDS = ("com", "org", "net", "edu", "gov", "io", "dev", "app", "ai", "co", "me", "info", "biz",
+            "uk", "us", "ca", "au", "eu", "de", "fr", "nl", "es", "it", "ch", "se", "jp", "in")
+_TLD = "|".join(WEB_TLDS)
+_DOMAIN = rf"(?:https?://(?:[\w-]+\.)+[a-z]{{2,}}|www\.(?:[\w-]+\.)+[a-z]{{2,}}|(?:[\w-]+\.)+(?:{_TLD})\b)"
+_TARGET = rf"(?P<target>{_DOMAIN}(?:/\S*)?|{_SITE})"
+_QUERY = r"""(?:'(?P<q1>[^']+)'|"(?P<q2>[^"]+)"|“(?P<q3>[^”]+)”|(?P<q4>[^'"“”]+?))"""
+_FORMAT = r"(?:\s+(?:as|in)\s+(?:an?\s+)?(?P<format>csv|xlsx|excel)(?:\s+file)?)?"
+
+# Separators between the parts of a multi-step request ("A, then B", "A; B")
+_THEN = re.compile(r"\s*(?:;|,?\s+(?:and\s+)?then)\s+", re.IGNORECASE)
+_COLUMN_SEPARATOR = re.compile(r"\s*,\s*(?:and\s+)?|\s+and\s+", re.IGNORECASE)
+# An unquoted query containing any of these probably holds more than one task
+_NOT_A_QUERY = re.compile(r"\b(?:and|then|spreadsheet|sheet|excel|email|e-mail|mail)\b|[,;]", re.IGNORECASE)
+
+MAX_COLUMNS = 26
+MAX_COLUMN_LENGTH = 40
+
+
+def parse_browser_instruction(instruction: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Find the URL and the quoted search query of a browser instruction
+
+    Returns:
+        tuple: (url or None, search query or None)
+    """
+    url_match = URL_PATTERN.search(instruction)
+    search_match = SEARCH_PATTERN.search(instruction)
+    return (url_match.group(0) if url_match else None,
+            search_match.group(1) if search_match else None)
+
+
+def _url(target: str) -> str:
+    target = target.rstrip(".,")
+    site = SITES.get(" ".join(target.lower().split()))
+    if site is not None:
+        return site
+    return target if target.lower().startswith(("http://", "https://")) else f"https://{target}"
+
+
+def _query(match: re.Match) -> Optional[str]:
+    quoted = match.group("q1") or match.group("q2") or match.group("q3")
+    query = (quoted or match.group("q4") or "").strip()
+    if not query or (quoted is None and _NOT_A_QUERY.search(query)):
+        return None
+    # The executor reads the query back from between quotes
+    if "'" in query or '"' in query:
+        return None
+    return query
+
+
+def _search_step(url: str, query: str) -> Dict[str, Any]:
+    return {"type": "browser", "instruction": f"open {url} and search for '{query}'"}
+
+
+def _open(match: re.Match) -> Optional[Dict[str, Any]]:
+    return {"type": "browser", "instruction": f"open {_url(match.group('target'))}"}
+
+
+def _search_on(match: re.Match) -> Optional[Dict[str, Any]]:
+    query = _query(match)
+    return _search_step(_url(match.group("target")), query) if query else None
+
+
+def _search(match: re.Match) -> Optional[Dict[str, Any]]:
+    query = _query(match)
+    return _search_step(SITES[DEFAULT_SEARCH_SITE], query) if query else None
+
+
+def _spreadsheet(match: re.Match) -> Optional[Dict[str, Any]]:
+    headers = [column.strip(" '\"“”") for column in _COLUMN_SEPARATOR.split(match.group("columns"))]
+    if (not headers or len(headers) > MAX_COLUMNS
+            or any(not header or len(header) > MAX_COLUMN_LENGTH for header in headers)):
+        return None
+    step = {"type": "excel", "instruction": f"create a new spreadsheet with columns {', '.join(headers)}",
+            "headers": headers, "data": []}
+    output_format = (match.group("format") or "").lower()
+    if output_format:
+        step["format"] = "csv" if output_format == "csv" else "xlsx"
+    return step
+
+
+class Rule:
+    """A precompiled pattern that must match one whole request part, and the step it builds"""
+
+    __slots__ = ("name", "pattern", "build")
+
+    def __init__(self, name: str, pattern: str, build: Callable[[re.Match], Optional[Dict[str, Any]]]):
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.build = build
+
+    def apply(self, text: str) -> Optional[Dict[str, Any]]:
+        match = self.pattern.fullmatch(text)
+        return self.build(match) if match else None
+
+
+# Tried in order; the first rule that builds a step wins
+RULES = [
+    Rule("open", rf"{_POLITE}(?:open|go\s+to|navigate\s+to|visit|browse\s+to|load)\s+(?:the\s+)?{_TARGET}"
+                 r"(?:\s+(?:website|site|homepage|home\s+page))?", _open),
+    Rule("search_on", rf"{_POLITE}(?:search(?:\s+for)?|look\s+up)\s+{_QUERY}\s+(?:on|using)\s+{_TARGET}",
+         _search_on),
+    Rule("search_site", rf"{_POLITE}search\s+{_TARGET}\s+for\s+{_QUERY}", _search_on),
+    Rule("open_and_search", rf"{_POLITE}(?:open|go\s+to|visit)\s+{_TARGET}\s+and\s+search(?:\s+for)?\s+{_QUERY}",
+         _search_on),
+    Rule("search", rf"{_POLITE}(?:search(?:\s+for)?|look\s+up|google)\s+{_QUERY}", _search),
+    Rule("spreadsheet", rf"{_POLITE}(?:make|create|build|start|set\s+up)\s+(?:me\s+)?(?:an?\s+)?(?:new\s+)?"
+                        r"(?:excel\s+)?(?:spreadsheet|sheet|workbook|table|excel\s+file)\s+"
+                        r"(?:with|having|containing)\s+(?:the\s+)?(?:columns?|headers?|column\s+headers|fields)"
+                        rf"\s*:?\s+(?P<columns>[^;]+?){_FORMAT}", _spreadsheet),
+]
+
+
+class FastPlanner:
+    """
+    Plans requests made only of well-known shapes ("open <url>", "search for
+    'X' on <site>", "make a spreadsheet with columns A, B, C", joined by
+    "then") without a model call.
+
+    A request is split into parts and every part has to match a rule over its
+    whole text, otherwise nothing is returned and the LLM plans the request.
+    Plans are validated against the step schema like generated ones.
+    Hits, misses and the time they took are kept for GET /planner, with the
+    mean latency of LLM plans to estimate the time saved.
+    """
+
+    def __init__(self, rules: Optional[List[Rule]] = None):
+        self.rules = RULES if rules is None else rules
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses = 0
+        self.match_seconds = 0.0
+        self.llm_plans = 0
+        self.llm_seconds = 0.0
+
+    def match(self, request: str) -> Optional[Tuple[List[Dict[str, Any]], List[str]]]:
+        """
+        Apply the rules without recording anything
+
+        Returns:
+            tuple: (steps, the rule that built each step), or None
+        """
+        text = " ".join(request.split()).rstrip(".!")
+        steps, names = [], []
+        for part in _THEN.split(text):
+            for rule in self.rules:
+                step = rule.apply(part)
+                if step is not None:
+                    steps.append(step)
+                    names.append(rule.name)
+                    break
+            else:
+                return None
+        try:
+            return validate_plan(steps), names
+        except PlanValidationError as e:
+            logger.warning(f"Rule plan failed validation, using the LLM: {e}")
+            return None
+
+    def plan(self, request: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Plan a request with the rules
+
+        Args:
+            request (str): The user's request
+
+        Returns:
+            list: Steps in the schema execute_workflow consumes, or None when
+                the request needs the LLM
+        """
+        started = time.perf_counter()
+        matched = self.match(request)
+        elapsed = time.perf_counter() - started
+        rule = None if matched is None else (matched[1][0] if len(matched[1]) == 1 else "compound")
+        with self._lock:
+            self.match_seconds += elapsed
+            if rule is None:
+                self.misses += 1
+            else:
+                self.hits[rule] = self.hits.get(rule, 0) + 1
+        FAST_PLANS.inc(rule=rule or "miss")
+        if matched is None:
+            return None
+        logger.info(f"Planned {len(matched[0])} steps with rules ({', '.join(matched[1])})")
+        return matched[0]
+
+    def record_llm(self, seconds: float):
+        """Record how long an LLM plan took (cache hits excluded)"""
+        with self._lock:
+            self.llm_plans += 1
+            self.llm_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.hits.values())
+            requests = hits + self.misses
+            llm_mean = self.llm_seconds / self.llm_plans if self.llm_plans else None
+            return {
+                "requests": requests,
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": hits / requests if requests else 0.0,
+                "rules": dict(self.hits),
+                "mean_match_ms": self.match_seconds / requests * 1000 if requests else None,
+                "mean_llm_plan_ms": llm_mean * 1000 if llm_mean is not None else None,
+                # Each hit is an LLM plan that did not run
+                "estimated_seconds_saved": hits * llm_mean if llm_mean is not None else None,
+            }
+
+
+fast_planner = FastPlanner()
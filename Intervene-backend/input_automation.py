@@ -0,0 +1,332 @@
+"""
+input_automation.py - Pluggable keyboard/clipboard automation with batched execution
+"""
+import abc
+import base64
+import logging
+import math
+import os
+import subprocess
+import sys
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Deque, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from config import INPUT_BACKEND, INPUT_ACTION_DELAY, INPUT_CLIPBOARD_RESTORE_DELAY, INPUT_RECORD_LIMIT
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Key(NamedTuple):
+    """A key press with its (canonical) modifiers, e.g. Key(("command",), "n")"""
+    modifiers: Tuple[str, ...]
+    key: str
+
+
+class Paste(NamedTuple):
+    """Put text on the clipboard and paste it at the cursor"""
+    text: str
+
+
+class WaitForWindow(NamedTuple):
+    """
+    Wait until a process has more than ``count`` windows, at most ``timeout``
+    seconds, e.g. for the window a shortcut opens before pasting into it.
+    Only the AppleScript backend can see windows; the others pass over it.
+    """
+    process: str
+    count: int
+    timeout: float
+
+
+Action = Union[Key, Paste, WaitForWindow]
+
+# How often an in-script WaitForWindow checks the window count (seconds)
+WINDOW_POLL_INTERVAL = 0.05
+
+# Every spelling we accept, mapped once to a canonical modifier name
+MODIFIER_ALIASES = {
+    "cmd": "command", "command": "command",
+    "ctrl": "control", "control": "control",
+    "alt": "option", "option": "option",
+    "shift": "shift",
+}
+
+# macOS: canonical modifier -> AppleScript "using" clause, named keys -> key codes
+APPLESCRIPT_MODIFIERS = {"command": "command down", "control": "control down",
+                         "option": "option down", "shift": "shift down"}
+APPLESCRIPT_KEY_CODES = {"enter": 36, "return": 36, "tab": 48, "space": 49, "delete": 51, "backspace": 51,
+                         "escape": 53, "esc": 53, "left": 123, "right": 124, "down": 125, "up": 126}
+
+# Windows SendKeys: command maps to Control, as before
+SENDKEYS_MODIFIERS = {"command": "^", "control": "^", "option": "%", "shift": "+"}
+SENDKEYS_KEYS = {"enter": "{ENTER}", "return": "{ENTER}", "tab": "{TAB}", "space": " ",
+                 "delete": "{DEL}", "backspace": "{BACKSPACE}", "escape": "{ESC}", "esc": "{ESC}",
+                 "left": "{LEFT}", "right": "{RIGHT}", "down": "{DOWN}", "up": "{UP}"}
+SENDKEYS_SPECIAL = set("+^%~(){}[]")
+
+
+@lru_cache(maxsize=256)
+def parse_key(combination: str) -> Key:
+    """
+    Parse "command+shift+n" style combinations once
+
+    Raises:
+        ValueError: For an empty key or an unknown modifier
+    """
+    *modifiers, key = combination.split("+")
+    key = key.strip()
+    if not key:
+        raise ValueError(f"Invalid key combination: {combination!r}")
+    canonical = []
+    for modifier in modifiers:
+        try:
+            canonical.append(MODIFIER_ALIASES[modifier.strip().lower()])
+        except KeyError:
+            raise ValueError(f"Unknown modifier {modifier!r} in {combination!r}")
+    return Key(tuple(canonical), key)
+
+
+def _applescript_string(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _powershell_string(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _powershell_text(text: str) -> str:
+    """Arbitrary text as a single-line PowerShell expression (safe for the line-based helper)"""
+    encoded = base64.b64encode(text.encode("utf-8")).decode("ascii")
+    return f"([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}')))"
+
+
+@lru_cache(maxsize=256)
+def applescript_key(action: Key) -> str:
+    using = ""
+    if action.modifiers:
+        using = " using {" + ", ".join(APPLESCRIPT_MODIFIERS[m] for m in action.modifiers) + "}"
+    code = APPLESCRIPT_KEY_CODES.get(action.key.lower()) if len(action.key) > 1 else None
+    if code is not None:
+        return f"key code {code}{using}"
+    return f"keystroke {_applescript_string(action.key)}{using}"
+
+
+@lru_cache(maxsize=256)
+def sendkeys_key(action: Key) -> str:
+    key = SENDKEYS_KEYS.get(action.key.lower()) if len(action.key) > 1 else None
+    if key is None:
+        key = "{" + action.key + "}" if action.key in SENDKEYS_SPECIAL else action.key.lower()
+    return "".join(SENDKEYS_MODIFIERS[m] for m in action.modifiers) + key
+
+
+class InputBackend(abc.ABC):
+    """Executes a sequence of actions as one unit, in order"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def run(self, actions: Sequence[Action]):
+        """Run actions in order, as one backend invocation"""
+
+    def close(self):
+        pass
+
+
+class AppleScriptBackend(InputBackend):
+    """
+    macOS: compiles the whole sequence into one AppleScript run by a single
+    osascript process, instead of one process per key.
+    """
+
+    name = "applescript"
+
+    def __init__(self, action_delay: float = INPUT_ACTION_DELAY,
+                 restore_delay: float = INPUT_CLIPBOARD_RESTORE_DELAY):
+        self.action_delay = action_delay
+        self.restore_delay = restore_delay
+
+    def compile(self, actions: Sequence[Action]) -> str:
+        pastes = any(isinstance(action, Paste) for action in actions)
+        lines = []
+        if pastes:
+            lines.append("set savedClipboard to the clipboard")
+        lines.append('tell application "System Events"')
+        for i, action in enumerate(actions):
+            if i and self.action_delay:
+                lines.append(f"    delay {self.action_delay}")
+            if isinstance(action, Paste):
+                lines.append(f"    set the clipboard to {_applescript_string(action.text)}")
+                lines.append('    keystroke "v" using {command down}')
+            elif isinstance(action, WaitForWindow):
+                polls = max(1, math.ceil(action.timeout / WINDOW_POLL_INTERVAL))
+                lines.append(f"    repeat {polls} times")
+                lines.append(f"        if (count windows of process {_applescript_string(action.process)}) "
+                             f"> {action.count} then exit repeat")
+                lines.append(f"        delay {WINDOW_POLL_INTERVAL}")
+                lines.append("    end repeat")
+            else:
+                lines.append(f"    {applescript_key(action)}")
+        lines.append("end tell")
+        if pastes:
+            # Give the target app time to read the clipboard before restoring it
+            lines.append(f"delay {self.restore_delay}")
+            lines.append("set the clipboard to savedClipboard")
+        return "\n".join(lines)
+
+    def run(self, actions: Sequence[Action]):
+        result = subprocess.run(["osascript", "-"], input=self.compile(actions), text=True)
+        if result.returncode:
+            logger.warning(f"osascript exited with {result.returncode} for {len(actions)} actions")
+
+
+class PowerShellBackend(InputBackend):
+    """Windows: compiles the whole sequence into one PowerShell invocation"""
+
+    name = "powershell"
+    PRELUDE = "Add-Type -AssemblyName System.Windows.Forms"
+
+    def __init__(self, action_delay: float = INPUT_ACTION_DELAY,
+                 restore_delay: float = INPUT_CLIPBOARD_RESTORE_DELAY):
+        self.action_delay = action_delay
+        self.restore_delay = restore_delay
+
+    def compile(self, actions: Sequence[Action]) -> str:
+        pastes = any(isinstance(action, Paste) for action in actions)
+        lines = []
+        if pastes:
+            lines.append("$savedClipboard = Get-Clipboard -Raw")
+        for i, action in enumerate(actions):
+            if isinstance(action, WaitForWindow):
+                continue
+            if i and self.action_delay:
+                lines.append(f"Start-Sleep -Milliseconds {int(self.action_delay * 1000)}")
+            if isinstance(action, Paste):
+                lines.append(f"Set-Clipboard -Value {_powershell_text(action.text)}")
+                lines.append("[System.Windows.Forms.SendKeys]::SendWait('^v')")
+            else:
+                lines.append(f"[System.Windows.Forms.SendKeys]::SendWait({_powershell_string(sendkeys_key(action))})")
+        if pastes:
+            lines.append(f"Start-Sleep -Milliseconds {int(self.restore_delay * 1000)}")
+            lines.append("if ($savedClipboard) { Set-Clipboard -Value $savedClipboard }")
+        return "; ".join(lines)
+
+    def run(self, actions: Sequence[Action]):
+        result = subprocess.run(["powershell", "-NoProfile", "-Command", f"{self.PRELUDE}; {self.compile(actions)}"])
+        if result.returncode:
+            logger.warning(f"powershell exited with {result.returncode} for {len(actions)} actions")
+
+
+class PowerShellHelperBackend(PowerShellBackend):
+    """
+    Windows: feeds compiled batches to one long-lived PowerShell process, so
+    even single key presses skip interpreter startup.
+    """
+
+    name = "powershell-helper"
+    SENTINEL = "__intervene_done__"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _helper(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["powershell", "-NoProfile", "-NoLogo", "-Command", "-"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+            )
+            self._process.stdin.write(self.PRELUDE + "\n")
+        return self._process
+
+    def run(self, actions: Sequence[Action]):
+        with self._lock:
+            helper = self._helper()
+            helper.stdin.write(f"{self.compile(actions)}; Write-Output '{self.SENTINEL}'\n")
+            helper.stdin.flush()
+            # Block until the batch has been sent, so callers keep their ordering
+            for line in helper.stdout:
+                if line.strip() == self.SENTINEL:
+                    return
+            raise RuntimeError("PowerShell helper exited unexpectedly")
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.stdin.close()
+                self._process.terminate()
+            self._process = None
+
+
+class RecordingBackend(InputBackend):
+    """
+    Records batches instead of touching the desktop
+
+    Used on machines without an input backend and for tests and benchmarks.
+    Only the last ``max_batches`` batches are kept (None keeps all), since
+    this is the default backend of a long-running server on Linux. When
+    ``command`` is given it is spawned once per batch, to stand in for the
+    cost of a real osascript/powershell invocation.
+    """
+
+    name = "recording"
+
+    def __init__(self, command: Optional[List[str]] = None, max_batches: Optional[int] = INPUT_RECORD_LIMIT):
+        self.command = command
+        self.batches: Deque[List[Action]] = deque(maxlen=max_batches)
+        self._lock = threading.Lock()
+
+    @property
+    def actions(self) -> List[Action]:
+        with self._lock:
+            return [action for batch in self.batches for action in batch]
+
+    def run(self, actions: Sequence[Action]):
+        if self.command:
+            subprocess.run(self.command, check=True)
+        with self._lock:
+            self.batches.append(list(actions))
+        logger.debug(f"Recorded input batch: {list(actions)}")
+
+
+BACKENDS = {
+    AppleScriptBackend.name: AppleScriptBackend,
+    PowerShellBackend.name: PowerShellBackend,
+    PowerShellHelperBackend.name: PowerShellHelperBackend,
+    RecordingBackend.name: RecordingBackend,
+}
+
+
+def default_backend_name() -> str:
+    if sys.platform == "darwin":
+        return AppleScriptBackend.name
+    if os.name == "nt":
+        return PowerShellBackend.name
+    # No desktop automation available (e.g. a Linux server)
+    return RecordingBackend.name
+
+
+_backend: Optional[InputBackend] = None
+
+
+def get_backend() -> InputBackend:
+    """Return the process-wide input backend selected by INPUT_BACKEND"""
+    global _backend
+    if _backend is None:
+        name = default_backend_name() if INPUT_BACKEND == "auto" else INPUT_BACKEND
+        try:
+            _backend = BACKENDS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown input backend: {name}")
+        logger.info(f"Input automation backend: {name}")
+    return _backend
+
+
+def set_backend(backend: InputBackend) -> InputBackend:
+    """Swap the process-wide backend (e.g. for a RecordingBackend); returns the previous one"""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
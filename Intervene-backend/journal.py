@@ -0,0 +1,358 @@
+"""
+journal.py - Durable workflow journal (SQLite, WAL mode, batched commits)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (JOURNAL_ENABLED, JOURNAL_PATH, JOURNAL_FLUSH_INTERVAL,
+                    JOURNAL_BATCH_SIZE, JOURNAL_MAX_RUNS)
+from scheduler import QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED, INTERRUPTED, Job
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RUN_COLUMNS = ("job_id", "request", "status", "planned", "streamed", "error", "replay_of",
+               "resumes", "created_at", "started_at", "finished_at")
+
+UPSERT_RUN = (
+    f"INSERT INTO runs ({', '.join(RUN_COLUMNS)}) VALUES ({', '.join('?' * len(RUN_COLUMNS))}) "
+    "ON CONFLICT (job_id) DO UPDATE SET "
+    # created_at stays that of the first submission when a run is resumed
+    + ", ".join(f"{column} = excluded.{column}" for column in RUN_COLUMNS[1:] if column != "created_at")
+)
+UPSERT_STEP = (
+    "INSERT INTO steps (job_id, idx, step, status, result, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (job_id, idx) DO UPDATE SET step = excluded.step, status = excluded.status, "
+    "result = excluded.result, updated_at = excluded.updated_at"
+)
+
+
+class WorkflowJournal:
+    """
+    Append-only record of every workflow's plan, step status and results.
+
+    Recording never touches the disk on the caller's thread: each call stores
+    a snapshot of the row in a pending map, and a writer thread commits
+    whatever has accumulated every ``flush_interval`` seconds (or once
+    ``batch_size`` rows are waiting) in one transaction. Rows are full
+    upserts, so several updates to the same step inside one window collapse
+    into a single write. With WAL and synchronous=NORMAL a commit survives a
+    crash of the process; at most the last window of updates is lost, which
+    on resume means re-running the step that was in flight.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.05, batch_size: int = 256,
+                 max_runs: int = 1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_runs = max_runs
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending: Dict[Tuple, Tuple[str, Tuple]] = {}
+        self._recorded = 0
+        self._committed = 0
+        self._flush_requested = False
+        self._closing = False
+        self._writer: Optional[threading.Thread] = None
+        self.records = 0
+        self.record_seconds = 0.0
+        self.commits = 0
+        self.rows_written = 0
+        self.commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.errors = 0
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "job_id TEXT PRIMARY KEY, request TEXT, status TEXT NOT NULL, "
+                "planned INTEGER NOT NULL, streamed INTEGER NOT NULL, error TEXT, replay_of TEXT, "
+                "resumes INTEGER NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS steps ("
+                "job_id TEXT NOT NULL, idx INTEGER NOT NULL, step TEXT NOT NULL, status TEXT NOT NULL, "
+                "result TEXT, updated_at REAL NOT NULL, PRIMARY KEY (job_id, idx))"
+            )
+            self._conn.commit()
+            self._prune()
+        except sqlite3.Error as e:
+            logger.error(f"Workflow journal unavailable, runs will not survive a restart: {e}")
+            self._conn = None
+            return
+
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    @property
+    def available(self) -> bool:
+        return self._conn is not None
+
+    # Recording (called on the event loop; never blocks on disk)
+
+    def record_run(self, job: Job, status: Optional[str] = None):
+        """Record the run row and every step the job knows about (status overrides job.status)"""
+        started = time.perf_counter()
+        rows = [self._run_row(job, status)]
+        rows.extend(self._step_row(job, index) for index in range(len(job.steps)))
+        self._put(rows, started)
+
+    def record_status(self, job: Job, status: Optional[str] = None):
+        """Record the run's status, timestamps and error (status overrides job.status)"""
+        self._put([self._run_row(job, status)], time.perf_counter())
+
+    def record_step(self, job: Job, index: int):
+        """Record one step's definition, status and result"""
+        self._put([self._step_row(job, index)], time.perf_counter())
+
+    @staticmethod
+    def _run_row(job: Job, status: Optional[str] = None):
+        return ("run", job.id), (UPSERT_RUN, (
+            job.id, job.request, status or job.status, int(job.planned), int(job.streamed), job.error,
+            job.replay_of, job.resumes, job.created_at, job.started_at, job.finished_at,
+        ))
+
+    @staticmethod
+    def _step_row(job: Job, index: int):
+        return ("step", job.id, index), (UPSERT_STEP, (
+            job.id, index, job.steps[index], job.step_status[index], job.results[index], time.time(),
+        ))
+
+    def _put(self, rows, started: float):
+        if self._conn is None:
+            return
+        with self._cond:
+            idle = not self._pending
+            for key, row in rows:
+                self._pending[key] = row
+            self._recorded += 1
+            # Only wake the writer when it is waiting for work; otherwise it
+            # picks these rows up with the batch it is already collecting
+            if idle or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+            self.records += 1
+            self.record_seconds += time.perf_counter() - started
+
+    # Writer thread
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.flush_interval
+                while not (self._closing or self._flush_requested or len(self._pending) >= self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = list(self._pending.values()), {}
+                recorded, self._flush_requested = self._recorded, False
+            self._commit(batch)
+            with self._cond:
+                self._committed = recorded
+                self._cond.notify_all()
+
+    def _commit(self, batch: List[Tuple[str, Tuple]]):
+        started = time.perf_counter()
+        try:
+            runs, steps = [], []
+            for sql, params in batch:
+                if sql is UPSERT_RUN:
+                    runs.append(params)
+                else:
+                    # Steps and results are serialized here, off the event loop
+                    job_id, index, step, status, result, updated_at = params
+                    steps.append((job_id, index, json.dumps(step), status,
+                                  json.dumps(result, default=str), updated_at))
+            with self._lock:
+                with self._conn:
+                    self._conn.executemany(UPSERT_RUN, runs)
+                    self._conn.executemany(UPSERT_STEP, steps)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.errors += 1
+            logger.error(f"Workflow journal dropped {len(batch)} rows: {e}")
+            return
+        elapsed = time.perf_counter() - started
+        self.commits += 1
+        self.rows_written += len(batch)
+        self.commit_seconds += elapsed
+        self.max_commit_seconds = max(self.max_commit_seconds, elapsed)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything recorded so far is committed
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        if self._conn is None:
+            return True
+        with self._cond:
+            target = self._recorded
+            if self._committed >= target:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._committed >= target or self._writer is None, timeout)
+
+    # Queries (blocking; run them in a worker thread from async code)
+
+    def mark_interrupted(self) -> int:
+        """
+        Mark runs a previous process left queued or running as interrupted
+
+        Call once at startup, before new jobs are submitted.
+
+        Returns:
+            int: Number of runs that can be resumed
+        """
+        if self._conn is None:
+            return 0
+        with self._lock:
+            with self._conn:
+                count = self._conn.execute(
+                    "UPDATE runs SET status = ? WHERE status IN (?, ?)", (INTERRUPTED, QUEUED, RUNNING)
+                ).rowcount
+        if count:
+            logger.info(f"Workflow journal: {count} interrupted runs can be resumed")
+        return count
+
+    def list_runs(self, limit: int = 50, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent runs first, with per-run step counts"""
+        if self._conn is None:
+            return []
+        self.flush()
+        query = (
+            f"SELECT {', '.join('r.' + column for column in RUN_COLUMNS)}, "
+            "COUNT(s.idx), SUM(CASE WHEN s.status = 'done' THEN 1 ELSE 0 END) "
+            "FROM runs r LEFT JOIN steps s ON s.job_id = r.job_id "
+        )
+        params: List[Any] = []
+        if status is not None:
+            query += "WHERE r.status = ? "
+            params.append(status)
+        query += "GROUP BY r.job_id ORDER BY r.created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        runs = []
+        for row in rows:
+            run = self._run_dict(row[:len(RUN_COLUMNS)])
+            run["step_count"], run["steps_done"] = row[-2], row[-1] or 0
+            runs.append(run)
+        return runs
+
+    def get_run(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """One run with its steps, results and step statuses, or None"""
+        if self._conn is None:
+            return None
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            steps = self._conn.execute(
+                "SELECT idx, step, status, result, updated_at FROM steps WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        run = self._run_dict(row)
+        run["steps"] = [
+            {"index": idx, "step": json.loads(step), "status": status,
+             "result": json.loads(result) if result is not None else None, "updated_at": updated_at}
+            for idx, step, status, result, updated_at in steps
+        ]
+        return run
+
+    @staticmethod
+    def _run_dict(row: Tuple) -> Dict[str, Any]:
+        run = dict(zip(RUN_COLUMNS, row))
+        run["planned"] = bool(run["planned"])
+        run["streamed"] = bool(run["streamed"])
+        return run
+
+    def _prune(self):
+        """Forget the oldest finished runs beyond max_runs"""
+        with self._lock:
+            with self._conn:
+                stale = self._conn.execute(
+                    "SELECT job_id FROM runs WHERE status IN (?, ?, ?) ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                    (COMPLETED, FAILED, CANCELLED, self.max_runs),
+                ).fetchall()
+                self._conn.executemany("DELETE FROM steps WHERE job_id = ?", stale)
+                self._conn.executemany("DELETE FROM runs WHERE job_id = ?", stale)
+        if stale:
+            logger.info(f"Workflow journal pruned {len(stale)} old runs")
+
+    def stats(self) -> Dict[str, Any]:
+        """Recording cost on the caller, batch sizes and commit latency"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "available": self.available,
+            "path": self.path,
+            "records": self.records,
+            "mean_record_us": round(self.record_seconds / self.records * 1e6, 2) if self.records else None,
+            "pending_rows": pending,
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+            "mean_rows_per_commit": round(self.rows_written / self.commits, 2) if self.commits else None,
+            "mean_commit_ms": round(self.commit_seconds / self.commits * 1000, 3) if self.commits else None,
+            "max_commit_ms": round(self.max_commit_seconds * 1000, 3),
+            "errors": self.errors,
+        }
+
+    def close(self):
+        """Commit what is pending and close the store"""
+        if self._conn is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+
+
+_journal: Optional[WorkflowJournal] = None
+
+
+def get_journal() -> Optional[WorkflowJournal]:
+    """Return the process-wide journal, or None when journaling is disabled"""
+    global _journal
+    if not JOURNAL_ENABLED:
+        return None
+    if _journal is None:
+        _journal = WorkflowJournal(
+            path=JOURNAL_PATH,
+            flush_interval=JOURNAL_FLUSH_INTERVAL,
+            batch_size=JOURNAL_BATCH_SIZE,
+            max_runs=JOURNAL_MAX_RUNS,
+        )
+    return _journal
+
+
+def close_journal():
+    """Flush and close the process-wide journal if it was opened"""
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
@@ -1,18 +1,184 @@
-from pynput import mouse, keyboard
+"""
+listener.py - Low-overhead detection of manual user input (override)
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+from config import OVERRIDE_DEBOUNCE, OVERRIDE_MIN_MOVE, OVERRIDE_SELF_INPUT_GRACE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
 
 class OverrideDetector:
-    def __init__(self):
-        self.override = False
+    """
+    Turns the raw mouse/keyboard event stream into a single override signal.
+
+    Input callbacks run on the listener threads for every motion event, so
+    the hot path is a couple of attribute checks: once the override is set,
+    further events are only counted. Mouse moves shorter than ``min_move``
+    pixels are treated as jitter, events within ``debounce`` seconds of the
+    last trigger are coalesced into it, and input generated by our own
+    automation (see ignoring_input) is not mistaken for the user.
+
+    Consumers observe the signal continuously: ``event`` for blocking code,
+    per-task tokens from watch(), and observer callbacks, which run on the
+    listener thread and must only hand off (e.g. loop.call_soon_threadsafe).
+    """
+
+    def __init__(self, debounce: float = OVERRIDE_DEBOUNCE, min_move: int = OVERRIDE_MIN_MOVE,
+                 self_input_grace: float = OVERRIDE_SELF_INPUT_GRACE):
+        self.debounce = debounce
+        self.min_move = min_move
+        self.self_input_grace = self_input_grace
+        self.event = threading.Event()
+        self.triggered_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._observers: List[Callable[[float], None]] = []
+        self._tokens = set()
+        self._origin = None
+        self._quiet_until = 0.0
+        self._ignoring = 0
+        self.events = 0
+        self.triggers = 0
+        self.aborts = 0
+        self.abort_total = 0.0
+        self.abort_max = 0.0
+
+    @property
+    def override(self) -> bool:
+        return self.event.is_set()
 
     def on_mouse_move(self, x, y):
-        self.override = True
+        self.events += 1
+        if self.event.is_set() or self._ignoring:
+            return
+        origin = self._origin
+        if origin is None:
+            self._origin = (x, y)
+            return
+        if abs(x - origin[0]) + abs(y - origin[1]) >= self.min_move:
+            self._input()
 
     def on_key_press(self, key):
-        self.override = True
+        self.events += 1
+        if self.event.is_set() or self._ignoring:
+            return
+        self._input()
+
+    def _input(self):
+        now = time.perf_counter()
+        if now < self._quiet_until:
+            return
+        with self._lock:
+            if self.event.is_set():
+                return
+            self.triggered_at = now
+            self._quiet_until = now + self.debounce
+            self.triggers += 1
+            self.event.set()
+            for token in self._tokens:
+                token.set()
+            observers = list(self._observers)
+        logger.info("Manual override detected")
+        for observer in observers:
+            try:
+                observer(now)
+            except Exception as e:
+                logger.error(f"Override observer failed: {e}")
+
+    def reset(self):
+        """Clear the override so the next workflow can run"""
+        with self._lock:
+            self.event.clear()
+            self._origin = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until an override or timeout; True if the user took over"""
+        return self.event.wait(timeout)
+
+    def add_observer(self, callback: Callable[[float], None]):
+        """Call callback(triggered_at) on the listener thread for every trigger"""
+        with self._lock:
+            self._observers.append(callback)
+
+    def remove_observer(self, callback: Callable[[float], None]):
+        with self._lock:
+            if callback in self._observers:
+                self._observers.remove(callback)
+
+    @contextmanager
+    def watch(self):
+        """
+        Yield a threading.Event that is set on override (already set if one is active)
+
+        Unlike ``event``, the token stays set after reset(), so a long-running
+        handler cannot miss an override that was already dealt with elsewhere.
+        """
+        token = threading.Event()
+        with self._lock:
+            if self.event.is_set():
+                token.set()
+            self._tokens.add(token)
+        try:
+            yield token
+        finally:
+            with self._lock:
+                self._tokens.discard(token)
+
+    @contextmanager
+    def ignoring_input(self):
+        """Ignore input while our own automation types or pastes"""
+        with self._lock:
+            self._ignoring += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._ignoring -= 1
+                # Synthetic events are delivered slightly after the call returns
+                self._quiet_until = max(self._quiet_until, time.perf_counter() + self.self_input_grace)
+
+    def record_abort(self, triggered_at: float):
+        """Record how long it took from the input event to the aborted work"""
+        latency = time.perf_counter() - triggered_at
+        with self._lock:
+            self.aborts += 1
+            self.abort_total += latency
+            self.abort_max = max(self.abort_max, latency)
+        logger.info(f"Workflow aborted {latency * 1000:.1f}ms after manual input")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "override": self.event.is_set(),
+                "events": self.events,
+                "triggers": self.triggers,
+                "aborts": self.aborts,
+                "abort_mean_ms": self.abort_total / self.aborts * 1000 if self.aborts else None,
+                "abort_max_ms": self.abort_max * 1000 if self.aborts else None,
+            }
 
     def start_listeners(self):
+        # Imported here so the server and tools load without an input backend
+        from pynput import mouse, keyboard
+
         mouse_listener = mouse.Listener(on_move=self.on_mouse_move)
         keyboard_listener = keyboard.Listener(on_press=self.on_key_press)
         mouse_listener.start()
         keyboard_listener.start()
         return mouse_listener, keyboard_listener
+
+
+_detector: Optional[OverrideDetector] = None
+
+
+def get_detector() -> OverrideDetector:
+    """Return the process-wide override detector"""
+    global _detector
+    if _detector is None:
+        _detector = OverrideDetector()
+    return _detector
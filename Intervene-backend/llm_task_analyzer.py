@@ -1,97 +1,450 @@
 """
 llm_task_analyzer.py - Task analysis using llama3.2 locally
 """
-from langchain_community.llms import Ollama
-from langchain_core.prompts import PromptTemplate
+import asyncio
+import copy
 import json
-import re
 import logging
+import hashlib
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from model_registry import get_model, LLM
+from model_gateway import get_gateway, GatewayBusyError, PRIORITY_BACKGROUND, PRIORITY_NORMAL
+from plan_cache import get_plan_cache, normalize_request
+from fast_planner import fast_planner
+from plan_schema import PLAN_SCHEMA, PlanValidationError, validate_plan, validate_step
+from metrics import PLANS, PLAN_GENERATIONS, stage
+from step_parser import IncrementalStepParser, parse_steps_text
+from config import (FAST_PLANNER_ENABLED, MODEL_MAX_CONCURRENT, PLAN_FORMAT, PLAN_MAX_STEPS, PLAN_MAX_TOKENS,
+                    PLAN_REPAIR_ATTEMPTS, PLAN_PREFIX_REUSE)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Initialize LLM with llama3.2 pointing to local Ollama server
-llm = Ollama(model="llama3.2", base_url="http://localhost:11434")
-
-ANALYZE_PROMPT = """
-You are an expert automation orchestrator. Given a user's request, break it down into a list of atomic, actionable steps that can be executed by either a browser automation agent or an Excel automation agent.
+# Static planning instructions. They are sent as the system prompt, ahead of
+# anything request-specific, so every planning call starts with the same
+# tokens and Ollama can reuse the evaluated prefix from its cache
+PLANNER_SYSTEM = """
+You are an expert automation orchestrator. Given a user's request, break it down into a list of atomic, actionable steps that can be executed by a browser automation agent, an Excel automation agent or an email agent.
 
 STRICT RULES:
 - EVERY browser step must be a single, atomic, fully-specified action. Do NOT output vague, multi-stage, or incomplete browser instructions. For example, do NOT output steps like 'open google', 'search google', 'search for X', or 'go to google and search'.
 - For browser steps, ALWAYS include BOTH the exact URL (e.g., 'https://www.google.com') AND the full search query in the instruction (e.g., 'open https://www.google.com and search for "LangChain"').
 - For Excel steps, ALWAYS output the headers and data to enter as JSON fields: 'headers' (a list of column names) and 'data' (a list of rows, each a list of cell values). If data should be copied from browser results, explicitly specify the headers and example data.
+- For email steps, put the complete draft text in 'body'.
+- Steps run in order. To let independent steps run at the same time, give every step an 'id' and list the ids each step needs first in 'depends_on'.
 - Do NOT ask for clarification or require any user input during execution.
 - Excel steps must always be routed to the Excel automation agent (not browser automation) and must be handled by a function called 'open_excel_with_data'.
-- STRICTLY output valid JSON: no trailing commas, use double quotes for all keys and string values, and do not include comments or explanations.
+- STRICTLY output a JSON array of steps and nothing else: no trailing commas, double quotes for all keys and string values, no comments or explanations.
 
-Respond in JSON format as follows (strictly valid JSON):
-[
-  {{"type": "browser", "instruction": "open https://www.google.com and search for 'LangChain'"}},
-  {{"type": "excel", "instruction": "create a new spreadsheet with general information about LangChain from its homepage", "headers": ["Title", "Description", "URL"], "data": [
-    ["Applications that can reason.", "Powered by LangChain.", "https://www.langchain.com"],
-    ["LangChain", "The framework for developing applications powered by language models.", "https://www.langchain.com"]
-  ]}}
-]
+Example:
+[{"type": "browser", "instruction": "open https://www.google.com and search for 'LangChain'"}, {"type": "excel", "instruction": "create a new spreadsheet with general information about LangChain from its homepage", "headers": ["Title", "Description", "URL"], "data": [["LangChain", "The framework for developing applications powered by language models.", "https://www.langchain.com"]]}]
+"""
 
+# The per-request part of a planning call
+PLAN_PROMPT = """
 User request: {request}
 """
 
-def analyze_request_with_llm(request: str):
+# A plan that failed validation is sent back once with only its problems
+REPAIR_PROMPT = """
+Your plan for the user request below does not match the required step format.
+
+Problems:
+{problems}
+
+Your plan:
+{output}
+
+Fix only these problems and output the corrected JSON array of steps and nothing else.
+
+User request: {request}
+"""
+
+# Longest previous output quoted back in a repair prompt (characters)
+MAX_REPAIR_OUTPUT = 4000
+
+
+def prompt_version(system: str, prompt: str, schema: Dict[str, Any]) -> str:
+    """Short hash of the planning prompt and schema text"""
+    return hashlib.sha256(
+        (system + prompt + json.dumps(schema, sort_keys=True)).encode("utf-8")
+    ).hexdigest()[:12]
+
+
+# Plans cached under an older prompt or schema are never served for the current one
+PROMPT_VERSION = prompt_version(PLANNER_SYSTEM, PLAN_PROMPT, PLAN_SCHEMA)
+
+# Planning outcomes
+VALID = "valid"
+REPAIRED_LOCALLY = "repaired_locally"
+REPAIRED_BY_MODEL = "repaired_by_model"
+FAILED = "failed"
+
+
+class PlanGenerationError(Exception):
+    """Raised when no valid plan could be produced, even after repair"""
+
+
+class PlanningStats:
+    """Per-plan outcomes, generations and tokens, for GET /planner"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes = {VALID: 0, REPAIRED_LOCALLY: 0, REPAIRED_BY_MODEL: 0, FAILED: 0}
+        self.generations = 0
+        self.repair_generations = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, outcome: str, usage: "PlanUsage"):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.generations += usage.generations
+            self.repair_generations += usage.generations - 1
+            self.prompt_tokens += usage.prompt_tokens
+            self.output_tokens += usage.output_tokens
+        PLANS.inc(outcome=outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            plans = sum(self.outcomes.values())
+            return {
+                "format": PLAN_FORMAT,
+                "plans": plans,
+                "outcomes": dict(self.outcomes),
+                # First output unusable as generated (repaired or failed)
+                "parse_failure_rate": (plans - self.outcomes[VALID]) / plans if plans else 0.0,
+                "repair_generations": self.repair_generations,
+                "generations_per_plan": self.generations / plans if plans else None,
+                "prompt_tokens_per_plan": self.prompt_tokens / plans if plans else None,
+                "output_tokens_per_plan": self.output_tokens / plans if plans else None,
+            }
+
+
+planning_stats = PlanningStats()
+
+
+class PlanUsage:
+    """Generations and tokens spent on one plan"""
+
+    __slots__ = ("generations", "prompt_tokens", "output_tokens")
+
+    def __init__(self):
+        self.generations = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, result: Optional[Dict[str, Any]], kind: str):
+        self.generations += 1
+        PLAN_GENERATIONS.inc(kind=kind)
+        if result:
+            self.prompt_tokens += result.get("prompt_eval_count") or 0
+            self.output_tokens += result.get("eval_count") or 0
+
+
+def planning_call(prompt: str, repair: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """
+    The prompt and Ollama request fields for one planning generation
+
+    With PLAN_PREFIX_REUSE the instructions travel as the system prompt, so
+    plans and repairs share one cached prefix. Without it the instructions
+    are prepended to plan prompts and repairs go without them.
+
+    Returns:
+        tuple: (prompt, keyword arguments for generate)
+    """
+    options: Dict[str, Any] = {"options": {"num_predict": PLAN_MAX_TOKENS}}
+    if PLAN_FORMAT == "schema":
+        options["format"] = PLAN_SCHEMA
+    elif PLAN_FORMAT == "json":
+        options["format"] = "json"
+    if PLAN_PREFIX_REUSE:
+        options["system"] = PLANNER_SYSTEM
+    elif not repair:
+        prompt = PLANNER_SYSTEM + prompt
+    return prompt, options
+
+
+async def prime_planner(slots: int = MODEL_MAX_CONCURRENT, timeout: Optional[float] = None) -> int:
+    """
+    Evaluate the planning prefix ahead of the first request
+
+    Runs one single-token generation per concurrent model slot, so each of
+    Ollama's parallel slots holds the instructions in its prompt cache.
+
+    Returns:
+        int: Prompt tokens Ollama evaluated while priming
+    """
+    if not PLAN_PREFIX_REUSE:
+        return 0
+    llm = get_model(LLM)
+    prompt, options = planning_call(PLAN_PROMPT.format(request=""))
+    options = {"system": options["system"], "options": {"num_predict": 1}}
+
+    async def prime():
+        async with get_gateway().slot(llm.model, PRIORITY_BACKGROUND):
+            result = await llm.generate(prompt, timeout=timeout, **options)
+        return result.get("prompt_eval_count") or 0
+
+    evaluated = sum(await asyncio.gather(*(prime() for _ in range(max(1, slots)))))
+    logger.info(f"Primed planning prefix on {llm.model} ({evaluated} prompt tokens)")
+    return evaluated
+
+
+def check_plan(text: str) -> Tuple[Optional[List[Dict[str, Any]]], List[str], bool]:
     """
-    Analyze a user request with llama3.2 and break it down into actionable steps
+    Decode and validate a generated plan
+
+    Output that is not valid JSON (prose around the array, single quotes,
+    trailing commas) gets a local repair first, which costs no generation.
+
+    Args:
+        text (str): The raw model output
+
+    Returns:
+        tuple: (steps or None, problems, whether local repair was needed)
+    """
+    repaired = False
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        value = parse_steps_text(text)
+        if not value:
+            return None, [f"output is not a JSON array of steps ({e.msg})"], False
+        repaired = True
+    # JSON mode tends to wrap the array in an object
+    if isinstance(value, dict) and isinstance(value.get("steps"), list):
+        value = value["steps"]
+    try:
+        return validate_plan(value), [], repaired
+    except PlanValidationError as e:
+        return None, e.errors, repaired
+
+
+def repair_prompt(request: str, output: str, problems: List[str]) -> str:
+    return REPAIR_PROMPT.format(
+        problems="\n".join(f"- {problem}" for problem in problems),
+        output=output[:MAX_REPAIR_OUTPUT],
+        request=request,
+    )
+
+
+def fast_plan(request: str) -> Optional[List[Dict[str, Any]]]:
+    """Plan a request with the rule-based fast path; None when it needs the LLM"""
+    if not FAST_PLANNER_ENABLED:
+        return None
+    with stage("fast_plan"):
+        return fast_planner.plan(request)
+
+
+def _outcome(usage: PlanUsage, repaired_locally: bool) -> str:
+    if usage.generations > 1:
+        return REPAIRED_BY_MODEL
+    return REPAIRED_LOCALLY if repaired_locally else VALID
+
+
+async def _plan_async(llm, request: str, timeout: Optional[float]) -> List[Dict[str, Any]]:
+    """Generate, validate and (within bounds) repair one plan; runs under a model slot"""
+    usage = PlanUsage()
+    try:
+        with stage("planning"):
+            prompt, options = planning_call(PLAN_PROMPT.format(request=request))
+            result = await llm.generate(prompt, timeout=timeout, **options)
+        usage.add(result, "plan")
+        output = result.get("response", "")
+        with stage("plan_parse"):
+            steps, problems, repaired = check_plan(output)
+        while steps is None and usage.generations <= PLAN_REPAIR_ATTEMPTS:
+            logger.warning(f"Plan failed validation, repairing: {problems}")
+            with stage("plan_repair"):
+                prompt, options = planning_call(repair_prompt(request, output, problems), repair=True)
+                result = await llm.generate(prompt, timeout=timeout, **options)
+            usage.add(result, "repair")
+            output = result.get("response", "")
+            steps, problems, repaired = check_plan(output)
+    except Exception:
+        planning_stats.record(FAILED, usage)
+        raise
+    
+    if steps is None:
+        planning_stats.record(FAILED, usage)
+        raise PlanGenerationError(f"Could not produce a valid plan: {'; '.join(problems)}")
+    planning_stats.record(_outcome(usage, repaired), usage)
+    logger.info(f"Planned {len(steps)} steps")
+    return steps
+
+async def analyze_request_with_llm_async(request: str, timeout: Optional[float] = None,
+                                         priority: int = PRIORITY_NORMAL):
+    """
+    Analyze a user request with the planning model and break it down into actionable steps
+    
+    Requests the rule-based fast path recognizes are planned without a model
+    call. Uses the shared model client, so concurrent requests reuse pooled
+    connections. Identical requests already being planned share that
+    generation, including its repair. Cancelling the awaiting task aborts
+    the HTTP call.
     
     Args:
         request (str): The user's request
+        timeout (float): Optional deadline for each LLM call in seconds
+        priority (int): Admission priority at the model gateway
         
     Returns:
         list: A list of steps to execute
-    """
-    try:
-        logger.info(f"Analyzing request: {request}")
-        
-        # Prepare the prompt
-        prompt = PromptTemplate.from_template(ANALYZE_PROMPT)
-        
-        # Invoke the LLM
-        response = llm.invoke(prompt.format(request=request))
         
-        # Log LLM output for debugging
-        logger.info(f"LLM output: {response}")
-        
-        # Clean and parse the JSON response
-        cleaned_response = clean_json_response(response)
-        steps = json.loads(cleaned_response)
-        
-        logger.info(f"Parsed {len(steps)} steps from LLM response")
+    Raises:
+        GatewayBusyError: When the planning model's queue is full
+        PlanGenerationError: When no valid plan could be produced
+    """
+    steps = fast_plan(request)
+    if steps is not None:
         return steps
-        
+    llm = get_model(LLM)
+    cache = get_plan_cache()
+    if cache is not None:
+        cached = await cache.get_async(request, llm.model, PROMPT_VERSION)
+        if cached is not None:
+            logger.info(f"Plan cache hit for request: {request}")
+            return cached
+    
+    logger.info(f"Analyzing request: {request}")
+    started = time.perf_counter()
+    try:
+        steps = await get_gateway().call(
+            llm.model,
+            (PROMPT_VERSION, normalize_request(request)),
+            lambda: _plan_async(llm, request, timeout),
+            priority,
+        )
+    except (GatewayBusyError, PlanGenerationError):
+        raise
     except Exception as e:
         logger.error(f"Error analyzing request: {str(e)}")
-        # Return a fallback step in case of error
-        return [{"type": "browser", "instruction": "open https://www.google.com"}]
+        raise PlanGenerationError(f"Planning failed: {e}") from e
+    
+    fast_planner.record_llm(time.perf_counter() - started)
+    if cache is not None:
+        await cache.put_async(request, llm.model, PROMPT_VERSION, steps)
+    # Coalesced callers each get their own copy of the shared plan
+    return copy.deepcopy(steps)
 
-def clean_json_response(response: str) -> str:
+async def stream_steps_with_llm(request: str, timeout: Optional[float] = None,
+                                priority: int = PRIORITY_NORMAL) -> AsyncIterator[Dict[str, Any]]:
     """
-    Clean a potentially messy JSON response from the LLM
+    Stream the plan for a request, yielding each step as soon as it is generated
+    
+    Each step is validated as it completes and invalid ones are skipped. If
+    nothing valid arrives, the output gets the same bounded repair as a
+    non-streamed plan. At most PLAN_MAX_STEPS steps are yielded: generation
+    stops at the limit and the cut-off plan is not cached.
     
     Args:
-        response (str): The raw LLM response
+        request (str): The user's request
+        timeout (float): Optional deadline for the whole generation in seconds
+        priority (int): Admission priority at the model gateway
         
-    Returns:
-        str: A cleaned JSON string
+    Yields:
+        dict: The next step to execute
+        
+    Raises:
+        GatewayBusyError: When the planning model's queue is full
+        PlanGenerationError: When no valid step could be produced
     """
-    # Extract JSON array from response
-    json_match = re.search(r'\[\s*{.*}\s*\]', response, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(0)
-    else:
-        # Fallback - try to find anything that looks like JSON
-        json_str = response
+    steps = fast_plan(request)
+    if steps is not None:
+        for step in steps:
+            yield step
+        return
+    llm = get_model(LLM)
+    cache = get_plan_cache()
+    if cache is not None:
+        cached = await cache.get_async(request, llm.model, PROMPT_VERSION)
+        if cached is not None:
+            logger.info(f"Plan cache hit for request: {request}")
+            for step in cached:
+                yield step
+            return
     
-    # Fix common JSON errors
-    json_str = json_str.replace('}}', ']}')  # Fix bracket mismatch
-    json_str = json_str.replace('}\n  }', ']\n  }')  # Fix nested endings
-    json_str = re.sub(r',(\s*[\]}])', r'\1', json_str)  # Remove trailing commas
-    json_str = re.sub(r'\'', r'"', json_str)  # Replace single quotes with double quotes
+    logger.info(f"Streaming plan for request: {request}")
+    parser = IncrementalStepParser()
+    usage = PlanUsage()
+    steps, problems, output = [], [], []
+    final = None
+    complete = False
+    truncated = False
+    try:
+        # Streams cannot be shared, but they still take a generation slot
+        with stage("planning", streaming=True):
+            prompt, options = planning_call(PLAN_PROMPT.format(request=request))
+            async with get_gateway().slot(llm.model, priority):
+                stream = llm.generate_stream(prompt, timeout=timeout, **options)
+                try:
+                    async for chunk in stream:
+                        text = chunk.get("response", "")
+                        output.append(text)
+                        if chunk.get("done"):
+                            final = chunk
+                        for step in parser.feed(text):
+                            if len(steps) >= PLAN_MAX_STEPS:
+                                truncated = True
+                                break
+                            try:
+                                step = validate_step(step)
+                            except PlanValidationError as e:
+                                logger.warning(f"Skipping invalid step: {e}")
+                                problems.extend(f"step {len(steps) + 1}: {problem}" for problem in e.errors)
+                                continue
+                            steps.append(step)
+                            yield step
+                        if truncated or (len(steps) >= PLAN_MAX_STEPS and not parser.done):
+                            # Same limit as a whole plan; stop the generation instead of running on
+                            logger.warning(f"Streamed plan reached {PLAN_MAX_STEPS} steps, stopping generation")
+                            truncated = True
+                            break
+                finally:
+                    await stream.aclose()
+        usage.add(final, "plan")
+        complete = parser.done and not problems and not truncated
+        
+        if not steps:
+            output = "".join(output)
+            async with get_gateway().slot(llm.model, priority):
+                repaired = await _repair_stream_async(llm, request, output, usage, timeout)
+            complete = True
+            for step in repaired:
+                steps.append(step)
+                yield step
+    except GatewayBusyError:
+        raise
+    except PlanGenerationError:
+        planning_stats.record(FAILED, usage)
+        raise
+    except Exception as e:
+        planning_stats.record(FAILED, usage)
+        logger.error(f"Error streaming plan: {str(e)}")
+        if not steps:
+            raise PlanGenerationError(f"Planning failed: {e}") from e
+        return
     
-    return json_str
\ No newline at end of file
+    planning_stats.record(_outcome(usage, bool(parser.skipped or problems)), usage)
+    logger.info(f"Streamed {len(steps)} steps from LLM response")
+    if complete and cache is not None:
+        await cache.put_async(request, llm.model, PROMPT_VERSION, steps)
+
+async def _repair_stream_async(llm, request: str, output: str, usage: PlanUsage,
+                               timeout: Optional[float]) -> List[Dict[str, Any]]:
+    """Repair a streamed plan that yielded no valid step; runs under a model slot"""
+    steps, problems, _ = check_plan(output)
+    while steps is None and usage.generations <= PLAN_REPAIR_ATTEMPTS:
+        logger.warning(f"Streamed plan failed validation, repairing: {problems}")
+        with stage("plan_repair"):
+            prompt, options = planning_call(repair_prompt(request, output, problems), repair=True)
+            result = await llm.generate(prompt, timeout=timeout, **options)
+        usage.add(result, "repair")
+        output = result.get("response", "")
+        steps, problems, _ = check_plan(output)
+    if steps is None:
+        raise PlanGenerationError(f"Could not produce a valid plan: {'; '.join(problems)}")
+    return steps
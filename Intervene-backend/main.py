@@ -1,29 +1,105 @@
 """
 main.py - Main application with FastAPI and Ollama-based agent tool calling
 """
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 from typing import List, Dict, Any, Optional
-import uvicorn
 import json
 import logging
-import re
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 
 # Import your task functions
-from tasks import handle_email_task, handle_spreadsheet_task, open_excel_with_data
-from llm_task_analyzer import analyze_request_with_llm
-from vision_analyzer import analyze_screenshot
+from tasks import handle_email_task, handle_spreadsheet_task, open_excel_with_data, analyze_current_screen_async
+from llm_task_analyzer import (analyze_request_with_llm_async, stream_steps_with_llm, prime_planner,
+                               planning_stats, PlanGenerationError, PROMPT_VERSION)
+from fast_planner import fast_planner, parse_browser_instruction
+from ollama_pool import close_pools, endpoint_stats, start_health_checks
+from screen_buffer import get_screen_capture, start_screen_capture, stop_screen_capture
+from plan_cache import get_plan_cache
+from vision_cache import get_vision_cache
+from scheduler import (JobScheduler, Job, QueueFullError, PlanError, QUEUED, RUNNING, INTERRUPTED,
+                       STEP_RUNNING, STEP_DONE, STEP_FAILED, STEP_SKIPPED)
+from journal import get_journal, close_journal
+from broadcaster import Broadcaster
+from shared_state import get_state_backend, close_state_backend
+from update_protocol import LEGACY, negotiate, decode
+from tool_executor import ToolExecutor
+from waiting import wait_stats
+from model_registry import get_registry, get_model, LLM
+from model_gateway import get_gateway, GatewayBusyError, PRIORITY_INTERACTIVE
+from listener import get_detector
+from metrics import registry as metrics_registry, monitor_event_loop
+from tracing import start_trace, activate, trace_store
+from config import (OLLAMA_LLM_MODEL, SCHEDULER_WORKERS, SCHEDULER_QUEUE_SIZE,
+                    SCHEDULER_MAX_PARALLEL_STEPS, SCHEDULER_HISTORY_SIZE,
+                    WS_QUEUE_SIZE, WS_REPLAY_SIZE, WS_SLOW_CLIENT_POLICY, WS_SEND_TIMEOUT, WS_COALESCE_WINDOW,
+                    TOOL_THREAD_WORKERS, TOOL_TIMEOUT, TOOL_LIMITS,
+                    OLLAMA_WARMUP, OLLAMA_KEEPALIVE_INTERVAL, OLLAMA_HEALTH_INTERVAL, OVERRIDE_DETECTION,
+                    EVENT_LOOP_PROBE_INTERVAL, JOURNAL_AUTO_RESUME, JOURNAL_MAX_RUNS, PLAN_PREFIX_WARMUP,
+                    configure_logging)
+from vision_analyzer import analyze_screenshot_async
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Intervene Backend")
+async def warm_up(registry):
+    """Load the models, then put the planning prefix in the model's prompt cache."""
+    await registry.warmup()
+    if PLAN_PREFIX_WARMUP:
+        try:
+            # One priming call per concurrent slot, spread over the planning endpoints
+            await prime_planner(get_gateway().gate(get_model(LLM).model).max_concurrent)
+        except Exception as e:
+            logger.warning(f"Priming the planning prefix failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the job scheduler and model warm-up; release shared resources on shutdown."""
+    state = await asyncio.to_thread(get_state_backend)
+    await state.start(broadcaster.publish, handle_control)
+    journal = await asyncio.to_thread(get_journal)
+    # With several workers only the first one to start recovers, so live runs of the others are left alone
+    if journal is not None and state.first:
+        # Runs a previous process left queued or running can now be resumed
+        await asyncio.to_thread(journal.mark_interrupted)
+    scheduler.journal = journal
+    await scheduler.start()
+    if journal is not None and JOURNAL_AUTO_RESUME and state.first:
+        await resume_interrupted(journal)
+    registry = get_registry()
+    if OLLAMA_WARMUP:
+        # Load models in the background so the port is bound right away
+        warmup = asyncio.create_task(warm_up(registry))
+    registry.start_keepalive(OLLAMA_KEEPALIVE_INTERVAL)
+    start_health_checks(OLLAMA_HEALTH_INTERVAL)
+    start_screen_capture()
+    stop_override_detection = start_override_detection() if OVERRIDE_DETECTION else None
+    loop_probe = asyncio.create_task(monitor_event_loop(EVENT_LOOP_PROBE_INTERVAL)) if EVENT_LOOP_PROBE_INTERVAL > 0 else None
+    yield
+    if loop_probe is not None:
+        loop_probe.cancel()
+    if stop_override_detection is not None:
+        stop_override_detection()
+    if OLLAMA_WARMUP:
+        warmup.cancel()
+    await asyncio.to_thread(stop_screen_capture)
+    await registry.stop()
+    await scheduler.stop()
+    scheduler.journal = None
+    await asyncio.to_thread(close_journal)
+    await close_state_backend()
+    await broadcaster.close()
+    tools.shutdown()
+    await close_pools()
+    cache = get_plan_cache()
+    if cache is not None:
+        await asyncio.to_thread(cache.close)
+
+app = FastAPI(title="Intervene Backend", lifespan=lifespan)
 
 # Enable CORS for all origins (for development)
 app.add_middleware(
@@ -34,69 +110,184 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store active WebSocket connections
-active_connections: List[WebSocket] = []
+# Fans step updates out to connected WebSocket clients
+broadcaster = Broadcaster(
+    queue_size=WS_QUEUE_SIZE,
+    replay_size=WS_REPLAY_SIZE,
+    slow_policy=WS_SLOW_CLIENT_POLICY,
+    send_timeout=WS_SEND_TIMEOUT,
+    coalesce_window=WS_COALESCE_WINDOW,
+)
 
-# Store current execution state
-current_execution = {
-    "is_running": False,
-    "steps": [],
-    "current_step": -1,
-}
+# Blocking tool handlers (subprocess, sleeps, sync HTTP) run in worker threads
+tools = ToolExecutor(
+    thread_workers=TOOL_THREAD_WORKERS,
+    default_timeout=TOOL_TIMEOUT,
+)
+tools.register("excel", handle_spreadsheet_task, limit=TOOL_LIMITS.get("excel"))
+tools.register("email", handle_email_task, limit=TOOL_LIMITS.get("email"))
+tools.register("vision_analyze", analyze_screenshot_async, limit=TOOL_LIMITS.get("vision_analyze"))
+# Capture-and-analyze is the same vision tool without a file, so it counts against the same limit
+tools.register("vision_capture", analyze_current_screen_async, shares="vision_analyze")
 
 class StepsRequest(BaseModel):
     steps: List[Dict[str, Any]]
 
 class RequestString(BaseModel):
     request: str
+    stream: bool = False
 
 class ToolRequest(BaseModel):
     tool_name: str
     parameters: Dict[str, Any] = {}
 
-async def notify_clients(step_index: int, message: Optional[str] = None):
-    """Send step completion notification to all connected clients."""
-    if active_connections:
-        update = {
-            "completedStepIndex": step_index,
-            "message": message or f"Completed step {step_index + 1}"
-        }
-        for connection in active_connections:
-            try:
-                await connection.send_json(update)
-            except Exception as e:
-                logger.error(f"Error sending update: {e}")
+async def notify_clients(step_index: int, message: Optional[str] = None, job_id: Optional[str] = None,
+                         state: Optional[str] = None, result: Optional[Any] = None):
+    """
+    Send a step update to all connected clients, on every worker.
+    
+    Legacy clients receive the message; version 2 clients receive the step's
+    new state (and result) in the next coalesced delta frame. Only queues the
+    update; each client's own sender delivers it, so a slow client never
+    holds up the workflow or the other clients.
+    """
+    event = {"step": step_index, "message": message or f"Completed step {step_index + 1}"}
+    if job_id is not None:
+        event["job"] = job_id
+    if state is not None:
+        event["state"] = state
+    if result is not None:
+        event["result"] = result if isinstance(result, (str, int, float, bool)) else str(result)
+    get_state_backend().publish(event)
+
+def notify_job_status(job: Job):
+    """Publish a job's status change to version 2 clients (legacy clients never received these)."""
+    state = get_state_backend()
+    if state.shared:
+        state.put_job(job.to_dict())
+    event = {"job": job.id, "status": job.status}
+    if job.is_finished:
+        # Steps that will never complete: failed, or skipped after a failure or cancellation
+        ended = {i: status for i, status in enumerate(job.step_status) if status in (STEP_FAILED, STEP_SKIPPED)}
+        if ended:
+            event["steps"] = ended
+    state.publish(event)
+
+def record_job_step(job: Job, index: int):
+    """Share a job's step progress with the other workers."""
+    state = get_state_backend()
+    if state.shared:
+        state.put_job(job.to_dict())
+
+def handle_control(message: Dict[str, Any]):
+    """Act on a command sent to every worker; only the worker running the job cancels it."""
+    if "cancel" in message:
+        scheduler.cancel(message["cancel"])
+
+async def run_step(job: Job, index: int, step: Dict[str, Any]) -> str:
+    """Execute one workflow step, routing it to the correct handler."""
+    await notify_clients(index, f"Started step {index+1}: {step.get('instruction', 'No instruction')}", job.id,
+                         state=STEP_RUNNING)
+    
+    if step.get('type') == 'browser':
+        # Handle browser tool calling
+        result = await handle_browser_tool(step['instruction'])
+    elif step.get('type') == 'excel':
+        headers = step.get('headers')
+        data = step.get('data')
+        result = await tools.run("excel", data=data or [], headers=headers or [],
+                                 output_format=step.get('format', 'csv'))
+    elif step.get('type') == 'email':
+        result = await tools.run("email", draft_text=step.get('body'))
+    else:
+        result = f"Unsupported query type for step: {step.get('instruction', 'No instruction')}"
+    
+    await notify_clients(index, f"Completed step {index+1}: {result}", job.id, state=STEP_DONE, result=result)
+    return result
+
+# Runs submitted workflows concurrently on a bounded worker pool
+scheduler = JobScheduler(
+    run_step,
+    max_workers=SCHEDULER_WORKERS,
+    max_queue=SCHEDULER_QUEUE_SIZE,
+    max_parallel_steps=SCHEDULER_MAX_PARALLEL_STEPS,
+    history_size=SCHEDULER_HISTORY_SIZE,
+    on_status=notify_job_status,
+    on_step=record_job_step,
+)
+
+def start_override_detection():
+    """
+    Abort running workflows as soon as the user takes over mouse or keyboard.
+    
+    The detector's observer runs on the input listener thread and only hands
+    the trigger to the event loop; cancellation happens on the next loop tick.
+    The listeners (and pynput) are started in a worker thread so they do not
+    delay the server accepting its first request.
+    
+    Returns:
+        callable: Removes the observer and stops the listeners
+    """
+    detector = get_detector()
+    loop = asyncio.get_running_loop()
+    
+    def observer(triggered_at: float):
+        loop.call_soon_threadsafe(abort_for_override, triggered_at)
+    
+    def started(future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            # No input backend (e.g. headless or missing accessibility permission)
+            logger.warning(f"Override detection unavailable: {future.exception()}")
+            detector.remove_observer(observer)
+            return
+        logger.info("Override detection started")
+    
+    def stop_listeners(future):
+        if not future.cancelled() and future.exception() is None:
+            for listener in future.result():
+                listener.stop()
+    
+    detector.add_observer(observer)
+    starting = loop.run_in_executor(None, detector.start_listeners)
+    starting.add_done_callback(started)
+    
+    def stop():
+        detector.remove_observer(observer)
+        if starting.done():
+            stop_listeners(starting)
+        else:
+            starting.add_done_callback(stop_listeners)
+    
+    return stop
 
-async def execute_workflow(steps: List[Dict[str, Any]]):
-    """Execute the workflow, routing each step to the correct handler."""
-    global current_execution
+def abort_for_override(triggered_at: float):
+    """Cancel every running job, then re-arm the detector once they have stopped."""
+    jobs = scheduler.running_jobs()
+    tasks = scheduler.cancel_running()
+    for job in jobs:
+        get_state_backend().publish({
+            "step": job.current_step,
+            "message": "Cancelled: manual override detected",
+            "job": job.id,
+        })
     
-    current_execution["is_running"] = True
-    current_execution["steps"] = steps
-    current_execution["current_step"] = -1
+    async def settle():
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            get_detector().record_abort(triggered_at)
+        get_detector().reset()
     
+    asyncio.create_task(settle())
+
+def submit_job(steps, trace=None, request=None, replay_of=None) -> Dict[str, Any]:
+    """Submit steps to the scheduler and build the API response."""
     try:
-        for i, step in enumerate(steps):
-            current_execution["current_step"] = i
-            await notify_clients(current_execution["current_step"], f"Started step {i+1}: {step.get('instruction', 'No instruction')}")
-            
-            if step['type'] == 'browser':
-                # Handle browser tool calling
-                result = await handle_browser_tool(step['instruction'])
-            elif step['type'] == 'excel':
-                headers = step.get('headers')
-                data = step.get('data')
-                result = handle_spreadsheet_task(data=data or [], headers=headers or [])
-            else:
-                result = f"Unsupported query type for step: {step.get('instruction', 'No instruction')}"
-            
-            await asyncio.sleep(1)
-            await notify_clients(current_execution["current_step"], f"Completed step {i+1}: {result}")
-            await asyncio.sleep(0.5)
-    except Exception as e:
-        logger.error(f"Error executing workflow: {e}")
-    finally:
-        current_execution["is_running"] = False
+        job = scheduler.submit(steps, trace=trace, request=request, replay_of=replay_of)
+    except (QueueFullError, PlanError) as e:
+        return {"success": False, "message": str(e)}
+    return {"success": True, "message": "Execution started", "job_id": job.id}
 
 async def handle_browser_tool(instruction: str) -> str:
     """
@@ -110,13 +301,8 @@ async def handle_browser_tool(instruction: str) -> str:
     """
     logger.info(f"Handling browser instruction: {instruction}")
     
-    # Extract URL if present
-    url_match = re.search(r'https?://[^\s"\']+', instruction)
-    url = url_match.group(0) if url_match else None
-    
-    # Extract search query if present
-    search_match = re.search(r'search for ["\']([^"\']+)["\']', instruction, re.IGNORECASE)
-    search_query = search_match.group(1) if search_match else None
+    # Extract the URL and search query, if present, with the planner's precompiled patterns
+    url, search_query = parse_browser_instruction(instruction)
     
     # Handle different browser actions
     if url and search_query:
@@ -135,24 +321,153 @@ async def handle_browser_tool(instruction: str) -> str:
         # No specific action detected
         return "No specific browser action detected in instruction"
 
+def busy_response(message: str = "Model is busy, try again shortly"):
+    """Fast answer for requests shed by the model gateway."""
+    return {"success": False, "busy": True, "message": message}
+
 @app.post("/steps")
 async def receive_steps(request: StepsRequest):
-    """Receive explicit steps and start execution."""
-    if current_execution["is_running"]:
-        return {"success": False, "message": "Execution already in progress"}
-    
-    asyncio.create_task(execute_workflow(request.steps))
-    return {"success": True, "message": "Execution started"}
+    """Receive explicit steps and queue them for execution."""
+    return submit_job(request.steps)
 
 @app.post("/run_request")
 async def run_request(request: RequestString):
-    """Accept a free-form user request, break it into steps, and execute them."""
-    if current_execution["is_running"]:
-        return {"success": False, "message": "Execution already in progress"}
+    """
+    Accept a free-form user request, break it into steps, and execute them.
+    
+    With "stream": true the response returns immediately and each step starts
+    executing as soon as the LLM has generated it; progress arrives over
+    /step-updates.
     
-    steps = analyze_request_with_llm(request.request)
-    asyncio.create_task(execute_workflow(steps))
-    return {"success": True, "message": "Execution started", "steps": steps}
+    When the planning model is saturated the request is turned away at once
+    with "busy": true instead of queueing behind a long backlog.
+    """
+    if request.stream:
+        if get_gateway().gate(get_model(LLM).model).is_full():
+            return busy_response()
+        return {**submit_job(stream_steps_with_llm(request.request), request=request.request), "streaming": True}
+    
+    # Planning happens before the job exists, so its span opens the job's trace
+    trace = start_trace("job")
+    try:
+        with activate(trace):
+            steps = await analyze_request_with_llm_async(request.request)
+    except GatewayBusyError as e:
+        return busy_response(str(e))
+    except PlanGenerationError as e:
+        return {"success": False, "message": str(e)}
+    return {**submit_job(steps, trace=trace, request=request.request), "steps": steps}
+
+async def all_jobs() -> List[Dict[str, Any]]:
+    """This worker's jobs, then those the other workers shared."""
+    jobs = [job.to_dict() for job in scheduler.list_jobs()]
+    state = get_state_backend()
+    if state.shared:
+        local = {job["job_id"] for job in jobs}
+        shared = await asyncio.to_thread(state.list_jobs)
+        jobs.extend(job for job in shared if job["job_id"] not in local)
+    return jobs
+
+@app.get("/jobs")
+async def list_jobs():
+    """List queued, running and recently finished jobs of every worker."""
+    return {"jobs": await all_jobs(), "queue_depth": scheduler.queue_depth()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the status of one job, whichever worker runs it."""
+    job = scheduler.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    shared = await asyncio.to_thread(get_state_backend().get_job, job_id)
+    if shared is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return shared
+
+@app.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str):
+    """Return the span tree of one job: planning, queueing, steps, tools and waits."""
+    trace = trace_store.get(job_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace for this job")
+    return trace.to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job, whichever worker runs it."""
+    if scheduler.get(job_id) is None:
+        shared = await asyncio.to_thread(get_state_backend().get_job, job_id)
+        if shared is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if shared["status"] not in (QUEUED, RUNNING):
+            return {"success": False, "message": "Job already finished"}
+        # The worker running it cancels it when the command arrives
+        get_state_backend().control({"cancel": job_id})
+        return {"success": True, "message": "Cancellation requested"}
+    if not scheduler.cancel(job_id):
+        return {"success": False, "message": "Job already finished"}
+    return {"success": True, "message": "Job cancelled"}
+
+async def load_run(job_id: str) -> Dict[str, Any]:
+    """Read one run from the journal, or raise 404."""
+    journal = scheduler.journal
+    if journal is None:
+        raise HTTPException(status_code=404, detail="Workflow journal is disabled")
+    run = await asyncio.to_thread(journal.get_run, job_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+async def resume_interrupted(journal):
+    """Resume every run the previous process left unfinished, oldest first."""
+    runs = await asyncio.to_thread(journal.list_runs, JOURNAL_MAX_RUNS, INTERRUPTED)
+    for summary in reversed(runs):
+        run = await asyncio.to_thread(journal.get_run, summary["job_id"])
+        try:
+            scheduler.resume(run)
+        except (QueueFullError, PlanError) as e:
+            logger.warning(f"Could not resume run {summary['job_id']}: {e}")
+
+@app.get("/runs")
+async def list_runs(limit: int = 50, status: Optional[str] = None):
+    """List journaled runs, newest first, including runs from before a restart."""
+    journal = scheduler.journal
+    if journal is None:
+        return {"enabled": False, "runs": []}
+    return {"enabled": True, "runs": await asyncio.to_thread(journal.list_runs, limit, status)}
+
+@app.get("/runs/{job_id}")
+async def get_run(job_id: str):
+    """Return a journaled run with its plan, step statuses and results."""
+    return await load_run(job_id)
+
+@app.post("/runs/{job_id}/resume")
+async def resume_run(job_id: str):
+    """Continue a run from its last completed step, under the same job id and without replanning."""
+    run = await load_run(job_id)
+    try:
+        job = scheduler.resume(run)
+    except (QueueFullError, PlanError) as e:
+        return {"success": False, "message": str(e)}
+    return {"success": True, "message": "Execution resumed", "job_id": job.id,
+            "completed_steps": job.step_status.count(STEP_DONE)}
+
+@app.post("/runs/{job_id}/replay")
+async def replay_run(job_id: str):
+    """Run a journaled plan again from the first step as a new job, without replanning."""
+    run = await load_run(job_id)
+    if not run["planned"]:
+        return {"success": False, "message": "Run stopped before its plan finished streaming; submit the request again"}
+    steps = [record["step"] for record in run["steps"]]
+    return {**submit_job(steps, request=run["request"], replay_of=job_id), "steps": steps}
+
+@app.get("/journal")
+async def journal_stats():
+    """Report journaling cost: per-record time on the event loop, batch sizes and commit latency."""
+    journal = scheduler.journal
+    if journal is None:
+        return {"enabled": False}
+    return {"enabled": True, **journal.stats()}
 
 @app.post("/tool_call")
 async def tool_call(request: ToolRequest):
@@ -166,51 +481,245 @@ async def tool_call(request: ToolRequest):
         elif request.tool_name == "excel":
             data = request.parameters.get("data", [])
             headers = request.parameters.get("headers", [])
-            result = handle_spreadsheet_task(data=data, headers=headers)
+            output_format = request.parameters.get("format", "csv")
+            result = await tools.run("excel", data=data, headers=headers, output_format=output_format)
         elif request.tool_name == "email":
             draft_text = request.parameters.get("draft_text", None)
-            result = handle_email_task(draft_text=draft_text)
+            result = await tools.run("email", draft_text=draft_text)
         elif request.tool_name == "vision_analyze":
             screenshot_path = request.parameters.get("screenshot_path")
-            result = analyze_screenshot(screenshot_path)
+            if screenshot_path:
+                result = await tools.run("vision_analyze", screenshot_path, priority=PRIORITY_INTERACTIVE)
+            else:
+                # No file given: capture the screen in memory
+                result = await tools.run("vision_capture", priority=PRIORITY_INTERACTIVE)
         else:
             result = f"Unknown tool: {request.tool_name}"
             
         return {"success": True, "result": result}
+    except GatewayBusyError as e:
+        return busy_response(str(e))
     except Exception as e:
         logger.error(f"Error executing tool {request.tool_name}: {str(e)}")
         return {"success": False, "error": str(e)}
 
+@app.get("/plan_cache")
+async def plan_cache_stats():
+    """Report plan cache hit/miss counters."""
+    cache = get_plan_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await asyncio.to_thread(cache.stats))}
+
+@app.delete("/plan_cache")
+async def invalidate_plan_cache(request: Optional[str] = None):
+    """Invalidate one cached request (?request=...) or the whole plan cache."""
+    cache = get_plan_cache()
+    if cache is None:
+        return {"success": False, "message": "Plan cache is disabled"}
+    if request is None:
+        removed = await asyncio.to_thread(cache.invalidate)
+    else:
+        removed = await asyncio.to_thread(cache.invalidate, request, OLLAMA_LLM_MODEL, PROMPT_VERSION)
+    return {"success": True, "removed": removed}
+
+@app.get("/vision_cache")
+async def vision_cache_stats():
+    """Report vision cache hit rate and model time saved."""
+    cache = get_vision_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await asyncio.to_thread(cache.stats))}
+
+@app.delete("/vision_cache")
+async def clear_vision_cache():
+    """Drop all cached vision results."""
+    cache = get_vision_cache()
+    if cache is None:
+        return {"success": False, "message": "Vision cache is disabled"}
+    cache.clear()
+    return {"success": True}
+
+@app.get("/models")
+async def model_stats():
+    """Report warm-up time and cold-vs-warm call latency per model."""
+    return {"models": get_registry().stats()}
+
+@app.get("/gateway")
+async def gateway_stats():
+    """Report model admission, queueing, shedding and coalescing counters."""
+    return get_gateway().stats()
+
+@app.get("/endpoints")
+async def ollama_endpoints():
+    """Report each Ollama endpoint's health, circuit state, load, latency and errors."""
+    return {"endpoints": endpoint_stats()}
+
+@app.get("/screen")
+async def screen_capture_stats():
+    """Report background capture rate, lateness, capture and diff cost, and tiles changed per frame."""
+    capture = get_screen_capture()
+    if capture is None:
+        return {"enabled": False}
+    return {"enabled": True, **capture.stats()}
+
+@app.get("/screen/changes")
+async def screen_changes(since: int = 0):
+    """Boxes around everything on screen that changed after frame ?since=N (null when N is too old)."""
+    capture = get_screen_capture()
+    if capture is None or capture.ring is None:
+        return {"enabled": capture is not None, "seq": 0, "regions": None}
+    ring = capture.ring
+    seq = ring.latest_seq
+    regions = ring.changed_regions(since, seq)
+    return {"enabled": True, "ring": ring.name, "seq": seq, "size": list(ring.size),
+            "regions": [list(box) for box in regions] if regions is not None else None}
+
+@app.get("/planner")
+async def planner_stats():
+    """Report plan outcomes, parse-failure rate, repair generations, tokens per plan and fast-path hits."""
+    return {**planning_stats.stats(), "fast_path": fast_planner.stats()}
+
+def collect_runtime_metrics():
+    """Gauges read at scrape time from the live components."""
+    gateway = get_gateway().stats()
+    plan_cache = get_plan_cache()
+    vision_cache = get_vision_cache()
+    tool_stats = tools.stats()
+    yield ("intervene_job_queue_depth", "gauge", "Jobs waiting for a worker",
+           [({}, scheduler.queue_depth())])
+    yield ("intervene_jobs_running", "gauge", "Jobs currently executing",
+           [({}, len(scheduler.running_jobs()))])
+    yield ("intervene_websocket_clients", "gauge", "Connected /step-updates clients",
+           [({}, broadcaster.count)])
+    yield ("intervene_websocket_dropped_events_total", "counter", "Updates dropped for slow clients",
+           [({}, broadcaster.dropped_events)])
+    updates = broadcaster.stats()
+    yield ("intervene_websocket_bytes_total", "counter", "Update bytes written to clients per protocol version",
+           [({"protocol": protocol}, sent) for protocol, sent in updates["bytes"].items()])
+    yield ("intervene_websocket_coalesced_events_total", "counter", "Events merged into another event's delta frame",
+           [({}, updates["coalesced_events"])])
+    yield ("intervene_model_active", "gauge", "Generations in progress per model",
+           [({"model": model}, gate["active"]) for model, gate in gateway["models"].items()])
+    yield ("intervene_model_queue_depth", "gauge", "Model calls waiting for a slot",
+           [({"model": model}, gate["queued"]) for model, gate in gateway["models"].items()])
+    yield ("intervene_model_shed_total", "counter", "Model calls turned away as busy",
+           [({"model": model}, gate["shed"]) for model, gate in gateway["models"].items()])
+    yield ("intervene_model_coalesced_total", "counter", "Model calls served by an identical call in flight",
+           [({}, gateway["coalesced"])])
+    endpoints = endpoint_stats()
+    yield ("intervene_ollama_endpoint_up", "gauge", "1 when the endpoint is healthy and its circuit is closed",
+           [({"endpoint": e["url"]}, int(e["healthy"] and e["state"] == "closed")) for e in endpoints])
+    yield ("intervene_ollama_endpoint_outstanding", "gauge", "Calls in progress per Ollama endpoint",
+           [({"endpoint": e["url"]}, e["outstanding"]) for e in endpoints])
+    yield ("intervene_ollama_endpoint_requests_total", "counter", "Calls routed to each Ollama endpoint",
+           [({"endpoint": e["url"]}, e["requests"]) for e in endpoints])
+    yield ("intervene_ollama_endpoint_errors_total", "counter", "Failed calls per Ollama endpoint",
+           [({"endpoint": e["url"]}, e["errors"]) for e in endpoints])
+    yield ("intervene_ollama_endpoint_failovers_total", "counter", "Calls moved to another endpoint after a failure",
+           [({"endpoint": e["url"]}, e["failovers"]) for e in endpoints])
+    yield ("intervene_tool_running", "gauge", "Tool calls in progress",
+           [({"tool": name}, stats["running"]) for name, stats in tool_stats.items()])
+    journal = scheduler.journal
+    if journal is not None:
+        journal_stats = journal.stats()
+        yield ("intervene_journal_pending_rows", "gauge", "Journal rows waiting for the next batched commit",
+               [({}, journal_stats["pending_rows"])])
+        yield ("intervene_journal_commits_total", "counter", "Batched journal commits",
+               [({}, journal_stats["commits"])])
+    hit_rates = []
+    if plan_cache is not None:
+        hit_rates.append(({"cache": "plan"}, plan_cache.stats()["hit_rate"]))
+    if vision_cache is not None:
+        hit_rates.append(({"cache": "vision"}, vision_cache.stats()["hit_rate"]))
+    yield ("intervene_cache_hit_ratio", "gauge", "Fraction of lookups served from cache", hit_rates)
+
+metrics_registry.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose latency histograms, model throughput and live gauges in Prometheus text format."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/updates")
+async def update_stats():
+    """Report step-update clients, frames and bytes per protocol version, coalescing and encode time."""
+    return broadcaster.stats()
+
+@app.get("/state")
+async def state_stats():
+    """Report the shared state backend: workers, events published and delivered, and delivery lag."""
+    return get_state_backend().stats()
+
+@app.get("/override")
+async def override_stats():
+    """Report manual override triggers and input-to-abort latency."""
+    return get_detector().stats()
+
+@app.get("/waits")
+async def wait_timings():
+    """Report how long each readiness wait actually took."""
+    return {"waits": wait_stats.snapshot()}
+
 @app.websocket("/step-updates")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time step execution updates."""
-    await websocket.accept()
-    active_connections.append(websocket)
+async def websocket_endpoint(websocket: WebSocket, since: Optional[int] = None, protocol: Optional[int] = None,
+                             encoding: Optional[str] = None):
+    """
+    WebSocket endpoint for real-time step execution updates.
+    
+    Clients get the legacy stream (one JSON message per step transition)
+    unless they negotiate version 2 with the intervene.v2.json /
+    intervene.v2.msgpack subprotocol or ?protocol=2[&encoding=msgpack]:
+    coalesced deltas of job state, see update_protocol. Every update carries
+    a "seq". A reconnecting client can pass ?since=N, or send {"since": N},
+    to receive what it missed.
+    """
+    version, encoding, subprotocol = negotiate(websocket.scope.get("subprotocols", []), protocol, encoding)
+    await websocket.accept(subprotocol=subprotocol)
+    
+    # Send current state of every running job, on any worker, immediately upon connection
+    initial = []
+    if since is None and version == LEGACY:
+        for job in await all_jobs():
+            if job["status"] == RUNNING and job["current_step"] >= 0:
+                initial.append({
+                    "completedStepIndex": job["current_step"],
+                    "message": f"Currently at step {job['current_step'] + 1}",
+                    "jobId": job["job_id"]
+                })
+    subscriber = broadcaster.subscribe(websocket, since=since, initial=initial, version=version, encoding=encoding)
     
     try:
-        # Send current state immediately upon connection
-        if current_execution["current_step"] >= 0:
-            await websocket.send_json({
-                "completedStepIndex": current_execution["current_step"],
-                "message": f"Currently at step {current_execution['current_step'] + 1}"
-            })
-        
         # Keep connection open and handle messages
         while True:
-            # Wait for any message (ping/pong)
-            await websocket.receive_text()
+            # Wait for any message (ping/pong or a replay request), as text or binary
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                break
+            payload = received.get("text")
+            if payload is None:
+                payload = received.get("bytes")
+            try:
+                message = decode(payload)
+            except Exception:
+                continue
+            if isinstance(message, dict) and isinstance(message.get("since"), int):
+                broadcaster.replay_to(subscriber, message["since"])
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+    finally:
+        await broadcaster.unsubscribe(subscriber)
 
 if __name__ == "__main__":
-    from config import SERVER_HOST, SERVER_PORT, DEBUG, log_config
+    import uvicorn
+    from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, DEBUG, log_config
     
     # Log configuration settings
     log_config()
     
     logger.info(f"Starting Intervene Backend on {SERVER_HOST}:{SERVER_PORT}")
-    uvicorn.run("main:app", host=SERVER_HOST, port=SERVER_PORT, reload=DEBUG)
\ No newline at end of file
+    # Reloading runs a single process, so it is only used with one worker
+    uvicorn.run("main:app", host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS,
+                reload=DEBUG and SERVER_WORKERS == 1)
\ No newline at end of file
@@ -1,6 +1,5 @@
 # -*- mode: python ; coding: utf-8 -*-
 import os
-from PyInstaller.utils.hooks import collect_data_files
 
 a = Analysis(
     ['main.py'],
@@ -10,28 +9,51 @@ a = Analysis(
     hiddenimports=[
         'fastapi', 
         'uvicorn', 
-        'langchain', 
-        'langchain_community',
-        'langchain_ollama',
+        'httpx',
         'config',
+        'ollama_client',
+        'ollama_pool',
+        'plan_cache',
+        'step_parser',
+        'scheduler',
+        'journal',
+        'shared_state',
+        'plan_schema',
+        'fast_planner',
+        'broadcaster',
+        'update_protocol',
+        'tool_executor',
+        'waiting',
+        'spreadsheet_writer',
+        'model_registry',
+        'model_gateway',
+        'metrics',
+        'tracing',
         'vision_analyzer',
+        'vision_cache',
+        'screen_buffer',
         'llm_task_analyzer',
+        'input_automation',
         'tasks',
         'listener',
-        'agent'
+        'agent',
+        # Imported lazily at first use rather than at startup
+        'PIL.Image',
+        'PIL.ImageGrab',
+        'pynput.mouse',
+        'pynput.keyboard',
+        'xlsxwriter',
+        'concurrent.futures.process'
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Never used by the backend; keeps the bundle (and its unpack at launch) small
+    excludes=['tkinter', 'matplotlib', 'IPython', 'pytest'],
     noarchive=False,
     optimize=0,
 )
 
-# Collect additional data files if needed
-extra_data = collect_data_files('langchain_community')
-a.datas.extend(extra_data)
-
 pyz = PYZ(a.pure)
 
 exe = EXE(
@@ -44,7 +66,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-compressed libraries must be decompressed on every launch
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=True,
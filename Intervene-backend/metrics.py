@@ -0,0 +1,244 @@
+"""
+metrics.py - In-process metrics with Prometheus text exposition
+"""
+import abc
+import asyncio
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tracing import record_span, span
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+# A collector returns (name, type, help, [(labels, value), ...]) families at scrape time
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines for every label set"""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, as Prometheus expects"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: [per-bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Owns the process's metrics and the collectors polled at scrape time"""
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "intervene_stage_seconds", "Latency of each workflow stage", ["stage"]))
+LLM_TIME_TO_FIRST_TOKEN = registry.register(Histogram(
+    "intervene_llm_time_to_first_token_seconds", "Time until the model produced its first token", ["model"]))
+LLM_TOKENS_PER_SECOND = registry.register(Histogram(
+    "intervene_llm_tokens_per_second", "Generation speed of each model call", ["model"], RATE_BUCKETS))
+LLM_TOKENS = registry.register(Counter(
+    "intervene_llm_generated_tokens_total", "Tokens generated by each model", ["model"]))
+PLANS = registry.register(Counter(
+    "intervene_plans_total", "Plans by outcome (valid, repaired_locally, repaired_by_model, failed)", ["outcome"]))
+PLAN_GENERATIONS = registry.register(Counter(
+    "intervene_plan_generations_total", "Planning generations, first attempts and repairs", ["kind"]))
+FAST_PLANS = registry.register(Counter(
+    "intervene_fast_plans_total", "Requests planned by rules, by rule (\"miss\" when the LLM planned them)", ["rule"]))
+SCREEN_ANALYSES = registry.register(Counter(
+    "intervene_screen_analyses_total", "Screen analyses by what was sent (full, regions, unchanged)", ["kind"]))
+SCREEN_PIXELS_SENT = registry.register(Counter(
+    "intervene_screen_pixels_sent_total", "Frame pixels sent to the vision model for screen analysis", ["kind"]))
+EVENT_LOOP_LAG = registry.register(Histogram(
+    "intervene_event_loop_lag_seconds", "How late the event loop woke a periodic probe (time spent blocked)"))
+
+
+@contextmanager
+def stage(name: str, **attrs: Any):
+    """Time a block into the stage histogram and the current workflow trace"""
+    started = time.perf_counter()
+    try:
+        with span(name, **attrs) as current:
+            yield current
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def record_stage(name: str, seconds: float, **attrs: Any):
+    """Record a stage that was timed elsewhere and has just ended"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    record_span(name, seconds, **attrs)
+
+
+def observe_generation(model: str, result: Optional[Dict[str, Any]], first_token: Optional[float] = None):
+    """
+    Record token throughput and time-to-first-token from an Ollama response
+
+    Args:
+        model (str): Model name
+        result (dict): The final response, carrying Ollama's timing fields (ns)
+        first_token (float): Measured seconds to the first streamed token; when
+            absent, Ollama's load + prompt evaluation time is used instead
+    """
+    if not result:
+        return
+    eval_count = result.get("eval_count") or 0
+    eval_duration = result.get("eval_duration") or 0
+    if eval_count:
+        LLM_TOKENS.inc(eval_count, model=model)
+        if eval_duration:
+            LLM_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9), model=model)
+    if first_token is None and "prompt_eval_duration" in result:
+        first_token = ((result.get("load_duration") or 0) + result["prompt_eval_duration"]) / 1e9
+    if first_token is not None:
+        LLM_TIME_TO_FIRST_TOKEN.observe(first_token, model=model)
+
+
+async def monitor_event_loop(interval: float):
+    """
+    Sample event-loop responsiveness until cancelled
+
+    Sleeps for interval and records how much later than requested it woke
+    up; anything beyond a few ms means a callback blocked the loop.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
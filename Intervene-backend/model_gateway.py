@@ -0,0 +1,290 @@
+"""
+model_gateway.py - Coalescing and prioritized admission control for model calls
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Hashable, List, Optional
+
+from config import MODEL_MAX_CONCURRENT, MODEL_MAX_QUEUE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Lower numbers are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10
+
+
+class GatewayBusyError(Exception):
+    """Raised instead of queueing when a model's wait queue is full"""
+
+
+class _Waiter:
+    """A place in a gate's queue; ordered by priority, then arrival"""
+
+    __slots__ = ("priority", "order", "future")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.order = 0
+        self.future: Optional[asyncio.Future] = None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class ModelGate:
+    """
+    Caps concurrent generations for one model and admits waiters by priority.
+
+    Waiters beyond ``max_queue`` are rejected immediately with
+    GatewayBusyError, so overload turns into a fast "busy" answer rather than
+    a long wait ending in a timeout. A queued waiter can be promoted to a
+    higher priority while it waits.
+    """
+
+    def __init__(self, model: str, max_concurrent: int, max_queue: int):
+        self.model = model
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: List[_Waiter] = []
+        self._order = itertools.count()
+        self.admitted = 0
+        self.shed = 0
+        self.promoted = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.future.done())
+
+    def is_full(self) -> bool:
+        """True when a new waiter would be shed right now"""
+        return self.active >= self.max_concurrent and self.queued >= self.max_queue
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, waiter: Optional[_Waiter] = None):
+        """Wait for a slot; with a waiter, its priority applies and can be raised with promote()"""
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            return
+        if self.queued >= self.max_queue:
+            self.shed += 1
+            raise GatewayBusyError(f"Model {self.model} is busy ({self.queued} requests waiting)")
+
+        if waiter is None:
+            waiter = _Waiter(priority)
+        waiter.order = next(self._order)
+        waiter.future = future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled: pass it on
+                self.release()
+            raise
+        self.admitted += 1
+
+    def release(self):
+        """Hand the slot to the highest-priority live waiter, or free it"""
+        while self._waiters:
+            future = heapq.heappop(self._waiters).future
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def promote(self, waiter: _Waiter, priority: int):
+        """Raise a waiter to priority if that is higher (lower number) than its own"""
+        if priority >= waiter.priority:
+            return
+        waiter.priority = priority
+        self.promoted += 1
+        if waiter.future is not None and not waiter.future.done():
+            heapq.heapify(self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "promoted": self.promoted,
+        }
+
+
+class _InFlight:
+    def __init__(self, priority: int):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # The shared call's place in the gate queue, at the best priority of its callers
+        self.place = _Waiter(priority)
+
+
+class ModelGateway:
+    """
+    Front door for async model calls.
+
+    Identical calls in flight at the same time share one generation: the
+    first caller starts it and later callers wait on the same result, and a
+    shared call still waiting for a slot takes the highest priority among
+    its callers. If every waiter goes away, the shared generation is
+    cancelled.
+
+    The gateway belongs to the event loop that first uses it. Blocking code
+    in other threads reaches it with run_sync().
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 16):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.gates: Dict[str, ModelGate] = {}
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def gate(self, model: str) -> ModelGate:
+        if model not in self.gates:
+            self.gates[model] = ModelGate(model, self.max_concurrent, self.max_queue)
+        return self.gates[model]
+
+    def configure(self, model: str, max_concurrent: int):
+        """Set how many generations model may run at once (e.g. the per-endpoint limit times its endpoints)"""
+        self.gate(model).max_concurrent = max_concurrent
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITY_NORMAL):
+        """Hold one generation slot for model (for calls that cannot be coalesced, e.g. streams)"""
+        self._bind()
+        gate = self.gate(model)
+        await gate.acquire(priority)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    async def call(self, model: str, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                   priority: int = PRIORITY_NORMAL) -> Any:
+        """
+        Run factory() under model's admission control, sharing it with identical calls
+
+        Args:
+            model (str): Model the call runs on
+            key (hashable): Identity of the call; equal keys are coalesced
+            factory (callable): Starts the actual generation
+            priority (int): Admission priority; lower runs first
+
+        Returns:
+            The factory's result
+
+        Raises:
+            GatewayBusyError: When the model's queue is full
+        """
+        self._bind()
+        self.calls += 1
+        key = (model, key)
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = _InFlight(priority)
+            entry.task = asyncio.create_task(self._run(model, factory, entry.place))
+            self._inflight[key] = entry
+            entry.task.add_done_callback(lambda _, k=key, e=entry: self._forget(k, e))
+        else:
+            self.coalesced += 1
+            # An interactive caller must not wait behind the background call it joined
+            self.gate(model).promote(entry.place, priority)
+
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                # Every caller gave up: stop the shared generation
+                entry.task.cancel()
+
+    async def _run(self, model: str, factory: Callable[[], Awaitable[Any]], place: _Waiter) -> Any:
+        gate = self.gate(model)
+        await gate.acquire(place.priority, place)
+        try:
+            return await factory()
+        finally:
+            gate.release()
+
+    def run_sync(self, coroutine: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine that uses the gateway from blocking code, on the gateway's loop
+
+        Admission, priorities and coalescing then cover blocking callers as
+        well. A process without a running server loop (e.g. the standalone
+        agent) gets a background loop for this on first use.
+
+        Args:
+            coroutine: The async call, e.g. analyze_image_async(image)
+            timeout (float): Seconds to wait for the result
+
+        Returns:
+            The coroutine's result
+
+        Raises:
+            RuntimeError: When called on the gateway's own loop, which it would block
+        """
+        loop = self._bound_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coroutine.close()
+            raise RuntimeError("run_sync would block the gateway's event loop; await the call instead")
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout)
+
+    def _bind(self):
+        if self._loop is None or self._loop.is_closed():
+            with self._loop_lock:
+                if self._loop is None or self._loop.is_closed():
+                    self._loop = asyncio.get_running_loop()
+
+    def _bound_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="model-gateway", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _forget(self, key: Hashable, entry: _InFlight):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+        # Keep "exception was never retrieved" warnings quiet for abandoned calls
+        if not entry.task.cancelled():
+            entry.task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "models": {model: gate.stats() for model, gate in self.gates.items()},
+        }
+
+
+_gateway: Optional[ModelGateway] = None
+
+
+def get_gateway() -> ModelGateway:
+    """Return the process-wide model gateway, built from config on first use"""
+    global _gateway
+    if _gateway is None:
+        _gateway = ModelGateway(max_concurrent=MODEL_MAX_CONCURRENT, max_queue=MODEL_MAX_QUEUE)
+    return _gateway
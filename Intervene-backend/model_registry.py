@@ -0,0 +1,239 @@
+"""
+model_registry.py - Registry of reusable model clients with warm-up and keep-alive
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import get_ollama_config, MODEL_MAX_CONCURRENT
+from metrics import observe_generation
+from model_gateway import get_gateway
+from ollama_client import OllamaError
+from ollama_pool import EndpointPool, get_pool
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LLM = "llm"
+VISION = "vision"
+
+# A call whose load_duration exceeds this had to load the model first
+COLD_LOAD_THRESHOLD = 0.1
+
+
+class ModelStats:
+    """Cold-vs-warm call counters, prompt evaluation and time to first token for one model"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cold_calls = 0
+        self.warm_calls = 0
+        self.cold_seconds = 0.0
+        self.warm_seconds = 0.0
+        self.load_seconds = 0.0
+        self.prompt_tokens = 0
+        self.prompt_seconds = 0.0
+        self.first_token_seconds = 0.0
+        self.first_token_calls = 0
+        self.errors = 0
+        self.last_used: Optional[float] = None
+
+    def record(self, elapsed: float, result: Optional[Dict[str, Any]], first_token: Optional[float] = None):
+        result = result or {}
+        load = result.get("load_duration", 0) / 1e9
+        # Ollama only counts prompt tokens it had to evaluate, not ones served from its prefix cache
+        prompt_seconds = (result.get("prompt_eval_duration") or 0) / 1e9
+        if first_token is None and "prompt_eval_duration" in result:
+            first_token = load + prompt_seconds
+        with self._lock:
+            self.last_used = time.time()
+            self.prompt_tokens += result.get("prompt_eval_count") or 0
+            self.prompt_seconds += prompt_seconds
+            if first_token is not None:
+                self.first_token_seconds += first_token
+                self.first_token_calls += 1
+            if load > COLD_LOAD_THRESHOLD:
+                self.cold_calls += 1
+                self.cold_seconds += elapsed
+                self.load_seconds += load
+            else:
+                self.warm_calls += 1
+                self.warm_seconds += elapsed
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cold_calls": self.cold_calls,
+                "warm_calls": self.warm_calls,
+                "cold_mean_seconds": self.cold_seconds / self.cold_calls if self.cold_calls else None,
+                "warm_mean_seconds": self.warm_seconds / self.warm_calls if self.warm_calls else None,
+                "load_seconds": round(self.load_seconds, 3),
+                "prompt_tokens_evaluated": self.prompt_tokens,
+                "prompt_eval_seconds": round(self.prompt_seconds, 3),
+                "first_token_calls": self.first_token_calls,
+                "mean_time_to_first_token": (self.first_token_seconds / self.first_token_calls
+                                             if self.first_token_calls else None),
+                "errors": self.errors,
+                "last_used": self.last_used,
+            }
+
+
+class ModelClient:
+    """
+    A model bound to a shared Ollama client.
+
+    Every call carries the configured keep_alive, so Ollama keeps the model
+    resident between requests, and is timed to tell cold from warm calls.
+    """
+
+    def __init__(self, role: str, model: str, client: EndpointPool, keep_alive: str,
+                 options: Optional[Dict[str, Any]] = None):
+        self.role = role
+        self.model = model
+        self.client = client
+        self.keep_alive = keep_alive
+        self.options = options or {}
+        self.stats = ModelStats()
+
+    def _extra(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs.setdefault("keep_alive", self.keep_alive)
+        if self.options:
+            kwargs["options"] = {**self.options, **(kwargs.get("options") or {})}
+        return kwargs
+
+    async def generate(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        """Non-streaming generation on the model's endpoint pool; see OllamaClient.generate"""
+        started = time.perf_counter()
+        try:
+            result = await self.client.generate(self.model, prompt, **self._extra(kwargs))
+        except Exception:
+            self.stats.record_error()
+            raise
+        self.stats.record(time.perf_counter() - started, result)
+        observe_generation(self.model, result)
+        return result
+
+    async def generate_stream(self, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming generation; see OllamaClient.generate_stream"""
+        started = time.perf_counter()
+        first_token = None
+        final = None
+        try:
+            async for chunk in self.client.generate_stream(self.model, prompt, **self._extra(kwargs)):
+                if first_token is None and chunk.get("response"):
+                    first_token = time.perf_counter() - started
+                if chunk.get("done"):
+                    final = chunk
+                yield chunk
+        except Exception:
+            self.stats.record_error()
+            raise
+        self.stats.record(time.perf_counter() - started, final, first_token)
+        observe_generation(self.model, final, first_token)
+
+    async def warmup(self, timeout: Optional[float] = None) -> float:
+        """
+        Ask every endpoint in the pool to load the model without generating anything
+
+        Returns:
+            float: Seconds the slowest load took (near zero if already resident)
+        """
+        elapsed = await self.client.load(self.model, self.keep_alive, timeout)
+        logger.info(f"Model {self.model} ready after {elapsed:.2f}s")
+        return elapsed
+
+
+class ModelRegistry:
+    """Holds one ModelClient per role (planning LLM, vision) built from config"""
+
+    def __init__(self, models: Dict[str, ModelClient]):
+        self.models = models
+        self.warmup_seconds: Dict[str, float] = {}
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    def get(self, role: str) -> ModelClient:
+        return self.models[role]
+
+    async def warmup(self, roles: Optional[List[str]] = None):
+        """Preload the given models (all by default) concurrently; roles sharing a model load it once"""
+        groups: Dict[Tuple[str, EndpointPool], List[str]] = {}
+        for role in roles or list(self.models):
+            model = self.models[role]
+            groups.setdefault((model.model, model.client), []).append(role)
+
+        async def load(roles: List[str]):
+            model = self.models[roles[0]]
+            try:
+                elapsed = await model.warmup()
+            except Exception as e:
+                # Serving goes on without the warm-up; the first call then pays the load
+                if isinstance(e, OllamaError) and e.status == 404:
+                    logger.error(f"Model {model.model} is not available on Ollama (ollama pull {model.model})")
+                else:
+                    logger.warning(f"Warm-up of {model.model} failed: {e}")
+                return
+            for role in roles:
+                self.warmup_seconds[role] = elapsed
+
+        await asyncio.gather(*(load(roles) for roles in groups.values()))
+
+    def start_keepalive(self, interval: float):
+        """Re-touch every model periodically so it never unloads while idle"""
+        if interval <= 0 or self._keepalive_task is not None:
+            return
+
+        async def refresh():
+            while True:
+                await asyncio.sleep(interval)
+                await self.warmup()
+
+        self._keepalive_task = asyncio.create_task(refresh())
+
+    async def stop(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            await asyncio.gather(self._keepalive_task, return_exceptions=True)
+            self._keepalive_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            role: {
+                "model": model.model,
+                "keep_alive": model.keep_alive,
+                "warmup_seconds": self.warmup_seconds.get(role),
+                **model.stats.snapshot(),
+            }
+            for role, model in self.models.items()
+        }
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_registry() -> ModelRegistry:
+    """Return the process-wide model registry, built from config on first use"""
+    global _registry
+    if _registry is None:
+        ollama_config = get_ollama_config()
+        models = {
+            LLM: ModelClient(LLM, ollama_config["llm_model"], get_pool(ollama_config["llm_endpoints"]),
+                             ollama_config["keep_alive"]),
+            VISION: ModelClient(VISION, ollama_config["vision_model"], get_pool(ollama_config["vision_endpoints"]),
+                                ollama_config["keep_alive"]),
+        }
+        for model in models.values():
+            # MODEL_MAX_CONCURRENT applies per endpoint, so capacity grows with the pool
+            get_gateway().configure(model.model, MODEL_MAX_CONCURRENT * len(model.client.endpoints))
+        _registry = ModelRegistry(models)
+    return _registry
+
+
+def get_model(role: str) -> ModelClient:
+    """Shortcut for get_registry().get(role)"""
+    return get_registry().get(role)
@@ -0,0 +1,208 @@
+"""
+ollama_client.py - Pooled async HTTP client for one Ollama server (shared per host through ollama_pool)
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class OllamaError(Exception):
+    """Raised when the Ollama server cannot be reached or returns an error"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        # HTTP status when the server answered with an error, None otherwise
+        self.status = status
+
+
+class OllamaTimeout(OllamaError):
+    """Raised when a call runs past its deadline"""
+
+
+class OllamaClient:
+    """
+    Thin wrapper around the Ollama REST API.
+
+    A single instance keeps one httpx connection pool open for the lifetime of
+    the server, so concurrent planning and vision calls reuse TCP connections
+    instead of opening a new one per request. Blocking code reaches it
+    through ModelGateway.run_sync rather than a pool of its own.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 120.0, connect_timeout: float = 5.0,
+                 max_connections: int = 10, max_keepalive_connections: int = 5):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._ping_client: Optional["httpx.AsyncClient"] = None
+
+    def _pool_options(self) -> Dict[str, Any]:
+        # httpx is imported on first use so it stays off the startup path
+        import httpx
+
+        return {
+            "base_url": self.base_url,
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+            ),
+        }
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Create the underlying connection pool on first use"""
+        if self._client is None or self._client.is_closed:
+            import httpx
+
+            self._client = httpx.AsyncClient(**self._pool_options())
+        return self._client
+
+    @staticmethod
+    def _payload(model: str, prompt: str, stream: bool, images: Optional[List[str]],
+                 options: Optional[Dict[str, Any]], extra: Dict[str, Any]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "prompt": prompt, "stream": stream}
+        if images:
+            payload["images"] = images
+        if options:
+            payload["options"] = options
+        payload.update(extra)
+        return payload
+
+    async def generate(self, model: str, prompt: str, images: Optional[List[str]] = None,
+                       options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                       **extra: Any) -> Dict[str, Any]:
+        """
+        Run a non-streaming generation
+
+        Args:
+            model (str): Name of the Ollama model
+            prompt (str): Prompt text
+            images (list): Optional base64-encoded images for multimodal models
+            options (dict): Optional model options (temperature, num_ctx, ...)
+            timeout (float): Overall deadline for this call, defaults to the client timeout
+            **extra: Additional top-level fields for /api/generate
+
+        Returns:
+            dict: The decoded Ollama response, with the text under "response"
+        """
+        import httpx
+
+        payload = self._payload(model, prompt, False, images, options, extra)
+        deadline = timeout if timeout is not None else self.timeout
+        try:
+            response = await asyncio.wait_for(
+                self._get_client().post("/api/generate", json=payload), deadline
+            )
+        except asyncio.TimeoutError:
+            raise OllamaTimeout(f"Ollama call to {model} timed out after {deadline}s")
+        except httpx.HTTPError as e:
+            raise OllamaError(f"Ollama call to {model} failed: {e}") from e
+
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama returned {response.status_code}: {response.text}", response.status_code)
+        return response.json()
+
+    async def generate_stream(self, model: str, prompt: str, images: Optional[List[str]] = None,
+                              options: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                              **extra: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run a streaming generation, yielding each chunk as Ollama produces it
+
+        Args:
+            model (str): Name of the Ollama model
+            prompt (str): Prompt text
+            images (list): Optional base64-encoded images for multimodal models
+            options (dict): Optional model options (temperature, num_ctx, ...)
+            timeout (float): Overall deadline for the whole stream, defaults to the client timeout
+            **extra: Additional top-level fields for /api/generate
+
+        Yields:
+            dict: Decoded chunks; the text fragment is under "response" and the
+                final chunk has "done" set along with the timing statistics
+        """
+        import httpx
+
+        payload = self._payload(model, prompt, True, images, options, extra)
+        deadline = timeout if timeout is not None else self.timeout
+        loop = asyncio.get_running_loop()
+        expires_at = loop.time() + deadline
+
+        async def within_deadline(awaitable):
+            # Every await is bounded by what is left of the budget, so a stalled stream cannot outlive it
+            try:
+                return await asyncio.wait_for(awaitable, max(0.0, expires_at - loop.time()))
+            except asyncio.TimeoutError:
+                raise OllamaTimeout(f"Ollama stream from {model} timed out after {deadline}s")
+
+        client = self._get_client()
+        try:
+            response = await within_deadline(
+                client.send(client.build_request("POST", "/api/generate", json=payload), stream=True))
+            try:
+                if response.status_code != 200:
+                    body = await within_deadline(response.aread())
+                    raise OllamaError(f"Ollama returned {response.status_code}: {body.decode(errors='replace')}",
+                                      response.status_code)
+                lines = response.aiter_lines()
+                while True:
+                    try:
+                        line = await within_deadline(lines.__anext__())
+                    except StopAsyncIteration:
+                        return
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise OllamaError(f"Ollama error: {chunk['error']}")
+                    yield chunk
+                    if chunk.get("done"):
+                        return
+            finally:
+                await response.aclose()
+        except httpx.HTTPError as e:
+            raise OllamaError(f"Ollama stream from {model} failed: {e}") from e
+
+    async def ping(self, timeout: Optional[float] = None) -> float:
+        """
+        Check that the server answers, without touching any model
+
+        Returns:
+            float: Round-trip time in seconds
+        """
+        import httpx
+
+        deadline = timeout if timeout is not None else self.connect_timeout
+        if self._ping_client is None or self._ping_client.is_closed:
+            # Own connection, so a check never queues behind generations in the main pool
+            self._ping_client = httpx.AsyncClient(base_url=self.base_url, limits=httpx.Limits(max_connections=1))
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._ping_client.get("/api/tags"), deadline)
+        except asyncio.TimeoutError:
+            raise OllamaTimeout(f"Ollama at {self.base_url} did not answer within {deadline}s")
+        except httpx.HTTPError as e:
+            raise OllamaError(f"Ollama at {self.base_url} is unreachable: {e}") from e
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama at {self.base_url} returned {response.status_code}", response.status_code)
+        return time.perf_counter() - started
+
+    async def aclose(self):
+        """Close the connection pools"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        if self._ping_client is not None and not self._ping_client.is_closed:
+            await self._ping_client.aclose()
+        self._ping_client = None
+
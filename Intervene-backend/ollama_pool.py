@@ -0,0 +1,318 @@
+"""
+ollama_pool.py - Per-model pools of Ollama endpoints with health checks, least-loaded routing and failover
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from config import get_ollama_config, OLLAMA_CIRCUIT_FAILURES, OLLAMA_CIRCUIT_WINDOW, OLLAMA_CIRCUIT_COOLDOWN
+from ollama_client import OllamaClient, OllamaError, OllamaTimeout
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Weight of the newest call in the moving latency average
+LATENCY_SMOOTHING = 0.2
+
+# Endpoints are shared by every pool routing to them, so one lock guards their counters and circuits
+_lock = threading.Lock()
+
+
+class Endpoint:
+    """
+    One Ollama server as seen by the pools routing to it: outstanding calls,
+    latency, errors and circuit state.
+
+    The circuit opens once ``failure_threshold`` of the last ``window`` calls
+    failed and stays open for ``cooldown`` seconds; then a single trial call
+    decides whether it closes again. Counting over a window matters because a
+    failing node answers fast: with least-outstanding routing it would
+    otherwise attract more calls than its healthy peers.
+    """
+
+    def __init__(self, client: OllamaClient, failure_threshold: int = OLLAMA_CIRCUIT_FAILURES,
+                 window: int = OLLAMA_CIRCUIT_WINDOW, cooldown: float = OLLAMA_CIRCUIT_COOLDOWN):
+        self.client = client
+        self.url = client.base_url
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # True for each recent failed call, False for each success
+        self.recent = deque(maxlen=max(window, failure_threshold))
+        self.outstanding = 0
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.failovers = 0
+        self.latency_sum = 0.0
+        self.latency_ewma: Optional[float] = None
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.healthy = True
+        self.last_check: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def available(self, now: float, ignore_health: bool = False) -> bool:
+        """Whether a new call may be routed here (caller holds the module lock)"""
+        if not self.healthy and not ignore_health:
+            return False
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            # One trial call at a time
+            return self.outstanding == 0
+        return self.state == CLOSED
+
+    def succeeded(self, elapsed: float):
+        self.completed += 1
+        self.latency_sum += elapsed
+        self.latency_ewma = elapsed if self.latency_ewma is None else (
+            LATENCY_SMOOTHING * elapsed + (1 - LATENCY_SMOOTHING) * self.latency_ewma)
+        self.recent.append(False)
+        if self.state != CLOSED:
+            # Earlier failures stay in the window, so a relapse reopens the circuit at once
+            logger.info(f"Ollama endpoint {self.url} recovered, circuit closed")
+            self.state = CLOSED
+
+    def failed(self, error: Exception):
+        self.errors += 1
+        self.last_error = str(error)
+        self.recent.append(True)
+        if self.state == HALF_OPEN or (self.state == CLOSED and sum(self.recent) >= self.failure_threshold):
+            logger.warning(f"Ollama endpoint {self.url} failing ({error}), circuit open for {self.cooldown}s")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "completed": self.completed,
+            "errors": self.errors,
+            "failovers": self.failovers,
+            "mean_latency_ms": round(self.latency_sum / self.completed * 1000, 1) if self.completed else None,
+            "ewma_latency_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
+
+
+def _node_failure(error: OllamaError) -> bool:
+    """Errors that say something about the endpoint rather than the request"""
+    return error.status is None or error.status >= 500 or error.status == 404
+
+
+class EndpointPool:
+    """
+    Routes calls for one model across its endpoints.
+
+    Exposes the same generate/generate_stream interface as
+    OllamaClient. Each call goes to the available endpoint with the fewest
+    outstanding calls (then the fewest calls overall). Connection errors,
+    5xx answers and a missing model fail over to the next endpoint; a
+    timeout does not, since the caller's deadline is already spent. Streams
+    only fail over before their first chunk.
+    """
+
+    def __init__(self, endpoints: Sequence[Endpoint]):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+
+    @property
+    def timeout(self) -> float:
+        return self.endpoints[0].client.timeout
+
+    def _acquire(self, tried: List[Endpoint], error: Optional[OllamaError] = None) -> Endpoint:
+        now = time.monotonic()
+        with _lock:
+            candidates = [e for e in self.endpoints if e not in tried and e.available(now)]
+            if not candidates and not any(e.healthy for e in self.endpoints):
+                # Every health check failing more likely means the checks are wrong
+                # than that each call would fail; let the circuits decide instead
+                candidates = [e for e in self.endpoints if e not in tried and e.available(now, ignore_health=True)]
+            if not candidates:
+                if error is not None:
+                    # Nowhere left to fail over to: surface the last real error
+                    raise error
+                raise OllamaError(f"No available Ollama endpoint ({len(self.endpoints)} configured, "
+                                  f"{len(tried)} tried)")
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.requests))
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            if tried:
+                tried[-1].failovers += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, started: float, error: Optional[BaseException] = None):
+        with _lock:
+            endpoint.outstanding -= 1
+            if error is None:
+                endpoint.succeeded(time.perf_counter() - started)
+            elif isinstance(error, OllamaError) and (_node_failure(error) or isinstance(error, OllamaTimeout)):
+                endpoint.failed(error)
+            # Cancelled, or the request itself was bad: not the endpoint's fault
+
+    def _should_fail_over(self, error: OllamaError, tried: List[Endpoint], model: str) -> bool:
+        if isinstance(error, OllamaTimeout) or not _node_failure(error) or len(tried) >= len(self.endpoints):
+            return False
+        logger.warning(f"Ollama endpoint {tried[-1].url} failed for {model}, failing over: {error}")
+        return True
+
+    async def generate(self, model: str, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        """Non-streaming generation on the least-loaded endpoint; see OllamaClient.generate"""
+        tried: List[Endpoint] = []
+        error: Optional[OllamaError] = None
+        while True:
+            endpoint = self._acquire(tried, error)
+            started = time.perf_counter()
+            try:
+                result = await endpoint.client.generate(model, prompt, **kwargs)
+            except BaseException as e:
+                self._release(endpoint, started, e)
+                tried.append(endpoint)
+                if isinstance(e, OllamaError) and self._should_fail_over(e, tried, model):
+                    error = e
+                    continue
+                raise
+            self._release(endpoint, started)
+            return result
+
+    async def generate_stream(self, model: str, prompt: str, **kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming generation on the least-loaded endpoint; see OllamaClient.generate_stream"""
+        tried: List[Endpoint] = []
+        error: Optional[OllamaError] = None
+        while True:
+            endpoint = self._acquire(tried, error)
+            started = time.perf_counter()
+            streamed = False
+            try:
+                async for chunk in endpoint.client.generate_stream(model, prompt, **kwargs):
+                    streamed = True
+                    yield chunk
+            except BaseException as e:
+                self._release(endpoint, started, e)
+                tried.append(endpoint)
+                if not streamed and isinstance(e, OllamaError) and self._should_fail_over(e, tried, model):
+                    error = e
+                    continue
+                raise
+            self._release(endpoint, started)
+            return
+
+    async def load(self, model: str, keep_alive: str, timeout: Optional[float] = None) -> float:
+        """
+        Load model on every available endpoint, so any of them can take the next call
+
+        Returns:
+            float: Seconds until the slowest endpoint was ready
+        """
+        now = time.monotonic()
+        with _lock:
+            endpoints = [e for e in self.endpoints if e.available(now)] or self.endpoints
+
+        async def load_one(endpoint: Endpoint):
+            await endpoint.client.generate(model, "", keep_alive=keep_alive, timeout=timeout)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(load_one(e) for e in endpoints), return_exceptions=True)
+        failures = [(e, r) for e, r in zip(endpoints, results) if isinstance(r, BaseException)]
+        for endpoint, error in failures:
+            logger.warning(f"Loading {model} on {endpoint.url} failed: {error}")
+        if len(failures) == len(endpoints):
+            raise failures[0][1]
+        return time.perf_counter() - started
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with _lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+async def check_endpoint(endpoint: Endpoint, timeout: Optional[float] = None):
+    """
+    Ping one endpoint and update its health
+
+    Only reachability is checked; a server that answers pings but fails
+    generations is left to the circuit breaker.
+    """
+    try:
+        await endpoint.client.ping(timeout)
+    except OllamaError as e:
+        if endpoint.healthy:
+            logger.warning(f"Ollama endpoint {endpoint.url} failed its health check: {e}")
+        endpoint.healthy = False
+        endpoint.last_error = str(e)
+    else:
+        if not endpoint.healthy:
+            logger.info(f"Ollama endpoint {endpoint.url} is reachable again")
+        endpoint.healthy = True
+    endpoint.last_check = time.time()
+
+
+_endpoints: Dict[str, Endpoint] = {}
+_pools: Dict[Tuple[str, ...], EndpointPool] = {}
+_health_task: Optional[asyncio.Task] = None
+
+
+def get_endpoint(url: str) -> Endpoint:
+    """Return the process-wide Endpoint for url; models on the same host share its connections"""
+    url = url.rstrip("/")
+    if url not in _endpoints:
+        ollama_config = get_ollama_config()
+        _endpoints[url] = Endpoint(OllamaClient(
+            base_url=url,
+            timeout=ollama_config["timeout"],
+            connect_timeout=ollama_config["connect_timeout"],
+            max_connections=ollama_config["max_connections"],
+            max_keepalive_connections=ollama_config["max_keepalive_connections"],
+        ))
+    return _endpoints[url]
+
+
+def get_pool(urls: Sequence[str]) -> EndpointPool:
+    """Return the process-wide pool over urls"""
+    key = tuple(url.rstrip("/") for url in urls)
+    if key not in _pools:
+        _pools[key] = EndpointPool([get_endpoint(url) for url in key])
+    return _pools[key]
+
+
+def endpoint_stats() -> List[Dict[str, Any]]:
+    """Stats of every endpoint in use, whichever pools route to it"""
+    with _lock:
+        return [endpoint.stats() for endpoint in _endpoints.values()]
+
+
+def start_health_checks(interval: float):
+    """Ping every endpoint periodically, taking unreachable ones out of rotation"""
+    global _health_task
+    if interval <= 0 or _health_task is not None:
+        return
+
+    async def run():
+        while True:
+            await asyncio.gather(*(check_endpoint(e) for e in list(_endpoints.values())))
+            await asyncio.sleep(interval)
+
+    _health_task = asyncio.create_task(run())
+
+
+async def close_pools():
+    """Stop health checks and close every endpoint's connection pools"""
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        await asyncio.gather(_health_task, return_exceptions=True)
+        _health_task = None
+    for endpoint in _endpoints.values():
+        await endpoint.client.aclose()
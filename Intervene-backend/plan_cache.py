@@ -0,0 +1,288 @@
+"""
+plan_cache.py - Two-tier (memory LRU + SQLite) cache for LLM-generated plans
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from config import (PLAN_CACHE_ENABLED, PLAN_CACHE_PATH, PLAN_CACHE_TTL,
+                    PLAN_CACHE_MEMORY_SIZE, PLAN_CACHE_DISK_SIZE)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_request(request: str) -> str:
+    """Normalize request text so trivially different phrasings share a key"""
+    return re.sub(r"\s+", " ", request).strip().casefold()
+
+
+def make_key(request: str, model: str, prompt_version: str) -> str:
+    """Build the cache key from the normalized request, model and prompt version"""
+    raw = "\x1f".join([normalize_request(request), model, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    Plan cache with an in-process LRU in front of a persistent SQLite store.
+
+    Entries expire after ``ttl`` seconds in both tiers. The memory tier holds at
+    most ``max_memory_entries`` plans; the disk tier evicts least recently used
+    rows once it exceeds ``max_disk_entries``.
+
+    The disk store runs in WAL mode with synchronous=NORMAL and has its own
+    lock, so a thread reading or writing it never holds up memory lookups.
+    Disk hits do not write: their access times are kept in memory and saved
+    with the next put. The async methods do the disk work on a worker thread.
+    """
+
+    def __init__(self, path: Optional[str], ttl: float = 86400.0,
+                 max_memory_entries: int = 256, max_disk_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Access times of disk hits not written yet
+        self._touched: Dict[str, float] = {}
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS plans ("
+                    "key TEXT PRIMARY KEY, plan TEXT NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS plans_accessed ON plans (accessed)")
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Plan cache disk store unavailable, using memory only: {e}")
+                self._conn = None
+
+    def get(self, request: str, model: str, prompt_version: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Look up a cached plan
+
+        Args:
+            request (str): The user's request
+            model (str): Model that produced the plan
+            prompt_version (str): Version of the planning prompt
+
+        Returns:
+            list: A copy of the cached steps, or None on a miss
+        """
+        key = make_key(request, model, prompt_version)
+        now = time.time()
+        plan = self._get_memory(key, now)
+        if plan is None and self._conn is not None:
+            plan = self._get_disk(key, now)
+        return self._result(plan)
+
+    async def get_async(self, request: str, model: str,
+                        prompt_version: str) -> Optional[List[Dict[str, Any]]]:
+        """Like get, reading the disk tier on a worker thread"""
+        key = make_key(request, model, prompt_version)
+        now = time.time()
+        plan = self._get_memory(key, now)
+        if plan is None and self._conn is not None:
+            plan = await asyncio.to_thread(self._get_disk, key, now)
+        return self._result(plan)
+
+    def put(self, request: str, model: str, prompt_version: str, plan: List[Dict[str, Any]]):
+        """Store a plan in both tiers"""
+        key, plan, now = self._put_memory(request, model, prompt_version, plan)
+        if self._conn is not None:
+            self._put_disk(key, plan, now)
+
+    async def put_async(self, request: str, model: str, prompt_version: str, plan: List[Dict[str, Any]]):
+        """Like put, writing the disk tier on a worker thread"""
+        key, plan, now = self._put_memory(request, model, prompt_version, plan)
+        if self._conn is not None:
+            await asyncio.to_thread(self._put_disk, key, plan, now)
+
+    def invalidate(self, request: Optional[str] = None, model: Optional[str] = None,
+                   prompt_version: Optional[str] = None) -> int:
+        """
+        Drop cached plans
+
+        Args:
+            request (str): Request to drop; when omitted, the whole cache is cleared
+            model (str): Model of the entry to drop (required with request)
+            prompt_version (str): Prompt version of the entry to drop (required with request)
+
+        Returns:
+            int: Number of entries removed from the disk tier (or memory tier without disk)
+        """
+        if request is None:
+            with self._lock:
+                removed = len(self._memory)
+                self._memory.clear()
+            with self._disk_lock:
+                if self._conn is not None:
+                    self._touched.clear()
+                    removed = self._conn.execute("DELETE FROM plans").rowcount
+                    self._conn.commit()
+            return removed
+
+        key = make_key(request, model or "", prompt_version or "")
+        with self._lock:
+            removed = 1 if self._memory.pop(key, None) is not None else 0
+        with self._disk_lock:
+            if self._conn is not None:
+                self._touched.pop(key, None)
+                removed = self._conn.execute("DELETE FROM plans WHERE key = ?", (key,)).rowcount
+                self._conn.commit()
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and tier sizes"""
+        disk_entries = 0
+        with self._disk_lock:
+            if self._conn is not None:
+                disk_entries = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+    def close(self):
+        """Save pending access times and close the disk store"""
+        with self._disk_lock:
+            if self._conn is not None:
+                try:
+                    self._write_touched()
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not save plan cache access times: {e}")
+                self._conn.close()
+                self._conn = None
+
+    def _get_memory(self, key: str, now: float) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            plan, created = entry
+            if now - created <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return plan
+            del self._memory[key]
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[List[Dict[str, Any]]]:
+        with self._disk_lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute("SELECT plan, created FROM plans WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            plan_json, created = row
+            if now - created > self.ttl:
+                self._touched.pop(key, None)
+                self._conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._touched[key] = now
+        plan = json.loads(plan_json)
+        with self._lock:
+            self._remember(key, plan, created)
+            self.hits_disk += 1
+        return plan
+
+    def _result(self, plan: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+        if plan is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return copy.deepcopy(plan)
+
+    def _put_memory(self, request: str, model: str, prompt_version: str, plan: List[Dict[str, Any]]):
+        key = make_key(request, model, prompt_version)
+        now = time.time()
+        plan = copy.deepcopy(plan)
+        with self._lock:
+            self._remember(key, plan, now)
+        return key, plan, now
+
+    def _put_disk(self, key: str, plan: List[Dict[str, Any]], now: float):
+        with self._disk_lock:
+            if self._conn is None:
+                return
+            self._touched.pop(key, None)
+            self._write_touched()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plans (key, plan, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(plan), now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+            if count > self.max_disk_entries:
+                excess = count - self.max_disk_entries
+                self._conn.execute(
+                    "DELETE FROM plans WHERE key IN "
+                    "(SELECT key FROM plans ORDER BY accessed ASC LIMIT ?)",
+                    (excess,),
+                )
+                with self._lock:
+                    self.evictions += excess
+            self._conn.commit()
+
+    def _write_touched(self):
+        """Write the access times of disk hits (disk lock held); eviction order depends on them"""
+        if self._touched:
+            self._conn.executemany("UPDATE plans SET accessed = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+
+    def _remember(self, key: str, plan: List[Dict[str, Any]], created: float):
+        """Insert into the memory LRU, evicting the oldest entry when full"""
+        self._memory[key] = (plan, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+
+_cache: Optional[PlanCache] = None
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """Return the process-wide plan cache, or None when caching is disabled"""
+    global _cache
+    if not PLAN_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = PlanCache(
+            path=PLAN_CACHE_PATH or None,
+            ttl=PLAN_CACHE_TTL,
+            max_memory_entries=PLAN_CACHE_MEMORY_SIZE,
+            max_disk_entries=PLAN_CACHE_DISK_SIZE,
+        )
+    return _cache
@@ -0,0 +1,141 @@
+"""
+plan_schema.py - Typed step models and the JSON schema plans are generated against
+"""
+import logging
+from typing import Annotated, Any, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+
+from config import PLAN_MAX_STEPS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MAX_INSTRUCTION_LENGTH = 500
+
+Cell = Union[str, int, float, bool, None]
+
+
+class _Step(BaseModel):
+    # The schema forbids extra fields, so constrained decoding cannot spend
+    # tokens on them; validation of unconstrained output just drops them
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True,
+                              json_schema_extra={"additionalProperties": False})
+
+    # Optional ordering: a step waits only for the steps listed in depends_on
+    # (ids, or indices of steps without one); see scheduler.resolve_dependencies
+    id: Optional[Union[int, str]] = None
+    depends_on: Optional[List[Union[int, str]]] = None
+
+
+class BrowserStep(_Step):
+    """Open a page and optionally search on it; the instruction carries URL and query"""
+    type: Literal["browser"]
+    instruction: str = Field(min_length=1, max_length=MAX_INSTRUCTION_LENGTH)
+
+
+class ExcelStep(_Step):
+    """Write a table to a new spreadsheet"""
+    type: Literal["excel"]
+    instruction: str = Field(min_length=1, max_length=MAX_INSTRUCTION_LENGTH)
+    headers: List[str] = Field(min_length=1)
+    data: List[List[Cell]]
+    format: Optional[Literal["csv", "xlsx"]] = None
+
+
+class EmailStep(_Step):
+    """Compose an email in the default client with body as the draft"""
+    type: Literal["email"]
+    instruction: str = Field(min_length=1, max_length=MAX_INSTRUCTION_LENGTH)
+    body: Optional[str] = None
+
+
+Step = Annotated[Union[BrowserStep, ExcelStep, EmailStep], Field(discriminator="type")]
+Plan = Annotated[List[Step], Field(min_length=1, max_length=PLAN_MAX_STEPS)]
+
+_step_adapter: TypeAdapter = TypeAdapter(Step)
+_plan_adapter: TypeAdapter = TypeAdapter(Plan)
+
+
+class PlanValidationError(ValueError):
+    """Raised when a plan does not match the step schema; errors lists each problem"""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _describe(error: ValidationError) -> List[str]:
+    """One short line per problem, e.g. "step 2 (excel) headers: Field required" """
+    problems = []
+    for item in error.errors():
+        loc = list(item["loc"])
+        where = []
+        if loc and isinstance(loc[0], int):
+            where.append(f"step {loc.pop(0) + 1}")
+            if loc and loc[0] in ("browser", "excel", "email"):
+                where[-1] += f" ({loc.pop(0)})"
+        where.extend(str(part) for part in loc)
+        problems.append(f"{' '.join(where) or 'plan'}: {item['msg']}")
+    return problems
+
+
+def validate_plan(value: Any) -> List[Dict[str, Any]]:
+    """
+    Validate decoded JSON as a plan
+
+    Args:
+        value: The decoded plan (a list of step objects)
+
+    Returns:
+        list: The steps as plain dicts, with unknown fields and nulls removed
+
+    Raises:
+        PlanValidationError: When the plan does not match the schema
+    """
+    try:
+        steps = _plan_adapter.validate_python(value)
+    except ValidationError as e:
+        raise PlanValidationError(_describe(e))
+    return [step.model_dump(exclude_none=True) for step in steps]
+
+
+def validate_step(value: Any) -> Dict[str, Any]:
+    """
+    Validate one step object (used while a plan is streaming in)
+
+    Raises:
+        PlanValidationError: When the step does not match the schema
+    """
+    try:
+        step = _step_adapter.validate_python(value)
+    except ValidationError as e:
+        raise PlanValidationError(_describe(e))
+    return step.model_dump(exclude_none=True)
+
+
+def _inline(schema: Any, definitions: Dict[str, Any]) -> Any:
+    """Resolve local $refs and drop titles, defaults and the discriminator hint"""
+    if isinstance(schema, list):
+        return [_inline(item, definitions) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    if "$ref" in schema:
+        return _inline(definitions[schema["$ref"].rsplit("/", 1)[-1]], definitions)
+    return {
+        key: _inline(value, definitions)
+        for key, value in schema.items()
+        if key not in ("title", "default", "description", "discriminator", "$defs")
+    }
+
+
+def build_plan_schema() -> Dict[str, Any]:
+    """
+    The plan's JSON schema in the self-contained form Ollama's ``format``
+    accepts, generated from the step models so the two cannot drift apart
+    """
+    schema = _plan_adapter.json_schema()
+    return _inline(schema, schema.get("$defs", {}))
+
+
+PLAN_SCHEMA = build_plan_schema()
@@ -0,0 +1,508 @@
+"""
+scheduler.py - Multi-job workflow scheduler with a bounded queue and worker pool
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
+
+from metrics import record_stage, stage
+from tracing import Span, activate, start_trace, trace_store
+
+if TYPE_CHECKING:
+    from journal import WorkflowJournal
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+# Journal-only: the process stopped while the run was queued or running
+INTERRUPTED = "interrupted"
+
+STEP_PENDING = "pending"
+STEP_RUNNING = "running"
+STEP_DONE = "done"
+STEP_FAILED = "failed"
+STEP_SKIPPED = "skipped"
+
+StepSource = Union[List[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]
+StepRunner = Callable[["Job", int, Dict[str, Any]], Awaitable[Any]]
+StatusListener = Callable[["Job"], None]
+StepListener = Callable[["Job", int], None]
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class PlanError(ValueError):
+    """Raised when step dependencies are invalid (duplicate or unknown ids, or cycles)"""
+
+
+@dataclass
+class Job:
+    """A submitted workflow and its execution state"""
+    id: str
+    steps: List[Dict[str, Any]]
+    status: str = QUEUED
+    current_step: int = -1
+    step_status: List[str] = field(default_factory=list)
+    results: List[Any] = field(default_factory=list)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    stream: Optional[AsyncIterator[Dict[str, Any]]] = field(default=None, repr=False)
+    dependencies: Optional[List[List[int]]] = field(default=None, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    trace: Optional[Span] = field(default=None, repr=False)
+    streamed: bool = False
+    request: Optional[str] = None
+    replay_of: Optional[str] = None
+    resumes: int = 0
+
+    @property
+    def planned(self) -> bool:
+        """Whether every step is known (a streamed plan is complete once the stream ends)"""
+        return self.dependencies is not None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED, CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public view of the job for API responses"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "current_step": self.current_step,
+            "steps": self.steps,
+            "step_status": self.step_status,
+            "results": self.results,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def resolve_dependencies(steps: List[Dict[str, Any]]) -> List[List[int]]:
+    """
+    Build the dependency list for each step
+
+    Steps may carry an "id" and a "depends_on" list of step ids (or indices).
+    When no step declares "depends_on", the plan runs strictly in order, which
+    is what existing plans expect.
+
+    Args:
+        steps (list): The workflow steps
+
+    Returns:
+        list: For each step, the indices of the steps it waits for
+
+    Raises:
+        PlanError: On duplicate step ids, unknown dependencies or dependency cycles
+    """
+    if not any("depends_on" in step for step in steps):
+        return [[i - 1] if i else [] for i in range(len(steps))]
+
+    ids = {}
+    for i, step in enumerate(steps):
+        if step.get("id") is None:
+            continue
+        key = str(step["id"])
+        if key in ids:
+            raise PlanError(f"Steps {ids[key] + 1} and {i + 1} have the same id {step['id']!r}")
+        ids[key] = i
+    # Steps without an id are referenced by index, unless another step took it as its id
+    for i, step in enumerate(steps):
+        if step.get("id") is None:
+            ids.setdefault(str(i), i)
+
+    dependencies = []
+    for i, step in enumerate(steps):
+        depends_on = step.get("depends_on") or []
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        resolved = []
+        for ref in depends_on:
+            if str(ref) not in ids:
+                raise PlanError(f"Step {i + 1} depends on unknown step {ref!r}")
+            resolved.append(ids[str(ref)])
+        dependencies.append(resolved)
+
+    # Kahn's algorithm: every step must become ready eventually
+    remaining = [len(deps) for deps in dependencies]
+    dependents: List[List[int]] = [[] for _ in steps]
+    for i, deps in enumerate(dependencies):
+        for dep in deps:
+            dependents[dep].append(i)
+    ready = [i for i, count in enumerate(remaining) if count == 0]
+    visited = 0
+    while ready:
+        node = ready.pop()
+        visited += 1
+        for child in dependents[node]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+    if visited != len(steps):
+        raise PlanError("Step dependencies contain a cycle")
+    return dependencies
+
+
+async def prefetch_steps(steps: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Drain a step stream in the background while the caller executes steps.
+
+    Without this, the LLM stream would only be read between steps, so
+    generation of later steps would stall while earlier ones execute.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async for step in steps:
+                await queue.put(step)
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            step = await queue.get()
+            if step is done:
+                break
+            yield step
+        await producer
+    finally:
+        producer.cancel()
+
+
+class JobScheduler:
+    """
+    Runs submitted workflows on a pool of async workers.
+
+    Jobs wait in a bounded FIFO queue; ``max_workers`` jobs run at once. Inside
+    a job, steps whose dependencies are satisfied run concurrently, up to
+    ``max_parallel_steps`` at a time. Finished jobs are kept for status queries
+    until ``history_size`` newer jobs have finished. With a ``journal``, every
+    job's plan, step status and results are also recorded durably, so runs
+    can be resumed or replayed after a restart. ``on_status`` is called on
+    the event loop whenever a job is queued, starts running or finishes, and
+    ``on_step`` whenever one of its steps changes status.
+    """
+
+    def __init__(self, run_step: StepRunner, max_workers: int = 2, max_queue: int = 32,
+                 max_parallel_steps: int = 4, history_size: int = 100,
+                 journal: Optional["WorkflowJournal"] = None, on_status: Optional[StatusListener] = None,
+                 on_step: Optional[StepListener] = None):
+        self.run_step = run_step
+        self.on_status = on_status
+        self.on_step = on_step
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_parallel_steps = max_parallel_steps
+        self.history_size = history_size
+        self.journal = journal
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        """Start the worker pool"""
+        if self._workers:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker(n)) for n in range(self.max_workers)]
+        logger.info(f"Job scheduler started with {self.max_workers} workers")
+
+    async def stop(self):
+        """Cancel running jobs and stop the worker pool"""
+        self._stopping = True
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def submit(self, steps: StepSource, trace: Optional[Span] = None, request: Optional[str] = None,
+               replay_of: Optional[str] = None) -> Job:
+        """
+        Queue a workflow for execution
+
+        Args:
+            steps: A list of steps, or an async stream of steps (run in arrival order)
+            trace (Span): Root span already covering work done for this job
+                (e.g. planning); a new one is started otherwise
+            request (str): The user request the steps were planned from, for the journal
+            replay_of (str): Id of the journaled run whose plan this job replays
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: When the queue is at capacity
+            PlanError: When step dependencies are invalid
+        """
+        if hasattr(steps, "__aiter__"):
+            job = Job(id=uuid.uuid4().hex, steps=[], stream=steps, streamed=True)
+        else:
+            steps = list(steps)
+            job = Job(id=uuid.uuid4().hex, steps=steps,
+                      step_status=[STEP_PENDING] * len(steps), results=[None] * len(steps),
+                      dependencies=resolve_dependencies(steps))
+        job.request = request
+        job.replay_of = replay_of
+        return self._enqueue(job, trace)
+
+    def resume(self, run: Dict[str, Any]) -> Job:
+        """
+        Re-queue a journaled run under its own id, skipping completed steps
+
+        Completed steps keep their recorded results; every other step runs
+        again. No planning is involved, so the run must have a complete plan.
+
+        Args:
+            run (dict): The run as returned by WorkflowJournal.get_run()
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: When the queue is at capacity
+            PlanError: When the plan is incomplete, or the run already completed or is still active
+        """
+        if not run["planned"]:
+            raise PlanError("Run stopped before its plan finished streaming; submit the request again")
+        if run["status"] == COMPLETED:
+            raise PlanError("Run already completed; replay it to run it again")
+        current = self.jobs.get(run["job_id"])
+        if current is not None and not current.is_finished:
+            raise PlanError("Run is already queued or running")
+        records = run["steps"]
+        steps = [record["step"] for record in records]
+        done = [record["status"] == STEP_DONE for record in records]
+        # Streamed plans ran in arrival order
+        dependencies = ([[i - 1] if i else [] for i in range(len(steps))] if run["streamed"]
+                        else resolve_dependencies(steps))
+        job = Job(id=run["job_id"], steps=steps,
+                  step_status=[STEP_DONE if d else STEP_PENDING for d in done],
+                  results=[record["result"] if d else None for record, d in zip(records, done)],
+                  dependencies=dependencies, streamed=run["streamed"], request=run["request"], replay_of=run["replay_of"],
+                  resumes=run["resumes"] + 1)
+        logger.info(f"Resuming job {job.id} with {done.count(True)}/{len(steps)} steps already done")
+        return self._enqueue(job, None)
+
+    def _enqueue(self, job: Job, trace: Optional[Span]) -> Job:
+        if self._queue is None:
+            raise RuntimeError("Scheduler is not running")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+        job.trace = trace or start_trace("job")
+        if job.trace is not None:
+            job.trace.attrs["job_id"] = job.id
+            trace_store.put(job.id, job.trace)
+        self.jobs[job.id] = job
+        if self.journal is not None:
+            self.journal.record_run(job)
+        if self.on_status is not None:
+            self.on_status(job)
+        self._trim_history()
+        logger.info(f"Queued job {job.id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Job]:
+        return list(self.jobs.values())
+
+    def running_jobs(self) -> List[Job]:
+        return [job for job in self.jobs.values() if job.status == RUNNING]
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def cancel_running(self) -> List[asyncio.Task]:
+        """
+        Cancel every running job at once
+
+        Returns:
+            list: The cancelled job tasks, to await if the caller needs to
+            know when they have actually stopped
+        """
+        tasks = []
+        for job in self.running_jobs():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+                tasks.append(job.task)
+        return tasks
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job
+
+        Returns:
+            bool: False if the job is unknown or already finished
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Still queued: the worker skips it when dequeued
+            self._finish(job, CANCELLED)
+        return True
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.is_finished:
+                    continue
+                job.task = asyncio.create_task(self._run_job(job))
+                try:
+                    await job.task
+                except asyncio.CancelledError:
+                    # Only a cancelled job is absorbed; a stopping worker exits
+                    if self._stopping:
+                        raise
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: Job):
+        job.status = RUNNING
+        job.started_at = time.time()
+        if self.journal is not None:
+            self.journal.record_status(job)
+        if self.on_status is not None:
+            self.on_status(job)
+        logger.info(f"Running job {job.id}")
+        try:
+            with activate(job.trace):
+                record_stage("queue_wait", job.started_at - job.created_at)
+                with stage("workflow"):
+                    if job.stream is not None:
+                        await self._run_stream(job)
+                    else:
+                        await self._run_graph(job)
+            self._finish(job, COMPLETED)
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED)
+            raise
+        except Exception as e:
+            logger.error(f"Error executing job {job.id}: {e}")
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    async def _run_stream(self, job: Job):
+        """Execute streamed steps one by one as they arrive"""
+        async for step in prefetch_steps(job.stream):
+            index = len(job.steps)
+            job.steps.append(step)
+            job.step_status.append(STEP_PENDING)
+            job.results.append(None)
+            await self._run_one(job, index)
+        # The whole plan is known now: a resume runs it in arrival order
+        job.dependencies = [[i - 1] if i else [] for i in range(len(job.steps))]
+
+    async def _run_graph(self, job: Job):
+        """Execute steps as their dependencies complete (steps already done are skipped)"""
+        dependencies = job.dependencies
+        completed = [status == STEP_DONE for status in job.step_status]
+        remaining = [sum(not completed[dep] for dep in deps) for deps in dependencies]
+        dependents: List[List[int]] = [[] for _ in job.steps]
+        for i, deps in enumerate(dependencies):
+            for dep in deps:
+                dependents[dep].append(i)
+
+        limit = asyncio.Semaphore(self.max_parallel_steps)
+
+        async def run_limited(index: int):
+            async with limit:
+                await self._run_one(job, index)
+            return index
+
+        running = {asyncio.create_task(run_limited(i))
+                   for i, count in enumerate(remaining) if count == 0 and not completed[i]}
+        try:
+            while running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = task.result()
+                    for child in dependents[index]:
+                        remaining[child] -= 1
+                        if remaining[child] == 0:
+                            running.add(asyncio.create_task(run_limited(child)))
+        finally:
+            # A failed or cancelled job must not leave steps running behind it
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def _run_one(self, job: Job, index: int):
+        job.current_step = index
+        job.step_status[index] = STEP_RUNNING
+        self._record_step(job, index)
+        step = job.steps[index]
+        try:
+            with stage(f"step_{step.get('type', 'unknown')}", index=index):
+                job.results[index] = await self.run_step(job, index, step)
+        except asyncio.CancelledError:
+            job.step_status[index] = STEP_SKIPPED
+            self._record_step(job, index)
+            raise
+        except Exception:
+            job.step_status[index] = STEP_FAILED
+            self._record_step(job, index)
+            raise
+        job.step_status[index] = STEP_DONE
+        self._record_step(job, index)
+
+    def _record_step(self, job: Job, index: int):
+        if self.journal is not None:
+            self.journal.record_step(job, index)
+        if self.on_step is not None:
+            self.on_step(job, index)
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        if job.trace is not None:
+            job.trace.attrs["status"] = status
+            job.trace.finish()
+        for i, step_status in enumerate(job.step_status):
+            if step_status == STEP_PENDING:
+                job.step_status[i] = STEP_SKIPPED
+        if self.journal is not None:
+            if status == CANCELLED and self._stopping:
+                # Cut short by shutdown rather than by the user: resumable
+                self.journal.record_run(job, INTERRUPTED)
+            else:
+                self.journal.record_run(job)
+        if self.on_status is not None:
+            self.on_status(job)
+        logger.info(f"Job {job.id} {status}")
+
+    def _trim_history(self):
+        """Forget the oldest finished jobs beyond history_size"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self.jobs[job_id]
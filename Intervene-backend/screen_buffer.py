@@ -0,0 +1,537 @@
+"""
+screen_buffer.py - Background screen capture into a shared-memory ring of frames with per-tile diffs
+"""
+import logging
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from config import (SCREEN_CAPTURE_ENABLED, SCREEN_CAPTURE_FPS, SCREEN_CAPTURE_FRAMES, SCREEN_CAPTURE_MAX_SIDE,
+                    SCREEN_TILE_SIZE, SCREEN_DIFF_THRESHOLD, SCREEN_MAX_REGIONS)
+
+if TYPE_CHECKING:
+    # multiprocessing stays off the startup path; segments are only opened once capture starts
+    from multiprocessing.shared_memory import SharedMemory
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# magic, width, height, slots, tile size, latest sequence number
+_HEADER = struct.Struct("<4sIIIIQ")
+_HEADER_SIZE = 64
+_LATEST_OFFSET = _HEADER.size - 8
+# sequence number when the write started, sequence number when it finished, capture time
+_SLOT_HEADER = struct.Struct("<QQd")
+_MAGIC = b"IVFR"
+
+Box = Tuple[int, int, int, int]
+
+# Rings this process created; the resource tracker already owns their names
+_created = set()
+
+
+@dataclass
+class Frame:
+    """One captured frame: its sequence number, capture time (time.time()), pixels and ring name"""
+    seq: int
+    timestamp: float
+    image: Any
+    ring: str
+
+
+def changed_tiles(previous, current, tile: int, threshold: int) -> bytes:
+    """
+    Compare two frames of the same size tile by tile
+
+    A pixel changed when a channel moved by more than ``threshold``; a tile
+    changed when more than about 1/500 of its pixels did, which ignores
+    isolated flicker but catches a blinking caret or one typed character.
+
+    Args:
+        previous (PIL.Image.Image): The earlier RGB frame
+        current (PIL.Image.Image): The later RGB frame
+        tile (int): Tile side in pixels
+        threshold (int): Per-channel difference treated as noise
+
+    Returns:
+        bytes: One byte per tile in row-major order, 1 where the tile changed
+    """
+    from PIL import ImageChops
+
+    width, height = current.size
+    tiles_x, tiles_y = -(-width // tile), -(-height // tile)
+    bitmap = bytearray(tiles_x * tiles_y)
+    difference = ImageChops.difference(previous, current)
+    box = difference.getbbox()
+    if box is None:
+        return bytes(bitmap)
+
+    # Only the tile-aligned area around the change is thresholded and reduced
+    left, top = box[0] // tile * tile, box[1] // tile * tile
+    right, bottom = min(-(-box[2] // tile) * tile, width), min(-(-box[3] // tile) * tile, height)
+    mask = difference.crop((left, top, right, bottom)).point([0 if v <= threshold else 255 for v in range(256)] * 3)
+    # A channel past the threshold marks the pixel; box-averaging each tile
+    # then leaves a non-zero value wherever enough of its pixels changed
+    channels = mask.split()
+    marked = channels[0]
+    for channel in channels[1:]:
+        marked = ImageChops.lighter(marked, channel)
+    reduced = marked.reduce(tile).tobytes()
+    reduced_width = -(-(right - left) // tile)
+    first_x, first_y = left // tile, top // tile
+    for index, value in enumerate(reduced):
+        if value:
+            row, col = divmod(index, reduced_width)
+            bitmap[(first_y + row) * tiles_x + first_x + col] = 1
+    return bytes(bitmap)
+
+
+def tile_regions(bitmap: bytes, size: Tuple[int, int], tile: int, max_regions: int = SCREEN_MAX_REGIONS) -> List[Box]:
+    """
+    Merge changed tiles into boxes
+
+    Touching tiles (diagonals included) form one region. When there are more
+    than ``max_regions`` regions, a single box around all of them is returned
+    instead.
+
+    Args:
+        bitmap (bytes): Tile bitmap from changed_tiles()
+        size (tuple): Frame (width, height)
+        tile (int): Tile side in pixels
+        max_regions (int): Most regions returned separately
+
+    Returns:
+        list: (left, top, right, bottom) boxes in frame pixels, largest first
+    """
+    width, height = size
+    tiles_x = -(-width // tile)
+    seen = set()
+    boxes = []
+    for start, value in enumerate(bitmap):
+        if not value or start in seen:
+            continue
+        seen.add(start)
+        stack = [start]
+        min_x = max_x = start % tiles_x
+        min_y = max_y = start // tiles_x
+        while stack:
+            y, x = divmod(stack.pop(), tiles_x)
+            min_x, max_x, min_y, max_y = min(min_x, x), max(max_x, x), min(min_y, y), max(max_y, y)
+            for ny in (y - 1, y, y + 1):
+                for nx in (x - 1, x, x + 1):
+                    neighbour = ny * tiles_x + nx
+                    if 0 <= nx < tiles_x and 0 <= neighbour < len(bitmap) and bitmap[neighbour] \
+                            and neighbour not in seen:
+                        seen.add(neighbour)
+                        stack.append(neighbour)
+        boxes.append((min_x * tile, min_y * tile, min((max_x + 1) * tile, width), min((max_y + 1) * tile, height)))
+    if len(boxes) > max_regions:
+        boxes = [(min(b[0] for b in boxes), min(b[1] for b in boxes),
+                  max(b[2] for b in boxes), max(b[3] for b in boxes))]
+    return sorted(boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True)
+
+
+def _attach_untracked(name: str) -> "SharedMemory":
+    """Open an existing segment without letting this process's exit unlink it"""
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach registers with the resource tracker
+        from multiprocessing import resource_tracker
+
+        memory = shared_memory.SharedMemory(name=name)
+        if name not in _created:
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class FrameRing:
+    """
+    Fixed-size ring of RGB frames in one preallocated shared-memory segment.
+
+    One writer (the capture thread) appends frames; any number of readers,
+    in this or other processes (see attach), read them without locking. Each
+    slot holds a frame, its capture time and the tiles that changed since
+    the previous frame. Slots are guarded by a sequence number written
+    before and after the pixels, so a reader detects a frame overwritten
+    while it was reading and gets None rather than torn pixels.
+    """
+
+    def __init__(self, memory: "SharedMemory", width: int, height: int, slots: int, tile: int,
+                 owner: bool = False):
+        self.memory = memory
+        self.name = memory.name
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.tile = tile
+        self.tiles_x = -(-width // tile)
+        self.tiles_y = -(-height // tile)
+        self.frame_bytes = width * height * 3
+        self._pixel_offset, self.slot_bytes = self._layout(width, height, tile)
+        self._owner = owner
+
+    @staticmethod
+    def _layout(width: int, height: int, tile: int) -> Tuple[int, int]:
+        """Offset of the pixels within a slot and the slot size"""
+        bitmap_bytes = -(-width // tile) * -(-height // tile)
+        # Slot header, tile bitmap, then the pixels 8-byte aligned
+        pixel_offset = -(-(_SLOT_HEADER.size + bitmap_bytes) // 8) * 8
+        return pixel_offset, pixel_offset + width * height * 3
+
+    @classmethod
+    def create(cls, width: int, height: int, slots: int = SCREEN_CAPTURE_FRAMES, tile: int = SCREEN_TILE_SIZE,
+               name: Optional[str] = None) -> "FrameRing":
+        """Allocate a ring for frames of width x height"""
+        from multiprocessing import shared_memory
+
+        _, slot_bytes = cls._layout(width, height, tile)
+        memory = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_SIZE + slots * slot_bytes)
+        _HEADER.pack_into(memory.buf, 0, _MAGIC, width, height, slots, tile, 0)
+        _created.add(memory.name)
+        return cls(memory, width, height, slots, tile, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRing":
+        """Open a ring created by another process, by its name"""
+        memory = _attach_untracked(name)
+        magic, width, height, slots, tile, _ = _HEADER.unpack_from(memory.buf, 0)
+        if magic != _MAGIC:
+            memory.close()
+            raise ValueError(f"Shared memory {name} is not a frame ring")
+        return cls(memory, width, height, slots, tile)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def latest_seq(self) -> int:
+        """Sequence number of the newest complete frame; 0 before the first one"""
+        return _HEADER.unpack_from(self.memory.buf, 0)[5]
+
+    def _slot(self, seq: int) -> int:
+        return _HEADER_SIZE + (seq % self.slots) * self.slot_bytes
+
+    def write(self, image, bitmap: Optional[bytes] = None) -> int:
+        """
+        Append a frame (writer only)
+
+        Args:
+            image (PIL.Image.Image): An RGB frame of the ring's size
+            bitmap (bytes): Tiles changed since the previous frame, from
+                changed_tiles(); without it every tile counts as changed
+
+        Returns:
+            int: The new frame's sequence number
+        """
+        if image.size != self.size:
+            raise ValueError(f"Frame is {image.size}, ring holds {self.size}")
+        seq = self.latest_seq + 1
+        if bitmap is None:
+            bitmap = b"\x01" * (self.tiles_x * self.tiles_y)
+        offset = self._slot(seq)
+        buf = self.memory.buf
+        # Mark the slot as being written, fill it, then mark it complete
+        _SLOT_HEADER.pack_into(buf, offset, seq, 0, time.time())
+        buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(bitmap)] = bitmap
+        buf[offset + self._pixel_offset:offset + self._pixel_offset + self.frame_bytes] = image.tobytes()
+        struct.pack_into("<Q", buf, offset + 8, seq)
+        struct.pack_into("<Q", buf, _LATEST_OFFSET, seq)
+        return seq
+
+    def _stamp(self, seq: int) -> Optional[float]:
+        """Capture time of frame seq if its slot still holds it completely"""
+        started, finished, timestamp = _SLOT_HEADER.unpack_from(self.memory.buf, self._slot(seq))
+        return timestamp if started == finished == seq else None
+
+    def frame(self, seq: int, copy: bool = True) -> Optional[Frame]:
+        """
+        Read frame seq
+
+        Args:
+            seq (int): Sequence number
+            copy (bool): False returns an image backed by the shared memory
+                itself, valid until the writer comes round to the slot again
+                (check with is_current) and holding the segment open while it lives
+
+        Returns:
+            Frame: The frame, or None when it was overwritten or not written yet
+        """
+        from PIL import Image
+
+        if seq <= 0 or seq > self.latest_seq:
+            return None
+        timestamp = self._stamp(seq)
+        if timestamp is None:
+            return None
+        start = self._slot(seq) + self._pixel_offset
+        pixels = self.memory.buf[start:start + self.frame_bytes]
+        if copy:
+            image = Image.frombytes("RGB", self.size, bytes(pixels))
+            pixels.release()
+            # The writer may have lapped us while we copied
+            if not self.is_current(seq):
+                return None
+        else:
+            image = Image.frombuffer("RGB", self.size, pixels, "raw", "RGB", 0, 1)
+        return Frame(seq, timestamp, image, self.name)
+
+    def latest(self, copy: bool = True) -> Optional[Frame]:
+        """The newest frame, or None before the first capture"""
+        for _ in range(3):
+            seq = self.latest_seq
+            if seq == 0:
+                return None
+            frame = self.frame(seq, copy)
+            if frame is not None:
+                return frame
+        return None
+
+    def is_current(self, seq: int) -> bool:
+        """Whether frame seq is still intact in its slot"""
+        return self._stamp(seq) is not None
+
+    def changed_tiles_since(self, since: int, until: Optional[int] = None) -> Optional[bytes]:
+        """
+        Tiles that changed after frame since, up to and including frame until
+
+        Returns:
+            bytes: The combined tile bitmap, or None when a frame in between
+                has been overwritten already (treat everything as changed)
+        """
+        until = self.latest_seq if until is None else until
+        if since > until:
+            # A sequence number from a ring this one replaced
+            return None
+        combined = 0
+        count = self.tiles_x * self.tiles_y
+        for seq in range(max(since, 0) + 1, until + 1):
+            offset = self._slot(seq)
+            bitmap = bytes(self.memory.buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + count])
+            if not self.is_current(seq):
+                return None
+            # Tiles are 0/1 bytes, so OR-ing them as one integer merges bitmaps
+            combined |= int.from_bytes(bitmap, "big")
+        return combined.to_bytes(count, "big")
+
+    def changed_regions(self, since: int, until: Optional[int] = None,
+                        max_regions: int = SCREEN_MAX_REGIONS) -> Optional[List[Box]]:
+        """
+        Boxes around everything that changed after frame since
+
+        Returns:
+            list: (left, top, right, bottom) boxes, empty when nothing changed,
+                or None when frame since is too old to tell
+        """
+        bitmap = self.changed_tiles_since(since, until)
+        if bitmap is None:
+            return None
+        return tile_regions(bitmap, self.size, self.tile, max_regions)
+
+    def close(self):
+        """Detach; the creating process also frees the segment"""
+        try:
+            self.memory.close()
+        except BufferError:
+            # Zero-copy images still point into the segment
+            logger.warning(f"Frame ring {self.name} closed while frames were still in use")
+            return
+        if self._owner:
+            _created.discard(self.name)
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def grab_screen():
+    """Capture the full screen as an RGB image"""
+    # PIL is imported on first capture so it stays off the startup path
+    from PIL import ImageGrab
+
+    return ImageGrab.grab().convert("RGB")
+
+
+class ScreenCapture:
+    """
+    Samples the screen at a fixed rate into a FrameRing from a daemon thread.
+
+    Frames are downscaled to ``max_side`` before they are stored and diffed.
+    The ring is allocated at the first frame and reallocated if the display
+    size changes, so readers in other processes should re-attach when
+    ``ring.name`` changes. Capture keeps a steady cadence: a frame that took
+    longer than the interval is counted as late and the next one is taken
+    right away.
+    """
+
+    def __init__(self, fps: float = SCREEN_CAPTURE_FPS, frames: int = SCREEN_CAPTURE_FRAMES,
+                 max_side: int = SCREEN_CAPTURE_MAX_SIDE, tile: int = SCREEN_TILE_SIZE,
+                 threshold: int = SCREEN_DIFF_THRESHOLD, grab: Callable[[], Any] = grab_screen):
+        self.interval = 1.0 / fps
+        self.frames = frames
+        self.max_side = max_side
+        self.tile = tile
+        self.threshold = threshold
+        self.grab = grab
+        self.ring: Optional[FrameRing] = None
+        self._previous = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.captured = 0
+        self.late = 0
+        self.errors = 0
+        self.capture_seconds = 0.0
+        self.store_seconds = 0.0
+        self.changed_tiles = 0
+
+    def capture_once(self) -> int:
+        """Grab, scale and store one frame; returns its sequence number"""
+        from PIL import Image
+
+        started = time.perf_counter()
+        image = self.grab()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        if self.max_side and max(image.size) > self.max_side:
+            image.thumbnail((self.max_side, self.max_side), Image.BILINEAR, reducing_gap=2.0)
+        grabbed = time.perf_counter()
+
+        with self._lock:
+            if self.ring is None or self.ring.size != image.size:
+                if self.ring is not None:
+                    logger.info(f"Screen size changed to {image.size}, reallocating the frame ring")
+                    self.ring.close()
+                self.ring = FrameRing.create(*image.size, slots=self.frames, tile=self.tile,
+                                             name=f"intervene-frames-{os.getpid()}-{self.captured}")
+                self._previous = None
+            bitmap = None
+            if self._previous is not None:
+                bitmap = changed_tiles(self._previous, image, self.tile, self.threshold)
+                self.changed_tiles += sum(bitmap)
+            seq = self.ring.write(image, bitmap)
+            self._previous = image
+
+        self.captured += 1
+        self.capture_seconds += grabbed - started
+        self.store_seconds += time.perf_counter() - grabbed
+        return seq
+
+    def _run(self):
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.capture_once()
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1 or self.errors % 100 == 0:
+                    logger.warning(f"Screen capture failed ({self.errors} so far): {e}")
+            next_due += self.interval
+            delay = next_due - time.monotonic()
+            if delay < 0:
+                self.late += 1
+                next_due = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self):
+        """Start sampling in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="screen-capture", daemon=True)
+        self._thread.start()
+        logger.info(f"Screen capture started at {1 / self.interval:g} fps, {self.frames} frames buffered")
+
+    def stop(self):
+        """Stop sampling and free the ring"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+            self._previous = None
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[Frame]:
+        """
+        The newest frame, copied out of the ring
+
+        Args:
+            max_age (float): Seconds; an older frame is not returned (defaults to two intervals)
+        """
+        ring = self.ring
+        if ring is None:
+            return None
+        frame = ring.latest()
+        max_age = 2 * self.interval if max_age is None else max_age
+        if frame is None or time.time() - frame.timestamp > max_age:
+            return None
+        return frame
+
+    def changed_regions(self, since: int, until: Optional[int] = None) -> Optional[List[Box]]:
+        """See FrameRing.changed_regions; None also while nothing is captured"""
+        ring = self.ring
+        if ring is None:
+            return None
+        return ring.changed_regions(since, until)
+
+    def regions_between(self, previous, current) -> List[Box]:
+        """Changed regions between two frames the ring no longer holds, diffed directly"""
+        bitmap = changed_tiles(previous, current, self.tile, self.threshold)
+        return tile_regions(bitmap, current.size, self.tile)
+
+    def stats(self) -> Dict[str, Any]:
+        ring = self.ring
+        captured = self.captured or 1
+        return {
+            "running": self._thread is not None,
+            "fps": round(1 / self.interval, 2),
+            "ring": ring.name if ring is not None else None,
+            "size": list(ring.size) if ring is not None else None,
+            "frames_buffered": self.frames,
+            "latest_seq": ring.latest_seq if ring is not None else 0,
+            "captured": self.captured,
+            "late": self.late,
+            "errors": self.errors,
+            "mean_capture_ms": round(self.capture_seconds / captured * 1000, 2),
+            "mean_store_ms": round(self.store_seconds / captured * 1000, 2),
+            "mean_changed_tiles": round(self.changed_tiles / captured, 1),
+        }
+
+
+_capture: Optional[ScreenCapture] = None
+
+
+def get_screen_capture() -> Optional[ScreenCapture]:
+    """Return the running process-wide capture service, or None when it is off"""
+    if _capture is None or _capture._thread is None:
+        return None
+    return _capture
+
+
+def start_screen_capture() -> Optional[ScreenCapture]:
+    """Start the process-wide capture service if SCREEN_CAPTURE_ENABLED"""
+    global _capture
+    if not SCREEN_CAPTURE_ENABLED:
+        return None
+    if _capture is None:
+        _capture = ScreenCapture()
+    _capture.start()
+    return _capture
+
+
+def stop_screen_capture():
+    """Stop the process-wide capture service and free its shared memory"""
+    global _capture
+    if _capture is not None:
+        _capture.stop()
+        _capture = None
@@ -0,0 +1,458 @@
+"""
+shared_state.py - Job status and step events shared by every server worker process
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (STATE_BACKEND, STATE_PATH, STATE_POLL_INTERVAL, STATE_EVENT_RETENTION,
+                    STATE_REPLAY_BACKLOG, STATE_MAX_JOBS, SERVER_WORKERS)
+from scheduler import QUEUED, RUNNING, INTERRUPTED
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LOCAL = "local"
+SQLITE = "sqlite"
+
+# Kinds of rows in the shared event log
+EVENT = "event"
+CONTROL = "control"
+
+EventListener = Callable[[Dict[str, Any]], None]
+
+# A worker whose heartbeat is older than this is considered gone
+HEARTBEAT_INTERVAL = 2.0
+STALE_AFTER = 10.0
+
+
+class LocalState:
+    """
+    Single-process backend: events go straight to this process's listener and
+    the scheduler is the only record of job status. Nothing is shared, which
+    is all a server with one worker needs.
+    """
+
+    shared = False
+    # The only process, so it recovers runs a previous process left behind
+    first = True
+
+    def __init__(self):
+        self._on_event: Optional[EventListener] = None
+        self._on_control: Optional[EventListener] = None
+
+    async def start(self, on_event: EventListener, on_control: EventListener):
+        """Deliver every event and control message to these callbacks on the event loop"""
+        self._on_event = on_event
+        self._on_control = on_control
+
+    def publish(self, event: Dict[str, Any]):
+        """Send a step or job event to every worker's WebSocket clients"""
+        if self._on_event is not None:
+            self._on_event(event)
+
+    def control(self, message: Dict[str, Any]):
+        """Send a command (e.g. {"cancel": job_id}) to every worker"""
+        if self._on_control is not None:
+            self._on_control(message)
+
+    def put_job(self, job: Dict[str, Any]):
+        """Record the latest view of a job this worker runs"""
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job run by another worker (blocking)"""
+        return None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Jobs of every worker, newest first (blocking)"""
+        return []
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": LOCAL, "workers": 1}
+
+    async def stop(self):
+        self._on_event = self._on_control = None
+
+
+class SQLiteState(LocalState):
+    """
+    Backend for several worker processes on one machine.
+
+    Events and control messages are appended to a log table in a shared
+    SQLite database (WAL mode). The log's rowid is the event's ``seq``, so
+    every worker delivers the same events in the same order under the same
+    sequence numbers, and a client can resume with ?since= on any worker.
+    A snapshot of each job is upserted into a jobs table, so status queries
+    answer the same on every worker.
+
+    Appends are committed by a writer thread, never on the event loop. After
+    a commit the writer sends a one-byte UDP datagram to every worker's
+    loopback socket; their reader threads then fetch the new rows. The
+    reader also polls every ``poll_interval`` seconds, so a lost datagram
+    only delays delivery. Workers register themselves with a heartbeat;
+    ``first`` is true for the process that found no other live worker at
+    startup, and that process alone recovers interrupted runs.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, poll_interval: float = 0.5, retention: int = 10000, backlog: int = 256,
+                 max_jobs: int = 1000):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.backlog = backlog
+        self.max_jobs = max_jobs
+        self.pid = os.getpid()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writes: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._reader: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._query_lock = threading.Lock()
+        self._peers: List[int] = []
+        self._last_seq = 0
+        self.published = 0
+        self.delivered = 0
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.errors = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._query = self._connect()
+        self._query.executescript(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "origin INTEGER NOT NULL, created_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, worker INTEGER NOT NULL, status TEXT NOT NULL, data TEXT NOT NULL, "
+            "updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated_at);"
+            "CREATE TABLE IF NOT EXISTS workers ("
+            "pid INTEGER PRIMARY KEY, port INTEGER NOT NULL, started_at REAL NOT NULL, heartbeat REAL NOT NULL);"
+        )
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port = self._socket.getsockname()[1]
+        self.first = self._register()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _alive(pid: int, heartbeat: float) -> bool:
+        if time.time() - heartbeat > STALE_AFTER:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _reap(self, conn: sqlite3.Connection) -> int:
+        """
+        Forget workers that are gone; their unfinished jobs become interrupted
+
+        Returns:
+            int: Number of other workers still alive
+        """
+        rows = conn.execute("SELECT pid, heartbeat FROM workers WHERE pid != ?", (self.pid,)).fetchall()
+        dead = [(pid,) for pid, heartbeat in rows if not self._alive(pid, heartbeat)]
+        if dead:
+            conn.executemany("DELETE FROM workers WHERE pid = ?", dead)
+            conn.executemany(
+                "UPDATE jobs SET status = ?, data = json_set(data, '$.status', ?) "
+                "WHERE worker = ? AND status IN (?, ?)",
+                [(INTERRUPTED, INTERRUPTED, pid, QUEUED, RUNNING) for pid, in dead])
+            logger.info(f"Shared state: {len(dead)} workers are gone")
+        return len(rows) - len(dead)
+
+    def _register(self) -> bool:
+        """Add this worker and forget dead ones; True when no other worker is alive"""
+        with self._query_lock:
+            self._query.execute("BEGIN IMMEDIATE")
+            try:
+                alive = self._reap(self._query)
+                now = time.time()
+                self._query.execute("INSERT OR REPLACE INTO workers (pid, port, started_at, heartbeat) "
+                                    "VALUES (?, ?, ?, ?)", (self.pid, self.port, now, now))
+                self._query.execute("COMMIT")
+            except BaseException:
+                self._query.execute("ROLLBACK")
+                raise
+        return alive == 0
+
+    async def start(self, on_event: EventListener, on_control: EventListener):
+        await super().start(on_event, on_control)
+        self._loop = asyncio.get_running_loop()
+        with self._query_lock:
+            newest = self._query.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+        # Recent events fill the local replay buffer and job states
+        self._last_seq = max(0, newest - self.backlog)
+        self._refresh_peers()
+        self._writer = threading.Thread(target=self._write_loop, name="state-writer", daemon=True)
+        self._reader = threading.Thread(target=self._read_loop, name="state-reader", daemon=True)
+        self._writer.start()
+        self._reader.start()
+        logger.info(f"Shared state at {self.path} (worker {self.pid}, {len(self._peers)} workers"
+                    f"{', recovering runs' if self.first else ''})")
+
+    # Publishing (called on the event loop; never blocks on disk)
+
+    def publish(self, event: Dict[str, Any]):
+        self.published += 1
+        self._writes.put((EVENT, event, time.time()))
+
+    def control(self, message: Dict[str, Any]):
+        self._writes.put((CONTROL, message, time.time()))
+
+    def put_job(self, job: Dict[str, Any]):
+        self._writes.put((None, job, time.time()))
+
+    # Writer thread
+
+    def _write_loop(self):
+        conn = self._connect()
+        heartbeat = 0.0
+        try:
+            while True:
+                try:
+                    items = [self._writes.get(timeout=HEARTBEAT_INTERVAL)]
+                except queue.Empty:
+                    items = []
+                while True:
+                    try:
+                        items.append(self._writes.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(item is None for item in items)
+                items = [item for item in items if item is not None]
+                if items:
+                    self._commit(conn, items)
+                if time.monotonic() - heartbeat > HEARTBEAT_INTERVAL:
+                    heartbeat = time.monotonic()
+                    self._heartbeat(conn)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, items: List):
+        started = time.perf_counter()
+        events, jobs = [], {}
+        for kind, payload, created_at in items:
+            if kind is None:
+                # Later snapshots of a job replace earlier ones in the same batch
+                jobs[payload["job_id"]] = (payload["job_id"], self.pid, payload["status"],
+                                           json.dumps(payload, default=str), created_at)
+            else:
+                events.append((kind, json.dumps(payload, default=str), self.pid, created_at))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT INTO events (kind, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+                                 events)
+                conn.executemany("INSERT OR REPLACE INTO jobs (job_id, worker, status, data, updated_at) "
+                                 "VALUES (?, ?, ?, ?, ?)", list(jobs.values()))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"Shared state dropped {len(items)} updates: {e}")
+            return
+        self.commits += 1
+        self.commit_seconds += time.perf_counter() - started
+        if events:
+            self._notify()
+
+    def _notify(self):
+        for port in self._peers:
+            try:
+                self._socket.sendto(b"\x01", ("127.0.0.1", port))
+            except OSError:
+                pass
+
+    def _heartbeat(self, conn: sqlite3.Connection):
+        """Mark this worker alive, reap dead ones and trim the event log and job table"""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("UPDATE workers SET heartbeat = ? WHERE pid = ?", (time.time(), self.pid))
+                self._reap(conn)
+                newest = conn.execute("SELECT MAX(seq) FROM events").fetchone()[0]
+                if newest is not None and newest > self.retention:
+                    conn.execute("DELETE FROM events WHERE seq <= ?", (newest - self.retention,))
+                conn.execute("DELETE FROM jobs WHERE job_id NOT IN "
+                             "(SELECT job_id FROM jobs ORDER BY updated_at DESC LIMIT ?)", (self.max_jobs,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Shared state heartbeat failed: {e}")
+        self._refresh_peers(conn)
+
+    def _refresh_peers(self, conn: Optional[sqlite3.Connection] = None):
+        """Ports of live workers, this one included"""
+        try:
+            if conn is None:
+                with self._query_lock:
+                    rows = self._query.execute("SELECT pid, port, heartbeat FROM workers").fetchall()
+            else:
+                rows = conn.execute("SELECT pid, port, heartbeat FROM workers").fetchall()
+        except sqlite3.Error:
+            return
+        self._peers = [port for pid, port, heartbeat in rows if pid == self.pid or self._alive(pid, heartbeat)]
+
+    # Reader thread
+
+    def _read_loop(self):
+        conn = self._connect()
+        self._socket.settimeout(self.poll_interval)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    self._socket.recv(16)
+                    # Collapse a burst of wake-ups into one query
+                    self._socket.setblocking(False)
+                    try:
+                        while True:
+                            self._socket.recv(16)
+                    except (BlockingIOError, OSError):
+                        pass
+                    self._socket.settimeout(self.poll_interval)
+                except socket.timeout:
+                    pass
+                except OSError:
+                    if self._stopping.is_set():
+                        return
+                    time.sleep(self.poll_interval)
+                self._fetch(conn)
+        finally:
+            conn.close()
+
+    def _fetch(self, conn: sqlite3.Connection):
+        try:
+            rows = conn.execute("SELECT seq, kind, payload, created_at FROM events WHERE seq > ? ORDER BY seq",
+                                (self._last_seq,)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Reading shared events failed: {e}")
+            return
+        if not rows:
+            return
+        self._last_seq = rows[-1][0]
+        batch = [(seq, kind, json.loads(payload), created_at) for seq, kind, payload, created_at in rows]
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, batch)
+        except RuntimeError:
+            pass
+
+    def _dispatch(self, batch: List):
+        now = time.time()
+        for seq, kind, payload, created_at in batch:
+            if kind == EVENT:
+                if self._on_event is not None:
+                    self._on_event({**payload, "seq": seq})
+                lag = max(0.0, now - created_at)
+                self.delivered += 1
+                self.lag_seconds += lag
+                self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            elif self._on_control is not None:
+                self._on_control(payload)
+
+    # Queries (blocking; run them in a worker thread from async code)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._query_lock:
+            row = self._query.execute("SELECT data, worker FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return {**json.loads(row[0]), "worker": row[1]} if row else None
+
+    def list_jobs(self, limit: int = 200) -> List[Dict[str, Any]]:
+        with self._query_lock:
+            rows = self._query.execute("SELECT data, worker FROM jobs ORDER BY updated_at DESC LIMIT ?",
+                                       (limit,)).fetchall()
+        return [{**json.loads(data), "worker": worker} for data, worker in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": SQLITE,
+            "path": self.path,
+            "worker": self.pid,
+            "workers": len(self._peers),
+            "first": self.first,
+            "published": self.published,
+            "delivered": self.delivered,
+            "last_seq": self._last_seq,
+            "commits": self.commits,
+            "mean_commit_ms": round(self.commit_seconds / self.commits * 1000, 3) if self.commits else None,
+            # Publish on any worker -> delivered to this worker's clients
+            "mean_delivery_lag_ms": round(self.lag_seconds / self.delivered * 1000, 3) if self.delivered else None,
+            "max_delivery_lag_ms": round(self.max_lag_seconds * 1000, 3),
+            "errors": self.errors,
+        }
+
+    async def stop(self):
+        """Commit what is pending, stop the threads and deregister this worker"""
+        self._writes.put(None)
+        if self._writer is not None:
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+        self._stopping.set()
+        if self._reader is not None:
+            await asyncio.to_thread(self._reader.join)
+            self._reader = None
+        self._socket.close()
+        with self._query_lock:
+            self._query.execute("DELETE FROM workers WHERE pid = ?", (self.pid,))
+            self._query.close()
+        await super().stop()
+
+
+_state: Optional[LocalState] = None
+
+
+def get_state_backend() -> LocalState:
+    """
+    Return the process-wide state backend
+
+    STATE_BACKEND "auto" shares state through SQLite when the server runs
+    more than one worker (SERVER_WORKERS, or uvicorn's WEB_CONCURRENCY).
+    """
+    global _state
+    if _state is None:
+        backend = STATE_BACKEND
+        if backend == "auto":
+            backend = SQLITE if SERVER_WORKERS > 1 else LOCAL
+        if backend == SQLITE:
+            _state = SQLiteState(STATE_PATH, poll_interval=STATE_POLL_INTERVAL, retention=STATE_EVENT_RETENTION,
+                                 backlog=STATE_REPLAY_BACKLOG, max_jobs=STATE_MAX_JOBS)
+        elif backend == LOCAL:
+            _state = LocalState()
+        else:
+            raise ValueError(f"Unknown state backend: {STATE_BACKEND}")
+    return _state
+
+
+async def close_state_backend():
+    """Stop the process-wide state backend if it was opened"""
+    global _state
+    if _state is not None:
+        await _state.stop()
+        _state = None
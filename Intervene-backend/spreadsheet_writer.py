@@ -0,0 +1,110 @@
+"""
+spreadsheet_writer.py - Streaming CSV and XLSX writers with flat memory use
+"""
+import csv
+import itertools
+import logging
+from typing import Any, Iterable, Optional, Sequence
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _chunks(rows: Iterable[Sequence[Any]], chunk_size: int):
+    """Yield lists of at most chunk_size rows without materializing the input"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(path: str, rows: Iterable[Sequence[Any]], headers: Optional[Sequence[Any]] = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Stream rows to a CSV file with proper quoting and escaping
+
+    Args:
+        path (str): Destination file
+        rows (iterable): Rows to write; may be a generator of any length
+        headers (list): Optional header row
+        chunk_size (int): Rows buffered per write call
+
+    Returns:
+        int: Number of data rows written
+    """
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if headers:
+            writer.writerow(headers)
+        for chunk in _chunks(rows, chunk_size):
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+
+def write_xlsx(path: str, rows: Iterable[Sequence[Any]], headers: Optional[Sequence[Any]] = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Stream rows to a native .xlsx file in xlsxwriter's constant-memory mode
+
+    Rows are flushed to disk as soon as the next row starts, so memory stays
+    flat regardless of row count. Requires the optional xlsxwriter package.
+
+    Args:
+        path (str): Destination file
+        rows (iterable): Rows to write; may be a generator of any length
+        headers (list): Optional header row
+        chunk_size (int): Rows pulled from the input at a time
+
+    Returns:
+        int: Number of data rows written
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise RuntimeError("xlsx output requires the xlsxwriter package (pip install xlsxwriter)")
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_numbers": False})
+    try:
+        worksheet = workbook.add_worksheet()
+        row_index = 0
+        if headers:
+            worksheet.write_row(row_index, 0, headers, workbook.add_format({"bold": True}))
+            row_index += 1
+        count = 0
+        for chunk in _chunks(rows, chunk_size):
+            for row in chunk:
+                worksheet.write_row(row_index, 0, row)
+                row_index += 1
+            count += len(chunk)
+    finally:
+        workbook.close()
+    return count
+
+
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+}
+
+
+def write_spreadsheet(path: str, rows: Iterable[Sequence[Any]], headers: Optional[Sequence[Any]] = None,
+                      output_format: str = "csv", chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Write rows with the writer for output_format ("csv" or "xlsx")
+
+    Returns:
+        int: Number of data rows written
+    """
+    try:
+        writer = WRITERS[output_format]
+    except KeyError:
+        raise ValueError(f"Unsupported spreadsheet format: {output_format}")
+    count = writer(path, rows, headers, chunk_size)
+    logger.info(f"Wrote {count} rows to {path}")
+    return count
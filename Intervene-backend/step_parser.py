@@ -0,0 +1,178 @@
+"""
+step_parser.py - Tolerant incremental parser for streamed LLM step lists
+"""
+import json
+import logging
+from typing import Any, Dict, List
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class IncrementalStepParser:
+    """
+    Incrementally parse a JSON array of step objects from a token stream.
+
+    Text before the first '[' (prose, code fences) is ignored. Each object that
+    is a direct element of that array is emitted as soon as its closing brace
+    arrives, without waiting for the rest of the array. Quote state is tracked,
+    so brackets and apostrophes inside strings never confuse the parser.
+    Objects that are not valid JSON on their own get a targeted repair
+    (single-quoted strings, trailing commas) and are only dropped if that fails.
+    """
+
+    def __init__(self):
+        self._started = False
+        self.done = False
+        self._depth = 0
+        self._quote = None
+        self._escape = False
+        self._object_start = -1
+        self._text = ""
+        self._pos = 0
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consume the next piece of text
+
+        Args:
+            chunk (str): Newly generated text
+
+        Returns:
+            list: Step objects completed by this chunk, in order
+        """
+        if self.done or not chunk:
+            return []
+
+        self._text += chunk
+        steps = []
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            char = text[i]
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == self._quote:
+                    self._quote = None
+                i += 1
+                continue
+
+            if char in "\"'":
+                self._quote = char
+            elif char in "[{":
+                if self._depth == 1 and char == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1 and char == "}" and self._object_start >= 0:
+                    step = self._decode(text[self._object_start:i + 1])
+                    if step is not None:
+                        steps.append(step)
+                    self._object_start = -1
+                elif self._depth <= 0:
+                    self.done = True
+                    i += 1
+                    break
+            i += 1
+
+        # Drop consumed text that can no longer be part of a pending object
+        if self._object_start >= 0:
+            self._text = text[self._object_start:]
+            self._pos = i - self._object_start
+            self._object_start = 0
+        else:
+            self._text = ""
+            self._pos = 0
+        return steps
+
+    def _decode(self, raw: str):
+        """Decode one step object, repairing it if needed"""
+        try:
+            step = json.loads(raw)
+        except json.JSONDecodeError:
+            try:
+                step = json.loads(repair_json(raw))
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping unparseable step: {e}: {raw}")
+                self.skipped += 1
+                return None
+        if not isinstance(step, dict):
+            self.skipped += 1
+            return None
+        return step
+
+
+def repair_json(raw: str) -> str:
+    """
+    Re-emit an almost-JSON fragment as strict JSON
+
+    Converts single-quoted strings to double-quoted ones and removes trailing
+    commas. Apostrophes inside double-quoted strings are left untouched.
+
+    Args:
+        raw (str): The fragment to repair
+
+    Returns:
+        str: The repaired fragment
+    """
+    out = []
+    quote = None
+    escape = False
+    pending_comma = False
+    for char in raw:
+        if quote is not None:
+            if escape:
+                escape = False
+                # \' is not a valid JSON escape
+                if char == "'":
+                    out[-1] = "'"
+                    continue
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == quote:
+                quote = None
+                out.append('"')
+            elif char == '"' and quote == "'":
+                out.append('\\"')
+            else:
+                out.append(char)
+            continue
+
+        if char.isspace():
+            out.append(char)
+            continue
+        if char == ",":
+            if pending_comma:
+                continue
+            pending_comma = True
+            continue
+        if pending_comma:
+            if char not in "]}":
+                out.append(",")
+            pending_comma = False
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def parse_steps_text(text: str) -> List[Dict[str, Any]]:
+    """Parse a complete LLM response with the incremental parser"""
+    parser = IncrementalStepParser()
+    return parser.feed(text)
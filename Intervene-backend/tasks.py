@@ -1,99 +1,134 @@
 """
 tasks.py - Task execution with safer alternatives to PyAutoGUI
 """
+import asyncio
 import subprocess
-import time
 import os
 import logging
 import json
-from threading import Timer
-from PIL import ImageGrab
 import tempfile
-from vision_analyzer import analyze_screenshot
+from dataclasses import dataclass
+from vision_analyzer import analyze_image, analyze_image_async, analyze_regions_async
+from model_gateway import PRIORITY_NORMAL
+from screen_buffer import get_screen_capture
+from metrics import SCREEN_ANALYSES, SCREEN_PIXELS_SENT
+from listener import get_detector
+from input_automation import get_backend, parse_key, Paste, WaitForWindow
+from waiting import wait_until
+from spreadsheet_writer import WRITERS, write_spreadsheet
+from config import APP_READY_TIMEOUT, SCREEN_REGION_MAX_AREA
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+OVERRIDE_RESULT = "Cancelled: manual override detected"
+
 class SafeAutomation:
     """A safer alternative to PyAutoGUI that uses platform-specific commands"""
     
+    @staticmethod
+    def run_actions(actions):
+        """
+        Send a batch of key presses and pastes in one backend invocation
+        
+        Args:
+            actions (list): input_automation.Key / Paste actions, run in order
+        """
+        # Our own keystrokes must not count as the user taking over
+        with get_detector().ignoring_input():
+            get_backend().run(actions)
+    
     @staticmethod
     def paste_text(text):
         """Paste text at current cursor position using clipboard"""
-        import pyperclip
-        original = pyperclip.paste()
-        pyperclip.copy(text)
-        
-        if os.name == 'posix':  # macOS or Linux
-            subprocess.run(["osascript", "-e", 'tell application "System Events" to keystroke "v" using command down'])
-        elif os.name == 'nt':  # Windows
-            subprocess.run(["powershell", "-command", "Add-Type -AssemblyName System.Windows.Forms; [System.Windows.Forms.SendKeys]::SendWait('^v')"])
-        
-        # Restore original clipboard after short delay
-        Timer(0.5, lambda: pyperclip.copy(original)).start()
+        SafeAutomation.run_actions([Paste(text)])
         
     @staticmethod
     def press_key(key_combination):
         """Press keys with platform-specific methods"""
-        if os.name == 'posix':  # macOS or Linux
-            if '+' in key_combination:
-                keys = key_combination.split('+')
-                modifiers = []
-                for mod in keys[:-1]:
-                    if mod.lower() == 'cmd' or mod.lower() == 'command':
-                        modifiers.append('command')
-                    elif mod.lower() in ['ctrl', 'control']:
-                        modifiers.append('control')
-                    elif mod.lower() == 'alt':
-                        modifiers.append('option')
-                    elif mod.lower() == 'shift':
-                        modifiers.append('shift')
-                
-                mod_str = ' '.join(f"{m} down" for m in modifiers)
-                key = keys[-1]
-                subprocess.run(["osascript", "-e", f'tell application "System Events" to keystroke "{key}" using {{{mod_str}}}'])
-            else:
-                # Single key press
-                subprocess.run(["osascript", "-e", f'tell application "System Events" to keystroke "{key_combination}"'])
-        elif os.name == 'nt':  # Windows
-            # Map common keys
-            key_map = {
-                'command': '^',  # Control
-                'cmd': '^',
-                'control': '^',
-                'ctrl': '^',
-                'alt': '%',
-                'shift': '+',
-                'enter': '{ENTER}',
-                'tab': '{TAB}',
-                'escape': '{ESC}'
-            }
-            
-            win_combo = key_combination
-            for k, v in key_map.items():
-                win_combo = win_combo.replace(k, v)
-                
-            subprocess.run(["powershell", "-command", f"Add-Type -AssemblyName System.Windows.Forms; [System.Windows.Forms.SendKeys]::SendWait('{win_combo}')"])
+        SafeAutomation.run_actions([parse_key(key_combination)])
+
+    @staticmethod
+    def capture_screen():
+        """Capture the screen as an in-memory image, without touching disk"""
+        # With background capture running, a recent buffered frame costs no capture at all
+        capture = get_screen_capture()
+        frame = capture.latest() if capture is not None else None
+        if frame is not None:
+            return frame.image
+
+        # PIL is imported on first capture so it stays off the startup path
+        from PIL import ImageGrab
+
+        return ImageGrab.grab()
 
     @staticmethod
     def take_screenshot():
         """Take a screenshot and save to a temporary file"""
         temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-        screenshot = ImageGrab.grab()
+        screenshot = SafeAutomation.capture_screen()
         screenshot.save(temp_file.name)
         logger.info(f"Screenshot saved to {temp_file.name}")
         return temp_file.name
 
+def app_is_running(mac_app, windows_image):
+    """
+    Check whether an application process is up
+
+    Args:
+        mac_app (str): Application name on macOS (e.g. "Mail")
+        windows_image (str): Executable image name on Windows (e.g. "OUTLOOK.EXE")
+
+    Returns:
+        bool: True if running, or if the platform offers no way to tell
+    """
+    try:
+        if os.name == 'posix':
+            result = subprocess.run(
+                ["osascript", "-e", f'application "{mac_app}" is running'],
+                capture_output=True, text=True
+            )
+            return result.stdout.strip() == "true"
+        elif os.name == 'nt':
+            result = subprocess.run(
+                ["tasklist", "/FI", f"IMAGENAME eq {windows_image}", "/NH"],
+                capture_output=True, text=True
+            )
+            return windows_image.lower() in result.stdout.lower()
+    except FileNotFoundError:
+        pass
+    # No way to check on this platform: don't hold the task up
+    return True
+
+def window_count(mac_app):
+    """
+    Count the open windows of an application (macOS only)
+
+    Returns:
+        int: The window count, or None when it cannot be determined
+    """
+    if os.name != 'posix':
+        return None
+    try:
+        result = subprocess.run(
+            ["osascript", "-e", f'tell application "System Events" to count windows of process "{mac_app}"'],
+            capture_output=True, text=True
+        )
+        return int(result.stdout.strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
 def run_task_workflow():
-    """Run a workflow based on LLM task analysis"""
+    """Run a workflow based on LLM task analysis; stops as soon as the user takes over"""
     logger.info("Starting task workflow")
     
-    # Take a screenshot to analyze the current state
-    screenshot_path = SafeAutomation.take_screenshot()
-    
-    # Analyze screenshot with vision model
-    analysis = analyze_screenshot(screenshot_path)
-    logger.info(f"Screen analysis: {analysis}")
+    with get_detector().watch() as cancelled:
+        # Capture the current state in memory and analyze it with the vision model
+        screenshot = SafeAutomation.capture_screen()
+        analysis = analyze_image(screenshot)
+        logger.info(f"Screen analysis: {analysis}")
+        if cancelled.is_set():
+            return OVERRIDE_RESULT
     
     # Based on analysis, perform appropriate task
     if "email" in analysis.lower():
@@ -103,8 +138,60 @@ def run_task_workflow():
     else:
         result = "No specific task detected"
     
-    # Clean up temporary screenshot
-    os.unlink(screenshot_path)
+    return result
+
+@dataclass
+class _ScreenAnalysis:
+    """The last buffered frame analyze_current_screen_async analyzed, and the result"""
+    ring: str
+    seq: int
+    image: object
+    result: str
+
+_last_screen_analysis = None
+
+async def analyze_current_screen_async(priority=PRIORITY_NORMAL):
+    """
+    Capture the screen and analyze it with the vision model through the model gateway
+
+    With background capture running, the latest buffered frame is analyzed
+    and the vision model only sees what changed since the previous analysis:
+    nothing when the screen is unchanged, the changed regions while they
+    cover at most SCREEN_REGION_MAX_AREA of it, the full frame otherwise.
+    """
+    global _last_screen_analysis
+    capture = get_screen_capture()
+    frame = capture.latest() if capture is not None else None
+    if frame is None:
+        screenshot = await asyncio.to_thread(SafeAutomation.capture_screen)
+        SCREEN_ANALYSES.inc(kind="full")
+        SCREEN_PIXELS_SENT.inc(screenshot.width * screenshot.height, kind="full")
+        return await analyze_image_async(screenshot, priority)
+
+    last = _last_screen_analysis
+    regions = None
+    if last is not None:
+        if last.ring == frame.ring:
+            regions = capture.changed_regions(last.seq, frame.seq)
+        if regions is None and last.image.size == frame.image.size:
+            # Further back than the ring reaches: diff against the analyzed frame itself
+            regions = await asyncio.to_thread(capture.regions_between, last.image, frame.image)
+    if regions == []:
+        SCREEN_ANALYSES.inc(kind="unchanged")
+        return last.result
+
+    screen_area = frame.image.width * frame.image.height
+    changed_area = sum((box[2] - box[0]) * (box[3] - box[1]) for box in regions or ())
+    if regions is None or changed_area > SCREEN_REGION_MAX_AREA * screen_area:
+        kind, pixels = "full", screen_area
+        result = await analyze_image_async(frame.image, priority)
+    else:
+        kind, pixels = "regions", changed_area
+        result = await analyze_regions_async(frame.image, regions, last.result, priority)
+    SCREEN_ANALYSES.inc(kind=kind)
+    SCREEN_PIXELS_SENT.inc(pixels, kind=kind)
+    if not result.startswith("Error analyzing"):
+        _last_screen_analysis = _ScreenAnalysis(frame.ring, frame.seq, frame.image, result)
     return result
 
 def handle_email_task(draft_text=None):
@@ -125,58 +212,79 @@ Best regards,
     elif os.name == 'nt':
         subprocess.run(["start", "outlook:"])
     
-    time.sleep(3)  # Wait for client to open
-    
-    # Compose new email using keyboard shortcuts
-    SafeAutomation.press_key("command+n")
-    time.sleep(1)
-    
-    # Paste the draft text
-    SafeAutomation.paste_text(draft_text)
+    with get_detector().watch() as cancelled:
+        # Wait for client to open
+        wait_until(lambda: app_is_running("Mail", "OUTLOOK.EXE"), timeout=APP_READY_TIMEOUT,
+                   name="email_app_ready", cancel_event=cancelled)
+        if cancelled.is_set():
+            return OVERRIDE_RESULT
+        
+        # Compose a new email and paste the draft in one backend invocation;
+        # the script itself waits for the compose window before pasting
+        actions = [parse_key("command+n")]
+        windows_before = window_count("Mail")
+        if windows_before is not None:
+            actions.append(WaitForWindow("Mail", windows_before, APP_READY_TIMEOUT))
+        actions.append(Paste(draft_text))
+        SafeAutomation.run_actions(actions)
     
     return "Email draft created"
 
-def handle_spreadsheet_task(data=None, headers=None):
-    """Handle spreadsheet tasks with safer alternatives"""
+def handle_spreadsheet_task(data=None, headers=None, output_format="csv"):
+    """
+    Handle spreadsheet tasks with safer alternatives
+    
+    Args:
+        data (iterable): Rows to write; a list or any iterator/generator of rows
+        headers (list): Column names
+        output_format (str): "csv", or "xlsx" for a native workbook (needs xlsxwriter)
+    
+    Raises:
+        ValueError: For an unsupported output_format
+    """
     logger.info("Handling spreadsheet task")
     
+    # Checked before the format becomes part of a file name or anything is launched
+    if output_format not in WRITERS:
+        raise ValueError(f"Unsupported spreadsheet format: {output_format!r} "
+                         f"(expected one of {', '.join(WRITERS)})")
+    
     if data is None:
         data = [["Item 1", 100], ["Item 2", 200]]
     
     if headers is None:
         headers = ["Item", "Value"]
     
-    # Open spreadsheet application
-    if os.name == 'posix':
-        subprocess.run(["open", "-a", "Numbers"])  # Use Numbers on Mac, or change to "Microsoft Excel"
-    elif os.name == 'nt':
-        subprocess.run(["start", "excel"])
-    
-    time.sleep(3)  # Wait for application to open
-    
-    # For demonstration, we'll create a CSV file and open it
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False) as f:
-        # Write headers
-        f.write(','.join(headers) + '\n')
+    with get_detector().watch() as cancelled:
+        # Open spreadsheet application
+        if os.name == 'posix':
+            subprocess.run(["open", "-a", "Numbers"])  # Use Numbers on Mac, or change to "Microsoft Excel"
+        elif os.name == 'nt':
+            subprocess.run(["start", "excel"])
         
-        # Write data rows
-        for row in data:
-            f.write(','.join(str(cell) for cell in row) + '\n')
+        # Stream the rows to a file in chunks, so memory stays flat for large inputs
+        with tempfile.NamedTemporaryFile(suffix=f'.{output_format}', delete=False) as f:
+            temp_path = f.name
+        row_count = write_spreadsheet(temp_path, data, headers, output_format=output_format)
         
-        temp_path = f.name
+        # The file was written while the application launched; wait until it is up
+        wait_until(lambda: app_is_running("Numbers", "EXCEL.EXE"), timeout=APP_READY_TIMEOUT,
+                   name="spreadsheet_app_ready", cancel_event=cancelled)
+        if cancelled.is_set():
+            return OVERRIDE_RESULT
     
-    # Open the CSV file
+    # Open the spreadsheet file
     if os.name == 'posix':
         subprocess.run(["open", temp_path])
     elif os.name == 'nt':
         subprocess.run(["start", temp_path])
     
     logger.info(f"Created and opened spreadsheet: {temp_path}")
-    return f"Spreadsheet created with {len(data)} rows of data"
+    return f"Spreadsheet created with {row_count} rows of data"
 
-def open_excel_with_data(data=None, headers=None):
+def open_excel_with_data(data=None, headers=None, output_format="csv"):
     """
     Legacy function maintained for compatibility with API calls.
     Now uses safer alternatives to PyAutoGUI.
     """
-    return handle_spreadsheet_task(data, headers)
\ No newline at end of file
+    return handle_spreadsheet_task(data, headers, output_format)
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""
+Shared test setup: the backend modules are imported from the directory above, as main.py does
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
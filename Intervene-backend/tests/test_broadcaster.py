@@ -0,0 +1,163 @@
+"""
+Tests for the broadcaster: slow and broken clients, bounded queues, replay, and events from the shared SQLite state
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+from broadcaster import DISCONNECT, Broadcaster
+from shared_state import SQLiteState
+from update_protocol import V2
+
+
+class FakeWebSocket:
+    """Records frames; a blocked socket holds every send until released, a broken one fails it"""
+
+    def __init__(self, blocked=False, broken=False):
+        self.frames = []
+        self.released = asyncio.Event()
+        if not blocked:
+            self.released.set()
+        self.broken = broken
+        self.closed_with = None
+
+    async def send_text(self, payload):
+        if self.broken:
+            raise ConnectionResetError("client went away")
+        await self.released.wait()
+        self.frames.append(json.loads(payload))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def step_event(index):
+    return {"job": "j1", "step": index, "state": "done", "message": f"Step {index + 1} done"}
+
+
+def seqs(websocket):
+    return [frame.get("seq") for frame in websocket.frames]
+
+
+def test_slow_and_broken_clients_do_not_hold_up_the_others():
+    async def run():
+        broadcaster = Broadcaster(queue_size=100)
+        slow, broken, fast = FakeWebSocket(blocked=True), FakeWebSocket(broken=True), FakeWebSocket()
+        subscribers = [broadcaster.subscribe(ws) for ws in (slow, broken, fast)]
+        for index in range(10):
+            broadcaster.publish(step_event(index))
+        await wait_for(lambda: len(fast.frames) == 10)
+
+        assert seqs(fast) == list(range(1, 11))
+        assert slow.frames == []
+        # The broken client was dropped and its socket closed; the slow one is still connected
+        await wait_for(lambda: broken.closed_with is not None)
+        assert broadcaster.subscribers == {subscribers[0], subscribers[2]}
+
+        slow.released.set()
+        await wait_for(lambda: len(slow.frames) == 10)
+        await broadcaster.close()
+
+    asyncio.run(run())
+
+
+def test_full_queue_drops_the_oldest_messages():
+    async def run():
+        broadcaster = Broadcaster(queue_size=3)
+        slow = FakeWebSocket(blocked=True)
+        subscriber = broadcaster.subscribe(slow)
+        for index in range(6):
+            broadcaster.publish(step_event(index))
+
+        assert subscriber.dropped == 3 and broadcaster.dropped_events == 3
+        slow.released.set()
+        await wait_for(lambda: len(slow.frames) == 3)
+        assert seqs(slow) == [4, 5, 6]
+        await broadcaster.close()
+
+    asyncio.run(run())
+
+
+def test_full_queue_disconnects_under_the_disconnect_policy():
+    async def run():
+        broadcaster = Broadcaster(queue_size=3, slow_policy=DISCONNECT)
+        slow, fast = FakeWebSocket(blocked=True), FakeWebSocket()
+        broadcaster.subscribe(slow)
+        broadcaster.subscribe(fast)
+        # One message in flight to the slow client plus three queued, then the fifth overflows
+        for index in range(5):
+            broadcaster.publish(step_event(index))
+            await asyncio.sleep(0)
+
+        await wait_for(lambda: slow.closed_with is not None)
+        assert slow.closed_with == 1008
+        assert broadcaster.stats()["disconnected_clients"] == 1
+        assert broadcaster.count == 1
+        await wait_for(lambda: len(fast.frames) == 5)
+        await broadcaster.close()
+
+    asyncio.run(run())
+
+
+def test_replay_sends_only_the_missed_messages():
+    async def run():
+        broadcaster = Broadcaster(replay_size=5)
+        for index in range(8):
+            broadcaster.publish(step_event(index))
+        # A job status event has no legacy message and is skipped in the replay
+        broadcaster.publish({"job": "j1", "status": "completed"})
+
+        recent = FakeWebSocket()
+        broadcaster.subscribe(recent, since=6)
+        await wait_for(lambda: len(recent.frames) == 2)
+
+        # Further back than the buffer: a gap marker, then everything still buffered
+        old = FakeWebSocket()
+        broadcaster.subscribe(old, since=1)
+        await wait_for(lambda: len(old.frames) == 5)
+        await asyncio.sleep(0.05)
+        await broadcaster.close()
+        return recent, old
+
+    recent, old = asyncio.run(run())
+    assert seqs(recent) == [7, 8]
+    assert old.frames[0] == {"replayGap": True, "oldestSeq": 5}
+    assert seqs(old)[1:] == [5, 6, 7, 8]
+
+
+def test_failed_job_through_sqlite_reaches_version_2_clients():
+    async def run():
+        with tempfile.TemporaryDirectory() as directory:
+            broadcaster = Broadcaster(coalesce_window=0)
+            state = SQLiteState(os.path.join(directory, "state.db"), poll_interval=0.05)
+            await state.start(broadcaster.publish, lambda message: None)
+            live = FakeWebSocket()
+            broadcaster.subscribe(live, version=V2)
+            try:
+                state.publish({"job": "j1", "step": 0, "state": "failed", "message": "Step 1 failed"})
+                # The step indices become JSON object keys, i.e. strings, in the event log
+                state.publish({"job": "j1", "status": "failed", "steps": {0: "failed", 1: "skipped", 10: "skipped"}})
+                await wait_for(lambda: any(f.get("jobs", {}).get("j1", {}).get("status") == "failed"
+                                           for f in live.frames))
+
+                # A client resuming from the start catches up from the merged events
+                resumed = FakeWebSocket()
+                broadcaster.subscribe(resumed, since=0, version=V2)
+                await wait_for(lambda: len(resumed.frames) >= 2)
+            finally:
+                await broadcaster.close()
+                await state.stop()
+
+        steps = [[0, "failed"], [1, "skipped"], [10, "skipped"]]
+        assert resumed.frames[1]["jobs"] == {"j1": {"status": "failed", "steps": steps}}
+        assert broadcaster.states.jobs["j1"]["steps"] == {0: ["failed"], 1: ["skipped"], 10: ["skipped"]}
+
+    asyncio.run(run())
@@ -0,0 +1,16 @@
+"""
+Importing main must not pull in the heavy modules (timing budgets stay in benchmarks/bench_cold_start.py)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_cold_start import HEAVY_MODULES, measure_import, server_env  # noqa: E402
+
+
+def test_importing_main_loads_no_heavy_modules():
+    # A fresh interpreter: this test process may already have imported some of them
+    result = measure_import(server_env())
+
+    assert result["loaded"] == [], f"importing main loaded {', '.join(result['loaded'])} (of {HEAVY_MODULES})"
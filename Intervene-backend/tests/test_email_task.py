@@ -0,0 +1,45 @@
+"""
+Tests that the email task sends its whole key/paste sequence as one batch
+"""
+import pytest
+
+import tasks
+from config import APP_READY_TIMEOUT
+from input_automation import Paste, RecordingBackend, WaitForWindow, parse_key, set_backend
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    monkeypatch.setattr(tasks.subprocess, "run", lambda *args, **kwargs: None)
+    monkeypatch.setattr(tasks, "app_is_running", lambda mac_app, windows_image: True)
+    backend = RecordingBackend(max_batches=None)
+    previous = set_backend(backend)
+    yield backend
+    set_backend(previous)
+
+
+def test_compose_and_paste_are_one_batch(recorder, monkeypatch):
+    monkeypatch.setattr(tasks, "window_count", lambda mac_app: 1)
+
+    assert tasks.handle_email_task("Hello Bob") == "Email draft created"
+    assert list(recorder.batches) == [[
+        parse_key("command+n"), WaitForWindow("Mail", 1, APP_READY_TIMEOUT), Paste("Hello Bob"),
+    ]]
+
+
+def test_without_window_counts_the_batch_has_no_wait(recorder, monkeypatch):
+    monkeypatch.setattr(tasks, "window_count", lambda mac_app: None)
+
+    tasks.handle_email_task("Hello Bob")
+    assert list(recorder.batches) == [[parse_key("command+n"), Paste("Hello Bob")]]
+
+
+def test_override_before_composing_sends_nothing(recorder, monkeypatch):
+    monkeypatch.setattr(tasks, "window_count", lambda mac_app: 1)
+    detector = tasks.get_detector()
+    detector.event.set()
+    try:
+        assert tasks.handle_email_task("Hello Bob") == tasks.OVERRIDE_RESULT
+    finally:
+        detector.event.clear()
+    assert list(recorder.batches) == []
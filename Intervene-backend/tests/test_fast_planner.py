@@ -0,0 +1,35 @@
+"""
+Tests for the rule-based planner's recognition of web targets
+"""
+import pytest
+
+from fast_planner import FastPlanner
+
+
+def browser(instruction):
+    return [{"type": "browser", "instruction": instruction}]
+
+
+@pytest.mark.parametrize("request_text, instruction", [
+    ("open https://news.ycombinator.com", "open https://news.ycombinator.com"),
+    ("open http://intranet.corp/wiki", "open http://intranet.corp/wiki"),
+    ("visit example.com/docs", "open https://example.com/docs"),
+    ("go to www.bbc.co.uk", "open https://www.bbc.co.uk"),
+    ("go to www.example.xyz", "open https://www.example.xyz"),
+    ("browse to docs.python.org", "open https://docs.python.org"),
+    ("navigate to wikipedia", "open https://en.wikipedia.org"),
+])
+def test_web_targets_are_planned(request_text, instruction):
+    assert FastPlanner().plan(request_text) == browser(instruction)
+
+
+@pytest.mark.parametrize("request_text", [
+    "open README.md",
+    "open file.txt",
+    "load config.json",
+    "open setup.py",
+    "visit notes.pdf",
+    "search for 'todo' on main.rs",
+])
+def test_file_names_are_left_to_the_llm(request_text):
+    assert FastPlanner().plan(request_text) is None
@@ -0,0 +1,47 @@
+"""
+Tests for the input backends
+"""
+import pytest
+
+from input_automation import (AppleScriptBackend, InputBackend, Key, Paste, PowerShellBackend, RecordingBackend,
+                              WaitForWindow, parse_key)
+
+
+def test_backend_base_is_abstract():
+    with pytest.raises(TypeError):
+        InputBackend()
+
+
+def test_recording_backend_keeps_only_recent_batches():
+    backend = RecordingBackend(max_batches=2)
+    for i in range(5):
+        backend.run([Paste(f"block {i}")])
+
+    assert list(backend.batches) == [[Paste("block 3")], [Paste("block 4")]]
+    assert backend.actions == [Paste("block 3"), Paste("block 4")]
+
+
+def test_recording_backend_unbounded_on_request():
+    backend = RecordingBackend(max_batches=None)
+    for _ in range(50):
+        backend.run([parse_key("command+n")])
+
+    assert len(backend.batches) == 50
+    assert backend.actions[0] == Key(("command",), "n")
+
+
+def test_applescript_waits_for_the_window_inside_the_script():
+    script = AppleScriptBackend(action_delay=0).compile(
+        [parse_key("command+n"), WaitForWindow("Mail", 2, 1.0), Paste("Hi")])
+    lines = [line.strip() for line in script.splitlines()]
+    start = lines.index("repeat 20 times")
+    assert lines[start - 1] == 'keystroke "n" using {command down}'
+    assert lines[start + 1] == 'if (count windows of process "Mail") > 2 then exit repeat'
+    assert lines[start + 3] == "end repeat"
+    assert lines[start + 4] == 'set the clipboard to "Hi"'
+
+
+def test_powershell_passes_over_window_waits():
+    backend = PowerShellBackend(action_delay=0)
+    actions = [parse_key("command+n"), Paste("Hi")]
+    assert backend.compile(actions[:1] + [WaitForWindow("Mail", 0, 5.0)] + actions[1:]) == backend.compile(actions)
@@ -0,0 +1,124 @@
+"""
+Tests for the workflow journal: durable recording and resuming interrupted runs
+"""
+import asyncio
+
+import pytest
+
+from journal import WorkflowJournal
+from scheduler import COMPLETED, INTERRUPTED, RUNNING, STEP_DONE, STEP_SKIPPED, Job, JobScheduler, PlanError
+
+
+def browser(n):
+    return {"type": "browser", "instruction": f"open https://example.com/{n}"}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.sqlite3")
+
+
+async def run_until_stopped(path):
+    """Run a 3-step job, stopping the scheduler (as on shutdown) while step 1 runs"""
+    journal = WorkflowJournal(path, flush_interval=0.01)
+    step_started = asyncio.Event()
+
+    async def run_step(job, index, step):
+        if index == 1:
+            step_started.set()
+            await asyncio.sleep(5)
+        return f"result {index}"
+
+    scheduler = JobScheduler(run_step, journal=journal)
+    await scheduler.start()
+    job = scheduler.submit([browser(n) for n in range(3)], request="open three pages")
+    await asyncio.wait_for(step_started.wait(), 1)
+    await scheduler.stop()
+    journal.close()
+    return job.id
+
+
+def test_shutdown_leaves_a_resumable_run(path):
+    job_id = asyncio.run(run_until_stopped(path))
+    journal = WorkflowJournal(path)
+    try:
+        run = journal.get_run(job_id)
+    finally:
+        journal.close()
+    assert run["status"] == INTERRUPTED
+    assert run["request"] == "open three pages"
+    assert run["planned"] and not run["streamed"]
+    assert [step["status"] for step in run["steps"]] == [STEP_DONE, STEP_SKIPPED, STEP_SKIPPED]
+    assert run["steps"][0]["result"] == "result 0"
+
+
+def test_resume_skips_completed_steps_and_keeps_their_results(path):
+    job_id = asyncio.run(run_until_stopped(path))
+
+    async def resume():
+        journal = WorkflowJournal(path, flush_interval=0.01)
+        ran = []
+
+        async def run_step(job, index, step):
+            ran.append(index)
+            return f"resumed {index}"
+
+        scheduler = JobScheduler(run_step, journal=journal)
+        await scheduler.start()
+        try:
+            job = scheduler.resume(journal.get_run(job_id))
+            while not job.is_finished:
+                await asyncio.sleep(0.005)
+            with pytest.raises(PlanError, match="already completed"):
+                scheduler.resume(journal.get_run(job_id))
+            return job, ran, journal.get_run(job_id)
+        finally:
+            await scheduler.stop()
+            journal.close()
+
+    job, ran, run = asyncio.run(resume())
+    assert job.id == job_id
+    assert ran == [1, 2]
+    assert job.results == ["result 0", "resumed 1", "resumed 2"]
+    assert run["status"] == COMPLETED
+    assert run["resumes"] == 1
+    assert [step["status"] for step in run["steps"]] == [STEP_DONE] * 3
+
+
+def test_mark_interrupted_after_a_crash(path):
+    journal = WorkflowJournal(path, flush_interval=0.01)
+
+    # What a process that died mid-run leaves behind
+    job = Job(id="crashed", steps=[browser(0)], status=RUNNING, step_status=["running"], results=[None],
+              dependencies=[[]], request="open a page")
+    journal.record_run(job)
+    assert journal.flush(1)
+    journal.close()
+
+    journal = WorkflowJournal(path)
+    try:
+        assert journal.mark_interrupted() == 1
+        assert [run["job_id"] for run in journal.list_runs(status=INTERRUPTED)] == ["crashed"]
+    finally:
+        journal.close()
+
+
+def test_pending_records_are_committed_on_close(path):
+    journal = WorkflowJournal(path, flush_interval=60.0, batch_size=10000)
+
+    async def run():
+        scheduler = JobScheduler(lambda job, index, step: asyncio.sleep(0), journal=journal)
+        await scheduler.start()
+        job = scheduler.submit([browser(0)])
+        while not job.is_finished:
+            await asyncio.sleep(0.005)
+        await scheduler.stop()
+        return job.id
+
+    job_id = asyncio.run(run())
+    journal.close()
+    journal = WorkflowJournal(path)
+    try:
+        assert journal.get_run(job_id)["status"] == COMPLETED
+    finally:
+        journal.close()
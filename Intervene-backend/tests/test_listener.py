@@ -0,0 +1,138 @@
+"""
+Tests for the override detector driven with synthetic input events, and the abort of running jobs
+"""
+import asyncio
+import threading
+
+import pytest
+
+import listener
+from listener import OverrideDetector
+from scheduler import CANCELLED, JobScheduler
+
+
+class Clock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(listener.time, "perf_counter", clock)
+    return clock
+
+
+def test_mouse_jitter_below_min_move_is_ignored(clock):
+    detector = OverrideDetector(min_move=5)
+    detector.on_mouse_move(100, 100)
+    detector.on_mouse_move(102, 101)
+    detector.on_mouse_move(98, 99)
+    assert not detector.override
+
+    detector.on_mouse_move(103, 102)
+    assert detector.override
+    assert detector.stats()["events"] == 4 and detector.stats()["triggers"] == 1
+
+
+def test_key_press_triggers_and_later_events_are_only_counted(clock):
+    detector = OverrideDetector()
+    triggers = []
+    detector.add_observer(triggers.append)
+    detector.on_key_press("a")
+    detector.on_key_press("b")
+    detector.on_mouse_move(0, 0)
+    detector.on_mouse_move(500, 500)
+
+    assert triggers == [100.0]
+    assert detector.stats()["triggers"] == 1 and detector.stats()["events"] == 4
+
+
+def test_input_within_the_debounce_window_is_coalesced(clock):
+    detector = OverrideDetector(debounce=0.25)
+    detector.on_key_press("a")
+    detector.reset()
+
+    clock.now += 0.1
+    detector.on_key_press("a")
+    assert not detector.override
+
+    clock.now += 0.2
+    detector.on_key_press("a")
+    assert detector.override
+    assert detector.stats()["triggers"] == 2
+
+
+def test_own_input_is_ignored_during_and_just_after_automation(clock):
+    detector = OverrideDetector(debounce=0, self_input_grace=0.1)
+    with detector.ignoring_input():
+        detector.on_key_press("v")
+        detector.on_mouse_move(0, 0)
+        detector.on_mouse_move(400, 300)
+    assert not detector.override
+
+    # Synthetic events arriving just after the call returned
+    clock.now += 0.05
+    detector.on_key_press("v")
+    assert not detector.override
+
+    clock.now += 0.1
+    detector.on_key_press("x")
+    assert detector.override
+
+
+def test_watch_tokens_stay_set_after_reset(clock):
+    detector = OverrideDetector()
+    with detector.watch() as token:
+        assert not token.is_set()
+        detector.on_key_press("a")
+        detector.reset()
+        assert token.is_set() and not detector.override
+    with detector.watch() as later:
+        assert not later.is_set()
+
+
+def test_override_from_the_listener_thread_cancels_running_jobs(monkeypatch):
+    import main
+
+    detector = OverrideDetector(debounce=0)
+    monkeypatch.setattr(detector, "start_listeners", lambda: [])
+    monkeypatch.setattr(listener, "_detector", detector)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def run_step(job, index, step):
+            started.set()
+            await asyncio.sleep(30)
+
+        scheduler = JobScheduler(run_step)
+        monkeypatch.setattr(main, "scheduler", scheduler)
+        await scheduler.start()
+        stop = main.start_override_detection()
+        try:
+            job = scheduler.submit([{"type": "browser", "instruction": "open https://example.com"}])
+            await asyncio.wait_for(started.wait(), 5)
+
+            # pynput calls the detector on its own thread
+            user = threading.Thread(target=detector.on_key_press, args=("a",))
+            user.start()
+            user.join()
+            for _ in range(500):
+                if job.is_finished and not detector.override:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            stop()
+            await scheduler.stop()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == CANCELLED
+    stats = detector.stats()
+    assert stats["aborts"] == 1 and stats["abort_max_ms"] < 5000
+    # Re-armed for the next workflow
+    assert not detector.override
@@ -0,0 +1,176 @@
+"""
+Tests for plan validation, the bounded repair round trip, the streamed step limit and the prompt prefix
+"""
+import asyncio
+import json
+
+import pytest
+
+import llm_task_analyzer
+from config import PLAN_MAX_STEPS
+from model_gateway import ModelGateway
+from plan_schema import PlanValidationError, validate_plan, validate_step
+
+BROWSER = {"type": "browser", "instruction": "open https://www.google.com and search for 'LangChain'"}
+EXCEL = {"type": "excel", "instruction": "write the results", "headers": ["Name"], "data": [["LangChain"]]}
+
+
+class FakePlanner:
+    """Stands in for the planning ModelClient, answering with canned outputs in order"""
+
+    model = "fake-planner"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.prompts = []
+        self.chunks_sent = 0
+
+    async def generate(self, prompt, timeout=None, **options):
+        self.prompts.append(prompt)
+        return {"response": self.responses.pop(0), "done": True, "eval_count": 10}
+
+    async def generate_stream(self, prompt, timeout=None, **options):
+        self.prompts.append(prompt)
+        text = self.responses.pop(0)
+        for start in range(0, len(text), 8):
+            self.chunks_sent += 1
+            yield {"response": text[start:start + 8], "done": False}
+        yield {"response": "", "done": True, "eval_count": 10}
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    def install(*responses):
+        fake = FakePlanner(*responses)
+        monkeypatch.setattr(llm_task_analyzer, "get_model", lambda role: fake)
+        return fake
+
+    monkeypatch.setattr(llm_task_analyzer, "fast_plan", lambda request: None)
+    monkeypatch.setattr(llm_task_analyzer, "get_plan_cache", lambda: None)
+    gateway = ModelGateway()
+    monkeypatch.setattr(llm_task_analyzer, "get_gateway", lambda: gateway)
+    monkeypatch.setattr(llm_task_analyzer, "PLAN_REPAIR_ATTEMPTS", 1)
+    return install
+
+
+def plan(request="research LangChain"):
+    return asyncio.run(llm_task_analyzer.analyze_request_with_llm_async(request))
+
+
+def stream(request="research LangChain"):
+    async def collect():
+        return [step async for step in llm_task_analyzer.stream_steps_with_llm(request)]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("steps, problem", [
+    ([{"type": "fax", "instruction": "send it"}], "step 1"),
+    ([BROWSER, {"type": "excel", "instruction": "write", "data": [["x"]]}], "step 2 (excel) headers: Field required"),
+    ([{"type": "browser"}], "step 1 (browser) instruction: Field required"),
+    ([{"instruction": "no type"}], "step 1"),
+    ([], "plan"),
+])
+def test_schema_rejects_bad_steps(steps, problem):
+    with pytest.raises(PlanValidationError) as error:
+        validate_plan(steps)
+    assert any(message.startswith(problem) for message in error.value.errors), error.value.errors
+
+
+def test_schema_drops_unknown_fields_and_rejects_too_long_plans():
+    assert validate_step({**BROWSER, "note": "extra"}) == BROWSER
+    with pytest.raises(PlanValidationError):
+        validate_plan([BROWSER] * (PLAN_MAX_STEPS + 1))
+
+
+def test_check_plan_repairs_locally_and_reports_problems():
+    steps, problems, repaired = llm_task_analyzer.check_plan(
+        "Here you go: [{'type': 'browser', 'instruction': 'open https://example.com',},]")
+    assert steps == [{"type": "browser", "instruction": "open https://example.com"}]
+    assert problems == [] and repaired
+
+    steps, problems, repaired = llm_task_analyzer.check_plan("I cannot help with that")
+    assert steps is None and problems[0].startswith("output is not a JSON array of steps")
+
+    steps, problems, _ = llm_task_analyzer.check_plan(json.dumps({"steps": [{"type": "fax"}]}))
+    assert steps is None and problems
+
+
+def test_invalid_output_gets_one_repair_round_trip(planner):
+    fake = planner("Sure! The plan is to open a browser.", json.dumps([BROWSER, EXCEL]))
+    before = llm_task_analyzer.planning_stats.stats()
+
+    assert plan() == [BROWSER, EXCEL]
+    assert len(fake.prompts) == 2
+    # The repair quotes the bad output and its problems back to the model
+    assert "Sure! The plan is to open a browser." in fake.prompts[1]
+    assert "output is not a JSON array of steps" in fake.prompts[1]
+    after = llm_task_analyzer.planning_stats.stats()
+    assert after["outcomes"]["repaired_by_model"] == before["outcomes"]["repaired_by_model"] + 1
+
+
+def test_failed_repair_raises_plan_generation_error(planner):
+    fake = planner("not a plan", json.dumps([{"type": "fax", "instruction": "send it"}]), json.dumps([BROWSER]))
+
+    with pytest.raises(llm_task_analyzer.PlanGenerationError, match="Could not produce a valid plan"):
+        plan()
+    # One repair only; the third response is never asked for
+    assert len(fake.prompts) == 2
+
+
+def test_stream_falls_back_to_repair_when_no_step_is_valid(planner):
+    fake = planner("no steps here", json.dumps([EXCEL]))
+    assert stream() == [EXCEL]
+    assert len(fake.prompts) == 2
+
+    planner("no steps here", "still no steps")
+    with pytest.raises(llm_task_analyzer.PlanGenerationError):
+        stream()
+
+
+def test_stream_stops_at_the_step_limit(planner, monkeypatch):
+    monkeypatch.setattr(llm_task_analyzer, "PLAN_MAX_STEPS", 3)
+    fake = planner(json.dumps([dict(BROWSER, id=index) for index in range(10)]))
+
+    steps = stream()
+    assert [step["id"] for step in steps] == [0, 1, 2]
+    # The generation was abandoned well before the end of the output
+    total_chunks = -(-len(json.dumps([dict(BROWSER, id=index) for index in range(10)])) // 8)
+    assert fake.chunks_sent < total_chunks
+
+
+def test_stream_within_the_limit_yields_every_step(planner):
+    planner(json.dumps([BROWSER, EXCEL]))
+    assert stream() == [BROWSER, EXCEL]
+
+
+def test_planner_prefix_is_byte_stable_across_requests(monkeypatch):
+    monkeypatch.setattr(llm_task_analyzer, "PLAN_PREFIX_REUSE", True)
+    calls = [llm_task_analyzer.planning_call(llm_task_analyzer.PLAN_PROMPT.format(request=request))
+             for request in ("research LangChain", "email Bob the report")]
+    calls.append(llm_task_analyzer.planning_call(
+        llm_task_analyzer.repair_prompt("email Bob", "oops", ["plan: bad"]), repair=True))
+    systems = {options["system"].encode("utf-8") for _, options in calls}
+    assert systems == {llm_task_analyzer.PLANNER_SYSTEM.encode("utf-8")}
+    # Nothing request-specific leaks into the shared prefix
+    assert all(llm_task_analyzer.PLANNER_SYSTEM not in prompt for prompt, _ in calls)
+
+    monkeypatch.setattr(llm_task_analyzer, "PLAN_PREFIX_REUSE", False)
+    prompts = [llm_task_analyzer.planning_call(llm_task_analyzer.PLAN_PROMPT.format(request=request))[0]
+               for request in ("research LangChain", "email Bob the report")]
+    prefix = llm_task_analyzer.PLANNER_SYSTEM.encode("utf-8")
+    assert all(prompt.encode("utf-8").startswith(prefix) for prompt in prompts)
+
+
+def test_prompt_version_follows_the_prompt_text():
+    version = llm_task_analyzer.prompt_version
+    system, prompt, schema = llm_task_analyzer.PLANNER_SYSTEM, llm_task_analyzer.PLAN_PROMPT, llm_task_analyzer.PLAN_SCHEMA
+
+    assert version(system, prompt, schema) == llm_task_analyzer.PROMPT_VERSION
+    assert version(system, prompt, dict(reversed(list(schema.items())))) == llm_task_analyzer.PROMPT_VERSION
+    changed = {
+        version(system.replace("STRICT RULES", "STRICT  RULES"), prompt, schema),
+        version(system, prompt + " ", schema),
+        version(system, prompt, {**schema, "maxItems": 3}),
+    }
+    assert llm_task_analyzer.PROMPT_VERSION not in changed and len(changed) == 3
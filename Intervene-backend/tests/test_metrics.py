@@ -0,0 +1,84 @@
+"""
+Tests for the Prometheus text exposition of counters, histograms and collectors
+"""
+import re
+
+import pytest
+
+from metrics import Counter, Histogram, MetricsRegistry, _Metric
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? \S+$')
+
+
+def assert_valid_exposition(text):
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+$", line), line
+        else:
+            assert SAMPLE.match(line), line
+
+
+def test_counter_lines_and_label_escaping():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter("test_requests_total", "Requests handled", ["path"]))
+    requests.inc(path="/plan")
+    requests.inc(2, path="/plan")
+    requests.inc(path='C:\\temp "quoted"\nnext')
+
+    text = registry.render()
+    assert_valid_exposition(text)
+    lines = text.splitlines()
+    assert lines[:2] == ["# HELP test_requests_total Requests handled", "# TYPE test_requests_total counter"]
+    assert 'test_requests_total{path="/plan"} 3' in lines
+    assert 'test_requests_total{path="C:\\\\temp \\"quoted\\"\\nnext"} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative_and_end_with_inf():
+    registry = MetricsRegistry()
+    latency = registry.register(Histogram("test_latency_seconds", "Latency", ["stage"], buckets=(1.0, 0.1)))
+    for value in (0.05, 0.1, 0.5, 1.0, 5.0):
+        latency.observe(value, stage="plan")
+
+    text = registry.render()
+    assert_valid_exposition(text)
+    lines = text.splitlines()
+    assert "# TYPE test_latency_seconds histogram" in lines
+    assert [line for line in lines if "_bucket" in line] == [
+        'test_latency_seconds_bucket{stage="plan",le="0.1"} 2',
+        'test_latency_seconds_bucket{stage="plan",le="1"} 4',
+        'test_latency_seconds_bucket{stage="plan",le="+Inf"} 5',
+    ]
+    assert 'test_latency_seconds_sum{stage="plan"} 6.65' in lines
+    assert 'test_latency_seconds_count{stage="plan"} 5' in lines
+
+
+def test_unlabelled_histogram_and_timer():
+    registry = MetricsRegistry()
+    lag = registry.register(Histogram("test_lag_seconds", "Lag", buckets=(0.5,)))
+    with lag.time():
+        pass
+    lines = registry.render().splitlines()
+    assert 'test_lag_seconds_bucket{le="0.5"} 1' in lines
+    assert "test_lag_seconds_count 1" in lines
+
+
+def test_collectors_are_rendered_and_failures_skipped():
+    registry = MetricsRegistry()
+
+    def broken():
+        raise RuntimeError("scheduler gone")
+
+    registry.add_collector(broken)
+    registry.add_collector(lambda: [("test_queue_depth", "gauge", "Jobs waiting",
+                                     [({}, 3), ({"worker": "b"}, None), ({"worker": "a"}, 0.5)])])
+
+    text = registry.render()
+    assert_valid_exposition(text)
+    assert text.splitlines() == ["# HELP test_queue_depth Jobs waiting", "# TYPE test_queue_depth gauge",
+                                 "test_queue_depth 3", 'test_queue_depth{worker="a"} 0.5']
+
+
+def test_metric_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("test_untyped", "No samples")
@@ -0,0 +1,193 @@
+"""
+Tests for model admission control: priorities, load shedding and call coalescing
+"""
+import asyncio
+
+import pytest
+
+from model_gateway import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, GatewayBusyError,
+                           ModelGate, ModelGateway)
+
+
+def test_gate_sheds_waiters_beyond_the_queue():
+    async def run():
+        gate = ModelGate("m", max_concurrent=1, max_queue=1)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.is_full()
+        with pytest.raises(GatewayBusyError):
+            await gate.acquire()
+        gate.release()
+        await waiter
+        gate.release()
+        return gate
+
+    gate = asyncio.run(run())
+    assert gate.stats() == {"active": 0, "queued": 0, "max_concurrent": 1, "max_queue": 1,
+                            "admitted": 2, "shed": 1, "promoted": 0}
+
+
+def test_gate_admits_by_priority_then_arrival():
+    async def run():
+        gate = ModelGate("m", max_concurrent=1, max_queue=10)
+        await gate.acquire()
+        order = []
+
+        async def wait(name, priority):
+            await gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        tasks = [asyncio.create_task(wait(name, priority)) for name, priority in
+                 [("background", PRIORITY_BACKGROUND), ("normal 1", PRIORITY_NORMAL),
+                  ("interactive", PRIORITY_INTERACTIVE), ("normal 2", PRIORITY_NORMAL)]]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "normal 1", "normal 2", "background"]
+
+
+def test_cancelled_waiter_frees_its_queue_place():
+    async def run():
+        gate = ModelGate("m", max_concurrent=1, max_queue=1)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert gate.queued == 0
+        second = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        gate.release()
+        await second
+        gate.release()
+        return gate
+
+    assert asyncio.run(run()).active == 0
+
+
+def test_identical_calls_share_one_generation():
+    async def run():
+        gateway = ModelGateway(max_concurrent=1, max_queue=4)
+        started = 0
+
+        async def generate():
+            nonlocal started
+            started += 1
+            await asyncio.sleep(0.01)
+            return {"plan": []}
+
+        results = await asyncio.gather(*(gateway.call("m", "same", generate) for _ in range(3)),
+                                       gateway.call("m", "other", generate))
+        return gateway, started, results
+
+    gateway, started, results = asyncio.run(run())
+    assert started == 2
+    assert results[0] is results[1] is results[2]
+    assert gateway.stats()["coalesced"] == 2
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_shared_call_is_cancelled_when_every_caller_leaves():
+    async def run():
+        gateway = ModelGateway(max_concurrent=1, max_queue=4)
+        cancelled = asyncio.Event()
+
+        async def generate():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(gateway.call("m", "k", generate)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return gateway
+
+    gateway = asyncio.run(run())
+    assert gateway.gate("m").active == 0
+    assert gateway.stats()["in_flight"] == 0
+
+
+def test_gateway_sheds_when_the_model_queue_is_full():
+    async def run():
+        gateway = ModelGateway(max_concurrent=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def generate():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(gateway.call("m", 1, generate))
+        second = asyncio.create_task(gateway.call("m", 2, generate))
+        await asyncio.sleep(0.01)
+        with pytest.raises(GatewayBusyError):
+            await gateway.call("m", 3, generate)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == ["done", "done"]
+
+
+def test_shared_call_takes_the_best_priority_of_its_callers():
+    async def run():
+        gateway = ModelGateway(max_concurrent=1, max_queue=10)
+        release = asyncio.Event()
+        order = []
+
+        async def generate(name):
+            order.append(name)
+            await release.wait()
+            return name
+
+        busy = asyncio.create_task(gateway.call("m", "busy", lambda: generate("busy")))
+        await asyncio.sleep(0)
+        normal = asyncio.create_task(gateway.call("m", "normal", lambda: generate("normal")))
+        shared = asyncio.create_task(
+            gateway.call("m", "shared", lambda: generate("shared"), PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        # Joining the background call as an interactive caller moves it ahead of "normal"
+        joined = asyncio.create_task(
+            gateway.call("m", "shared", lambda: generate("unused"), PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(busy, normal, shared, joined)
+        return gateway, order
+
+    gateway, order = asyncio.run(run())
+    assert order == ["busy", "shared", "normal"]
+    assert gateway.gate("m").stats()["promoted"] == 1
+
+
+def test_run_sync_uses_the_gateway_loop_from_blocking_code():
+    gateway = ModelGateway(max_concurrent=1, max_queue=1)
+
+    async def generate():
+        return asyncio.get_running_loop()
+
+    loop = gateway.run_sync(gateway.call("m", "k", generate))
+    assert loop is gateway._loop
+    assert gateway.run_sync(gateway.call("m", "k", generate)) is loop
+
+
+def test_run_sync_refuses_to_block_the_gateway_loop():
+    async def run():
+        gateway = ModelGateway()
+        async with gateway.slot("m"):
+            pass
+
+        async def noop():
+            return None
+
+        with pytest.raises(RuntimeError, match="block"):
+            gateway.run_sync(noop())
+
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+"""
+Tests for model warm-up and keep-alive, with a fake endpoint pool
+"""
+import asyncio
+import logging
+
+from model_registry import LLM, VISION, ModelClient, ModelRegistry
+from ollama_client import OllamaError
+
+
+class FakePool:
+    """Stands in for EndpointPool.load; fails for the models in errors"""
+
+    def __init__(self, errors=None):
+        self.loads = []
+        self.errors = errors or {}
+
+    async def load(self, model, keep_alive, timeout=None):
+        self.loads.append((model, keep_alive))
+        if model in self.errors:
+            raise self.errors[model]
+        return 0.25
+
+
+def registry(pool, llm="llama3", vision="llava"):
+    return ModelRegistry({
+        LLM: ModelClient(LLM, llm, pool, "30m"),
+        VISION: ModelClient(VISION, vision, pool, "30m"),
+    })
+
+
+def test_warmup_loads_each_model_once():
+    pool = FakePool()
+    models = registry(pool)
+    asyncio.run(models.warmup())
+
+    assert sorted(pool.loads) == [("llama3", "30m"), ("llava", "30m")]
+    assert models.stats()[LLM]["warmup_seconds"] == 0.25
+    assert models.stats()[VISION]["warmup_seconds"] == 0.25
+
+
+def test_roles_sharing_a_model_warm_it_up_once():
+    pool = FakePool()
+    models = registry(pool, llm="llava", vision="llava")
+    asyncio.run(models.warmup())
+
+    assert pool.loads == [("llava", "30m")]
+    assert models.warmup_seconds == {LLM: 0.25, VISION: 0.25}
+
+
+def test_failed_or_missing_model_does_not_stop_the_others(caplog):
+    pool = FakePool(errors={
+        "llava": OllamaError("model 'llava' not found", 404),
+        "llama3": OllamaError("connection refused"),
+    })
+    models = registry(pool)
+    healthy = FakePool()
+    models.models["extra"] = ModelClient("extra", "phi3", healthy, "30m")
+
+    with caplog.at_level(logging.WARNING, logger="model_registry"):
+        asyncio.run(models.warmup())
+
+    assert models.warmup_seconds == {"extra": 0.25}
+    assert models.stats()[VISION]["warmup_seconds"] is None
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("ollama pull llava" in message for message in messages)
+    assert any("Warm-up of llama3 failed" in message for message in messages)
+
+
+def test_keepalive_touches_the_models_every_interval():
+    pool = FakePool()
+    models = registry(pool)
+
+    async def run():
+        models.start_keepalive(0.05)
+        models.start_keepalive(0.05)  # a second start is ignored
+        await asyncio.sleep(0.02)
+        before_first_interval = len(pool.loads)
+        await asyncio.sleep(0.15)
+        await models.stop()
+        stopped_at = len(pool.loads)
+        await asyncio.sleep(0.1)
+        return before_first_interval, stopped_at
+
+    before_first_interval, stopped_at = asyncio.run(run())
+    assert before_first_interval == 0
+    # About three rounds of two models in 0.17s
+    assert 4 <= stopped_at <= 8
+    assert len(pool.loads) == stopped_at
+
+
+def test_keepalive_disabled_with_a_zero_interval():
+    models = registry(FakePool())
+
+    async def run():
+        models.start_keepalive(0)
+        return models._keepalive_task
+
+    assert asyncio.run(run()) is None
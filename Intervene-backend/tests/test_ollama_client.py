@@ -0,0 +1,59 @@
+"""
+Tests for the Ollama client's streaming deadline, against an in-process fake server
+"""
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from ollama_client import OllamaClient, OllamaTimeout
+
+
+class StallingStream(httpx.AsyncByteStream):
+    """Sends the given chunks, then goes quiet without closing the response"""
+
+    def __init__(self, chunks, stall=60.0):
+        self.chunks = chunks
+        self.stall = stall
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield (json.dumps(chunk) + "\n").encode()
+        await asyncio.sleep(self.stall)
+
+
+def client_for(stream):
+    client = OllamaClient("http://ollama.test", timeout=30.0)
+    # Read timeouts far beyond the deadline, so only the overall deadline can end the call
+    client._client = httpx.AsyncClient(base_url=client.base_url, timeout=60.0,
+                                       transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=stream)))
+    return client
+
+
+def test_stream_is_cut_off_at_the_deadline_when_it_stalls_midway():
+    async def run():
+        client = client_for(StallingStream([{"response": "[", "done": False}]))
+        chunks = []
+        started = time.perf_counter()
+        with pytest.raises(OllamaTimeout):
+            async for chunk in client.generate_stream("planner", "plan", timeout=0.2):
+                chunks.append(chunk)
+        elapsed = time.perf_counter() - started
+        await client.aclose()
+        return chunks, elapsed
+
+    chunks, elapsed = asyncio.run(run())
+    assert chunks == [{"response": "[", "done": False}]
+    assert elapsed < 2.0
+
+
+def test_stream_within_the_deadline_ends_at_done():
+    async def run():
+        client = client_for(StallingStream([{"response": "a", "done": False}, {"response": "b", "done": True}]))
+        chunks = [chunk async for chunk in client.generate_stream("planner", "plan", timeout=5.0)]
+        await client.aclose()
+        return chunks
+
+    assert [chunk["response"] for chunk in asyncio.run(run())] == ["a", "b"]
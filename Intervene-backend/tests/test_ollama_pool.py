@@ -0,0 +1,129 @@
+"""
+Tests for endpoint circuit breakers and least-loaded routing with failover
+"""
+import asyncio
+
+import pytest
+
+from ollama_client import OllamaError, OllamaTimeout
+from ollama_pool import CLOSED, HALF_OPEN, OPEN, Endpoint, EndpointPool
+
+
+class FakeClient:
+    """Stands in for OllamaClient; fails while ``errors`` holds exceptions to raise"""
+
+    def __init__(self, url, errors=()):
+        self.base_url = url
+        self.timeout = 1.0
+        self.errors = list(errors)
+        self.calls = 0
+
+    def _answer(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"response": self.base_url}
+
+    async def generate(self, model, prompt, **kwargs):
+        await asyncio.sleep(0)
+        return self._answer()
+
+
+def endpoint(url="http://a", errors=(), **kwargs):
+    return Endpoint(FakeClient(url, errors), **{"failure_threshold": 2, "window": 4, "cooldown": 10.0, **kwargs})
+
+
+def test_circuit_opens_after_threshold_failures_in_the_window():
+    e = endpoint()
+    e.failed(OllamaError("down"))
+    assert e.state == CLOSED
+    e.succeeded(0.1)
+    e.failed(OllamaError("down"))
+    assert e.state == OPEN
+    assert not e.available(e.opened_at + 1.0)
+
+
+def test_failures_outside_the_window_do_not_count():
+    e = endpoint()
+    e.failed(OllamaError("down"))
+    for _ in range(4):
+        e.succeeded(0.1)
+    e.failed(OllamaError("down"))
+    assert e.state == CLOSED
+
+
+def test_half_open_allows_one_trial_call():
+    e = endpoint()
+    e.failed(OllamaError("down"))
+    e.failed(OllamaError("down"))
+    later = e.opened_at + 10.0
+    assert e.available(later)
+    assert e.state == HALF_OPEN
+    e.outstanding = 1
+    assert not e.available(later)
+
+
+def test_trial_success_closes_and_failure_reopens():
+    e = endpoint()
+    e.failed(OllamaError("down"))
+    e.failed(OllamaError("down"))
+    e.available(e.opened_at + 10.0)
+    e.succeeded(0.1)
+    assert e.state == CLOSED
+
+    e.failed(OllamaError("down"))
+    assert e.state == OPEN, "earlier failures are still in the window"
+    e.available(e.opened_at + 10.0)
+    e.failed(OllamaError("still down"))
+    assert e.state == OPEN
+
+
+def test_unhealthy_endpoint_is_skipped_unless_health_is_ignored():
+    e = endpoint()
+    e.healthy = False
+    assert not e.available(0.0)
+    assert e.available(0.0, ignore_health=True)
+
+
+def test_pool_fails_over_on_node_errors():
+    bad = endpoint("http://bad", errors=[OllamaError("refused"), OllamaError("refused")])
+    good = endpoint("http://good")
+    pool = EndpointPool([bad, good])
+    assert asyncio.run(pool.generate("m", "p"))["response"] == "http://good"
+    assert bad.errors == 1 and bad.failovers == 1
+    assert good.completed == 1
+    assert bad.outstanding == good.outstanding == 0
+
+
+def test_pool_does_not_fail_over_on_timeouts_or_bad_requests():
+    for error in (OllamaTimeout("late"), OllamaError("bad request", status=400)):
+        first = endpoint("http://first", errors=[error])
+        second = endpoint("http://second")
+        pool = EndpointPool([first, second])
+        with pytest.raises(OllamaError):
+            asyncio.run(pool.generate("m", "p"))
+        assert second.client.calls == 0
+    # A bad request says nothing about the endpoint
+    assert first.errors == 0
+
+
+def test_pool_routes_to_the_least_loaded_endpoint():
+    a, b = endpoint("http://a"), endpoint("http://b")
+    pool = EndpointPool([a, b])
+    a.outstanding = 2
+    assert asyncio.run(pool.generate("m", "p"))["response"] == "http://b"
+
+
+def test_pool_surfaces_the_last_error_when_every_endpoint_failed():
+    a = endpoint("http://a", errors=[OllamaError("a down")])
+    b = endpoint("http://b", errors=[OllamaError("b down")])
+    with pytest.raises(OllamaError, match="b down"):
+        asyncio.run(EndpointPool([a, b]).generate("m", "p"))
+
+
+def test_open_circuits_leave_no_endpoint():
+    a = endpoint("http://a")
+    a.failed(OllamaError("down"))
+    a.failed(OllamaError("down"))
+    with pytest.raises(OllamaError, match="No available Ollama endpoint"):
+        asyncio.run(EndpointPool([a]).generate("m", "p"))
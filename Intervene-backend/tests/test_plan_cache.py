@@ -0,0 +1,148 @@
+"""
+Tests for the two-tier plan cache: hits per tier, expiry, eviction order and invalidation
+"""
+import asyncio
+
+import pytest
+
+import plan_cache
+from plan_cache import PlanCache
+
+MODEL = "llama3"
+VERSION = "v1"
+PLAN = [{"type": "browser", "instruction": "open https://github.com"}]
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(plan_cache.time, "time", clock)
+    return clock
+
+
+def open_cache(tmp_path, **kwargs):
+    return PlanCache(str(tmp_path / "plans.db"), **kwargs)
+
+
+def plan_for(name):
+    return [{"type": "browser", "instruction": f"open {name}"}]
+
+
+def test_memory_hit_then_disk_hit_after_restart(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    cache.put("Open GitHub", MODEL, VERSION, PLAN)
+    assert cache.get("  open   github ", MODEL, VERSION) == PLAN
+    assert cache.stats()["hits_memory"] == 1
+    cache.close()
+
+    reopened = open_cache(tmp_path)
+    assert reopened.get("open github", MODEL, VERSION) == PLAN
+    assert reopened.get("open github", MODEL, VERSION) == PLAN
+    stats = reopened.stats()
+    assert (stats["hits_disk"], stats["hits_memory"], stats["misses"]) == (1, 1, 0)
+    # Other model or prompt version: different key
+    assert reopened.get("open github", "mistral", VERSION) is None
+    assert reopened.get("open github", MODEL, "v2") is None
+    reopened.close()
+
+
+def test_entries_expire_in_both_tiers(tmp_path, clock):
+    cache = open_cache(tmp_path, ttl=60)
+    cache.put("open github", MODEL, VERSION, PLAN)
+    clock.now += 61
+    assert cache.get("open github", MODEL, VERSION) is None
+    assert cache.stats()["disk_entries"] == 0
+    cache.close()
+
+    cache = open_cache(tmp_path, ttl=60)
+    cache.put("open github", MODEL, VERSION, PLAN)
+    cache.close()
+    reopened = open_cache(tmp_path, ttl=60)
+    clock.now += 61
+    assert reopened.get("open github", MODEL, VERSION) is None
+    assert reopened.stats()["disk_entries"] == 0
+    reopened.close()
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path, clock):
+    cache = PlanCache(None, max_memory_entries=2)
+    cache.put("a", MODEL, VERSION, plan_for("a"))
+    cache.put("b", MODEL, VERSION, plan_for("b"))
+    assert cache.get("a", MODEL, VERSION) == plan_for("a")
+    cache.put("c", MODEL, VERSION, plan_for("c"))
+
+    assert cache.get("b", MODEL, VERSION) is None
+    assert cache.get("a", MODEL, VERSION) == plan_for("a")
+    assert cache.get("c", MODEL, VERSION) == plan_for("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_evicts_by_access_time_including_disk_hits(tmp_path, clock):
+    cache = open_cache(tmp_path, max_disk_entries=2)
+    cache.put("a", MODEL, VERSION, plan_for("a"))
+    clock.now += 1
+    cache.put("b", MODEL, VERSION, plan_for("b"))
+    cache.close()
+
+    # A disk hit on the older entry makes "b" the least recently used one
+    cache = open_cache(tmp_path, max_disk_entries=2)
+    clock.now += 1
+    assert cache.get("a", MODEL, VERSION) == plan_for("a")
+    clock.now += 1
+    cache.put("c", MODEL, VERSION, plan_for("c"))
+    cache.close()
+
+    reopened = open_cache(tmp_path)
+    assert reopened.get("b", MODEL, VERSION) is None
+    assert reopened.get("a", MODEL, VERSION) == plan_for("a")
+    assert reopened.get("c", MODEL, VERSION) == plan_for("c")
+    reopened.close()
+
+
+def test_invalidate_one_entry_or_everything(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    for name in ("a", "b", "c"):
+        cache.put(name, MODEL, VERSION, plan_for(name))
+
+    assert cache.invalidate("b", MODEL, VERSION) == 1
+    assert cache.get("b", MODEL, VERSION) is None
+    assert cache.get("a", MODEL, VERSION) == plan_for("a")
+
+    assert cache.invalidate() == 2
+    assert cache.get("a", MODEL, VERSION) is None
+    assert cache.stats()["memory_entries"] == 0 and cache.stats()["disk_entries"] == 0
+    cache.close()
+
+
+def test_get_returns_a_copy(tmp_path, clock):
+    cache = open_cache(tmp_path)
+    plan = plan_for("a")
+    cache.put("a", MODEL, VERSION, plan)
+    plan[0]["instruction"] = "changed by the caller"
+
+    first = cache.get("a", MODEL, VERSION)
+    first[0]["instruction"] = "changed by the executor"
+    assert cache.get("a", MODEL, VERSION) == plan_for("a")
+    cache.close()
+
+
+def test_async_methods_use_both_tiers(tmp_path, clock):
+    async def run():
+        cache = open_cache(tmp_path)
+        await cache.put_async("a", MODEL, VERSION, plan_for("a"))
+        cache.close()
+        reopened = open_cache(tmp_path)
+        plan = await reopened.get_async("a", MODEL, VERSION)
+        missing = await reopened.get_async("b", MODEL, VERSION)
+        reopened.close()
+        return plan, missing
+
+    assert asyncio.run(run()) == (plan_for("a"), None)
@@ -0,0 +1,235 @@
+"""
+Tests for step dependency resolution and the job scheduler
+"""
+import asyncio
+
+import pytest
+
+from scheduler import (CANCELLED, COMPLETED, FAILED, STEP_DONE, STEP_FAILED, STEP_PENDING, STEP_SKIPPED,
+                       JobScheduler, PlanError, QueueFullError, resolve_dependencies)
+
+
+def browser(n, **extra):
+    return {"type": "browser", "instruction": f"open https://example.com/{n}", **extra}
+
+
+async def wait_finished(job, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not job.is_finished:
+        assert asyncio.get_running_loop().time() < deadline, f"job still {job.status}"
+        await asyncio.sleep(0.005)
+
+
+def test_plans_without_depends_on_run_in_order():
+    assert resolve_dependencies([browser(0), browser(1), browser(2)]) == [[], [0], [1]]
+
+
+def test_dependencies_by_id_and_by_index():
+    steps = [browser(0, id="a"), browser(1, depends_on=[]), browser(2, depends_on=["a", 1])]
+    assert resolve_dependencies(steps) == [[], [], [0, 1]]
+
+
+def test_single_dependency_may_be_a_scalar():
+    steps = [browser(0, id="a"), browser(1, depends_on="a")]
+    assert resolve_dependencies(steps) == [[], [0]]
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(PlanError, match="unknown step"):
+        resolve_dependencies([browser(0, id="a"), browser(1, depends_on=["b"])])
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(PlanError, match="cycle"):
+        resolve_dependencies([browser(0, id="a", depends_on=["b"]), browser(1, id="b", depends_on=["a"])])
+
+
+def test_duplicate_ids_are_rejected():
+    with pytest.raises(PlanError, match="same id"):
+        resolve_dependencies([browser(0, id="a"), browser(1, id="a", depends_on=[])])
+
+
+def test_explicit_id_wins_over_an_index():
+    # "1" is step 0's id, so it cannot also name step 1 by index
+    steps = [browser(0, id="1"), browser(1), browser(2, depends_on=["1"])]
+    assert resolve_dependencies(steps) == [[], [], [0]]
+
+
+def test_independent_steps_run_concurrently_and_dependents_wait():
+    async def run():
+        active, peak, order = 0, 0, []
+
+        async def run_step(job, index, step):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            order.append(index)
+            return index * 10
+
+        scheduler = JobScheduler(run_step, max_parallel_steps=4)
+        await scheduler.start()
+        try:
+            job = scheduler.submit([browser(0, id="a", depends_on=[]), browser(1, id="b", depends_on=[]),
+                                    browser(2, depends_on=["a", "b"])])
+            await wait_finished(job)
+        finally:
+            await scheduler.stop()
+        return job, peak, order
+
+    job, peak, order = asyncio.run(run())
+    assert job.status == COMPLETED
+    assert job.step_status == [STEP_DONE] * 3
+    assert job.results == [0, 10, 20]
+    assert peak == 2
+    assert order[-1] == 2
+
+
+def test_failed_step_stops_running_siblings_before_the_job_finishes():
+    async def run():
+        stopped = []
+
+        async def run_step(job, index, step):
+            if index == 0:
+                await asyncio.sleep(0.01)
+                raise RuntimeError("boom")
+            try:
+                await asyncio.sleep(5)
+            finally:
+                stopped.append((index, job.is_finished))
+
+        scheduler = JobScheduler(run_step)
+        await scheduler.start()
+        try:
+            job = scheduler.submit([browser(0, depends_on=[]), browser(1, depends_on=[]), browser(2, depends_on=[1])])
+            await wait_finished(job)
+        finally:
+            await scheduler.stop()
+        return job, stopped
+
+    job, stopped = asyncio.run(run())
+    assert job.status == FAILED
+    assert job.error == "boom"
+    assert job.step_status == [STEP_FAILED, STEP_SKIPPED, STEP_SKIPPED]
+    # The sibling was stopped while the job was still running
+    assert stopped == [(1, False)]
+
+
+def test_streamed_steps_run_in_arrival_order():
+    async def run():
+        async def stream():
+            for n in range(3):
+                await asyncio.sleep(0)
+                yield browser(n)
+
+        seen = []
+
+        async def run_step(job, index, step):
+            seen.append(step["instruction"])
+
+        scheduler = JobScheduler(run_step)
+        await scheduler.start()
+        try:
+            job = scheduler.submit(stream())
+            await wait_finished(job)
+        finally:
+            await scheduler.stop()
+        return job, seen
+
+    job, seen = asyncio.run(run())
+    assert job.status == COMPLETED
+    assert seen == [f"open https://example.com/{n}" for n in range(3)]
+    assert job.dependencies == [[], [0], [1]]
+
+
+def test_cancel_running_and_queued_jobs():
+    async def run():
+        async def run_step(job, index, step):
+            await asyncio.sleep(5)
+
+        scheduler = JobScheduler(run_step, max_workers=1)
+        await scheduler.start()
+        try:
+            running = scheduler.submit([browser(0)])
+            queued = scheduler.submit([browser(1)])
+            await asyncio.sleep(0.02)
+            assert scheduler.cancel(queued.id)
+            assert scheduler.cancel(running.id)
+            await wait_finished(running)
+            assert not scheduler.cancel(running.id)
+        finally:
+            await scheduler.stop()
+        return running, queued
+
+    running, queued = asyncio.run(run())
+    assert running.status == CANCELLED
+    assert running.step_status == [STEP_SKIPPED]
+    assert queued.status == CANCELLED
+    assert queued.step_status == [STEP_SKIPPED]
+
+
+def test_full_queue_rejects_submissions():
+    async def run():
+        async def run_step(job, index, step):
+            await asyncio.sleep(5)
+
+        scheduler = JobScheduler(run_step, max_workers=1, max_queue=1)
+        await scheduler.start()
+        try:
+            scheduler.submit([browser(0)])
+            await asyncio.sleep(0.01)
+            scheduler.submit([browser(1)])
+            with pytest.raises(QueueFullError):
+                scheduler.submit([browser(2)])
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(run())
+
+
+def test_status_and_step_listeners():
+    async def run():
+        statuses, steps = [], []
+
+        async def run_step(job, index, step):
+            return "ok"
+
+        scheduler = JobScheduler(run_step, on_status=lambda job: statuses.append(job.status),
+                                 on_step=lambda job, index: steps.append((index, job.step_status[index])))
+        await scheduler.start()
+        try:
+            job = scheduler.submit([browser(0)])
+            await wait_finished(job)
+        finally:
+            await scheduler.stop()
+        return statuses, steps
+
+    statuses, steps = asyncio.run(run())
+    assert statuses == ["queued", "running", "completed"]
+    assert steps == [(0, "running"), (0, "done")]
+
+
+def test_finished_jobs_beyond_history_are_forgotten():
+    async def run():
+        async def run_step(job, index, step):
+            return None
+
+        scheduler = JobScheduler(run_step, history_size=2)
+        await scheduler.start()
+        try:
+            jobs = []
+            for n in range(4):
+                jobs.append(scheduler.submit([browser(n)]))
+                await wait_finished(jobs[-1])
+            # History is trimmed when the next job is queued
+            scheduler.submit([browser(4)])
+        finally:
+            await scheduler.stop()
+        return scheduler, jobs
+
+    scheduler, jobs = asyncio.run(run())
+    assert scheduler.get(jobs[0].id) is None
+    assert scheduler.get(jobs[1].id) is None
+    assert scheduler.get(jobs[3].id) is not None
+    assert STEP_PENDING not in scheduler.get(jobs[3].id).step_status
@@ -0,0 +1,164 @@
+"""
+Tests for tile diffs, region merging and the shared-memory frame ring
+"""
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import pytest
+from PIL import Image
+
+from screen_buffer import FrameRing, changed_tiles, tile_regions
+
+TILE = 16
+THRESHOLD = 24
+
+
+def screen(width=64, height=48, color=(40, 40, 40)):
+    return Image.new("RGB", (width, height), color)
+
+
+def with_pixel(image, xy, color):
+    changed = image.copy()
+    changed.putpixel(xy, color)
+    return changed
+
+
+def tiles(bitmap, tiles_x=4):
+    return [divmod(index, tiles_x)[::-1] for index, value in enumerate(bitmap) if value]
+
+
+@pytest.fixture
+def ring():
+    rings = []
+
+    def create(width=64, height=48, slots=3):
+        rings.append(FrameRing.create(width, height, slots=slots, tile=TILE,
+                                      name=f"intervene-test-{os.getpid()}-{len(rings)}"))
+        return rings[-1]
+
+    yield create
+    for created in rings:
+        created.close()
+
+
+def test_single_pixel_over_the_threshold_marks_its_tile():
+    before = screen()
+    after = with_pixel(before, (37, 20), (40, 40 + THRESHOLD + 1, 40))
+    # Tile (2, 1) of a 4 x 3 grid
+    assert tiles(changed_tiles(before, after, TILE, THRESHOLD)) == [(2, 1)]
+
+
+def test_single_pixel_within_the_threshold_is_noise():
+    before = screen()
+    after = with_pixel(before, (37, 20), (40 + THRESHOLD, 40 - THRESHOLD, 40))
+    assert changed_tiles(before, after, TILE, THRESHOLD) == bytes(12)
+    assert changed_tiles(before, before, TILE, THRESHOLD) == bytes(12)
+
+
+def test_partial_edge_tiles_are_diffed():
+    before = screen(70, 50)
+    after = with_pixel(before, (69, 49), (255, 255, 255))
+    bitmap = changed_tiles(before, after, TILE, THRESHOLD)
+    # 5 x 4 tiles, the last one only 6 x 2 pixels
+    assert len(bitmap) == 20 and tiles(bitmap, 5) == [(4, 3)]
+
+
+def test_diagonal_neighbours_merge_into_one_region():
+    bitmap = bytearray(12)
+    bitmap[0] = bitmap[5] = 1   # (0, 0) and (1, 1) touch at a corner
+    bitmap[3] = 1               # (3, 0) is on its own
+    regions = tile_regions(bytes(bitmap), (64, 48), TILE)
+    assert regions == [(0, 0, 32, 32), (48, 0, 64, 16)]
+
+
+def test_regions_past_the_limit_collapse_to_one_box():
+    bitmap = bytearray(12)
+    bitmap[0] = bitmap[2] = bitmap[9] = 1
+    assert len(tile_regions(bytes(bitmap), (64, 48), TILE, max_regions=3)) == 3
+    assert tile_regions(bytes(bitmap), (64, 48), TILE, max_regions=2) == [(0, 0, 48, 48)]
+
+
+def test_regions_are_clipped_to_the_frame():
+    bitmap = bytearray(20)
+    bitmap[19] = 1
+    assert tile_regions(bytes(bitmap), (70, 50), TILE) == [(64, 48, 70, 50)]
+
+
+def test_ring_round_trip(ring):
+    frames = ring()
+    assert frames.latest_seq == 0 and frames.latest() is None and frames.frame(1) is None
+
+    first = screen(color=(10, 20, 30))
+    second = with_pixel(first, (5, 5), (200, 0, 0))
+    bitmap = changed_tiles(first, second, TILE, THRESHOLD)
+    assert frames.write(first) == 1
+    assert frames.write(second, bitmap) == 2
+
+    frame = frames.frame(1)
+    assert frame.seq == 1 and frame.ring == frames.name
+    assert frame.image.tobytes() == first.tobytes()
+    latest = frames.latest(copy=False)
+    assert latest.seq == 2 and latest.image.tobytes() == second.tobytes()
+    del latest
+    assert frames.changed_tiles_since(1) == bitmap
+    assert frames.changed_regions(1) == [(0, 0, 16, 16)]
+    assert frames.changed_regions(2) == []
+
+    with pytest.raises(ValueError):
+        frames.write(screen(32, 32))
+
+
+def test_lapped_slot_reads_as_none(ring):
+    frames = ring(slots=3)
+    for shade in range(4):
+        frames.write(screen(color=(shade, shade, shade)))
+    # Frame 4 went into frame 1's slot
+    assert frames.frame(1) is None and not frames.is_current(1)
+    assert frames.frame(2).image.getpixel((0, 0)) == (1, 1, 1)
+    assert frames.frame(5) is None
+
+
+def test_changed_tiles_since_an_overwritten_frame_is_unknown(ring):
+    frames = ring(slots=3)
+    base = screen()
+    frames.write(base)
+    frames.write(with_pixel(base, (0, 0), (255, 255, 255)), bytes([1] + [0] * 11))
+    frames.write(base, bytes(11) + b"\x01")
+    combined = frames.changed_tiles_since(1)
+    assert combined == bytes([1] + [0] * 10 + [1])
+
+    # Frame 4 overwrites frame 1; frames 2 and 3 are still intact
+    frames.write(base, bytes(12))
+    assert frames.changed_tiles_since(1) == combined
+    # Frame 5 overwrites frame 2, which lies between 1 and the newest frame
+    frames.write(base, bytes(12))
+    assert frames.changed_tiles_since(1) is None
+    assert frames.changed_regions(1) is None
+    # A sequence number from a newer ring than this one
+    assert frames.changed_tiles_since(9) is None
+
+
+def test_attach_reads_another_processes_ring(ring):
+    frames = ring()
+    frames.write(screen(color=(7, 8, 9)))
+    reader = FrameRing.attach(frames.name)
+    try:
+        assert reader.size == frames.size and reader.slots == frames.slots and reader.tile == TILE
+        assert reader.latest().image.getpixel((3, 3)) == (7, 8, 9)
+    finally:
+        reader.close()
+    # Closing a reader leaves the segment to its creator
+    assert frames.latest() is not None
+
+
+def test_attach_rejects_a_foreign_segment():
+    foreign = shared_memory.SharedMemory(name=f"intervene-test-foreign-{os.getpid()}", create=True, size=4096)
+    try:
+        foreign.buf[:8] = b"NOTARING"
+        with pytest.raises(ValueError, match="is not a frame ring"):
+            FrameRing.attach(foreign.name)
+        # attach treats any segment it did not create as another process's
+        resource_tracker.register(foreign._name, "shared_memory")
+    finally:
+        foreign.close()
+        foreign.unlink()
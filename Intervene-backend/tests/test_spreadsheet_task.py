@@ -0,0 +1,18 @@
+"""
+Tests for the spreadsheet tool's argument checks
+"""
+import tempfile
+
+import pytest
+
+import tasks
+
+
+def test_unknown_format_is_rejected_before_anything_runs(monkeypatch):
+    launched, created = [], []
+    monkeypatch.setattr(tasks.subprocess, "run", lambda *args, **kwargs: launched.append(args))
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", lambda *args, **kwargs: created.append(kwargs))
+    for output_format in ("../../evil", "xls", ""):
+        with pytest.raises(ValueError, match="Unsupported spreadsheet format"):
+            tasks.handle_spreadsheet_task([["a", 1]], ["A", "B"], output_format=output_format)
+    assert launched == [] and created == []
@@ -0,0 +1,88 @@
+"""
+Tests for the streaming spreadsheet writers
+"""
+import csv
+
+import pytest
+
+import spreadsheet_writer
+from spreadsheet_writer import write_csv, write_spreadsheet, write_xlsx
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_quotes_commas_quotes_and_newlines(tmp_path):
+    path = tmp_path / "out.csv"
+    rows = [["Smith, John", 'He said "hi"'], ["line one\nline two", "plain"], ["ünïcode", 3]]
+    assert write_csv(str(path), rows, ["Name", "Note"]) == 3
+
+    assert read_csv(path) == [["Name", "Note"], ["Smith, John", 'He said "hi"'],
+                              ["line one\nline two", "plain"], ["ünïcode", "3"]]
+    raw = path.read_text(encoding="utf-8")
+    assert '"Smith, John","He said ""hi"""' in raw
+
+
+def test_generator_input_is_written_in_chunks(tmp_path, monkeypatch):
+    chunks = []
+    real_writer = csv.writer
+
+    class RecordingWriter:
+        def __init__(self, f):
+            self.writer = real_writer(f)
+
+        def writerow(self, row):
+            self.writer.writerow(row)
+
+        def writerows(self, rows):
+            chunks.append(len(rows))
+            self.writer.writerows(rows)
+
+    monkeypatch.setattr(spreadsheet_writer.csv, "writer", RecordingWriter)
+    pulled = []
+
+    def rows():
+        for i in range(2500):
+            pulled.append(i)
+            yield [f"Item {i}", i]
+
+    path = tmp_path / "big.csv"
+    assert write_spreadsheet(str(path), rows(), ["Item", "Value"], chunk_size=1000) == 2500
+
+    assert chunks == [1000, 1000, 500]
+    assert len(pulled) == 2500
+    written = read_csv(path)
+    assert len(written) == 2501
+    assert written[1] == ["Item 0", "0"] and written[-1] == ["Item 2499", "2499"]
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported spreadsheet format"):
+        write_spreadsheet(str(tmp_path / "out.xls"), [], output_format="xls")
+
+
+def test_xlsx_without_xlsxwriter_says_what_is_missing(tmp_path):
+    try:
+        import xlsxwriter  # noqa: F401
+        pytest.skip("xlsxwriter is installed")
+    except ImportError:
+        pass
+    with pytest.raises(RuntimeError, match="xlsxwriter"):
+        write_xlsx(str(tmp_path / "out.xlsx"), [["a", 1]])
+
+
+def test_xlsx_round_trip(tmp_path):
+    pytest.importorskip("xlsxwriter")
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "out.xlsx"
+    rows = ([f"Item {i}", i, "007"] for i in range(2500))
+    assert write_xlsx(str(path), rows, ["Item", "Value", "Code"], chunk_size=1000) == 2500
+
+    sheet = openpyxl.load_workbook(path, read_only=True).active
+    values = list(sheet.iter_rows(values_only=True))
+    assert values[0] == ("Item", "Value", "Code")
+    assert values[1] == ("Item 0", 0, "007")
+    assert values[-1] == ("Item 2499", 2499, "007")
+    assert len(values) == 2501
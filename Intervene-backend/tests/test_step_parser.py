@@ -0,0 +1,76 @@
+"""
+Tests for the incremental step parser, fed whole and in every chunk size
+"""
+import json
+
+import pytest
+
+from step_parser import IncrementalStepParser, parse_steps_text, repair_json
+
+STEPS = [
+    {"type": "browser", "instruction": "open https://www.google.com and search for 'LangChain'"},
+    {"type": "excel", "instruction": "write [a] {table}", "headers": ["A", "B"], "data": [["x", 1], ["y", 2]]},
+    {"type": "email", "instruction": "draft an email", "body": "It's done \"today\"\n"},
+]
+RESPONSE = "Here is the plan:\n```json\n" + json.dumps(STEPS, indent=2) + "\n```\nTrailing prose [ignored]"
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalStepParser()
+    steps = []
+    for start in range(0, len(text), size):
+        steps.extend(parser.feed(text[start:start + size]))
+    return parser, steps
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 64, len(RESPONSE)])
+def test_chunking_does_not_change_the_result(size):
+    parser, steps = feed_in_chunks(RESPONSE, size)
+    assert steps == STEPS
+    assert parser.done
+    assert parser.skipped == 0
+
+
+def test_each_step_is_emitted_as_soon_as_its_object_closes():
+    text = json.dumps(STEPS)
+    first_end = text.index("}") + 1
+    parser = IncrementalStepParser()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [STEPS[0]]
+    assert not parser.done
+
+
+def test_text_after_the_array_is_ignored():
+    parser = IncrementalStepParser()
+    assert parser.feed('[{"type": "browser", "instruction": "open x"}] [{"type": "email"}]') == [
+        {"type": "browser", "instruction": "open x"}]
+    assert parser.done
+    assert parser.feed('{"type": "email"}') == []
+
+
+def test_single_quotes_and_trailing_commas_are_repaired():
+    text = "[{'type': 'browser', 'instruction': 'open https://example.com and search for \"it\\'s\"',},]"
+    for size in (1, 5, len(text)):
+        _, steps = feed_in_chunks(text, size)
+        assert steps == [{"type": "browser", "instruction": "open https://example.com and search for \"it's\""}]
+
+
+def test_unparseable_and_non_object_elements_are_skipped():
+    parser = IncrementalStepParser()
+    steps = parser.feed('[{"type": broken}, 3, "x", {"type": "email", "instruction": "hi"}]')
+    assert steps == [{"type": "email", "instruction": "hi"}]
+    assert parser.skipped == 1
+
+
+def test_buffer_only_keeps_the_open_object():
+    parser = IncrementalStepParser()
+    parser.feed('[{"type": "browser", "instruction": "open x"}, {"type": "em')
+    assert parser._text == '{"type": "em'
+
+
+def test_repair_json_leaves_apostrophes_in_double_quoted_strings():
+    assert json.loads(repair_json('{"body": "it\'s fine",}')) == {"body": "it's fine"}
+
+
+def test_parse_steps_text():
+    assert parse_steps_text(RESPONSE) == STEPS
@@ -0,0 +1,115 @@
+"""
+Tests for the tool executor: per-tool limits, shared limits and timeouts for blocking and async handlers
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from tool_executor import ToolExecutor, ToolTimeoutError
+
+
+class Tracker:
+    """A blocking handler that records how many calls overlap"""
+
+    def __init__(self, seconds=0.05):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __call__(self, value):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.current -= 1
+        return value * 2
+
+
+def test_blocking_tool_runs_at_most_limit_calls_at_once():
+    executor = ToolExecutor(thread_workers=8)
+    tracker = Tracker()
+    executor.register("excel", tracker, limit=2)
+
+    async def run():
+        return await asyncio.gather(*(executor.run("excel", i) for i in range(6)))
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8, 10]
+    assert tracker.peak == 2
+    executor.shutdown()
+
+
+def test_tools_sharing_a_limit_count_against_it_together():
+    executor = ToolExecutor(thread_workers=8)
+    tracker = Tracker()
+    executor.register("vision_analyze", tracker, limit=2)
+    executor.register("vision_capture", tracker, limit=5, shares="vision_analyze")
+
+    async def run():
+        calls = [executor.run("vision_analyze", i) for i in range(3)]
+        calls += [executor.run("vision_capture", i) for i in range(3)]
+        await asyncio.gather(*calls)
+
+    asyncio.run(run())
+    assert tracker.peak == 2
+    assert executor.stats()["vision_capture"] == {"running": 0, "limit": 2, "shares": "vision_analyze"}
+    with pytest.raises(KeyError):
+        executor.register("other", tracker, shares="missing")
+    executor.shutdown()
+
+
+def test_blocking_tool_timeout_returns_at_once_but_keeps_the_slot_until_it_finishes():
+    executor = ToolExecutor(thread_workers=2)
+    finish = threading.Event()
+    executor.register("email", lambda: finish.wait(5), limit=1)
+
+    async def run():
+        started = time.perf_counter()
+        with pytest.raises(ToolTimeoutError):
+            await executor.run("email", timeout=0.1)
+        elapsed = time.perf_counter() - started
+        still_running = executor.stats()["email"]["running"]
+        finish.set()
+        for _ in range(100):
+            if executor.stats()["email"]["running"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return elapsed, still_running
+
+    elapsed, still_running = asyncio.run(run())
+    assert elapsed < 1.0
+    assert still_running == 1
+    assert executor.stats()["email"]["running"] == 0
+    executor.shutdown()
+
+
+def test_async_tool_is_cancelled_on_timeout_and_frees_its_slot():
+    executor = ToolExecutor()
+    cancelled = []
+
+    async def slow(seconds):
+        try:
+            await asyncio.sleep(seconds)
+            return "done"
+        except asyncio.CancelledError:
+            cancelled.append(seconds)
+            raise
+
+    executor.register("vision_analyze", slow, limit=1, timeout=0.1)
+
+    async def run():
+        with pytest.raises(ToolTimeoutError):
+            await executor.run("vision_analyze", 5)
+        running = executor.stats()["vision_analyze"]["running"]
+        return running, await executor.run("vision_analyze", 0.01)
+
+    assert asyncio.run(run()) == (0, "done")
+    assert cancelled == [5]
+
+
+def test_unknown_tool_raises_key_error():
+    with pytest.raises(KeyError):
+        asyncio.run(ToolExecutor().run("missing"))
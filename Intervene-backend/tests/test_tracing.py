@@ -0,0 +1,83 @@
+"""
+Tests for span nesting through the current-span context variable
+"""
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from tracing import Span, activate, record_span, span
+
+
+def names(node):
+    return [child.name for child in node.children]
+
+
+def test_spans_nest_under_the_active_span():
+    root = Span("workflow")
+    with activate(root):
+        with span("plan", model="llama3") as plan:
+            with span("llm"):
+                pass
+            record_span("wait_app_ready", 0.5)
+        with span("execute"):
+            pass
+    root.finish()
+
+    assert names(root) == ["plan", "execute"]
+    assert names(plan) == ["llm", "wait_app_ready"]
+    assert plan.attrs == {"model": "llama3"}
+    waited = plan.children[1]
+    assert waited.duration == pytest.approx(0.5)
+    tree = root.to_dict()
+    assert tree["children"][0]["children"][0]["name"] == "llm"
+
+
+def test_no_active_trace_records_nothing():
+    with span("orphan") as current:
+        assert current is None
+    assert record_span("orphan", 1.0) is None
+
+
+def test_failing_block_marks_its_span():
+    root = Span("workflow")
+    with activate(root):
+        with pytest.raises(ValueError):
+            with span("step"):
+                raise ValueError("bad step")
+    assert root.children[0].attrs == {"error": "ValueError"}
+    assert root.children[0].duration is not None
+
+
+def test_tasks_and_worker_threads_attach_to_the_span_they_were_started_from():
+    root = Span("workflow")
+
+    async def step(index):
+        with span(f"step_{index}"):
+            await asyncio.sleep(0.01)
+            with span("tool"):
+                pass
+
+    def in_thread():
+        with span("thread_work"):
+            pass
+
+    async def run():
+        with activate(root):
+            with span("execute") as execute:
+                await asyncio.gather(step(0), step(1))
+                thread = threading.Thread(target=contextvars.copy_context().run, args=(in_thread,))
+                thread.start()
+                thread.join()
+        return execute
+
+    execute = asyncio.run(run())
+    assert sorted(names(execute)) == ["step_0", "step_1", "thread_work"]
+    for child in execute.children:
+        if child.name.startswith("step_"):
+            assert names(child) == ["tool"]
+    # Spans outside the activated block are not attached
+    with span("after"):
+        pass
+    assert names(root) == ["execute"]
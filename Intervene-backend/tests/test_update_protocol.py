@@ -0,0 +1,67 @@
+"""
+Tests for the /step-updates wire formats: negotiation, job state deltas and frames
+"""
+import json
+
+from update_protocol import JSON, LEGACY, V2, JobStates, decode, delta_frame, encode, legacy_message, negotiate
+
+
+def test_negotiation():
+    assert negotiate([]) == (LEGACY, JSON, None)
+    assert negotiate([], version=2) == (V2, JSON, None)
+    assert negotiate(["chat", "intervene.v2.json"]) == (V2, JSON, "intervene.v2.json")
+    assert negotiate([], version=2, encoding="xml") == (V2, JSON, None)
+
+
+def test_legacy_message_shape():
+    event = {"job": "j1", "step": 2, "state": "done", "message": "Step 3 done", "seq": 7}
+    assert legacy_message(event) == {"completedStepIndex": 2, "message": "Step 3 done", "jobId": "j1", "seq": 7}
+    assert legacy_message({"job": "j1", "status": "running", "seq": 8}) is None
+
+
+def test_merge_keeps_the_last_state_of_each_step():
+    delta = {}
+    JobStates.merge(delta, {"job": "j1", "status": "running"})
+    JobStates.merge(delta, {"job": "j1", "step": 0, "state": "running"})
+    JobStates.merge(delta, {"job": "j1", "step": 0, "state": "done", "result": "ok"})
+    JobStates.merge(delta, {"job": "j1", "step": 1, "state": "running"})
+    JobStates.merge(delta, {"step": 5, "state": "done"})
+    assert delta == {"j1": {"status": "running", "steps": {0: ["done", "ok"], 1: ["running"]}}}
+
+
+def test_finished_job_marks_its_remaining_steps():
+    delta = {}
+    JobStates.merge(delta, {"job": "j1", "step": 0, "state": "done"})
+    JobStates.merge(delta, {"job": "j1", "status": "failed", "steps": {1: "skipped", 2: "skipped"}})
+    assert delta["j1"] == {"status": "failed", "steps": {0: ["done"], 1: ["skipped"], 2: ["skipped"]}}
+
+
+def test_delta_frame_sorts_steps_into_lists():
+    jobs = {"j1": {"status": "running", "steps": {2: ["running"], 0: ["done", {"rows": 3}]}},
+            "j2": {"status": "queued"}}
+    frame = delta_frame(12, jobs)
+    assert frame == {"v": V2, "seq": 12, "jobs": {
+        "j1": {"status": "running", "steps": [[0, "done", {"rows": 3}], [2, "running"]]},
+        "j2": {"status": "queued"},
+    }}
+    assert delta_frame(13, {}, gap=True)["gap"] is True
+    # Integer step indices survive JSON because they are list items, not keys
+    assert decode(encode(frame)) == frame
+
+
+def test_job_states_forget_old_finished_jobs():
+    states = JobStates(max_finished=2)
+    for n in range(3):
+        states.apply({"job": f"j{n}", "step": 0, "state": "done"})
+        states.apply({"job": f"j{n}", "status": "completed"})
+    states.apply({"job": "live", "status": "running"})
+    assert list(states.snapshot()) == ["j1", "j2", "live"]
+    assert states.snapshot(["j2", "unknown"]) == {"j2": {"steps": {0: ["done"]}, "status": "completed"}}
+
+
+def test_json_frames_are_compact_ascii():
+    payload = encode({"v": V2, "seq": 1, "jobs": {"j": {"status": "naïve"}}})
+    assert isinstance(payload, str)
+    assert " " not in payload
+    assert payload.isascii()
+    assert json.loads(payload)["jobs"]["j"]["status"] == "naïve"
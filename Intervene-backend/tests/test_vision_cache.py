@@ -0,0 +1,97 @@
+"""
+Tests for the perceptual-hash vision cache
+"""
+import pytest
+from PIL import Image, ImageDraw
+
+import vision_cache
+from vision_cache import VisionCache, difference_hash, hamming_distance
+
+PROMPT = "Describe the screen"
+MODEL = "llava"
+
+
+def screen(text_box=None, noise=None):
+    """A synthetic 'window': title bar, sidebar and optionally a content block or a single changed pixel"""
+    image = Image.new("RGB", (640, 400), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 640, 30), fill=(40, 40, 40))
+    draw.rectangle((0, 30, 150, 400), fill=(200, 200, 210))
+    if text_box:
+        draw.rectangle(text_box, fill=(20, 20, 120))
+    if noise:
+        image.putpixel(noise, (250, 250, 250))
+    return image
+
+
+class Clock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(vision_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_near_identical_frame_hits_and_changed_frame_misses(clock):
+    cache = VisionCache(threshold=6)
+    base = screen()
+    cache.put(cache.hash_image(base), "an empty window", 1.5, PROMPT, MODEL)
+
+    noisy = screen(noise=(400, 200))
+    assert hamming_distance(cache.hash_image(base), cache.hash_image(noisy)) <= 6
+    assert cache.get(cache.hash_image(noisy), PROMPT, MODEL) == "an empty window"
+
+    changed = screen(text_box=(200, 60, 600, 360))
+    assert hamming_distance(cache.hash_image(base), cache.hash_image(changed)) > 6
+    assert cache.get(cache.hash_image(changed), PROMPT, MODEL) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.stats()["saved_seconds"] == 1.5
+
+
+def test_closest_entry_within_threshold_wins(clock):
+    cache = VisionCache(threshold=6)
+    cache.put(0b0000, "far", 0.1)
+    cache.put(0b0111, "near", 0.1)
+    assert cache.get(0b1111) == "near"
+    assert cache.get(0xFFFF << 20) is None
+
+
+def test_entries_expire(clock):
+    cache = VisionCache(ttl=30)
+    cache.put(42, "analysis", 0.1)
+    clock.now += 29
+    assert cache.get(42) == "analysis"
+    clock.now += 2
+    assert cache.get(42) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = VisionCache(max_entries=2, threshold=0)
+    cache.put(1, "one", 0.1)
+    cache.put(2, "two", 0.1)
+    assert cache.get(1) == "one"
+    cache.put(4, "four", 0.1)
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "one" and cache.get(4) == "four"
+    assert cache.stats()["entries"] == 2
+
+
+def test_prompt_and_model_are_part_of_the_key(clock):
+    cache = VisionCache()
+    image_hash = difference_hash(screen())
+    cache.put(image_hash, "described", 0.1, PROMPT, MODEL)
+
+    assert cache.get(image_hash, "List the buttons", MODEL) is None
+    assert cache.get(image_hash, PROMPT, "other-vision-model") is None
+    cache.put(image_hash, "buttons", 0.1, "List the buttons", MODEL)
+    assert cache.get(image_hash, PROMPT, MODEL) == "described"
+    assert cache.get(image_hash, "List the buttons", MODEL) == "buttons"
@@ -0,0 +1,85 @@
+"""
+Tests for condition-based waits: polling, backoff, timeouts and failing checks
+"""
+import threading
+
+import pytest
+
+import waiting
+from waiting import wait_until, wait_stats
+
+
+class FakeTime:
+    """Replaces time.monotonic/time.sleep so waits run instantly and their delays are recorded"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(waiting.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(waiting.time, "sleep", fake.sleep)
+    return fake
+
+
+def countdown(polls):
+    """A predicate that becomes true on its polls-th call"""
+    calls = []
+
+    def predicate():
+        calls.append(1)
+        return len(calls) >= polls
+
+    return predicate, calls
+
+
+def test_immediate_success_does_not_sleep(fake_time):
+    assert wait_until(lambda: True, name="test_immediate") is True
+    assert fake_time.sleeps == []
+    assert wait_stats.snapshot()["test_immediate"]["timeouts"] == 0
+
+
+def test_backoff_grows_and_is_capped(fake_time):
+    predicate, calls = countdown(7)
+    assert wait_until(predicate, timeout=60, initial_delay=0.1, max_delay=0.5, backoff=2.0, name="test_backoff")
+    assert len(calls) == 7
+    assert fake_time.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5, 0.5])
+    stats = wait_stats.snapshot()["test_backoff"]
+    assert stats["last_seconds"] == pytest.approx(2.2)
+
+
+def test_timeout_returns_false_without_oversleeping(fake_time):
+    assert wait_until(lambda: False, timeout=1.0, initial_delay=0.3, max_delay=1.0, name="test_timeout") is False
+    assert fake_time.now == pytest.approx(1.0)
+    # The last sleep is cut to what is left of the timeout
+    assert fake_time.sleeps == pytest.approx([0.3, 0.6, 0.1])
+    assert wait_stats.snapshot()["test_timeout"]["timeouts"] == 1
+
+
+def test_predicate_errors_count_as_not_ready(fake_time):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise OSError("osascript not ready")
+        return True
+
+    assert wait_until(flaky, timeout=5, name="test_flaky") is True
+    assert len(attempts) == 3
+
+
+def test_cancel_event_stops_the_wait():
+    cancelled = threading.Event()
+    cancelled.set()
+    assert wait_until(lambda: False, timeout=30, cancel_event=cancelled, name="test_cancel") is False
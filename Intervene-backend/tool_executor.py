@@ -0,0 +1,152 @@
+"""
+tool_executor.py - Runs blocking tool handlers off the event loop in a managed thread pool
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from metrics import stage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool does not finish within its timeout"""
+
+
+@dataclass
+class ToolSpec:
+    """A registered tool handler and its execution limits"""
+    name: str
+    func: Callable[..., Any]
+    limit: int
+    timeout: float
+    semaphore: Optional[asyncio.Semaphore] = None
+    running: int = 0
+    # Name of the tool whose concurrency slots this one takes
+    shares: Optional[str] = None
+
+
+class ToolExecutor:
+    """
+    Dispatches blocking tool handlers to a thread pool.
+
+    Each tool has its own concurrency limit and timeout. Async handlers run on
+    the event loop directly and are cancelled on timeout. A blocking handler
+    cannot be interrupted once started, so on timeout or cancellation the
+    caller gets control back immediately while the tool's concurrency slot
+    stays taken until the worker thread really finishes.
+    """
+
+    def __init__(self, thread_workers: int = 8, default_timeout: float = 120.0, default_limit: int = 4):
+        self.thread_workers = thread_workers
+        self.default_timeout = default_timeout
+        self.default_limit = default_limit
+        self.tools: Dict[str, ToolSpec] = {}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+
+    def register(self, name: str, func: Callable[..., Any], limit: Optional[int] = None,
+                 timeout: Optional[float] = None, shares: Optional[str] = None):
+        """
+        Register a tool handler
+
+        Args:
+            name (str): Tool name used with run()
+            func (callable): The handler, blocking or async
+            limit (int): Maximum concurrent calls of this tool
+            timeout (float): Seconds before the caller gives up on a call
+            shares (str): A registered tool whose limit this one counts against
+                (limit is then ignored)
+
+        Raises:
+            KeyError: When shares names an unknown tool
+        """
+        if shares is not None:
+            owner = self.tools[shares]
+            shares = owner.shares or owner.name
+            limit = self.tools[shares].limit
+        self.tools[name] = ToolSpec(
+            name=name,
+            func=func,
+            limit=limit or self.default_limit,
+            timeout=timeout or self.default_timeout,
+            shares=shares,
+        )
+
+    async def run(self, name: str, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """
+        Run a registered tool without blocking the event loop
+
+        Args:
+            name (str): The registered tool name
+            timeout (float): Override the tool's timeout for this call
+            *args, **kwargs: Passed to the handler
+
+        Returns:
+            The handler's result
+
+        Raises:
+            KeyError: For an unknown tool
+            ToolTimeoutError: When the call exceeds its timeout
+        """
+        with stage(f"tool_{name}"):
+            return await self._run(name, args, kwargs, timeout)
+
+    async def _run(self, name: str, args: tuple, kwargs: Dict[str, Any], timeout: Optional[float]) -> Any:
+        spec = self.tools[name]
+        slots = self.tools[spec.shares] if spec.shares else spec
+        if slots.semaphore is None:
+            slots.semaphore = asyncio.Semaphore(slots.limit)
+        deadline = timeout or spec.timeout
+
+        await slots.semaphore.acquire()
+        spec.running += 1
+        released = False
+        handed_off = False
+
+        def release(*_):
+            nonlocal released
+            if not released:
+                released = True
+                spec.running -= 1
+                slots.semaphore.release()
+
+        try:
+            if asyncio.iscoroutinefunction(spec.func):
+                return await asyncio.wait_for(spec.func(*args, **kwargs), deadline)
+
+            loop = asyncio.get_running_loop()
+            # Carry the caller's trace into the worker thread
+            call = functools.partial(contextvars.copy_context().run, spec.func, *args, **kwargs)
+            future = loop.run_in_executor(self._pool(), call)
+            # The slot is freed when the worker finishes, not when we stop waiting
+            future.add_done_callback(release)
+            handed_off = True
+            return await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            logger.error(f"Tool {name} timed out after {deadline}s")
+            raise ToolTimeoutError(f"Tool {name} timed out after {deadline}s")
+        finally:
+            if not handed_off:
+                release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Current in-flight count and limit per tool (a shared limit is listed under each tool)"""
+        return {name: {"running": spec.running, "limit": spec.limit,
+                       **({"shares": spec.shares} if spec.shares else {})}
+                for name, spec in self.tools.items()}
+
+    def shutdown(self):
+        """Stop the pool without waiting for running handlers"""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="tool")
+        return self._thread_pool
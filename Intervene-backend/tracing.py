@@ -0,0 +1,135 @@
+"""
+tracing.py - Lightweight per-workflow span trees
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from config import TRACE_ENABLED, TRACE_HISTORY_SIZE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed stage of a workflow and the stages nested inside it"""
+
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """Nested view with offsets in ms from the root span's start"""
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": None if self.end is None else round((self.end - self.start) * 1000, 3),
+            "attrs": self.attrs,
+            "children": [child.to_dict(origin) for child in list(self.children)],
+        }
+
+
+# The span new child spans attach to; copied into tasks and tool threads
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def start_trace(name: str, **attrs: Any) -> Optional[Span]:
+    """Create a root span, or None when tracing is disabled"""
+    if not TRACE_ENABLED:
+        return None
+    return Span(name, attrs)
+
+
+@contextmanager
+def activate(root: Optional[Span]):
+    """Make root the parent of spans opened inside the block"""
+    if root is None:
+        yield
+        return
+    token = _current.set(root)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """
+    Time a block as a child of the current span
+
+    Outside an active trace this records nothing and yields None.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        child.finish()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # An async generator finalized from another task: nothing to restore
+            pass
+
+
+def record_span(name: str, duration: float, **attrs: Any) -> Optional[Span]:
+    """Attach an already-finished interval ending now to the current span"""
+    parent = _current.get()
+    if parent is None:
+        return None
+    child = Span(name, attrs)
+    child.end = child.start
+    child.start -= duration
+    parent.children.append(child)
+    return child
+
+
+class TraceStore:
+    """Keeps the span trees of the most recent workflows by job id"""
+
+    def __init__(self, max_entries: int = 100):
+        self.max_entries = max_entries
+        self._traces: "OrderedDict[str, Span]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, job_id: str, root: Optional[Span]):
+        if root is None:
+            return
+        with self._lock:
+            self._traces[job_id] = root
+            while len(self._traces) > self.max_entries:
+                self._traces.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[Span]:
+        with self._lock:
+            return self._traces.get(job_id)
+
+
+trace_store = TraceStore(TRACE_HISTORY_SIZE)
@@ -0,0 +1,174 @@
+"""
+update_protocol.py - Wire formats of the /step-updates stream: legacy JSON messages and versioned state deltas
+"""
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LEGACY = 1
+V2 = 2
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+# WebSocket subprotocols a client may offer, e.g. Sec-WebSocket-Protocol: intervene.v2.msgpack
+SUBPROTOCOLS = {
+    "intervene.v2.json": (V2, JSON),
+    "intervene.v2.msgpack": (V2, MSGPACK),
+}
+
+Payload = Union[str, bytes]
+
+# Job statuses after which a job sends no further updates
+FINISHED = ("completed", "failed", "cancelled")
+
+
+def msgpack_available() -> bool:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate(offered: Iterable[str], version: Optional[int] = None,
+              encoding: Optional[str] = None) -> Tuple[int, str, Optional[str]]:
+    """
+    Pick the protocol for one client
+
+    A client opts in with a WebSocket subprotocol (intervene.v2.json or
+    intervene.v2.msgpack) or with ?protocol=2[&encoding=msgpack]. Anything
+    else gets the legacy stream. MessagePack needs the optional msgpack
+    package; without it the client gets JSON and is told so in the hello frame.
+
+    Args:
+        offered (iterable): Subprotocols from the handshake, in client preference order
+        version (int): ?protocol= query value
+        encoding (str): ?encoding= query value
+
+    Returns:
+        tuple: (version, encoding, subprotocol to accept or None)
+    """
+    subprotocol = None
+    for name in offered:
+        if name in SUBPROTOCOLS:
+            subprotocol = name
+            version, encoding = SUBPROTOCOLS[name]
+            break
+    if version != V2:
+        return LEGACY, JSON, None
+    encoding = (encoding or JSON).lower()
+    if encoding == MSGPACK and not msgpack_available():
+        logger.warning("Client asked for MessagePack updates but msgpack is not installed; using JSON")
+        encoding = JSON
+    elif encoding not in (JSON, MSGPACK):
+        encoding = JSON
+    return V2, encoding, subprotocol
+
+
+def encode(message: Any, encoding: str = JSON) -> Payload:
+    """Serialize one frame: JSON text, or MessagePack bytes"""
+    if encoding == MSGPACK:
+        import msgpack
+
+        return msgpack.packb(message, use_bin_type=True)
+    # ASCII-only text, so a frame's length is its size on the wire
+    return json.dumps(message, separators=(",", ":"))
+
+
+def decode(payload: Payload) -> Any:
+    """Parse a client message, JSON text or MessagePack bytes"""
+    if isinstance(payload, bytes):
+        try:
+            import msgpack
+
+            return msgpack.unpackb(payload, raw=False)
+        except ImportError:
+            return json.loads(payload)
+    return json.loads(payload)
+
+
+def legacy_message(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Render an event in the shape existing clients decode
+    ({"completedStepIndex": Int, "message": String?}, plus jobId and seq)
+
+    Returns:
+        dict: The message, or None for events legacy clients never received
+    """
+    if "message" not in event:
+        return None
+    message = {"completedStepIndex": event["step"], "message": event["message"]}
+    if event.get("job") is not None:
+        message["jobId"] = event["job"]
+    message["seq"] = event["seq"]
+    return message
+
+
+class JobStates:
+    """
+    Latest known state of each job, built from events
+
+    ``merge`` folds events into a delta with the same shape, so a frame only
+    carries what changed and the last state of a step within a coalescing
+    window wins over the ones before it.
+    """
+
+    def __init__(self, max_finished: int = 100):
+        self.max_finished = max_finished
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._finished: List[str] = []
+
+    @staticmethod
+    def merge(delta: Dict[str, Dict[str, Any]], event: Dict[str, Any]):
+        """Fold one event into a {job_id: {"status": ..., "steps": {index: [state, result?]}}} delta"""
+        job = event.get("job")
+        if job is None:
+            return
+        entry = delta.setdefault(job, {})
+        if "status" in event:
+            entry["status"] = event["status"]
+        if "step" in event and "state" in event:
+            step = [event["state"]]
+            if event.get("result") is not None:
+                step.append(event["result"])
+            entry.setdefault("steps", {})[event["step"]] = step
+        for index, state in event.get("steps", {}).items():
+            # Events that went through JSON (the shared state log) carry the indices as strings
+            entry.setdefault("steps", {})[int(index)] = [state]
+
+    def apply(self, event: Dict[str, Any]):
+        """Record an event in the job table"""
+        self.merge(self.jobs, event)
+        job = event.get("job")
+        if job is not None and event.get("status") in FINISHED and job not in self._finished:
+            self._finished.append(job)
+            while len(self._finished) > self.max_finished:
+                self.jobs.pop(self._finished.pop(0), None)
+
+    def snapshot(self, job_ids: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Full state of the given jobs (default: every known job) in delta shape"""
+        ids = self.jobs.keys() if job_ids is None else job_ids
+        return {job: self.jobs[job] for job in ids if job in self.jobs}
+
+
+def delta_frame(seq: int, jobs: Dict[str, Dict[str, Any]], gap: bool = False) -> Dict[str, Any]:
+    """
+    Build a version 2 frame
+
+    Steps go out as [index, state] or [index, state, result] lists, which
+    JSON and MessagePack encode the same way (JSON objects cannot have
+    integer keys).
+    """
+    frame: Dict[str, Any] = {"v": V2, "seq": seq, "jobs": {
+        job: {**({"status": entry["status"]} if "status" in entry else {}),
+              **({"steps": [[index, *step] for index, step in sorted(entry["steps"].items())]}
+                 if entry.get("steps") else {})}
+        for job, entry in jobs.items()
+    }}
+    if gap:
+        frame["gap"] = True
+    return frame
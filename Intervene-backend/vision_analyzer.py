@@ -1,59 +1,258 @@
 """
 vision_analyzer.py - Module for analyzing screenshots using locally hosted LLaVA
 """
+import asyncio
 import logging
 import base64
-from langchain_community.llms import Ollama
-import os
-from config import get_ollama_config
+import hashlib
+import io
+import time
+from config import VISION_MAX_SIDE, VISION_IMAGE_FORMAT, VISION_IMAGE_QUALITY
+from vision_cache import get_vision_cache
+from model_registry import get_model, VISION
+from model_gateway import get_gateway, GatewayBusyError, PRIORITY_NORMAL
+from metrics import stage
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Get Ollama configuration from environment
-ollama_config = get_ollama_config()
-VISION_MODEL = ollama_config["vision_model"]
-LOCAL_OLLAMA_URL = ollama_config["base_url"]
+VISION_PROMPT = """
+        Analyze this screenshot and tell me:
+        1. What application is visible?
+        2. What is the main content or context?
+        3. What tasks could be performed here?
+
+        Be concise and focus on actionable insights.
+        """
+
+REGION_PROMPT = """
+        Earlier analysis of this screen:
+        {previous}
+
+        Since then only parts of the {width}x{height} screen changed. The attached
+        images show those parts, in order, at {regions} (left, top, right, bottom).
+        Give the updated analysis of the whole screen:
+        1. What application is visible?
+        2. What is the main content or context?
+        3. What tasks could be performed here?
+
+        Be concise and focus on actionable insights.
+        """
+
+def prepare_image(image, max_side=None):
+    """
+    Downscale an image for the vision model without touching the original
+
+    Args:
+        image (PIL.Image.Image): The captured image
+        max_side (int): Longest side in pixels, 0 keeps full size; defaults to VISION_MAX_SIDE
+
+    Returns:
+        PIL.Image.Image: An RGB image no larger than max_side on either side
+    """
+    if max_side is None:
+        max_side = VISION_MAX_SIDE
+
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        # thumbnail() works in place, so copy first; reducing_gap trades a
+        # little quality for a much faster multi-step downscale
+        from PIL import Image
+
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.BICUBIC, reducing_gap=2.0)
+    return image
+
+def encode_image(image, max_side=None, image_format=None, quality=None):
+    """
+    Downscale and encode an in-memory image to base64 for the vision model
+
+    Args:
+        image (PIL.Image.Image): The captured image
+        max_side (int): Longest side in pixels, defaults to VISION_MAX_SIDE
+        image_format (str): PIL format name (JPEG, WEBP, PNG), defaults to VISION_IMAGE_FORMAT
+        quality (int): Lossy encoder quality, defaults to VISION_IMAGE_QUALITY
+
+    Returns:
+        str: Base64-encoded image bytes
+    """
+    image_format = (image_format or VISION_IMAGE_FORMAT).upper()
+    quality = quality or VISION_IMAGE_QUALITY
+
+    image = prepare_image(image, max_side)
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", compress_level=1)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def analyze_image(image, priority=PRIORITY_NORMAL):
+    """
+    Analyze an in-memory screenshot using LLaVA vision model, from blocking code
+
+    Runs analyze_image_async on the model gateway's event loop, so the call
+    gets the same admission, priority, coalescing and cache as async callers.
+    Must not be called on that loop itself.
+
+    Args:
+        image (PIL.Image.Image): The captured screenshot
+        priority (int): Admission priority at the model gateway
+
+    Returns:
+        str: Analysis of the screenshot
+    """
+    try:
+        return get_gateway().run_sync(analyze_image_async(image, priority))
+    except GatewayBusyError as e:
+        logger.error(f"Error analyzing screenshot: {str(e)}")
+        return f"Error analyzing screenshot: {str(e)}"
 
 def analyze_screenshot(image_path):
     """
     Analyze a screenshot using LLaVA vision model
-    
+
     Args:
         image_path (str): Path to the screenshot image file
-        
+
     Returns:
         str: Analysis of the screenshot
     """
+    from PIL import Image
+
     try:
-        # Encode image as base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        logger.info(f"Analyzing screenshot using {VISION_MODEL}")
-        
-        # Prepare the prompt for vision analysis
-        prompt = f"""
-        Analyze this screenshot and tell me:
-        1. What application is visible?
-        2. What is the main content or context?
-        3. What tasks could be performed here?
-        
-        Be concise and focus on actionable insights.
-        """
-        
-        # Set up the Ollama vision model with local endpoint
-        llava = Ollama(model=VISION_MODEL, base_url=LOCAL_OLLAMA_URL)
-        
-        # Create multimodal message with image and text
-        response = llava.invoke({
-            "prompt": prompt,
-            "images": [base64_image]
-        })
-        
+        with Image.open(image_path) as image:
+            image.load()
+    except Exception as e:
+        logger.error(f"Error analyzing screenshot: {str(e)}")
+        return f"Error analyzing screenshot: {str(e)}"
+
+    return analyze_image(image)
+
+
+async def analyze_image_async(image, priority=PRIORITY_NORMAL):
+    """
+    Async variant of analyze_image routed through the model gateway
+
+    Image preparation runs in a worker thread. Identical frames analyzed at
+    the same time share one vision call.
+
+    Args:
+        image (PIL.Image.Image): The captured screenshot
+        priority (int): Admission priority at the model gateway
+
+    Returns:
+        str: Analysis of the screenshot
+
+    Raises:
+        GatewayBusyError: When the vision model's queue is full
+    """
+    try:
+        image = await asyncio.to_thread(prepare_image, image)
+
+        llava = get_model(VISION)
+        cache = get_vision_cache()
+        image_hash = None
+        if cache is not None:
+            image_hash = await asyncio.to_thread(cache.hash_image, image)
+            cached = cache.get(image_hash, VISION_PROMPT, llava.model)
+            if cached is not None:
+                logger.info("Screenshot analysis served from vision cache")
+                return cached
+
+        base64_image = await asyncio.to_thread(encode_image, image)
+        key = image_hash if image_hash is not None else hashlib.sha256(base64_image.encode()).hexdigest()
+
+        logger.info(f"Analyzing screenshot using {llava.model}")
+        started = time.perf_counter()
+        with stage("vision"):
+            response = await get_gateway().call(
+                llava.model,
+                ("vision", key),
+                lambda: llava.generate(VISION_PROMPT, images=[base64_image]),
+                priority,
+            )
+
         logger.info("Screenshot analysis completed")
-        return response.strip()
-        
+        result = response.get("response", "").strip()
+        if cache is not None:
+            cache.put(image_hash, result, time.perf_counter() - started, VISION_PROMPT, llava.model)
+        return result
+
+    except GatewayBusyError:
+        raise
     except Exception as e:
         logger.error(f"Error analyzing screenshot: {str(e)}")
-        return f"Error analyzing screenshot: {str(e)}"
\ No newline at end of file
+        return f"Error analyzing screenshot: {str(e)}"
+
+async def analyze_regions_async(image, regions, previous, priority=PRIORITY_NORMAL):
+    """
+    Update an earlier analysis of a screen from the regions that changed since
+
+    Only the crops go to the vision model, each downscaled like a full frame
+    would be, so a small change costs a small upload and keeps full detail.
+
+    Args:
+        image (PIL.Image.Image): The current frame
+        regions (list): (left, top, right, bottom) boxes of changed content
+        previous (str): The analysis the regions update
+        priority (int): Admission priority at the model gateway
+
+    Returns:
+        str: Analysis of the whole screen
+
+    Raises:
+        GatewayBusyError: When the vision model's queue is full
+    """
+    try:
+        def encode_regions():
+            return [encode_image(image.crop(box)) for box in regions]
+
+        encoded = await asyncio.to_thread(encode_regions)
+        prompt = REGION_PROMPT.format(previous=previous, width=image.width, height=image.height,
+                                      regions=", ".join(str(tuple(box)) for box in regions))
+        key = hashlib.sha256("\n".join([prompt, *encoded]).encode()).hexdigest()
+
+        llava = get_model(VISION)
+        logger.info(f"Analyzing {len(regions)} changed screen regions using {llava.model}")
+        with stage("vision", regions=len(regions)):
+            response = await get_gateway().call(
+                llava.model,
+                ("vision_regions", key),
+                lambda: llava.generate(prompt, images=encoded),
+                priority,
+            )
+        return response.get("response", "").strip()
+
+    except GatewayBusyError:
+        raise
+    except Exception as e:
+        logger.error(f"Error analyzing screenshot: {str(e)}")
+        return f"Error analyzing screenshot: {str(e)}"
+
+async def analyze_screenshot_async(image_path, priority=PRIORITY_NORMAL):
+    """
+    Async variant of analyze_screenshot routed through the model gateway
+
+    Args:
+        image_path (str): Path to the screenshot image file
+        priority (int): Admission priority at the model gateway
+
+    Returns:
+        str: Analysis of the screenshot
+    """
+    def load():
+        from PIL import Image
+
+        with Image.open(image_path) as image:
+            image.load()
+        return image
+
+    try:
+        image = await asyncio.to_thread(load)
+    except Exception as e:
+        logger.error(f"Error analyzing screenshot: {str(e)}")
+        return f"Error analyzing screenshot: {str(e)}"
+
+    return await analyze_image_async(image, priority)
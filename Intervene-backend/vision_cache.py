@@ -0,0 +1,164 @@
+"""
+vision_cache.py - Perceptual-hash cache for vision analysis results
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import (VISION_CACHE_ENABLED, VISION_CACHE_SIZE, VISION_CACHE_TTL,
+                    VISION_CACHE_THRESHOLD, VISION_CACHE_HASH_SIZE)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def difference_hash(image, hash_size: int = 16) -> int:
+    """
+    Compute a difference hash (dHash) of an image
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale grid and
+    each bit records whether a cell is brighter than its right neighbour, so
+    small rendering noise flips few bits while real content changes flip many.
+
+    Args:
+        image (PIL.Image.Image): The image to hash
+        hash_size (int): Grid size; the hash has hash_size * hash_size bits
+
+    Returns:
+        int: The hash as an integer bit field
+    """
+    from PIL import Image
+
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    width = hash_size + 1
+    value = 0
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+
+class VisionCache:
+    """
+    LRU cache of vision results keyed by perceptual hash.
+
+    A lookup hits when a stored hash is within ``threshold`` bits of the
+    query and the entry was made with the same model and prompt, so
+    near-identical frames share one analysis. Entries expire after
+    ``ttl`` seconds because the same-looking screen can mean a different state
+    once enough time has passed.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl: float = 30.0, threshold: int = 6, hash_size: int = 16):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hash_size = hash_size
+        # (model, prompt, hash) -> (result, created, latency)
+        self._entries: "OrderedDict[Tuple[str, str, int], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def hash_image(self, image) -> int:
+        """Hash an image with this cache's hash size"""
+        return difference_hash(image, self.hash_size)
+
+    def get(self, image_hash: int, prompt: str = "", model: str = "") -> Optional[str]:
+        """
+        Find a cached analysis for a perceptually similar frame
+
+        Args:
+            image_hash (int): Hash from hash_image()
+            prompt (str): Prompt the analysis must have been made with
+            model (str): Vision model the analysis must have come from
+
+        Returns:
+            str: The cached analysis, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_distance = None, self.threshold + 1
+            for key in list(self._entries):
+                result, created, latency = self._entries[key]
+                if now - created > self.ttl:
+                    del self._entries[key]
+                    continue
+                if key[:2] != (model, prompt):
+                    continue
+                distance = hamming_distance(key[2], image_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            result, created, latency = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.saved_seconds += latency
+            return result
+
+    def put(self, image_hash: int, result: str, latency: float, prompt: str = "", model: str = ""):
+        """
+        Store an analysis
+
+        Args:
+            image_hash (int): Hash from hash_image()
+            result (str): The vision model's analysis
+            latency (float): Seconds the model call took, credited on later hits
+            prompt (str): Prompt the analysis was made with
+            model (str): Vision model that made it
+        """
+        key = (model, prompt, image_hash)
+        with self._lock:
+            self._entries[key] = (result, time.monotonic(), latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the model time saved by hits"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "entries": len(self._entries),
+            }
+
+
+_cache: Optional[VisionCache] = None
+
+
+def get_vision_cache() -> Optional[VisionCache]:
+    """Return the process-wide vision cache, or None when caching is disabled"""
+    global _cache
+    if not VISION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = VisionCache(
+            max_entries=VISION_CACHE_SIZE,
+            ttl=VISION_CACHE_TTL,
+            threshold=VISION_CACHE_THRESHOLD,
+            hash_size=VISION_CACHE_HASH_SIZE,
+        )
+    return _cache
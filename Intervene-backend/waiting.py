@@ -0,0 +1,100 @@
+"""
+waiting.py - Condition-based waits with exponential backoff and timing stats
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from metrics import record_stage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class WaitStats:
+    """Records how long each named wait actually took"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, elapsed: float, satisfied: bool):
+        with self._lock:
+            entry = self._stats.setdefault(
+                name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0, "timeouts": 0}
+            )
+            entry["count"] += 1
+            entry["total_seconds"] += elapsed
+            entry["max_seconds"] = max(entry["max_seconds"], elapsed)
+            entry["last_seconds"] = elapsed
+            if not satisfied:
+                entry["timeouts"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-wait counters, with the mean duration filled in"""
+        with self._lock:
+            return {
+                name: {**entry, "mean_seconds": entry["total_seconds"] / entry["count"]}
+                for name, entry in self._stats.items()
+            }
+
+
+wait_stats = WaitStats()
+
+
+def wait_until(predicate: Callable[[], bool], timeout: float = 10.0, initial_delay: float = 0.05,
+               max_delay: float = 1.0, backoff: float = 2.0, name: str = "wait",
+               cancel_event: Optional[threading.Event] = None) -> bool:
+    """
+    Block until predicate() is true, polling with exponential backoff
+
+    Args:
+        predicate (callable): Readiness check; exceptions count as "not ready"
+        timeout (float): Upper bound in seconds
+        initial_delay (float): First poll interval
+        max_delay (float): Longest poll interval
+        backoff (float): Interval multiplier after each failed poll
+        name (str): Label under which the elapsed time is recorded
+        cancel_event (threading.Event): Stop waiting early when set
+
+    Returns:
+        bool: True if the condition was met, False on timeout or cancellation
+    """
+    started = time.monotonic()
+    delay = initial_delay
+    satisfied = False
+    while True:
+        if _check(predicate, name):
+            satisfied = True
+            break
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        if cancel_event is not None:
+            if cancel_event.wait(min(delay, remaining)):
+                break
+        else:
+            time.sleep(min(delay, remaining))
+        delay = min(delay * backoff, max_delay)
+
+    return _finish(name, started, timeout, satisfied)
+
+
+def _check(predicate: Callable[[], bool], name: str) -> bool:
+    try:
+        return bool(predicate())
+    except Exception as e:
+        logger.debug(f"Readiness check {name} failed: {e}")
+        return False
+
+
+def _finish(name: str, started: float, timeout: float, satisfied: bool) -> bool:
+    elapsed = time.monotonic() - started
+    wait_stats.record(name, elapsed, satisfied)
+    record_stage(f"wait_{name}", elapsed, satisfied=satisfied)
+    if satisfied:
+        logger.info(f"Wait {name} ready after {elapsed:.2f}s")
+    else:
+        logger.warning(f"Wait {name} gave up after {elapsed:.2f}s (timeout {timeout}s)")
+    return satisfied